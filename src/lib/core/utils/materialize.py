@@ -0,0 +1,214 @@
+"""
+Title: Materialize
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Materialize dataset files (e.g. the training split folders) from the project dataset
+without copying the file contents whenever possible.
+
+The destination file is created as a hardlink, a reflink (copy-on-write clone) or a
+symlink, falling back to a normal copy when the source and destination are not on the
+same filesystem. A manifest in the destination folder records the source and its stats
+for every file, so running it again only syncs the files that changed.
+
+NOTE: Hardlinks share the same file contents as the source dataset. The materialized
+files must only be read or removed, never written in place, which is how the training
+folders are used.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from core.utils.log import logger
+
+MANIFEST_FILENAME = '.materialize_manifest.json'
+# the methods to try in order for the 'auto' method, symlink is not included as
+# it breaks when the source is moved or deleted, e.g. when a dataset is deleted
+AUTO_METHODS = ('hardlink', 'reflink', 'copy')
+# from <linux/fs.h>, to clone a file on Btrfs/XFS
+FICLONE = 0x40049409
+
+
+@dataclass(eq=False)
+class MaterializeSummary:
+    created: Dict[str, int] = field(default_factory=dict)
+    unchanged: int = 0
+    removed: int = 0
+    seconds: float = 0.0
+
+    @property
+    def num_created(self) -> int:
+        return sum(self.created.values())
+
+
+def hash_file(path: Union[str, Path]) -> str:
+    """SHA-1 of the file content"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def reflink(src: Union[str, Path], dst: Union[str, Path]):
+    """Clone the file with the FICLONE ioctl, only supported on Linux with
+    copy-on-write filesystems, raises OSError otherwise."""
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def link_or_copy(src: Union[str, Path], dst: Union[str, Path],
+                 methods: Sequence[str] = AUTO_METHODS) -> str:
+    """Create `dst` from `src` with the first method that works in `methods`, which
+    can include 'hardlink', 'reflink', 'symlink' and 'copy'. An existing `dst` is
+    replaced. Returns the method used."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    for method in methods:
+        try:
+            if method == 'hardlink':
+                os.link(src, dst)
+            elif method == 'reflink':
+                reflink(src, dst)
+            elif method == 'symlink':
+                os.symlink(os.path.abspath(src), dst)
+            elif method == 'copy':
+                shutil.copy2(src, dst)
+            else:
+                raise ValueError(f"Unknown method: {method}")
+            return method
+        except (OSError, NotImplementedError, ImportError):
+            # e.g. EXDEV for different filesystems, EPERM on filesystems
+            # without hardlinks, or Windows without the privilege to symlink
+            continue
+    raise OSError(f"Unable to materialize {src} to {dst} with {methods}")
+
+
+def get_methods(method: str) -> Tuple[str, ...]:
+    if method == 'auto':
+        return AUTO_METHODS
+    if method == 'copy':
+        return ('copy',)
+    # fallback to copy if the selected method is not supported
+    return (method, 'copy')
+
+
+def _file_stat(path: Union[str, Path]) -> List[int]:
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _load_manifest(dest_dir: Path) -> Dict[str, Dict]:
+    manifest_path = dest_dir / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return {}
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(dest_dir: Path, manifest: Dict[str, Dict]):
+    tmp_path = dest_dir / (MANIFEST_FILENAME + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, dest_dir / MANIFEST_FILENAME)
+
+
+def sync_files(src_paths: Sequence[Union[str, Path]],
+               dest_dir: Union[str, Path],
+               method: str = 'auto',
+               prune: bool = True,
+               num_workers: Optional[int] = None,
+               progress_wrapper: Callable = None) -> MaterializeSummary:
+    """Make `dest_dir` contain the `src_paths` with the same filenames, only creating
+    the files which are new or changed since the last sync.
+
+    Args:
+        src_paths (Sequence[Union[str, Path]]): Source files, the filenames must be
+            unique as they are all put directly in `dest_dir`.
+        dest_dir (Union[str, Path]): Destination folder, created if not exists.
+        method (str, optional): One of 'auto', 'hardlink', 'reflink', 'symlink' or
+            'copy'. 'auto' tries hardlink, then reflink, then copy. Defaults to 'auto'.
+        prune (bool, optional): Remove the other files in `dest_dir` that are not in
+            `src_paths`, same as recreating the folder. Defaults to True.
+        num_workers (Optional[int], optional): Number of threads to create the
+            files. Defaults to the default of `ThreadPoolExecutor`.
+        progress_wrapper (Callable, optional): To wrap the iterator of created files
+            for progress display, e.g. `stqdm`.
+    """
+    start = perf_counter()
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    methods = get_methods(method)
+    old_manifest = _load_manifest(dest_dir)
+
+    manifest = {}
+    to_create: List[Tuple[str, str]] = []
+    summary = MaterializeSummary()
+    for src in src_paths:
+        src = os.path.abspath(src)
+        name = os.path.basename(src)
+        entry = {'src': src, 'stat': _file_stat(src)}
+        old_entry = old_manifest.get(name)
+        if old_entry is not None and old_entry['src'] == entry['src'] \
+                and old_entry['stat'] == entry['stat'] \
+                and old_entry.get('method') in methods \
+                and os.path.lexists(dest_dir / name):
+            manifest[name] = old_entry
+            summary.unchanged += 1
+        else:
+            manifest[name] = entry
+            to_create.append((src, name))
+
+    if prune:
+        for existing in os.scandir(dest_dir):
+            if existing.name not in manifest and \
+                    not existing.name.startswith(MANIFEST_FILENAME):
+                if existing.is_dir(follow_symlinks=False):
+                    shutil.rmtree(existing.path)
+                else:
+                    os.remove(existing.path)
+                summary.removed += 1
+
+    dest_dev = os.stat(dest_dir).st_dev
+    # links and clones only work within the same filesystem
+    cross_device_methods = tuple(
+        m for m in methods if m not in ('hardlink', 'reflink')) or ('copy',)
+
+    def create(args: Tuple[str, str]) -> Tuple[str, str]:
+        src, name = args
+        src_methods = (methods if os.stat(src).st_dev == dest_dev
+                       else cross_device_methods)
+        return name, link_or_copy(src, dest_dir / name, src_methods)
+
+    with ThreadPoolExecutor(num_workers) as executor:
+        results = executor.map(create, to_create)
+        if progress_wrapper is not None:
+            results = progress_wrapper(results, total=len(to_create))
+        for name, used_method in results:
+            manifest[name]['method'] = used_method
+            summary.created[used_method] = summary.created.get(used_method, 0) + 1
+
+    _save_manifest(dest_dir, manifest)
+    summary.seconds = perf_counter() - start
+    logger.info(f"Synced {len(manifest)} files to {dest_dir} in "
+                f"{summary.seconds:.2f}s: created {summary.created}, "
+                f"unchanged {summary.unchanged}, removed {summary.removed}")
+    return summary
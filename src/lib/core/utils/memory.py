@@ -0,0 +1,172 @@
+"""
+Title: Memory
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Memory accounting for long-running deployments: reusable preallocated buffers,
+per-component byte counters, process RSS, and tracemalloc snapshots on demand.
+"""
+
+import os
+import tracemalloc
+from collections import defaultdict
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from psutil import Process
+
+from core.utils.log import logger
+
+
+def get_rss_bytes() -> int:
+    """Return the resident set size (RSS) of the current process in bytes."""
+    return Process(os.getpid()).memory_info().rss
+
+
+def format_bytes(nbytes: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(nbytes) < 1024:
+            return f"{nbytes:.1f}{unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f}TB"
+
+
+def release_replaced_media_files() -> Optional[int]:
+    """Streamlit keeps every image shown with `st.image()` in its in-memory file manager
+    until the script run ends, even when the image has been replaced by a newer frame
+    at the same place. This is why memory kept growing in the video deployment loop,
+    which never ends its script run.
+
+    This deletes the replaced media files (the ones still shown are kept), which is
+    what Streamlit does at the end of every script run. Returns the number of bytes
+    held by the file manager after cleaning up, or None if the Streamlit version
+    does not report it (e.g. `get_stats()` is not in Streamlit 0.89)."""
+    from streamlit.in_memory_file_manager import in_memory_file_manager
+    in_memory_file_manager.del_expired_files()
+    try:
+        stats = in_memory_file_manager.get_stats()
+    except AttributeError:
+        return None
+    return sum(stat.byte_length for stat in stats)
+
+
+class BufferPool:
+    """Preallocated reusable arrays identified by a key (e.g. 'record_0' for the
+    recording buffer of camera 0), to be passed as the `dst` of OpenCV functions
+    instead of allocating a new array for every frame.
+
+    A buffer is only reallocated when the requested shape or dtype changes."""
+
+    def __init__(self) -> None:
+        self._buffers: Dict[str, np.ndarray] = {}
+        self.num_allocations = 0
+
+    def get(self, key: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        buffer = self._buffers.get(key)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[key] = buffer
+            self.num_allocations += 1
+        return buffer
+
+    def get_like(self, key: str, array: np.ndarray) -> np.ndarray:
+        return self.get(key, array.shape, array.dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for b in self._buffers.values())
+
+    def clear(self):
+        self._buffers.clear()
+
+
+class MemoryMonitor:
+    """Keep track of the memory usage of a long-running loop.
+
+    - `update(component, nbytes)` to record the bytes currently held by a component,
+      e.g. the Streamlit media files, buffer pool, or CSV rows not flushed yet
+    - `log_stats()` at an interval to log the RSS and component bytes
+    - `take_snapshot()` to compare the current tracemalloc snapshot with the
+      previous one to find where the memory grows
+    """
+
+    def __init__(self, trace_frames: int = 10) -> None:
+        # None for the components with unavailable sizes
+        self.component_bytes: Dict[str, Optional[int]] = defaultdict(int)
+        self.start_rss = get_rss_bytes()
+        self.peak_rss = self.start_rss
+        self.started_at = perf_counter()
+        self.trace_frames = trace_frames
+        self._last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+    def update(self, component: str, nbytes: Optional[int]):
+        self.component_bytes[component] = int(nbytes) if nbytes is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        rss = get_rss_bytes()
+        self.peak_rss = max(self.peak_rss, rss)
+        stats = {
+            'uptime_sec': round(perf_counter() - self.started_at, 1),
+            'rss': format_bytes(rss),
+            'rss_growth': format_bytes(rss - self.start_rss),
+            'peak_rss': format_bytes(self.peak_rss),
+            'components': {k: format_bytes(v) if v is not None else 'unavailable'
+                           for k, v in self.component_bytes.items()},
+        }
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            stats['traced'] = format_bytes(current)
+            stats['traced_peak'] = format_bytes(peak)
+        return stats
+
+    def log_stats(self):
+        logger.info(f"Memory stats: {self.get_stats()}")
+
+    @property
+    def is_tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start_tracing(self):
+        """Start tracemalloc and take the baseline snapshot. Note that tracing
+        slows down the Python code considerably."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            logger.info("Started tracing memory allocations")
+        self._last_snapshot = tracemalloc.take_snapshot()
+
+    def stop_tracing(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("Stopped tracing memory allocations")
+        self._last_snapshot = None
+
+    def take_snapshot(self, top_n: int = 15) -> List[Dict[str, Any]]:
+        """Take a tracemalloc snapshot and return the `top_n` source lines with
+        the largest memory growth since the previous snapshot."""
+        if not tracemalloc.is_tracing():
+            self.start_tracing()
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        if self._last_snapshot is None:
+            stats = snapshot.statistics('lineno')
+        else:
+            stats = snapshot.compare_to(self._last_snapshot, 'lineno')
+        self._last_snapshot = snapshot
+
+        top_stats = []
+        for stat in stats[:top_n]:
+            frame = stat.traceback[0]
+            top_stats.append({
+                'location': f"{frame.filename}:{frame.lineno}",
+                'size': format_bytes(stat.size),
+                'size_diff': format_bytes(getattr(stat, 'size_diff', 0)),
+                'count': stat.count,
+                'count_diff': getattr(stat, 'count_diff', 0),
+            })
+        logger.info(f"Top memory allocations since the last snapshot: {top_stats}")
+        return top_stats
@@ -140,11 +140,14 @@ class Converter(object):
     def all_formats(self):
         return self._FORMAT_INFO
 
-    def __init__(self, config, project_dir=None, output_tags=None, upload_dir=None, download_resources=True):
+    def __init__(self, config, project_dir=None, output_tags=None, upload_dir=None, download_resources=True,
+                 overwrite_resources=True):
         self.project_dir = project_dir
         self.upload_dir = upload_dir
         # NOTE: set download_resources to False if don't want to copy images to the output_dir
         self.download_resources = download_resources
+        # NOTE: set overwrite_resources to False to skip the images already in the output_dir
+        self.overwrite_resources = overwrite_resources
         if isinstance(config, dict):
             self._schema = config
         elif isinstance(config, str):
@@ -462,7 +465,8 @@ class Converter(object):
             image_path = item['input'][data_key]
             try:
                 image_path = download(image_path, output_image_dir, project_dir=self.project_dir,
-                                      return_relative_path=True, upload_dir=self.upload_dir, download_resources=self.download_resources)
+                                      return_relative_path=True, upload_dir=self.upload_dir, download_resources=self.download_resources,
+                                      overwrite=self.overwrite_resources)
             except:
                 logger.error('Unable to download {image_path}. The item {item} will be skipped'.format(
                     image_path=image_path, item=item
@@ -598,7 +602,8 @@ class Converter(object):
 # TODO: Fix download
             try:
                 image_path = download(image_path, output_image_dir, project_dir=self.project_dir,
-                                      return_relative_path=True, upload_dir=self.upload_dir, download_resources=self.download_resources)
+                                      return_relative_path=True, upload_dir=self.upload_dir, download_resources=self.download_resources,
+                                      overwrite=self.overwrite_resources)
             except:
                 logger.error('Unable to download {image_path}. The item {item} will be skipped'.format(
                     image_path=image_path, item=item
@@ -702,7 +707,7 @@ class Converter(object):
             try:
                 image_path = download(
                     image_path, output_image_dir, project_dir=self.project_dir, upload_dir=self.upload_dir, return_relative_path=True,
-                    download_resources=self.download_resources)
+                    download_resources=self.download_resources, overwrite=self.overwrite_resources)
             except:
                 logger.error('Unable to download {image_path}. The item {item} will be skipped'.format(
                     image_path=image_path, item=item), exc_info=True)
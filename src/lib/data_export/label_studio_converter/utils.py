@@ -8,7 +8,6 @@ import hashlib
 import urllib
 import numpy as np
 import wave
-import shutil
 
 from operator import itemgetter
 from PIL import Image
@@ -17,6 +16,7 @@ from nltk.tokenize import WhitespaceTokenizer
 
 from path_desc import DATASET_DIR
 from core.utils.log import logger
+from core.utils.materialize import link_or_copy
 
 
 def tokenize(text):
@@ -97,7 +97,7 @@ def _get_upload_dir(project_dir=None, upload_dir=None):
 
 
 def download(url, output_dir, filename=None, project_dir=None, return_relative_path=False, upload_dir=None,
-             download_resources=True):
+             download_resources=True, overwrite=True):
     # - All these commented lines are from original `label-studio-converter` repo
     # is_local_file = url.startswith('/data/') and '?d=' in url
     # is_uploaded_file = url.startswith('/data/upload')
@@ -144,7 +144,10 @@ def download(url, output_dir, filename=None, project_dir=None, return_relative_p
         # NOTE: url here is currently a relative path to the DATASET_DIR
         full_image_path = DATASET_DIR / url
         # logger.debug(f"Copying image from {full_image_path} to {filepath}")
-        shutil.copy2(full_image_path, filepath)
+        # hardlink or clone the image instead of copying if possible
+        # NOTE: `overwrite` is False to keep the images of an incremental export
+        if overwrite or not os.path.exists(filepath):
+            link_or_copy(full_image_path, filepath)
         if return_relative_path:
             return os.path.join(os.path.basename(output_dir), filename)
         return filepath
@@ -35,7 +35,8 @@ from collections import namedtuple
 import traceback
 from enum import IntEnum
 from passlib.hash import argon2
-from typing import Any, Dict, List, NamedTuple, Tuple, Union
+from threading import Lock
+from typing import Any, Callable, Dict, List, NamedTuple, Set, Tuple, Union
 import streamlit as st
 from streamlit import session_state
 
@@ -65,6 +66,10 @@ from core.utils.model_details_db_setup import check_if_pretrained_models_exist,
 APP_DATABASE_NAME = os.environ.get(
     "POSTGRES_DB", "integrated_vision_inspection_system")
 
+# the `create_*_table()` functions already run by `ensure_table()` in this process
+_created_tables: Set[Callable] = set()
+_created_tables_lock = Lock()
+
 
 # <<<<<<<<<<<<<<<<<<<<<<TEMP<<<<<<<<<<<<<<<<<<<<<<<
 class DatabaseStatus(IntEnum):
@@ -255,6 +260,27 @@ def db_fetchall(sql_message: str, conn, vars: List = None,
                 logger.error(e)
 
 
+def db_no_fetch_many(queries: List[Tuple[str, List]], conn) -> bool:
+    """Execute multiple `(sql_message, vars)` queries in a single transaction with only
+    one commit. Everything is rolled back if any of them fails.
+
+    Returns True if successful."""
+    with conn:
+        with conn.cursor() as cur:
+            try:
+                for sql_message, vars in queries:
+                    if vars:
+                        cur.execute(sql_message, vars)
+                    else:
+                        cur.execute(sql_message)
+                conn.commit()
+                return True
+            except psycopg2.Error as e:
+                conn.rollback()
+                logger.error(e)
+                return False
+
+
 def convert_to_dict(query: List) -> Dict[str, Any]:
     query_dict = [dict(row) for row in query]
     return query_dict
@@ -1028,6 +1054,142 @@ def create_relation_database(conn):
         logger.error(e)
 
 
+def ensure_table(create_fn: Callable, conn):
+    """Run the `create_fn` (e.g. `create_training_job_table`) only once per process,
+    for the tables added after the database was created."""
+    with _created_tables_lock:
+        if create_fn not in _created_tables:
+            create_fn(conn)
+            _created_tables.add(create_fn)
+
+
+def create_training_metrics_table(conn):
+    """Create the table of the metrics history of every step (or epoch) of the trainings
+    if not exists. This is also called on existing databases created before this table
+    was added."""
+    sql_query = """
+        CREATE TABLE IF NOT EXISTS public.training_metrics (
+            training_id bigint NOT NULL
+            , step integer NOT NULL
+            ,
+            /* 'Step' for TFOD, 'Epoch' for Keras models */
+            metrics jsonb NOT NULL
+            , created_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP
+            , PRIMARY KEY (training_id , step)
+            , CONSTRAINT fk_training_id FOREIGN KEY (training_id)
+                REFERENCES public.training (id) ON DELETE CASCADE
+        );
+    """
+    db_no_fetch(sql_query, conn)
+
+
+def create_training_evaluation_table(conn):
+    """Create the table of the evaluation metrics of the trained models on the test
+    set if not exists. This is also called on existing databases created before this
+    table was added."""
+    sql_query = """
+        CREATE TABLE IF NOT EXISTS public.training_evaluation (
+            training_id bigint NOT NULL
+            , model_key text NOT NULL
+            ,
+            /* the key of the evaluated model file or checkpoint */
+            summary jsonb NOT NULL
+            ,
+            /* the overall metrics, e.g. mAP or accuracy */
+            metrics jsonb NOT NULL
+            ,
+            /* including the per-class metrics and the confusion matrix */
+            updated_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP
+            , PRIMARY KEY (training_id)
+            , CONSTRAINT fk_training_id FOREIGN KEY (training_id)
+                REFERENCES public.training (id) ON DELETE CASCADE
+        );
+    """
+    db_no_fetch(sql_query, conn)
+
+
+def create_training_job_table(conn):
+    """Create the table of the queue of the training jobs run by the background workers
+    in `training/job_worker.py` if not exists. This is also called on existing databases
+    created before this table was added."""
+    sql_query = """
+        CREATE TABLE IF NOT EXISTS public.training_job (
+            id bigint NOT NULL GENERATED ALWAYS AS IDENTITY (INCREMENT 1 START 1
+            MINVALUE 1
+            MAXVALUE 9223372036854775807
+            CACHE 1)
+            , training_id bigint NOT NULL
+            , params jsonb NOT NULL DEFAULT '{}'::jsonb
+            ,
+            /* e.g. is_resume and train_one_batch for Trainer.train() */
+            priority integer NOT NULL DEFAULT 0
+            ,
+            /* higher priority jobs are run first */
+            status text NOT NULL DEFAULT 'Queued'
+            , cancel_requested boolean NOT NULL DEFAULT FALSE
+            , worker_pid integer
+            , error text
+            , submitted_by bigint
+            , created_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP
+            , updated_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP
+            , started_at timestamp with time zone
+            , finished_at timestamp with time zone
+            , PRIMARY KEY (id)
+            , CONSTRAINT fk_training_id FOREIGN KEY (training_id)
+                REFERENCES public.training (id) ON DELETE CASCADE
+        );
+
+        CREATE INDEX IF NOT EXISTS training_job_queue_idx
+            ON public.training_job (status, priority DESC, id);
+
+        /* at most one active job of each training, see `submit_job()` */
+        CREATE UNIQUE INDEX IF NOT EXISTS training_job_active_idx
+            ON public.training_job (training_id)
+        WHERE
+            status IN ('Queued', 'Running');
+
+        DROP TRIGGER IF EXISTS training_job_update ON public.training_job;
+
+        CREATE TRIGGER training_job_update
+            BEFORE UPDATE ON public.training_job
+            FOR EACH ROW
+            EXECUTE PROCEDURE trigger_update_timestamp ();
+    """
+    db_no_fetch(sql_query, conn)
+
+
+def create_training_sweep_table(conn):
+    """Create the table of the hyper-parameter sweeps in `training/sweep.py` if not
+    exists. The trials of each sweep are stored in the `state` column."""
+    sql_query = """
+        CREATE TABLE IF NOT EXISTS public.training_sweep (
+            id bigint NOT NULL GENERATED ALWAYS AS IDENTITY (INCREMENT 1 START 1
+            MINVALUE 1
+            MAXVALUE 9223372036854775807
+            CACHE 1)
+            , base_training_id bigint NOT NULL
+            , config jsonb NOT NULL
+            , state jsonb NOT NULL DEFAULT '{}'::jsonb
+            , status text NOT NULL DEFAULT 'Running'
+            , best_training_id bigint
+            , submitted_by bigint
+            , created_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP
+            , updated_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP
+            , PRIMARY KEY (id)
+            , CONSTRAINT fk_base_training_id FOREIGN KEY (base_training_id)
+                REFERENCES public.training (id) ON DELETE CASCADE
+        );
+
+        DROP TRIGGER IF EXISTS training_sweep_update ON public.training_sweep;
+
+        CREATE TRIGGER training_sweep_update
+            BEFORE UPDATE ON public.training_sweep
+            FOR EACH ROW
+            EXECUTE PROCEDURE trigger_update_timestamp ();
+    """
+    db_no_fetch(sql_query, conn)
+
+
 def initialise_database_pipeline(conn, dsn: dict) -> DatabaseStatus:
     """Pipeliine to Initialise Database for the platform
 
@@ -1063,6 +1225,10 @@ def initialise_database_pipeline(conn, dsn: dict) -> DatabaseStatus:
     else:
         logger.info(
             f"Tables already exist in database '{APP_DATABASE_NAME}'")
+    create_training_metrics_table(conn)
+    create_training_job_table(conn)
+    create_training_sweep_table(conn)
+    create_training_evaluation_table(conn)
 
     # also scrape model details online and setup the `models` table if not exists
     if not check_if_pretrained_models_exist(conn):
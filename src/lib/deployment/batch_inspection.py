@@ -0,0 +1,499 @@
+"""
+Title: Batch Inspection
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Offline batch inspection of image folders, archives and recorded videos with a
+deployed model. Unlike the real-time deployment loop, this decodes and preprocesses
+the inputs with a pool of worker threads while the model runs inference on large
+batches, then writes all the results into a single CSV file, and optionally the
+annotated images/video too.
+"""
+from __future__ import annotations
+import os
+import shutil
+import sys
+import tarfile
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from csv import DictWriter
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+import cv2
+import numpy as np
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.helper import get_now_string
+from core.utils.log import logger
+from machine_learning.utils import preprocess_image, tfod_detect
+from machine_learning.visuals import draw_tfod_bboxes, get_colored_mask_image
+from path_desc import TEMP_DIR
+if TYPE_CHECKING:
+    from deployment.deployment_management import Deployment
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.asf', '.m4v', '.mkv')
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.gz', '.tgz', '.bz2', '.xz')
+
+# (done, total, eta_seconds) -> None
+ProgressCallback = Callable[[int, int, float], None]
+
+
+@dataclass(eq=False)
+class FrameBatch:
+    """A decoded and preprocessed batch ready to be passed to the model.
+
+    `keys` are (source name, frame index) for each item in the batch, the source name
+    is the path relative to the input directory, and the frame index is always 0 for
+    images. `images` are the original BGR images, only kept when they
+    are needed later for TFOD inference or drawing the annotated outputs."""
+    keys: List[Tuple[str, int]]
+    sizes: List[Tuple[int, int]]
+    preprocessed: Optional[np.ndarray] = None
+    images: Optional[List[np.ndarray]] = None
+
+
+@dataclass(eq=False)
+class BatchInspectionSummary:
+    total: int = 0
+    processed: int = 0
+    failed: List[str] = field(default_factory=list)
+    num_results: int = 0
+    elapsed: float = 0.0
+    csv_path: Optional[Path] = None
+    annotated_dir: Optional[Path] = None
+
+    @property
+    def items_per_sec(self) -> float:
+        if self.elapsed <= 0:
+            return 0.0
+        return self.processed / self.elapsed
+
+
+def _check_member_path(extract_dir: Path, name: str):
+    """Raise ValueError if the archive member `name` (a path or a link target) would be
+    extracted outside of the `extract_dir`, e.g. with '../' or an absolute path."""
+    target = os.path.realpath(os.path.join(extract_dir, name))
+    if os.path.commonpath([target, os.path.realpath(extract_dir)]) != \
+            os.path.realpath(extract_dir):
+        raise ValueError(f"Archive member is outside of the extract directory: {name}")
+
+
+def extract_archive(archive_path: Path, extract_dir: Path = None) -> Path:
+    """Extract a ZIP/TAR archive into `extract_dir` (defaults to a folder in TEMP_DIR)
+    and return the extracted directory. Raise ValueError without extracting anything
+    if any member would be extracted outside of the `extract_dir`."""
+    if extract_dir is None:
+        extract_dir = TEMP_DIR / 'batch_inspection' / archive_path.name.split('.')[0]
+    if extract_dir.exists():
+        shutil.rmtree(extract_dir)
+    os.makedirs(extract_dir)
+    logger.info(f"Extracting archive {archive_path} to {extract_dir}")
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as f:
+            for name in f.namelist():
+                _check_member_path(extract_dir, name)
+            f.extractall(extract_dir)
+    elif tarfile.is_tarfile(archive_path):
+        with tarfile.open(archive_path) as f:
+            for member in f.getmembers():
+                _check_member_path(extract_dir, member.name)
+                if member.issym():
+                    # symlink target is relative to the directory of the link
+                    _check_member_path(
+                        extract_dir, os.path.join(os.path.dirname(member.name),
+                                                  member.linkname))
+                elif member.islnk():
+                    _check_member_path(extract_dir, member.linkname)
+            f.extractall(extract_dir)
+    else:
+        raise ValueError(f"Unsupported archive file: {archive_path}")
+    return extract_dir
+
+
+def collect_inputs(input_path: Path) -> Tuple[Path, List[Path], List[Path]]:
+    """Collect all the image and video paths from the `input_path`, which can be
+    a directory, an archive, a video file or a single image file.
+
+    Returns:
+        Tuple[Path, List[Path], List[Path]]: the root directory of the inputs (i.e. the
+            extracted directory for an archive), image paths and video paths, sorted by
+            name
+    """
+    input_path = Path(input_path)
+    if not input_path.exists():
+        raise FileNotFoundError(f"Input path does not exist: {input_path}")
+
+    if input_path.is_file():
+        suffix = input_path.suffix.lower()
+        if suffix in IMAGE_EXTENSIONS:
+            return input_path.parent, [input_path], []
+        if suffix in VIDEO_EXTENSIONS:
+            return input_path.parent, [], [input_path]
+        if suffix in ARCHIVE_EXTENSIONS:
+            input_path = extract_archive(input_path)
+        else:
+            raise ValueError(f"Unsupported input file type: {input_path}")
+
+    image_paths, video_paths = [], []
+    for p in sorted(input_path.rglob('*')):
+        suffix = p.suffix.lower()
+        if suffix in IMAGE_EXTENSIONS:
+            image_paths.append(p)
+        elif suffix in VIDEO_EXTENSIONS:
+            video_paths.append(p)
+    return input_path, image_paths, video_paths
+
+
+def get_source_name(path: Path, root_dir: Path) -> str:
+    """The path relative to the `root_dir`, to identify the images and videos with the
+    same file name in different subfolders."""
+    return path.relative_to(root_dir).as_posix()
+
+
+def get_video_frame_count(video_path: Path) -> Tuple[int, float, Tuple[int, int]]:
+    """Returns the number of frames, FPS and (width, height) of the video."""
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    finally:
+        cap.release()
+    return num_frames, fps, (width, height)
+
+
+class BatchInspector:
+    """Run a loaded `Deployment` model over a large number of images/frames.
+
+    Decoding and preprocessing are done by a `ThreadPoolExecutor` (OpenCV releases
+    the GIL so the threads run on multiple cores) while the main thread runs batched
+    inference, so that the next batches are already decoded while the model is busy.
+    """
+
+    def __init__(self, deployment: Deployment,
+                 batch_size: int = 32,
+                 num_workers: int = None,
+                 frame_step: int = 1,
+                 conf_threshold: float = 0.6,
+                 ignore_background: bool = False,
+                 timezone: str = 'Singapore',
+                 save_annotated: bool = False) -> None:
+        assert deployment.model is not None, (
+            "Must run `deployment.run_preparation_pipeline()` to load the model first")
+        self.deployment = deployment
+        self.deployment_type = deployment.deployment_type
+        self.batch_size = max(1, int(batch_size))
+        self.num_workers = num_workers or min(8, os.cpu_count() or 1)
+        # only process every `frame_step` frames for videos
+        self.frame_step = max(1, int(frame_step))
+        self.conf_threshold = conf_threshold
+        self.ignore_background = ignore_background
+        self.timezone = timezone
+        self.save_annotated = save_annotated
+
+        # TFOD needs the original image as the model input
+        self.keep_images = (save_annotated
+                            or self.deployment_type == 'Object Detection with Bounding Boxes')
+
+    # ************************** Decoding & preprocessing **************************
+
+    def preprocess(self, img: np.ndarray) -> Optional[np.ndarray]:
+        if self.deployment_type == 'Image Classification':
+            return preprocess_image(img, self.deployment.image_size,
+                                    preprocess_fn=self.deployment.preprocess_fn)
+        elif self.deployment_type == 'Semantic Segmentation with Polygons':
+            return preprocess_image(img, self.deployment.image_size)
+        # TFOD model takes in the original image
+        return None
+
+    def _build_batch(self, keys: List[Tuple[str, int]],
+                     imgs: List[np.ndarray]) -> FrameBatch:
+        sizes = [img.shape[:2] for img in imgs]
+        preprocessed = [self.preprocess(img) for img in imgs]
+        if preprocessed and preprocessed[0] is not None:
+            preprocessed = np.stack(preprocessed)
+        else:
+            preprocessed = None
+        return FrameBatch(keys=keys, sizes=sizes, preprocessed=preprocessed,
+                          images=imgs if self.keep_images else None)
+
+    def _load_image_batch(self, paths: List[Path],
+                          root_dir: Path) -> Tuple[FrameBatch, List[str]]:
+        keys, imgs, failed = [], [], []
+        for p in paths:
+            img = cv2.imread(str(p))
+            if img is None:
+                logger.warning(f"Unable to read image: {p}")
+                failed.append(str(p))
+                continue
+            keys.append((get_source_name(p, root_dir), 0))
+            imgs.append(img)
+        return self._build_batch(keys, imgs), failed
+
+    def _load_video_batch(self, video_path: Path, source: str,
+                          frame_indices: List[int]) -> Tuple[FrameBatch, List[str]]:
+        # each worker opens its own capture and seeks to the start of its segment,
+        # this is what allows decoding different segments of the same video in parallel
+        cap = cv2.VideoCapture(str(video_path))
+        keys, imgs = [], []
+        try:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_indices[0])
+            curr_idx = frame_indices[0]
+            for idx in frame_indices:
+                # grab() without decoding for the skipped frames
+                while curr_idx < idx:
+                    cap.grab()
+                    curr_idx += 1
+                ret, frame = cap.read()
+                curr_idx += 1
+                if not ret:
+                    break
+                keys.append((source, idx))
+                imgs.append(frame)
+        finally:
+            cap.release()
+        return self._build_batch(keys, imgs), []
+
+    def _iter_batches(self, tasks: List[Tuple[Callable, tuple]]
+                      ) -> Iterator[Tuple[FrameBatch, List[str]]]:
+        """Submit the loading `tasks` to the thread pool with a bounded number of
+        batches in flight to limit the memory usage, and yield them in order."""
+        max_in_flight = self.num_workers * 2
+        with ThreadPoolExecutor(self.num_workers) as executor:
+            pending: Deque[Future] = deque()
+            task_iter = iter(tasks)
+            for func, args in task_iter:
+                pending.append(executor.submit(func, *args))
+                if len(pending) >= max_in_flight:
+                    break
+            while pending:
+                result = pending.popleft().result()
+                next_task = next(task_iter, None)
+                if next_task is not None:
+                    func, args = next_task
+                    pending.append(executor.submit(func, *args))
+                yield result
+
+    # ******************************** Inference ********************************
+
+    def predict_batch(self, batch: FrameBatch) -> List[Dict[str, Any]]:
+        """Run the model on the `batch` and return the inference outputs in the same
+        format as the deployment inference pipelines, to be passed to the
+        `Deployment.get_*_results()` methods."""
+        if not batch.keys:
+            return []
+        model = self.deployment.model
+
+        if self.deployment_type == 'Image Classification':
+            y_proba = model.predict(batch.preprocessed,
+                                    batch_size=len(batch.keys))
+            y_preds = np.argmax(y_proba, axis=-1)
+            probas = y_proba[np.arange(len(y_preds)), y_preds]
+            return [{'pred_classname': self.deployment.encoded_label_dict.get(
+                        y_pred, 'Unknown'),
+                     'probability': proba}
+                    for y_pred, proba in zip(y_preds, probas)]
+
+        elif self.deployment_type == 'Semantic Segmentation with Polygons':
+            pred_masks = model.predict(batch.preprocessed,
+                                       batch_size=len(batch.keys))
+            pred_masks = np.argmax(pred_masks, axis=-1).astype(np.uint8)
+            outputs = []
+            for pred_mask, (h, w) in zip(pred_masks, batch.sizes):
+                # same as segmentation_predict(), resize back to the original size
+                pred_mask = cv2.resize(pred_mask, (w, h),
+                                       interpolation=cv2.INTER_LINEAR)
+                outputs.append({'prediction_mask': pred_mask})
+            return outputs
+
+        # NOTE: the TFOD exported SavedModel has a fixed input batch size of 1,
+        # so the images are passed one by one, while the next batches are still being
+        # decoded in the background
+        outputs = []
+        for img in batch.images:
+            rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            detections = tfod_detect(model, rgb_img)
+            outputs.append({'detections': detections})
+        return outputs
+
+    def get_results(self, output: Dict[str, Any], source: str,
+                    frame_idx: int) -> List[Dict[str, Any]]:
+        if self.deployment_type == 'Image Classification':
+            results = self.deployment.get_classification_results(
+                **output, timezone=self.timezone, camera_title=source)
+        elif self.deployment_type == 'Semantic Segmentation with Polygons':
+            results = self.deployment.get_segmentation_results(
+                **output, timezone=self.timezone, camera_title=source)
+        else:
+            results = self.deployment.get_detection_results(
+                **output, timezone=self.timezone, camera_title=source,
+                conf_threshold=self.conf_threshold, get_bbox_coords=True)
+        for row in results:
+            row['frame'] = frame_idx
+        return results
+
+    def get_no_detection_row(self, source: str, frame_idx: int) -> Dict[str, Any]:
+        """CSV row with the same columns as the detection results, to still record the
+        images/frames without any detection."""
+        return {'name': '', 'probability': '', 'top_left': '', 'bottom_right': '',
+                'view': source, 'time': get_now_string(timezone=self.timezone),
+                'frame': frame_idx}
+
+    def draw_output(self, img: np.ndarray, output: Dict[str, Any]) -> np.ndarray:
+        """Draw the inference output on the BGR `img` and return a BGR image."""
+        if self.deployment_type == 'Image Classification':
+            text = f"{output['pred_classname']}: {output['probability'] * 100:.2f}%"
+            img = img.copy()
+            cv2.putText(img, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.8, (0, 255, 0), 2, cv2.LINE_AA)
+            return img
+        rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        if self.deployment_type == 'Semantic Segmentation with Polygons':
+            rgb_img = get_colored_mask_image(
+                rgb_img, output['prediction_mask'], self.deployment.class_colors_arr,
+                ignore_background=self.ignore_background)
+        else:
+            draw_tfod_bboxes(output['detections'], rgb_img,
+                             self.deployment.category_index,
+                             self.conf_threshold)
+        return cv2.cvtColor(rgb_img, cv2.COLOR_RGB2BGR)
+
+    # ********************************* Main job *********************************
+
+    def run(self, input_path: Path, output_dir: Path,
+            progress_callback: ProgressCallback = None) -> BatchInspectionSummary:
+        """Run the batch inspection on all images and videos found in `input_path`.
+
+        The results are written to `output_dir / 'results.csv'`, and the annotated
+        outputs (if `save_annotated`) to `output_dir / 'annotated'` with the same
+        subfolders as the inputs."""
+        root_dir, image_paths, video_paths = collect_inputs(input_path)
+        output_dir = Path(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        annotated_dir = output_dir / 'annotated'
+        if self.save_annotated:
+            os.makedirs(annotated_dir, exist_ok=True)
+
+        tasks: List[Tuple[Callable, tuple]] = []
+        for i in range(0, len(image_paths), self.batch_size):
+            tasks.append((self._load_image_batch,
+                          (image_paths[i: i + self.batch_size], root_dir)))
+        total = len(image_paths)
+
+        video_info: Dict[str, Tuple[float, Tuple[int, int]]] = {}
+        for video_path in video_paths:
+            source = get_source_name(video_path, root_dir)
+            num_frames, fps, frame_size = get_video_frame_count(video_path)
+            video_info[source] = (fps / self.frame_step, frame_size)
+            frame_indices = list(range(0, num_frames, self.frame_step))
+            total += len(frame_indices)
+            for i in range(0, len(frame_indices), self.batch_size):
+                tasks.append((self._load_video_batch,
+                              (video_path, source,
+                               frame_indices[i: i + self.batch_size])))
+
+        summary = BatchInspectionSummary(total=total)
+        summary.csv_path = output_dir / 'results.csv'
+        if self.save_annotated:
+            summary.annotated_dir = annotated_dir
+        if total == 0:
+            logger.warning(f"No images or videos found in {input_path}")
+            return summary
+
+        logger.info(f"Running batch inspection on {len(image_paths)} images and "
+                    f"{len(video_paths)} videos ({total} items in total) with "
+                    f"batch_size={self.batch_size}, num_workers={self.num_workers}")
+
+        vid_writers: Dict[str, cv2.VideoWriter] = {}
+        csv_writer: DictWriter = None
+        start_time = perf_counter()
+        with open(summary.csv_path, 'w', newline='') as csv_file:
+            try:
+                for batch, failed in self._iter_batches(tasks):
+                    summary.failed.extend(failed)
+                    outputs = self.predict_batch(batch)
+                    for i, ((source, frame_idx), output) in enumerate(
+                            zip(batch.keys, outputs)):
+                        results = self.get_results(output, source, frame_idx)
+                        if not results and self.deployment_type == \
+                                'Object Detection with Bounding Boxes':
+                            results = [self.get_no_detection_row(source, frame_idx)]
+                        if results:
+                            if csv_writer is None:
+                                csv_writer = DictWriter(
+                                    csv_file, fieldnames=results[0].keys(),
+                                    extrasaction='ignore')
+                                csv_writer.writeheader()
+                            csv_writer.writerows(results)
+                            summary.num_results += len(results)
+
+                        if self.save_annotated:
+                            drawn = self.draw_output(batch.images[i], output)
+                            out_path = annotated_dir / source
+                            os.makedirs(out_path.parent, exist_ok=True)
+                            if source in video_info:
+                                vid_writer = vid_writers.get(source)
+                                if vid_writer is None:
+                                    fps, frame_size = video_info[source]
+                                    # keep the original extension in the name to
+                                    # avoid overwriting videos with the same stem
+                                    if out_path.suffix.lower() != '.mp4':
+                                        out_path = out_path.with_name(
+                                            f"{out_path.name}.mp4")
+                                    vid_writer = cv2.VideoWriter(
+                                        str(out_path), cv2.VideoWriter_fourcc(*'mp4v'),
+                                        fps, frame_size)
+                                    vid_writers[source] = vid_writer
+                                vid_writer.write(drawn)
+                            else:
+                                cv2.imwrite(str(out_path), drawn)
+
+                    summary.processed += len(batch.keys) + len(failed)
+                    elapsed = perf_counter() - start_time
+                    rate = summary.processed / elapsed if elapsed > 0 else 0
+                    eta = (total - summary.processed) / rate if rate > 0 else 0
+                    logger.debug(f"Batch inspection: {summary.processed}/{total} "
+                                 f"({rate:.2f} items/sec, ETA {eta:.1f}s)")
+                    if progress_callback is not None:
+                        progress_callback(summary.processed, total, eta)
+            finally:
+                for vid_writer in vid_writers.values():
+                    # must release to properly close the video file
+                    vid_writer.release()
+
+        summary.elapsed = perf_counter() - start_time
+        logger.info(f"Batch inspection done: {summary.processed} items in "
+                    f"{summary.elapsed:.2f}s ({summary.items_per_sec:.2f} items/sec), "
+                    f"{summary.num_results} result rows saved to {summary.csv_path}")
+        if summary.failed:
+            logger.warning(f"{len(summary.failed)} images failed to be read")
+        return summary
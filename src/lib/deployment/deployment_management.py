@@ -67,8 +67,9 @@ if TYPE_CHECKING:
     from training.model_management import Model
 from machine_learning.visuals import create_class_colors, draw_tfod_bboxes, get_colored_mask_image
 from machine_learning.command_utils import export_tfod_savedmodel
+from deployment.frame_preprocessor import FramePreprocessor
 from deployment.utils import (
-    classification_inference_pipeline, reset_video_deployment, reset_client,
+    classification_inference_pipeline, reset_video_deployment, reset_client, reset_inference_server,
     reset_csv_file_and_writer, reset_record_and_vid_writer, segment_inference_pipeline, tfod_inference_pipeline)
 # <<<<<<<<<<<<<<<<<<<<<<TEMP<<<<<<<<<<<<<<<<<<<<<<<
 
@@ -129,6 +130,10 @@ class DeploymentConfig:
     # to store the title/view for multiple cameras
     # camera_titles: Dict[int, str] = field(default_factory=dict)
     camera_titles: List[str] = field(default_factory=lambda: [''])
+    # target frame rate for each camera (0 for unlimited) and the priority weights
+    # for the FrameScheduler when it cannot reach the target frame rates
+    camera_target_fps: List[int] = field(default_factory=lambda: [0])
+    camera_priorities: List[float] = field(default_factory=lambda: [1.0])
     retention_period: int = 7
     # whether is publishing inference results or not
     publishing: bool = True
@@ -376,6 +381,17 @@ class Deployment(BaseDeployment):
                 image_size=self.image_size, class_colors=self.class_colors_arr,
                 **kwargs)
 
+    def create_frame_preprocessor(self) -> FramePreprocessor:
+        """Create a `FramePreprocessor` with reusable buffers for one video source,
+        to pass to `get_inference_pipeline(preprocessor=...)`."""
+        if self.deployment_type == 'Image Classification':
+            return FramePreprocessor(self.image_size,
+                                     preprocess_fn=self.preprocess_fn)
+        elif self.deployment_type == 'Semantic Segmentation with Polygons':
+            return FramePreprocessor(self.image_size)
+        # TFOD only needs the RGB input buffer
+        return FramePreprocessor()
+
     def get_classification_results(self, pred_classname: str, probability: float,
                                    timezone: str, camera_title: str = '', **kwargs):
         results = [{'name': pred_classname,
@@ -432,13 +448,15 @@ class Deployment(BaseDeployment):
     def get_frame_save_dir(self, save_type: str = 'video') -> Path:
         """To save frames or record videos. 
 
-        `save_type` should be either `'video'`, 'NG', or `'image'.`"""
+        `save_type` should be either `'video'`, 'NG', `'batch'`, or `'image'.`"""
         if save_type == 'video':
             dirname = 'video-recordings'
         elif save_type == 'NG':
             dirname = 'NG-images'
         elif save_type == 'csv-labels':
             dirname = 'labels_to_check'
+        elif save_type == 'batch':
+            dirname = 'batch-inspection'
         else:
             dirname = 'saved-frames'
         record_dir = self.project_path / dirname
@@ -569,12 +587,16 @@ class Deployment(BaseDeployment):
         reset_record_and_vid_writer()
         reset_csv_file_and_writer()
         reset_client()
+        reset_inference_server()
 
         project_attributes = [
             "deployment_pagination", "deployment", "trainer", "publishing",
             "refresh", "deployment_conf", "today", "mqtt_conf",
-            "image_idx", "check_labels", "working_ports"
+            "image_idx", "check_labels", "working_ports", "memory_snapshot"
         ]
+        if 'memory_monitor' in session_state:
+            session_state.memory_monitor.stop_tracing()
+            del session_state['memory_monitor']
 
         reset_page_attributes(project_attributes)
 
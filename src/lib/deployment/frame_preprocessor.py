@@ -0,0 +1,195 @@
+"""
+Title: Frame Preprocessor
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Per-camera preprocessing with preallocated buffers for the video deployment loop.
+
+`preprocess_image()` allocates a new array for each of cvtColor, resize and the
+float32 rescaling for every frame. `FramePreprocessor` keeps its own buffers and uses
+the `dst=` forms of the OpenCV functions to write straight into a slot of the
+preallocated model input batch, so there is almost no allocation per frame once the
+buffers are created for the first frame.
+
+Run this file directly for the allocation-count benchmark:
+    python frame_preprocessor.py --frames 200 --image-size 224
+"""
+import argparse
+import sys
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, Optional
+
+import cv2
+import numpy as np
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.memory import BufferPool
+
+
+class FramePreprocessor:
+    def __init__(self, image_size: Optional[int] = None, batch_size: int = 1,
+                 preprocess_fn: Callable = None, rescale: bool = True) -> None:
+        """
+        Args:
+            image_size (Optional[int]): Input size of the model. Not required for
+                TFOD which takes in the original image. Defaults to None.
+            batch_size (int, optional): Number of slots in the input batch.
+                Defaults to 1.
+            preprocess_fn (Callable, optional): Model-specific preprocessing function,
+                e.g. `preprocess_input` of Keras applications. Same as in
+                `preprocess_image()`, `rescale` is ignored if this is provided.
+            rescale (bool, optional): Whether to rescale to [0, 1]. Defaults to True.
+        """
+        self.image_size = image_size
+        self.preprocess_fn = preprocess_fn
+        self.rescale = rescale and preprocess_fn is None
+        self.pool = BufferPool()
+        if image_size is not None:
+            # the model input tensor, each frame is written into one of its slots
+            self.input_batch = self.pool.get(
+                'input_batch', (batch_size, image_size, image_size, 3), np.float32)
+        else:
+            self.input_batch = None
+
+    def to_rgb(self, img: np.ndarray, key: str = 'rgb') -> np.ndarray:
+        """Convert the BGR `img` into a reusable RGB buffer. Note that the returned
+        array is overwritten on the next call with the same `key`."""
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB,
+                            dst=self.pool.get_like(key, img))
+
+    def to_rgb_batch(self, img: np.ndarray) -> np.ndarray:
+        """Convert the BGR `img` into a reusable uint8 RGB batch of one image
+        with shape (1, H, W, 3), e.g. for the TFOD model input."""
+        batch = self.pool.get('rgb_batch', (1, *img.shape), img.dtype)
+        cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=batch[0])
+        return batch
+
+    def preprocess(self, img: np.ndarray, slot: int = 0,
+                   bgr2rgb: bool = True) -> np.ndarray:
+        """Same output as `preprocess_image()` but written into `self.input_batch[slot]`,
+        which is returned.
+
+        Resizing is done before the color conversion to convert less pixels, this
+        gives the identical result because both the conversion and the
+        INTER_NEAREST_EXACT interpolation work on individual pixels."""
+        size = self.image_size
+        resized = cv2.resize(img, (size, size),
+                             dst=self.pool.get('resized', (size, size, 3)),
+                             interpolation=cv2.INTER_NEAREST_EXACT)
+        if bgr2rgb:
+            resized = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB,
+                                   dst=self.pool.get('resized_rgb', (size, size, 3)))
+
+        out = self.input_batch[slot]
+        if self.preprocess_fn is not None:
+            np.copyto(out, resized)
+            # Keras `preprocess_input` functions modify float arrays in-place
+            result = self.preprocess_fn(out)
+            if result is not out:
+                np.copyto(out, result)
+        elif self.rescale:
+            np.divide(resized, np.float32(255.0), out=out)
+        else:
+            np.copyto(out, resized)
+        return out
+
+
+def benchmark_allocations(num_frames: int = 200, image_size: int = 224,
+                          frame_shape=(720, 1280, 3), warmup: int = 10
+                          ) -> Dict[str, Dict[str, float]]:
+    """Compare `preprocess_image()` with `FramePreprocessor.preprocess()` in steady
+    state (after `warmup` frames).
+
+    The bytes allocated per frame are measured with `tracemalloc`, which also sees the
+    OpenCV outputs because the Python bindings allocate them through NumPy. Tracing is
+    restarted for every frame to get the peak of that frame alone (`reset_peak()` is
+    only available from Python 3.9)."""
+    from machine_learning.utils import preprocess_image
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, frame_shape, dtype=np.uint8) for _ in range(4)]
+    preprocessor = FramePreprocessor(image_size)
+
+    funcs = {
+        'preprocess_image': lambda img: preprocess_image(img, image_size),
+        'FramePreprocessor': lambda img: preprocessor.preprocess(img),
+    }
+    assert np.allclose(funcs['preprocess_image'](frames[0]),
+                       funcs['FramePreprocessor'](frames[0])), \
+        "FramePreprocessor output is different from preprocess_image()"
+
+    results = {}
+    for name, func in funcs.items():
+        for i in range(warmup):
+            func(frames[i % len(frames)])
+        num_buffer_allocations = preprocessor.pool.num_allocations
+
+        start = perf_counter()
+        for i in range(num_frames):
+            func(frames[i % len(frames)])
+        elapsed = perf_counter() - start
+
+        allocated = []
+        for i in range(num_frames):
+            tracemalloc.start()
+            out = func(frames[i % len(frames)])
+            allocated.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            del out
+
+        results[name] = {
+            'ms_per_frame': elapsed / num_frames * 1000,
+            'bytes_per_frame': float(np.mean(allocated)),
+        }
+        if name == 'FramePreprocessor':
+            # new buffers allocated after the warmup, should stay 0
+            results[name]['new_buffers'] = (preprocessor.pool.num_allocations
+                                            - num_buffer_allocations)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Allocation benchmark of frame preprocessing")
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--width', type=int, default=1280)
+    args = parser.parse_args()
+
+    results = benchmark_allocations(args.frames, args.image_size,
+                                    (args.height, args.width, 3))
+    print(f"{'':<20}{'ms/frame':>12}{'bytes allocated/frame':>24}")
+    for name, r in results.items():
+        print(f"{name:<20}{r['ms_per_frame']:>12.3f}{r['bytes_per_frame']:>24,.0f}")
+    print(f"New buffers allocated by FramePreprocessor after warmup: "
+          f"{results['FramePreprocessor']['new_buffers']}")
+
+
+if __name__ == '__main__':
+    main()
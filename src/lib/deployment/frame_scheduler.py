@@ -0,0 +1,204 @@
+"""
+Title: Frame Scheduler
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Decide which camera to run inference on next in the video deployment loop, instead of
+simply round-robin through all the cameras.
+
+Each camera has a target FPS (0 for unlimited) and a priority weight. The camera that
+is the most overdue relative to its own frame period (weighted by its priority) is
+selected next, and the loop sleeps until the next deadline when no camera is due,
+which also acts as the maximum frame rate limiter.
+
+The actual time spent on each frame of each camera is measured, and when the total
+demand of the target FPS exceeds what the machine can process, the cameras with higher
+priorities keep their target FPS while the others are degraded down to `min_fps`.
+"""
+from dataclasses import dataclass
+from math import inf
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+
+
+@dataclass(eq=False)
+class CameraSchedule:
+    # 0 means unlimited, i.e. as fast as possible
+    target_fps: float = 0.0
+    priority: float = 1.0
+    # FPS after adapting to the measured cost, equals to target_fps if not overloaded
+    effective_fps: float = 0.0
+    last_run: float = 0.0
+    # deadline of the next frame, advanced by one period for every frame processed
+    next_due: float = 0.0
+    # exponential moving average of the seconds spent on each frame
+    cost: float = 0.0
+    achieved_fps: float = 0.0
+    num_frames: int = 0
+
+    @property
+    def period(self) -> float:
+        if self.effective_fps <= 0:
+            return 0.0
+        return 1 / self.effective_fps
+
+
+class FrameScheduler:
+    def __init__(self, target_fps: List[float], priorities: Optional[List[float]] = None,
+                 min_fps: float = 1.0, max_utilization: float = 0.9,
+                 smoothing: float = 0.2, adapt_interval: float = 1.0) -> None:
+        """
+        Args:
+            target_fps (List[float]): Target FPS for each camera, 0 for unlimited.
+            priorities (Optional[List[float]]): Priority weight for each camera,
+                higher is more important. Defaults to 1.0 for all cameras.
+            min_fps (float, optional): The lowest FPS that any camera with a target FPS
+                is degraded to under load. Defaults to 1.0.
+            max_utilization (float, optional): Fraction of time that can be planned
+                for the cameras with a target FPS, the rest is left as headroom for
+                the jitter in the frame cost. Defaults to 0.9.
+            smoothing (float, optional): Weight of the latest measurement for the
+                moving averages of cost and achieved FPS. Defaults to 0.2.
+            adapt_interval (float, optional): Seconds between re-computing the
+                effective FPS from the measured costs. Defaults to 1.0.
+        """
+        if priorities is None:
+            priorities = [1.0] * len(target_fps)
+        assert len(target_fps) == len(priorities), (
+            "Must have the same number of target FPS and priorities")
+        assert len(target_fps) > 0, "Must have at least one camera"
+        self.cameras = [
+            CameraSchedule(target_fps=max(0.0, float(fps)),
+                           priority=max(1e-3, float(p)),
+                           effective_fps=max(0.0, float(fps)))
+            for fps, p in zip(target_fps, priorities)]
+        self.min_fps = min_fps
+        self.max_utilization = max_utilization
+        self.smoothing = smoothing
+        self.adapt_interval = adapt_interval
+        self._last_adapt = perf_counter()
+
+    @property
+    def num_cameras(self) -> int:
+        return len(self.cameras)
+
+    def _round_robin_period(self) -> float:
+        """Estimated time for one frame of every camera, used as the period of
+        cameras without a target FPS to compare them with the other cameras."""
+        return max(sum(cam.cost for cam in self.cameras), 1e-3)
+
+    def next_camera(self) -> Tuple[int, float]:
+        """Returns the index of the camera to process next, and the seconds
+        to wait before processing it (0 if it is already due)."""
+        now = perf_counter()
+        if now - self._last_adapt > self.adapt_interval:
+            self.adapt()
+            self._last_adapt = now
+
+        best_idx, best_score = None, -inf
+        earliest_idx, earliest_due = 0, inf
+        for idx, cam in enumerate(self.cameras):
+            next_due = cam.next_due
+            if next_due > now:
+                if next_due < earliest_due:
+                    earliest_idx, earliest_due = idx, next_due
+                continue
+            period = cam.period or self._round_robin_period()
+            # how overdue is the camera relative to its own frame period
+            score = cam.priority * (now - next_due + period) / period
+            if score > best_score:
+                best_idx, best_score = idx, score
+
+        if best_idx is not None:
+            return best_idx, 0.0
+        return earliest_idx, earliest_due - now
+
+    def record(self, idx: int, start_time: float, end_time: float = None):
+        """Record the frame of camera `idx` which started processing at `start_time`,
+        both times are from `time.perf_counter()`."""
+        if end_time is None:
+            end_time = perf_counter()
+        cam = self.cameras[idx]
+        cost = end_time - start_time
+        alpha = self.smoothing
+        if cam.num_frames == 0:
+            cam.cost = cost
+        else:
+            cam.cost = alpha * cost + (1 - alpha) * cam.cost
+            interval = start_time - cam.last_run
+            if interval > 0:
+                fps = 1 / interval
+                cam.achieved_fps = (fps if cam.num_frames == 1
+                                    else alpha * fps + (1 - alpha) * cam.achieved_fps)
+        cam.last_run = start_time
+        cam.num_frames += 1
+        # advance from the previous deadline instead of from `start_time` to keep the
+        # average rate when a frame is a bit late, but do not let it fall behind by
+        # more than one period to avoid a burst of frames after a long stall
+        period = cam.period
+        if cam.num_frames == 1:
+            cam.next_due = start_time + period
+        else:
+            cam.next_due = max(cam.next_due + period, start_time - period)
+
+    def adapt(self):
+        """Re-compute the effective FPS of each camera with a target FPS from the
+        measured costs. The time of the unlimited cameras is not reserved as they only
+        use the time left over by the others."""
+        limited = [cam for cam in self.cameras if cam.target_fps > 0]
+        if not limited or any(cam.num_frames == 0 for cam in limited):
+            # not measured yet
+            return
+        # fraction of every second required to reach all the target FPS
+        demand = sum(cam.target_fps * cam.cost for cam in limited)
+        if demand <= self.max_utilization:
+            for cam in limited:
+                cam.effective_fps = cam.target_fps
+            return
+
+        # overloaded, reserve the minimum FPS for all cameras first ...
+        floors = {id(cam): min(cam.target_fps, self.min_fps) for cam in limited}
+        floor_demand = sum(floors[id(cam)] * cam.cost for cam in limited)
+        remaining = self.max_utilization - floor_demand
+        if remaining <= 0:
+            # cannot even reach the minimum FPS, scale them down evenly
+            scale = self.max_utilization / floor_demand
+            for cam in limited:
+                cam.effective_fps = floors[id(cam)] * scale
+            return
+
+        # ... then give the remaining time to the cameras by priority
+        for cam in sorted(limited, key=lambda c: c.priority, reverse=True):
+            floor = floors[id(cam)]
+            extra_needed = (cam.target_fps - floor) * cam.cost
+            given = min(extra_needed, remaining)
+            remaining -= given
+            cam.effective_fps = floor + (given / cam.cost if cam.cost > 0 else 0)
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [{'camera': idx,
+                 'priority': cam.priority,
+                 'target_fps': cam.target_fps,
+                 'effective_fps': round(cam.effective_fps, 2),
+                 'achieved_fps': round(cam.achieved_fps, 2),
+                 'cost_ms': round(cam.cost * 1000, 2)}
+                for idx, cam in enumerate(self.cameras)]
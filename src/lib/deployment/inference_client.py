@@ -0,0 +1,105 @@
+"""
+Title: Inference Client
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Plain client for the local HTTP inference service in `inference_server.py`.
+This only depends on `requests` so it can be copied to other machines on the line.
+
+Usage:
+    python inference_client.py image1.jpg image2.png --url http://127.0.0.1:8502
+    python inference_client.py image.jpg --concurrency 8 --repeat 50
+    python inference_client.py --metrics
+"""
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Any, Dict, List
+
+import requests
+
+DEFAULT_URL = 'http://127.0.0.1:8502'
+
+
+def predict(image_bytes: bytes, url: str = DEFAULT_URL, view: str = '',
+            timeout: float = 30.0) -> Dict[str, Any]:
+    """Send the encoded image bytes and return the JSON response with the
+    `results`, `latency_ms`, `queue_wait_ms` and `inference_ms` keys."""
+    resp = requests.post(f"{url}/predict", data=image_bytes,
+                         params={'view': view} if view else None,
+                         headers={'Content-Type': 'application/octet-stream'},
+                         timeout=timeout)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def get_health(url: str = DEFAULT_URL) -> Dict[str, Any]:
+    return requests.get(f"{url}/health", timeout=5).json()
+
+
+def get_metrics(url: str = DEFAULT_URL) -> Dict[str, Any]:
+    return requests.get(f"{url}/metrics", timeout=5).json()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Client for the local HTTP inference service")
+    parser.add_argument('images', nargs='*', help="Path(s) to the image(s)")
+    parser.add_argument('--url', default=DEFAULT_URL)
+    parser.add_argument('--view', default='', help="Camera view for the results")
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help="Number of concurrent requests to send")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="Number of times to send each image")
+    parser.add_argument('--metrics', action='store_true',
+                        help="Print the health and metrics of the service")
+    args = parser.parse_args()
+
+    if args.metrics or not args.images:
+        print(json.dumps(get_health(args.url), indent=2))
+        print(json.dumps(get_metrics(args.url), indent=2))
+        return
+
+    payloads: List[bytes] = []
+    for path in args.images:
+        with open(path, 'rb') as f:
+            payloads.append(f.read())
+    payloads = payloads * args.repeat
+
+    start = perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        responses = list(executor.map(
+            lambda b: predict(b, args.url, args.view), payloads))
+    elapsed = perf_counter() - start
+
+    if len(responses) <= len(args.images):
+        for path, resp in zip(args.images, responses):
+            print(f"{path}: {json.dumps(resp)}")
+    latencies = sorted(r['latency_ms'] for r in responses)
+    print(f"Sent {len(responses)} requests in {elapsed:.2f}s "
+          f"({len(responses) / elapsed:.2f} requests/sec), "
+          f"median latency: {latencies[len(latencies) // 2]:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
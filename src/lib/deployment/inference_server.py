@@ -0,0 +1,405 @@
+"""
+Title: Inference Server
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Local HTTP inference service for other systems on the line (e.g. PLC gateways, MES)
+to send an image and receive the inspection results as JSON, without going through
+MQTT or the Streamlit page.
+
+Concurrent requests are collected into micro-batches (up to `max_batch_size` images,
+or whatever has arrived within `max_wait_ms` of the first request) and passed through
+the model once. The requests which have already timed out while waiting in the queue
+are dropped instead of running inference on them.
+
+NOTE: the exported TFOD SavedModel has a fixed input batch size of 1, so the images of
+an object detection batch still run through the model one by one (see
+`BatchInspector.predict_batch()`), only the queueing and preprocessing are shared.
+
+Endpoints:
+
+- `POST /predict`: request body is the encoded image bytes (JPG/PNG),
+  optional query parameter `view` is used as the camera view in the results
+- `GET /health`: service and model status
+- `GET /metrics`: request counts, batch sizes and the percentiles of the total
+  latency, the queue wait and the batch inference time
+
+Refer to `deployment/inference_client.py` for a plain client.
+"""
+from __future__ import annotations
+import json
+import queue
+import sys
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from time import perf_counter, time
+from typing import Any, Deque, Dict, List, Optional, TYPE_CHECKING
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+from deployment.batch_inspection import BatchInspector, FrameBatch
+if TYPE_CHECKING:
+    from deployment.deployment_management import Deployment
+
+DEFAULT_HOST = '127.0.0.1'
+# Streamlit is using 8501
+DEFAULT_PORT = 8502
+# number of latest requests to compute the latency percentiles
+LATENCY_WINDOW = 1000
+
+
+@dataclass(eq=False)
+class InferenceRequest:
+    img: np.ndarray
+    view: str = ''
+    preprocessed: Optional[np.ndarray] = None
+    enqueued_at: float = field(default_factory=perf_counter)
+    # perf_counter() time after which the client is no longer waiting for the result
+    deadline: Optional[float] = None
+    # set by the `MicroBatcher` when it is taken from the queue
+    dequeued_at: Optional[float] = None
+    inference_ms: Optional[float] = None
+    done: threading.Event = field(default_factory=threading.Event)
+    results: Optional[List[Dict[str, Any]]] = None
+    error: Optional[str] = None
+
+
+class InferenceMetrics:
+    """Thread-safe counters and latency window for the `/metrics` endpoint."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.started_at = time()
+        self.num_requests = 0
+        self.num_errors = 0
+        self.num_expired = 0
+        self.num_batches = 0
+        self.num_batched_images = 0
+        self.latencies_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.queue_wait_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.inference_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def record_batch(self, batch_size: int, inference_ms: float):
+        with self._lock:
+            self.num_batches += 1
+            self.num_batched_images += batch_size
+            self.inference_ms.append(inference_ms)
+
+    def record_expired(self):
+        with self._lock:
+            self.num_expired += 1
+
+    def record_request(self, latency_ms: float, queue_wait_ms: float, error: bool = False):
+        with self._lock:
+            self.num_requests += 1
+            if error:
+                self.num_errors += 1
+            self.latencies_ms.append(latency_ms)
+            self.queue_wait_ms.append(queue_wait_ms)
+
+    @staticmethod
+    def _percentiles(values: Deque[float]) -> Dict[str, float]:
+        if not values:
+            return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'mean': 0.0}
+        arr = np.fromiter(values, dtype=np.float64)
+        p50, p95, p99 = np.percentile(arr, (50, 95, 99))
+        return {'p50': round(float(p50), 2), 'p95': round(float(p95), 2),
+                'p99': round(float(p99), 2), 'mean': round(float(arr.mean()), 2)}
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            avg_batch_size = (self.num_batched_images / self.num_batches
+                              if self.num_batches else 0.0)
+            return {
+                'uptime_sec': round(time() - self.started_at, 1),
+                'num_requests': self.num_requests,
+                'num_errors': self.num_errors,
+                'num_expired': self.num_expired,
+                'num_batches': self.num_batches,
+                'avg_batch_size': round(avg_batch_size, 2),
+                'latency_ms': self._percentiles(self.latencies_ms),
+                'queue_wait_ms': self._percentiles(self.queue_wait_ms),
+                'batch_inference_ms': self._percentiles(self.inference_ms),
+            }
+
+
+class MicroBatcher:
+    """Collect the `InferenceRequest`s from the HTTP handler threads into micro-batches
+    and run them through the model in a single worker thread."""
+
+    def __init__(self, inspector: BatchInspector, metrics: InferenceMetrics,
+                 max_batch_size: int = 8, max_wait_ms: float = 10.0) -> None:
+        self.inspector = inspector
+        self.metrics = metrics
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self._queue: queue.Queue[InferenceRequest] = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='MicroBatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def submit(self, request: InferenceRequest):
+        self._queue.put(request)
+
+    def _dequeue(self, timeout: float) -> Optional[InferenceRequest]:
+        """Get the next request which has not timed out yet, or None if the queue is
+        still empty after the `timeout`."""
+        end = perf_counter() + timeout
+        while True:
+            try:
+                request = self._queue.get(timeout=max(0.0, end - perf_counter()))
+            except queue.Empty:
+                return None
+            request.dequeued_at = perf_counter()
+            if request.deadline is None or request.dequeued_at < request.deadline:
+                return request
+            # the client has stopped waiting, skip the inference
+            request.error = 'Timed out waiting in the queue'
+            request.done.set()
+            self.metrics.record_expired()
+
+    def _collect_batch(self) -> List[InferenceRequest]:
+        # wake up periodically to check for the stop event
+        first = self._dequeue(timeout=0.5)
+        if first is None:
+            return []
+        batch = [first]
+        deadline = perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - perf_counter()
+            if remaining <= 0:
+                break
+            request = self._dequeue(timeout=remaining)
+            if request is None:
+                break
+            batch.append(request)
+        return batch
+
+    def _run_batch(self, requests: List[InferenceRequest]):
+        frame_batch = FrameBatch(
+            keys=[(r.view, 0) for r in requests],
+            sizes=[r.img.shape[:2] for r in requests],
+            images=[r.img for r in requests])
+        if requests[0].preprocessed is not None:
+            frame_batch.preprocessed = np.stack(
+                [r.preprocessed for r in requests])
+
+        start = perf_counter()
+        outputs = self.inspector.predict_batch(frame_batch)
+        inference_ms = (perf_counter() - start) * 1000
+        self.metrics.record_batch(len(requests), inference_ms)
+
+        for r, output in zip(requests, outputs):
+            r.inference_ms = inference_ms
+            results = self.inspector.get_results(output, r.view, 0)
+            for row in results:
+                # only for video frames
+                row.pop('frame', None)
+            r.results = results
+
+    def _run(self):
+        logger.info(f"Micro-batching worker started with max_batch_size="
+                    f"{self.max_batch_size}, max_wait={self.max_wait * 1000:.1f}ms")
+        while not self._stop_event.is_set():
+            requests = self._collect_batch()
+            if not requests:
+                continue
+            try:
+                self._run_batch(requests)
+            except Exception as e:
+                logger.error(f"Error running inference on a batch of "
+                             f"{len(requests)} images: {e}")
+                for r in requests:
+                    r.error = str(e)
+            finally:
+                for r in requests:
+                    r.done.set()
+        logger.info("Micro-batching worker stopped")
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    # set by `InferenceServer` on the server instance
+    server: _InferenceHTTPServer
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        service = self.server.service
+        if path == '/health':
+            self._send_json(service.health())
+        elif path == '/metrics':
+            self._send_json(service.metrics.to_dict())
+        else:
+            self._send_json({'error': f'Unknown path: {path}'}, 404)
+
+    def do_POST(self):
+        start = perf_counter()
+        parsed = urlparse(self.path)
+        if parsed.path != '/predict':
+            self._send_json({'error': f'Unknown path: {parsed.path}'}, 404)
+            return
+
+        service = self.server.service
+        content_length = int(self.headers.get('Content-Length', 0))
+        if content_length <= 0:
+            self._send_json({'error': 'Empty image buffer received'}, 400)
+            return
+        buffer = self.rfile.read(content_length)
+        img = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8),
+                           cv2.IMREAD_COLOR)
+        if img is None:
+            self._send_json(
+                {'error': 'Unable to decode the image, please send the encoded '
+                 'image bytes (e.g. JPG or PNG)'}, 400)
+            return
+
+        view = parse_qs(parsed.query).get('view', [''])[0]
+        # preprocessing is done here in the handler thread to run concurrently
+        # with the other requests, the batcher only needs to stack them
+        try:
+            preprocessed = service.inspector.preprocess(img)
+        except Exception as e:
+            logger.error(f"Error preprocessing the image: {e}")
+            service.metrics.record_request(
+                (perf_counter() - start) * 1000, 0.0, error=True)
+            self._send_json({'error': f'Error preprocessing the image: {e}'}, 500)
+            return
+        request = InferenceRequest(
+            img=img, view=view, preprocessed=preprocessed,
+            deadline=start + service.request_timeout)
+        service.batcher.submit(request)
+
+        if not request.done.wait(max(0.0, request.deadline - perf_counter())):
+            request.error = 'Timed out waiting for the inference result'
+        latency_ms = (perf_counter() - start) * 1000
+        # still waiting in the queue if it has not been dequeued
+        dequeued_at = request.dequeued_at or perf_counter()
+        queue_wait_ms = (dequeued_at - request.enqueued_at) * 1000
+        service.metrics.record_request(latency_ms, queue_wait_ms,
+                                       error=request.error is not None)
+
+        if request.error is not None:
+            self._send_json({'error': request.error}, 500)
+            return
+        self._send_json({'results': request.results,
+                         'latency_ms': round(latency_ms, 2),
+                         'queue_wait_ms': round(queue_wait_ms, 2),
+                         'inference_ms': round(request.inference_ms, 2)})
+
+    def log_message(self, format: str, *args):
+        # use our logger instead of printing every request to stderr
+        logger.debug(f"[InferenceServer] {self.address_string()} - {format % args}")
+
+
+class _InferenceHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    service: InferenceServer
+
+
+class InferenceServer:
+    """HTTP inference service around a loaded `Deployment`, running in background
+    threads so it can be started and stopped from the deployment page."""
+
+    def __init__(self, deployment: Deployment,
+                 host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 conf_threshold: float = 0.6, timezone: str = 'Singapore',
+                 request_timeout: float = 30.0) -> None:
+        self.deployment = deployment
+        self.host = host
+        self.port = port
+        self.request_timeout = request_timeout
+        self.inspector = BatchInspector(
+            deployment, batch_size=max_batch_size,
+            conf_threshold=conf_threshold, timezone=timezone)
+        self.metrics = InferenceMetrics()
+        self.batcher = MicroBatcher(self.inspector, self.metrics,
+                                    max_batch_size, max_wait_ms)
+        self._httpd: Optional[_InferenceHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def health(self) -> Dict[str, Any]:
+        return {'status': 'ok' if self.is_running else 'stopped',
+                'deployment_type': self.deployment.deployment_type,
+                'model_loaded': self.deployment.model is not None,
+                'max_batch_size': self.batcher.max_batch_size,
+                'max_wait_ms': self.batcher.max_wait * 1000}
+
+    def start(self):
+        if self.is_running:
+            return
+        self._httpd = _InferenceHTTPServer((self.host, self.port),
+                                           InferenceRequestHandler)
+        self._httpd.service = self
+        self.batcher.start()
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name='InferenceServer', daemon=True)
+        self._thread.start()
+        logger.info(f"Inference server started at {self.url}")
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        self.batcher.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        logger.info(f"Inference server at {self.url} stopped")
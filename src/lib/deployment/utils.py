@@ -18,14 +18,20 @@ from core.utils.log import logger
 from machine_learning.utils import classification_predict, preprocess_image, segmentation_predict, tfod_detect
 from machine_learning.visuals import draw_tfod_bboxes, get_colored_mask_image
 from path_desc import MQTT_CONFIG_PATH
+from deployment.frame_preprocessor import FramePreprocessor
 
 
 def classification_inference_pipeline(
         img: np.ndarray, model: tf.keras.Model, image_size: int,
         encoded_label_dict: Dict[int, str],
-        preprocess_fn: Callable = None, **kwargs) -> Dict[str, Any]:
-    preprocessed_img = preprocess_image(
-        img, image_size, preprocess_fn=preprocess_fn)
+        preprocess_fn: Callable = None,
+        preprocessor: FramePreprocessor = None, **kwargs) -> Dict[str, Any]:
+    """Pass in a `FramePreprocessor` to reuse its buffers for every frame."""
+    if preprocessor is not None:
+        preprocessed_img = preprocessor.preprocess(img)
+    else:
+        preprocessed_img = preprocess_image(
+            img, image_size, preprocess_fn=preprocess_fn)
     y_pred, y_proba = classification_predict(
         preprocessed_img, model, return_proba=True)
     pred_classname = encoded_label_dict.get(y_pred, 'Unknown')
@@ -40,16 +46,25 @@ def tfod_inference_pipeline(
         conf_threshold: float = 0.6,
         draw_result: bool = True,
         category_index: Dict[int, Dict[str, Any]] = None,
-        is_checkpoint: bool = False, **kwargs) -> Dict[str, Any]:
+        is_checkpoint: bool = False,
+        preprocessor: FramePreprocessor = None, **kwargs) -> Dict[str, Any]:
     """Note that if `draw_result` = True, the `img` will be converted to RGB and 
-    overwritten with the visuals."""
+    overwritten with the visuals.
+
+    If a `FramePreprocessor` is passed in, the RGB image is written into its reusable
+    input batch, so the returned `img` is overwritten on the next frame."""
     # NOTE: This step is required for TFOD!
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    if preprocessor is not None:
+        input_batch = preprocessor.to_rgb_batch(img)
+        img = input_batch[0]
+    else:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        input_batch = img
     # converted to RGB above
     channels = "RGB"
     # take note of this tensor_dtype!
     tensor_dtype = tf.float32 if is_checkpoint else tf.uint8
-    detections = tfod_detect(model, img, tensor_dtype=tensor_dtype)
+    detections = tfod_detect(model, input_batch, tensor_dtype=tensor_dtype)
     if draw_result:
         draw_tfod_bboxes(detections, img,
                          category_index,
@@ -61,15 +76,22 @@ def tfod_inference_pipeline(
 def segment_inference_pipeline(
         img: np.ndarray, model: tf.keras.Model, image_size: int,
         draw_result: bool = True, class_colors: np.ndarray = None,
-        ignore_background: bool = False, **kwargs) -> Tuple[np.ndarray, np.ndarray]:
+        ignore_background: bool = False,
+        preprocessor: FramePreprocessor = None, **kwargs) -> Tuple[np.ndarray, np.ndarray]:
     """`class_colors` can be obtained from `create_class_colors()` and MUST convert
-    to `np.ndarray` format for fast computation!"""
+    to `np.ndarray` format for fast computation!
+
+    Pass in a `FramePreprocessor` to reuse its buffers for every frame."""
     orig_H, orig_W = img.shape[:2]
     # converting here instead of inside preprocess_image() to directly pass RGB image to
     # get_colored_mask_image() to avoid converting back and forth
-    rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    preprocessed_img = preprocess_image(
-        rgb_img, image_size, bgr2rgb=False)
+    if preprocessor is not None:
+        rgb_img = preprocessor.to_rgb(img)
+        preprocessed_img = preprocessor.preprocess(rgb_img, bgr2rgb=False)
+    else:
+        rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        preprocessed_img = preprocess_image(
+            rgb_img, image_size, bgr2rgb=False)
     pred_mask = segmentation_predict(
         model, preprocessed_img, orig_W, orig_H)
     if draw_result:
@@ -295,3 +317,13 @@ def reset_client():
         del session_state['client']
         del session_state['client_connected']
         del session_state['added_video_cbs']
+
+
+def reset_inference_server():
+    """Stop the local HTTP inference server if it is running"""
+    if 'inference_server' in session_state:
+        try:
+            session_state.inference_server.stop()
+        except Exception as e:
+            logger.error(f"Could not stop the inference server: {e}")
+        del session_state['inference_server']
@@ -0,0 +1,226 @@
+"""
+Title: Annotation Index
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Cached index of the Pascal VOC XML annotations in a folder, used by `xml_to_df()`.
+
+The parsed boxes are stored in a Parquet file next to the folder, e.g.
+`Annotations/` -> `.Annotations_index.parquet`, together with the modification time
+and size of each XML file. Only the new or modified XML files are parsed again (in
+parallel processes when there are many of them), and the removed ones are dropped.
+The latest index of each folder is also kept in memory to be shared by all the
+consumers in the same process without reading the Parquet file again.
+"""
+import os
+import sys
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from threading import Lock, get_ident
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+
+XML_DF_COLUMNS = ["filename", "width", "height", "classname",
+                  "xmin", "ymin", "xmax", "ymax"]
+# columns only stored in the index file to check for changes
+FILE_COLUMNS = ["xml_file", "mtime_ns", "size"]
+# parse in worker processes only when there are more changed files than this,
+# starting the processes takes longer than parsing a few hundred small XML files
+MIN_FILES_FOR_WORKERS = 500
+
+# (mtime_ns, size) of each XML file
+FileStats = Dict[str, Tuple[int, int]]
+
+_memory_cache: Dict[str, Tuple[FileStats, pd.DataFrame]] = {}
+_cache_lock = Lock()
+
+
+def parse_voc_xml(xml_file: str) -> List[tuple]:
+    """Parse a single Pascal VOC XML file into rows with the `XML_DF_COLUMNS`."""
+    root = ET.parse(xml_file).getroot()
+    filename = root.find("filename").text
+    width = int(root.find("size").find("width").text)
+    height = int(root.find("size").find("height").text)
+    rows = []
+    for member in root.findall("object"):
+        bndbox = member.find("bndbox")
+        rows.append((
+            filename,
+            width,
+            height,
+            member.find("name").text,
+            int(bndbox.find("xmin").text),
+            int(bndbox.find("ymin").text),
+            int(bndbox.find("xmax").text),
+            int(bndbox.find("ymax").text),
+        ))
+    return rows
+
+
+def _parse_files(xml_dir: str, xml_files: List[str]) -> List[Tuple[str, List[tuple]]]:
+    return [(f, parse_voc_xml(os.path.join(xml_dir, f))) for f in xml_files]
+
+
+def get_index_path(xml_dir: Union[str, Path]) -> Path:
+    xml_dir = Path(xml_dir)
+    return xml_dir.parent / f".{xml_dir.name}_index.parquet"
+
+
+def scan_xml_files(xml_dir: Union[str, Path]) -> FileStats:
+    stats = {}
+    with os.scandir(xml_dir) as it:
+        for entry in it:
+            if entry.name.endswith('.xml') and entry.is_file():
+                stat = entry.stat()
+                stats[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    return stats
+
+
+def _load_index_file(index_path: Path) -> Optional[pd.DataFrame]:
+    if not index_path.exists():
+        return None
+    try:
+        index_df = pd.read_parquet(index_path)
+    except Exception as e:
+        logger.warning(f"Unable to read the annotation index at {index_path}, "
+                       f"parsing all the XML files again: {e}")
+        return None
+    if not set(FILE_COLUMNS + XML_DF_COLUMNS).issubset(index_df.columns):
+        return None
+    return index_df
+
+
+def _save_index_file(index_df: pd.DataFrame, index_path: Path):
+    # unique temporary file as another job could be saving the same index
+    tmp_path = index_path.with_name(
+        f"{index_path.name}.{os.getpid()}.{get_ident()}.tmp")
+    try:
+        index_df.to_parquet(tmp_path, index=False)
+        # replace atomically to not leave a partially written index
+        os.replace(tmp_path, index_path)
+    except Exception as e:
+        # e.g. no Parquet engine installed or read-only folder, works without caching
+        logger.warning(f"Unable to save the annotation index at {index_path}: {e}")
+        if tmp_path.exists():
+            os.remove(tmp_path)
+
+
+def _parse_changed_files(xml_dir: str, xml_files: List[str],
+                         num_workers: Optional[int] = None) -> List[Tuple[str, List[tuple]]]:
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    if num_workers <= 1 or len(xml_files) < MIN_FILES_FOR_WORKERS:
+        return _parse_files(xml_dir, xml_files)
+    chunksize = max(64, len(xml_files) // (num_workers * 4))
+    chunks = [xml_files[i:i + chunksize]
+              for i in range(0, len(xml_files), chunksize)]
+    # NOTE: 'spawn' because the Streamlit process has running threads
+    # and possibly TensorFlow initialized, which are not safe to fork
+    with ProcessPoolExecutor(num_workers, mp_context=get_context('spawn')) as executor:
+        results = executor.map(_parse_files, [xml_dir] * len(chunks), chunks)
+        return [parsed for chunk in results for parsed in chunk]
+
+
+def _to_index_rows(parsed: List[Tuple[str, List[tuple]]], file_stats: FileStats
+                   ) -> pd.DataFrame:
+    rows = []
+    for xml_file, xml_rows in parsed:
+        mtime_ns, size = file_stats[xml_file]
+        if not xml_rows:
+            # keep a row without a box for the XML file without any object,
+            # to not parse it again next time
+            rows.append((xml_file, mtime_ns, size) + (None,) * len(XML_DF_COLUMNS))
+        for row in xml_rows:
+            rows.append((xml_file, mtime_ns, size) + row)
+    return pd.DataFrame(rows, columns=FILE_COLUMNS + XML_DF_COLUMNS)
+
+
+def _to_xml_df(index_df: pd.DataFrame) -> pd.DataFrame:
+    xml_df = index_df.loc[index_df['classname'].notna(), XML_DF_COLUMNS]
+    dtypes = {c: 'int64' for c in XML_DF_COLUMNS if c not in ('filename', 'classname')}
+    dtypes.update(filename=object, classname=object)
+    xml_df = xml_df.astype(dtypes)
+    return xml_df.reset_index(drop=True)
+
+
+def load_annotation_index(xml_dir: Union[str, Path], use_cache: bool = True,
+                          num_workers: Optional[int] = None) -> pd.DataFrame:
+    """Get the dataframe of all the bounding boxes in the XML files in `xml_dir`,
+    with the same columns as `xml_to_df()`, ordered by the XML filenames.
+
+    Args:
+        xml_dir (Union[str, Path]): Folder of the XML files.
+        use_cache (bool, optional): Set to False to parse all the XML files again and
+            rebuild the index. Defaults to True.
+        num_workers (Optional[int], optional): Number of processes to parse the
+            changed files. Defaults to the number of CPU cores.
+    """
+    start = perf_counter()
+    xml_dir = str(Path(xml_dir).resolve())
+    if not os.path.isdir(xml_dir):
+        return pd.DataFrame(columns=XML_DF_COLUMNS)
+    file_stats = scan_xml_files(xml_dir)
+
+    with _cache_lock:
+        cached = _memory_cache.get(xml_dir)
+    if use_cache and cached is not None and cached[0] == file_stats:
+        return cached[1].copy()
+
+    index_path = get_index_path(xml_dir)
+    index_df = _load_index_file(index_path) if use_cache else None
+    if index_df is None:
+        index_df = pd.DataFrame(columns=FILE_COLUMNS + XML_DF_COLUMNS)
+
+    # the files which are unchanged since the index was saved
+    cached_stats = dict(zip(index_df['xml_file'],
+                            zip(index_df['mtime_ns'], index_df['size'])))
+    unchanged = {f for f, s in file_stats.items() if cached_stats.get(f) == s}
+    changed = sorted(set(file_stats) - unchanged)
+    num_removed = len(set(cached_stats) - set(file_stats))
+
+    if changed or num_removed or not index_path.exists():
+        parsed = _parse_changed_files(xml_dir, changed, num_workers)
+        index_df = pd.concat(
+            [index_df.loc[index_df['xml_file'].isin(unchanged)],
+             _to_index_rows(parsed, file_stats)],
+            ignore_index=True)
+        index_df = index_df.sort_values('xml_file', kind='stable', ignore_index=True)
+        _save_index_file(index_df, index_path)
+        logger.info(f"Updated annotation index of {xml_dir} in "
+                    f"{perf_counter() - start:.2f}s: parsed {len(changed)} XML files, "
+                    f"removed {num_removed}, reused {len(unchanged)}")
+
+    xml_df = _to_xml_df(index_df)
+    with _cache_lock:
+        _memory_cache[xml_dir] = (file_stats, xml_df)
+    return xml_df.copy()
@@ -0,0 +1,209 @@
+"""
+Title: Bounding Box Augmentation
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Generate the augmented images and bounding boxes for TFOD training in parallel.
+
+The annotations are indexed by filename once, then every sample (image path + its boxes)
+is augmented and saved by a pool of worker processes. Each sample has its own seed
+derived from `seed` and its index, so the output is the same regardless of the number
+of workers or which worker handles the sample. The rows are written to the CSV file in
+order as soon as the samples are done.
+"""
+import csv
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import albumentations as A
+import cv2
+import numpy as np
+import pandas as pd
+
+CSV_COLUMNS = ["filename", "width", "height", "classname",
+               "xmin", "ymin", "xmax", "ymax"]
+
+# (class_names, bboxes) of an image
+Annotation = Tuple[List[str], np.ndarray]
+# (index, image_path, output_path, class_names, bboxes, seed)
+Sample = Tuple[int, str, str, List[str], np.ndarray, int]
+# (index, width, height, class_names, bboxes) of an augmented image
+Result = Tuple[int, int, int, List[str], np.ndarray]
+
+
+@dataclass(eq=False)
+class AugmentationSummary:
+    num_images: int = 0
+    num_boxes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def images_per_sec(self) -> float:
+        return self.num_images / self.seconds if self.seconds > 0 else 0.0
+
+
+def index_annotations(xml_df: pd.DataFrame) -> Dict[str, Annotation]:
+    """Group the rows of `xml_to_df()` by filename once, instead of filtering the whole
+    dataframe for every image."""
+    return {filename: (group['classname'].tolist(),
+                       group.loc[:, 'xmin': 'ymax'].to_numpy())
+            for filename, group in xml_df.groupby('filename', sort=False)}
+
+
+def get_augmented_image_name(filename: str, idx: int) -> str:
+    """Deterministic unique name for the `idx`-th augmented sample, the same image
+    could be sampled multiple times when `train_size` is larger than the dataset."""
+    stem, ext = os.path.splitext(filename.lower())
+    return f"{stem}_{idx:06d}{ext}"
+
+
+def _init_worker(num_threads: int):
+    # each process already runs one sample at a time, avoid oversubscribing the cores
+    cv2.setNumThreads(num_threads)
+
+
+def augment_sample(sample: Sample, transform: A.Compose) -> Result:
+    """Augment and save one image, runs in the worker processes. Returns the index,
+    size of the transformed image, and the transformed class names and boxes."""
+    idx, image_path, output_path, class_names, bboxes, seed = sample
+    # Albumentations samples its parameters from both `random` and `np.random`,
+    # newer versions use their own generators which are seeded separately
+    random.seed(seed)
+    np.random.seed(seed)
+    if hasattr(transform, 'set_random_seed'):
+        transform.set_random_seed(seed)
+
+    image = cv2.imread(image_path)
+    transformed = transform(image=image, bboxes=bboxes,
+                            class_names=class_names)
+    transformed_image = transformed['image']
+    cv2.imwrite(output_path, transformed_image)
+    # the size could be changed by the transform, e.g. A.RandomSizedBBoxSafeCrop
+    height, width = transformed_image.shape[:2]
+
+    transformed_bboxes = np.array(transformed['bboxes'], dtype=np.int32)
+    # this 'class_names' key is based on the 'label_fields' in A.BboxParams()
+    # used in get_transform()
+    return idx, width, height, list(transformed['class_names']), transformed_bboxes
+
+
+class BboxAugmentationGenerator:
+    def __init__(self, transform: A.Compose, num_workers: Optional[int] = None,
+                 seed: int = 42, chunksize: int = 8) -> None:
+        """
+        Args:
+            transform (A.Compose): Transform from `get_transform()`.
+            num_workers (Optional[int], optional): Number of worker processes, 0 to run
+                in the current process. Defaults to the number of CPU cores.
+            seed (int, optional): Base seed for sampling the extra images and the
+                per-sample seeds. Defaults to 42.
+            chunksize (int, optional): Number of samples sent to a worker at a time.
+                Defaults to 8.
+        """
+        self.transform = transform
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        self.num_workers = num_workers
+        self.seed = seed
+        self.chunksize = chunksize
+
+    def create_samples(self, image_paths: List[str], annotations: Dict[str, Annotation],
+                       output_img_dir: Path, train_size: Optional[int] = None
+                       ) -> List[Sample]:
+        rng = np.random.default_rng(self.seed)
+        image_paths = list(image_paths)
+        if train_size is not None and train_size > len(image_paths):
+            # randomly select the remaining paths and extend them to the original List
+            # to make sure to go through the entire dataset for at least once
+            n_remaining = train_size - len(image_paths)
+            image_paths.extend(rng.choice(
+                image_paths, size=n_remaining, replace=True).tolist())
+
+        seeds = rng.integers(0, 2**31 - 1, size=len(image_paths))
+        samples = []
+        for idx, (image_path, seed) in enumerate(zip(image_paths, seeds)):
+            filename = os.path.basename(image_path)
+            # images without any box are still augmented but have no rows in the CSV
+            class_names, bboxes = annotations.get(
+                filename, ([], np.zeros((0, 4), dtype=np.int64)))
+            new_img_name = get_augmented_image_name(filename, idx)
+            samples.append((idx, str(image_path), str(output_img_dir / new_img_name),
+                            class_names, bboxes, int(seed)))
+        return samples
+
+    def _run(self, samples: List[Sample]) -> Iterator[Result]:
+        if self.num_workers <= 0 or len(samples) <= self.chunksize:
+            for sample in samples:
+                yield augment_sample(sample, self.transform)
+            return
+        # NOTE: 'spawn' instead of 'fork' because the Streamlit process has running
+        # threads and TensorFlow initialized, which are not safe to fork
+        with ProcessPoolExecutor(self.num_workers, mp_context=get_context('spawn'),
+                                 initializer=_init_worker, initargs=(1,)) as executor:
+            # `map()` yields the results in the order of the samples
+            yield from executor.map(augment_sample, samples,
+                                    [self.transform] * len(samples),
+                                    chunksize=self.chunksize)
+
+    def generate(self, image_paths: List[str], xml_df: pd.DataFrame,
+                 output_img_dir: Path, csv_path: Path,
+                 train_size: Optional[int] = None,
+                 progress_wrapper: Callable = None
+                 ) -> Tuple[pd.DataFrame, AugmentationSummary]:
+        """Augment the images and write the boxes of all the augmented images into
+        `csv_path`. Returns the dataframe of the CSV file and the summary.
+
+        `progress_wrapper` wraps the iterator of results for progress display,
+        e.g. `stqdm`."""
+        start = perf_counter()
+        output_img_dir.mkdir(parents=True, exist_ok=True)
+        annotations = index_annotations(xml_df)
+        samples = self.create_samples(image_paths, annotations,
+                                      output_img_dir, train_size)
+
+        results = self._run(samples)
+        if progress_wrapper is not None:
+            results = progress_wrapper(results, total=len(samples))
+
+        rows = []
+        summary = AugmentationSummary()
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_COLUMNS)
+            for idx, width, height, class_names, bboxes in results:
+                new_img_name = os.path.basename(samples[idx][2])
+                new_rows = [(new_img_name, width, height,
+                             class_name, *bbox.tolist())
+                            for bbox, class_name in zip(bboxes, class_names)]
+                writer.writerows(new_rows)
+                rows.extend(new_rows)
+                summary.num_images += 1
+                summary.num_boxes += len(new_rows)
+
+        summary.seconds = perf_counter() - start
+        return pd.DataFrame(rows, columns=CSV_COLUMNS), summary
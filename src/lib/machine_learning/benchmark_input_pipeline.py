@@ -0,0 +1,646 @@
+"""
+Title: Training Input Pipeline Benchmark
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Throughput benchmark suite of the training input pipelines, runnable from the command
+line without Streamlit:
+    - Image classification and semantic segmentation: the same `load_dataset()` and
+      `batch_dataset()` of `tf_input_pipeline.py` used by `Trainer.create_tf_dataset()`,
+      compared with the previous `tf.numpy_function` pipeline, with and without
+      augmentation, the on-disk dataset cache and the derivative store.
+    - Object detection: the TFRecord files of the TFOD API, read with interleaved
+      `TFRecordDataset` readers and decoded with the `TfExampleDecoder` of the TFOD API.
+      The augmentation is only applied on the images to measure its cost, the boxes
+      are not transformed.
+
+Starting from the default options, `num_parallel_calls` and the prefetch buffer size are
+swept one at a time. With `--model`, a Keras model is also trained on the fastest
+pipeline (end to end) and on a single batch repeated in memory (compute only), to tell
+whether the training is input-bound or compute-bound. The TFOD models are built from
+the pipeline config by the TFOD API and are not included.
+
+The datasets are synthetic by default (random full resolution camera-like images), or
+the real datasets with `--images`, `--masks` and `--records`, e.g.
+    python benchmark_input_pipeline.py --task classification --image-size 224
+    python benchmark_input_pipeline.py --task segmentation --images <DIR> --masks <DIR>
+    python benchmark_input_pipeline.py --task detection --records "<DIR>/train.record-*"
+    python benchmark_input_pipeline.py --model --report report.csv
+
+The report is printed as a table, and saved as CSV, JSON or Markdown with `--report`.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+from machine_learning.derivative_store import DerivativeStore
+from machine_learning.tf_input_pipeline import (
+    batch_dataset,
+    benchmark_dataset,
+    build_tf_augment,
+    get_classification_finish_fn,
+    get_classification_load_fn,
+    get_numpy_function_map_fns,
+    get_segmentation_finish_fn,
+    get_segmentation_load_fn,
+    is_tf_supported,
+    load_dataset,
+    prune_dataset_cache,
+    resize_image,
+)
+
+TASKS = ('classification', 'segmentation', 'detection')
+# NOTE: same names as `Trainer.deployment_type` to have the same dataset cache keys
+DEPLOYMENT_TYPES = {
+    'classification': 'Image Classification',
+    'segmentation': 'Semantic Segmentation with Polygons',
+    'detection': 'Object Detection with Bounding Boxes',
+}
+# the augmentations used when `--augmentations` is not given, all supported by
+# `TF_AUGMENTATIONS` and commonly selected for the inspection datasets
+DEFAULT_AUGMENTATIONS = {
+    'HorizontalFlip': {'p': 0.5},
+    'RandomRotate90': {'p': 0.5},
+    'RandomBrightnessContrast': {'p': 0.5},
+}
+# the image extensions read from the `--images` folder
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+# ratio of the end to end throughput to the compute only throughput, below which the
+# training is considered input-bound
+INPUT_BOUND_RATIO = 0.9
+
+
+@dataclass(eq=False)
+class PipelineOptions:
+    # 'tf' for the TF ops pipeline, 'numpy' for the previous `tf.numpy_function` one
+    impl: str = 'tf'
+    augment: bool = False
+    num_parallel_calls: int = tf.data.AUTOTUNE
+    prefetch: int = tf.data.AUTOTUNE
+    # cache the decoded and resized samples on disk, measured after the cache is filled
+    cache: bool = False
+    # read the pre-resized images from the derivative store
+    derivatives: bool = False
+
+    @property
+    def name(self) -> str:
+        name = 'TensorFlow ops' if self.impl == 'tf' else 'tf.numpy_function'
+        if self.derivatives:
+            name += ' + derivatives'
+        if self.cache:
+            name += ' + cache'
+        return name
+
+    @property
+    def key(self) -> Tuple:
+        return tuple(asdict(self).values())
+
+
+@dataclass(eq=False)
+class BenchmarkDataset:
+    task: str
+    X: List[str]
+    y: List[Any]
+    num_classes: int
+    # glob pattern of the TFRecord files for detection
+    records: Optional[str] = None
+    synthetic: bool = False
+
+    @property
+    def num_images(self) -> int:
+        return len(self.X)
+
+
+def format_autotune(value: int) -> str:
+    return 'AUTOTUNE' if value == tf.data.AUTOTUNE else str(value)
+
+
+def parse_tf_data_values(text: str) -> List[int]:
+    """Parse a comma-separated list of ints and 'autotune', e.g. '1,4,autotune'"""
+    values = []
+    for x in text.split(','):
+        x = x.strip().lower()
+        if x:
+            values.append(tf.data.AUTOTUNE if x == 'autotune' else int(x))
+    return values
+
+
+# ****************************** Datasets ******************************
+
+def random_camera_image(rng: np.random.Generator, size: Tuple[int, int]) -> np.ndarray:
+    """A smooth random background with noise, so the JPEG size and decoding cost are
+    closer to the camera images than pure noise or flat colours."""
+    height, width = size
+    small = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    image = cv2.resize(small, (width, height),
+                       interpolation=cv2.INTER_CUBIC).astype(np.float32)
+    noise = rng.normal(0, 12, (height, width, 3))
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def random_boxes(rng: np.random.Generator, width: int, height: int,
+                 max_boxes: int = 5) -> List[Tuple[int, int, int, int]]:
+    boxes = []
+    for _ in range(rng.integers(1, max_boxes + 1)):
+        w, h = rng.integers(width // 10, width // 3), rng.integers(height // 10, height // 3)
+        xmin, ymin = rng.integers(0, width - w), rng.integers(0, height - h)
+        boxes.append((int(xmin), int(ymin), int(xmin + w), int(ymin + h)))
+    return boxes
+
+
+def create_synthetic_dataset(task: str, out_dir: Path, num_images: int,
+                             source_size: Tuple[int, int], num_classes: int,
+                             seed: int = 42) -> BenchmarkDataset:
+    """Write `num_images` random JPEG images of `source_size` (height, width) with
+    their labels, masks (PNG class indices) or TFRecord files into `out_dir`."""
+    rng = np.random.default_rng(seed)
+    image_dir = out_dir / task / 'images'
+    image_dir.mkdir(parents=True, exist_ok=True)
+    height, width = source_size
+    X, y, box_rows = [], [], []
+    logger.info(f"Creating {num_images} synthetic {task} images of "
+                f"{width}x{height} at {image_dir}")
+    for i in range(num_images):
+        filename = f"{i:06d}.jpg"
+        image_path = image_dir / filename
+        image = random_camera_image(rng, source_size)
+        if task == 'segmentation':
+            mask = np.zeros((height, width), dtype=np.uint8)
+            for xmin, ymin, xmax, ymax in random_boxes(rng, width, height):
+                mask[ymin:ymax, xmin:xmax] = rng.integers(1, num_classes)
+            mask_path = out_dir / task / 'masks' / f"{i:06d}.png"
+            mask_path.parent.mkdir(parents=True, exist_ok=True)
+            cv2.imwrite(str(mask_path), mask)
+            y.append(str(mask_path))
+        elif task == 'detection':
+            for xmin, ymin, xmax, ymax in random_boxes(rng, width, height):
+                classname = f"class_{rng.integers(1, num_classes + 1)}"
+                box_rows.append((filename, width, height, classname,
+                                 xmin, ymin, xmax, ymax))
+        else:
+            y.append(int(rng.integers(0, num_classes)))
+        cv2.imwrite(str(image_path), image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        X.append(str(image_path))
+
+    records = None
+    if task == 'detection':
+        records = write_synthetic_records(box_rows, image_dir, num_classes,
+                                          out_dir / task)
+    return BenchmarkDataset(task, X, y, num_classes, records=records, synthetic=True)
+
+
+def write_synthetic_records(box_rows: List[tuple], image_dir: Path, num_classes: int,
+                            out_dir: Path) -> str:
+    from machine_learning.annotation_index import XML_DF_COLUMNS
+    from machine_learning.tfrecord_writer import write_sharded_tfrecords
+
+    labelmap_path = out_dir / 'labelmap.pbtxt'
+    # same format as `TensorFlow.label_map_to_text()`
+    with open(labelmap_path, 'w', encoding='utf-8') as f:
+        for i in range(1, num_classes + 1):
+            f.write(f"item {{\n  name: \"class_{i}\"\n  id: {i}\n}}\n")
+    df = pd.DataFrame(box_rows, columns=XML_DF_COLUMNS)
+    return write_sharded_tfrecords(df, image_dir, labelmap_path, out_dir / 'train.record',
+                                   remove_error_images=False)
+
+
+def load_real_dataset(task: str, args: argparse.Namespace) -> BenchmarkDataset:
+    if task == 'detection':
+        return BenchmarkDataset(task, [], [], args.num_classes, records=args.records)
+    X = sorted(str(p) for p in Path(args.images).iterdir()
+               if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if task == 'segmentation':
+        # the masks have the same filenames in PNG, same as the exported masks
+        y = [str(Path(args.masks) / Path(p).with_suffix('.png').name) for p in X]
+    else:
+        # the labels do not matter for the throughput
+        y = [0] * len(X)
+    return BenchmarkDataset(task, X, y, args.num_classes)
+
+
+# ****************************** Keras pipelines ******************************
+
+def get_albumentations_transform(augmentations: Dict[str, Dict[str, Any]]):
+    import albumentations as A
+    return A.Compose([getattr(A, name)(**params)
+                      for name, params in augmentations.items()])
+
+
+def build_keras_pipeline(data: BenchmarkDataset, options: PipelineOptions,
+                         augmentations: Dict[str, Dict[str, Any]], image_size: int,
+                         batch_size: int, work_dir: Path,
+                         sparse: bool = False) -> tf.data.Dataset:
+    """Same steps as `Trainer.create_tf_dataset()` for the train set."""
+    is_classification = data.task == 'classification'
+    num_classes = None if is_classification else data.num_classes
+    augmentations = augmentations if options.augment else {}
+    use_tf_augment = (options.impl == 'tf' and bool(augmentations)
+                      and is_tf_supported(augmentations))
+    transform = (get_albumentations_transform(augmentations)
+                 if augmentations and not use_tf_augment else None)
+
+    map_fns = []
+    if options.impl == 'numpy':
+        load_fn, augment_fn = get_numpy_function_map_fns(
+            image_size, num_classes, transform, sparse)
+        finish_fn = None
+        if augment_fn is not None:
+            map_fns.append(augment_fn)
+    else:
+        tf_augment = build_tf_augment(augmentations) if use_tf_augment else None
+        if is_classification:
+            load_fn = get_classification_load_fn(image_size)
+            finish_fn = get_classification_finish_fn(image_size, augment=tf_augment)
+        else:
+            load_fn = get_segmentation_load_fn(image_size)
+            finish_fn = get_segmentation_finish_fn(
+                image_size, num_classes, augment=tf_augment, sparse=sparse)
+        if transform is not None:
+            # the transforms not supported with TF ops, same as the trainer
+            _, augment_fn = get_numpy_function_map_fns(
+                image_size, num_classes, transform, sparse)
+            map_fns.append(augment_fn)
+
+    X = data.X
+    if options.derivatives:
+        X = DerivativeStore(work_dir / 'derivatives').get_paths(X, image_size)
+    ds = load_dataset(
+        X, data.y, load_fn, finish_fn,
+        num_parallel_calls=options.num_parallel_calls,
+        cache_root=work_dir / 'dataset_cache' if options.cache else None,
+        subset='benchmark', image_size=image_size,
+        deployment_type=DEPLOYMENT_TYPES[data.task])
+    return batch_dataset(ds, batch_size, map_fns=map_fns,
+                         num_parallel_calls=options.num_parallel_calls,
+                         prefetch=options.prefetch)
+
+
+# ****************************** TFOD pipeline ******************************
+
+def get_tfod_decode_fn() -> Callable:
+    """The `TfExampleDecoder` used by the TFOD API input pipeline, or a minimal
+    decoder of the same features when the TFOD API is not installed."""
+    try:
+        from object_detection.core import standard_fields as fields
+        from object_detection.data_decoders.tf_example_decoder import TfExampleDecoder
+    except ImportError:
+        logger.warning("The TFOD API is not installed, decoding the TFRecords with "
+                       "tf.io.parse_single_example instead of TfExampleDecoder")
+        features = {
+            'image/encoded': tf.io.FixedLenFeature([], tf.string),
+            'image/object/class/label': tf.io.VarLenFeature(tf.int64),
+        }
+
+        def parse(serialized: tf.Tensor):
+            example = tf.io.parse_single_example(serialized, features)
+            image = tf.io.decode_image(example['image/encoded'], channels=3,
+                                       expand_animations=False)
+            num_boxes = tf.shape(example['image/object/class/label'].values)[0]
+            return image, num_boxes
+        return parse
+
+    decoder = TfExampleDecoder()
+
+    def decode(serialized: tf.Tensor):
+        tensors = decoder.decode(serialized)
+        num_boxes = tf.shape(tensors[fields.InputDataFields.groundtruth_boxes])[0]
+        return tensors[fields.InputDataFields.image], num_boxes
+    return decode
+
+
+def build_tfod_pipeline(records: str, options: PipelineOptions,
+                        augmentations: Dict[str, Dict[str, Any]], image_size: int,
+                        batch_size: int, work_dir: Path,
+                        num_readers: int = 4) -> tf.data.Dataset:
+    """Read the TFRecord shards in parallel like the TFOD `dataset_builder`, decode,
+    resize to `image_size` (as the fixed shape resizer of the model config would) and
+    augment. Only `impl='tf'` is supported, the `derivatives` option is ignored."""
+    files = tf.data.Dataset.list_files(records, shuffle=False)
+    ds = files.interleave(tf.data.TFRecordDataset, cycle_length=num_readers,
+                          num_parallel_calls=options.num_parallel_calls)
+    decode_fn = get_tfod_decode_fn()
+
+    def load_fn(serialized: tf.Tensor):
+        image, num_boxes = decode_fn(serialized)
+        image = resize_image(image, image_size)
+        image.set_shape([image_size, image_size, 3])
+        return image, num_boxes
+
+    ds = ds.map(load_fn, num_parallel_calls=options.num_parallel_calls)
+    if options.cache:
+        cache_dir = work_dir / 'tfod_cache'
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        cache_dir.mkdir(parents=True)
+        ds = ds.cache(str(cache_dir / 'benchmark'))
+
+    augment = (build_tf_augment(augmentations)
+               if options.augment and augmentations else None)
+
+    def finish_fn(image: tf.Tensor, num_boxes: tf.Tensor):
+        image = tf.cast(image, tf.float32) / 255.0
+        if augment is not None:
+            image, _ = augment(image)
+        return image, num_boxes
+
+    return batch_dataset(ds, batch_size, map_fns=[finish_fn],
+                         num_parallel_calls=options.num_parallel_calls,
+                         prefetch=options.prefetch)
+
+
+# ****************************** Models ******************************
+
+def build_benchmark_model(task: str, image_size: int, num_classes: int,
+                          model_name: str, sparse: bool = False) -> tf.keras.Model:
+    """An untrained model of the same kind as the trainer, without downloading the
+    pretrained weights."""
+    input_shape = (image_size, image_size, 3)
+    if task == 'classification':
+        model = getattr(tf.keras.applications, model_name)(
+            weights=None, input_shape=input_shape, classes=num_classes)
+        loss = 'sparse_categorical_crossentropy'
+    else:
+        from keras_unet_collection import models
+        model = models.unet_2d(input_shape, filter_num=[16, 32, 64, 128],
+                               n_labels=num_classes, output_activation='Softmax')
+        loss = ('sparse_categorical_crossentropy' if sparse
+                else 'categorical_crossentropy')
+    model.compile(optimizer='adam', loss=loss)
+    return model
+
+
+class _EpochTimer(tf.keras.callbacks.Callback):
+    def __init__(self):
+        super().__init__()
+        self.seconds: List[float] = []
+        self._start: float = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.seconds.append(perf_counter() - self._start)
+
+
+def measure_training_throughput(model: tf.keras.Model, ds: tf.data.Dataset,
+                                num_steps: int, batch_size: int) -> float:
+    """Images/sec of `model.fit()` in the last of 2 epochs, the first one includes
+    the graph tracing."""
+    timer = _EpochTimer()
+    model.fit(ds.repeat(), epochs=2, steps_per_epoch=num_steps,
+              callbacks=[timer], verbose=0)
+    return num_steps * batch_size / timer.seconds[-1]
+
+
+# ****************************** Benchmark ******************************
+
+def get_pipeline_variants(base: PipelineOptions, include_numpy: bool,
+                          include_derivatives: bool,
+                          num_parallel_calls: Sequence[int],
+                          prefetch: Sequence[int]) -> List[PipelineOptions]:
+    """The main combinations of the options, then one option swept at a time from
+    the defaults with augmentation."""
+    variants = []
+    for augment in (False, True):
+        if include_numpy:
+            variants.append(replace(base, impl='numpy', augment=augment))
+        variants.append(replace(base, augment=augment))
+    augmented = replace(base, augment=True)
+    variants.append(replace(augmented, cache=True))
+    if include_derivatives:
+        variants.append(replace(augmented, derivatives=True))
+        variants.append(replace(augmented, derivatives=True, cache=True))
+    variants.extend(replace(augmented, num_parallel_calls=n) for n in num_parallel_calls)
+    variants.extend(replace(augmented, prefetch=n) for n in prefetch)
+
+    unique = {}
+    for options in variants:
+        unique.setdefault(options.key, options)
+    return list(unique.values())
+
+
+def make_row(data: BenchmarkDataset, options: PipelineOptions, stage: str,
+             images_per_sec: float) -> Dict[str, Any]:
+    return {
+        'task': data.task,
+        'dataset': 'synthetic' if data.synthetic else 'real',
+        'stage': stage,
+        'pipeline': options.name,
+        'augment': options.augment,
+        'num_parallel_calls': format_autotune(options.num_parallel_calls),
+        'prefetch': format_autotune(options.prefetch),
+        'images/sec': round(images_per_sec, 1),
+    }
+
+
+def benchmark_task(data: BenchmarkDataset, args: argparse.Namespace,
+                   augmentations: Dict[str, Dict[str, Any]],
+                   work_dir: Path) -> List[Dict[str, Any]]:
+    is_detection = data.task == 'detection'
+    variants = get_pipeline_variants(
+        PipelineOptions(), include_numpy=not is_detection and not args.skip_numpy,
+        include_derivatives=not is_detection,
+        num_parallel_calls=args.num_parallel_calls, prefetch=args.prefetch)
+
+    def build(options: PipelineOptions) -> tf.data.Dataset:
+        if is_detection:
+            return build_tfod_pipeline(data.records, options, augmentations,
+                                       args.image_size, args.batch_size, work_dir,
+                                       num_readers=args.num_readers)
+        return build_keras_pipeline(data, options, augmentations, args.image_size,
+                                    args.batch_size, work_dir, args.sparse_labels)
+
+    rows = []
+    best: Tuple[float, PipelineOptions] = (0.0, None)
+    for options in variants:
+        ds = build(options)
+        if options.cache:
+            # fill the cache first, to measure the later epochs and training runs
+            for _ in ds:
+                pass
+        images_per_sec = benchmark_dataset(ds, args.epochs)
+        logger.info(f"[{data.task}] {options.name}, augment={options.augment}, "
+                    f"num_parallel_calls={format_autotune(options.num_parallel_calls)}, "
+                    f"prefetch={format_autotune(options.prefetch)}: "
+                    f"{images_per_sec:.1f} images/sec")
+        rows.append(make_row(data, options, 'input only', images_per_sec))
+        if options.augment and images_per_sec > best[0]:
+            best = (images_per_sec, options)
+
+    if args.model and not is_detection and best[1] is not None:
+        rows.extend(benchmark_model(data, args, best[1], build))
+    return rows
+
+
+def benchmark_model(data: BenchmarkDataset, args: argparse.Namespace,
+                    options: PipelineOptions,
+                    build: Callable[[PipelineOptions], tf.data.Dataset]
+                    ) -> List[Dict[str, Any]]:
+    model_name = args.model_name if data.task == 'classification' else 'unet_2d'
+    logger.info(f"[{data.task}] Training {model_name} on the {options.name} pipeline")
+    num_steps = max(1, data.num_images // args.batch_size)
+    ds = build(options)
+    model = build_benchmark_model(data.task, args.image_size, data.num_classes,
+                                  args.model_name, args.sparse_labels)
+    # the same batch in memory, i.e. the maximum throughput of the model
+    compute_only = measure_training_throughput(
+        model, ds.take(1).cache(), num_steps, args.batch_size)
+    end_to_end = measure_training_throughput(model, ds, num_steps, args.batch_size)
+    tf.keras.backend.clear_session()
+
+    bound = ('input-bound' if end_to_end < INPUT_BOUND_RATIO * compute_only
+             else 'compute-bound')
+    logger.info(f"[{data.task}] {model_name}: {compute_only:.1f} images/sec compute "
+                f"only, {end_to_end:.1f} images/sec end to end, {bound}")
+    rows = [make_row(data, options, f"{model_name} compute only", compute_only),
+            make_row(data, options, f"{model_name} end to end ({bound})", end_to_end)]
+    return rows
+
+
+def add_speedup(df: pd.DataFrame) -> pd.DataFrame:
+    """Speedup relative to the default pipeline without augmentation of each task."""
+    is_base = ((df['stage'] == 'input only') & (df['pipeline'] == 'TensorFlow ops')
+               & ~df['augment'] & (df['num_parallel_calls'] == 'AUTOTUNE')
+               & (df['prefetch'] == 'AUTOTUNE'))
+    base = df[is_base].set_index('task')['images/sec']
+    df['speedup'] = (df['images/sec'] / df['task'].map(base)).round(2)
+    return df
+
+
+def save_report(df: pd.DataFrame, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == '.json':
+        df.to_json(path, orient='records', indent=2)
+    elif path.suffix == '.md':
+        try:
+            # NOTE: requires the optional `tabulate` package
+            report = df.to_markdown(index=False)
+        except ImportError:
+            logger.warning("`tabulate` is not installed, saving the Markdown report "
+                           "as a plain text table instead")
+            report = f"```\n{df.to_string(index=False)}\n```\n"
+        path.write_text(report)
+    else:
+        df.to_csv(path, index=False)
+    logger.info(f"Saved the benchmark report at {path}")
+
+
+def parse_args(argv: Sequence[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Throughput benchmark suite of the training input pipelines")
+    parser.add_argument('--task', choices=TASKS + ('all',), default='all')
+    parser.add_argument('--images', default=None,
+                        help="Folder of the real images, instead of the synthetic ones")
+    parser.add_argument('--masks', default=None,
+                        help="Folder of the real masks with the same filenames (in PNG)")
+    parser.add_argument('--records', default=None,
+                        help="Glob pattern of the real TFRecord files for detection")
+    parser.add_argument('--num-classes', type=int, default=3,
+                        help="Number of classes, including background for segmentation")
+    parser.add_argument('--sparse-labels', action='store_true',
+                        help="Yield uint8 class-index masks instead of one-hot masks")
+    parser.add_argument('--num-images', type=int, default=256,
+                        help="Number of synthetic images")
+    parser.add_argument('--source-size', type=int, nargs=2, default=(1080, 1440),
+                        metavar=('HEIGHT', 'WIDTH'),
+                        help="Resolution of the synthetic images")
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--num-parallel-calls', type=parse_tf_data_values,
+                        default='1,2,4,autotune',
+                        help="Values to sweep, e.g. '1,4,autotune'")
+    parser.add_argument('--prefetch', type=parse_tf_data_values, default='0,1,autotune',
+                        help="Values to sweep, 0 for no prefetch")
+    parser.add_argument('--num-readers', type=int, default=4,
+                        help="Number of parallel TFRecord readers for detection")
+    parser.add_argument('--augmentations', default=None,
+                        help="Path to a JSON file of {transform_name: params}, same "
+                        "as the `augmentations` of AugmentationConfig")
+    parser.add_argument('--skip-numpy', action='store_true',
+                        help="Skip the previous tf.numpy_function pipeline")
+    parser.add_argument('--model', action='store_true',
+                        help="Also train a model to check if it is input-bound")
+    parser.add_argument('--model-name', default='MobileNetV2',
+                        help="Keras application for classification")
+    parser.add_argument('--work-dir', default=None,
+                        help="Folder for the synthetic datasets and the caches, "
+                        "a temporary folder removed at the end by default")
+    parser.add_argument('--report', default=None,
+                        help="Save the report as .csv, .json or .md")
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str] = None) -> pd.DataFrame:
+    args = parse_args(argv)
+    tasks = TASKS if args.task == 'all' else (args.task,)
+    augmentations = DEFAULT_AUGMENTATIONS
+    if args.augmentations:
+        with open(args.augmentations) as f:
+            augmentations = json.load(f)
+
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix='input_benchmark_'))
+    rows = []
+    try:
+        for task in tasks:
+            use_real = (args.records if task == 'detection' else args.images) and \
+                (task != 'segmentation' or args.masks)
+            if use_real:
+                data = load_real_dataset(task, args)
+            else:
+                data = create_synthetic_dataset(
+                    task, work_dir / 'synthetic', args.num_images,
+                    tuple(args.source_size), args.num_classes)
+            rows.extend(benchmark_task(data, args, augmentations, work_dir))
+            prune_dataset_cache(work_dir / 'dataset_cache')
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    df = add_speedup(pd.DataFrame(rows))
+    print(f"\nbatch size {args.batch_size}, image size {args.image_size}, "
+          f"augmentations: {list(augmentations)}, CPU cores: {os.cpu_count()}")
+    print(df.to_string(index=False))
+    if args.report:
+        save_report(df, Path(args.report))
+    return df
+
+
+if __name__ == '__main__':
+    main()
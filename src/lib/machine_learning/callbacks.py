@@ -1,12 +1,14 @@
 import datetime as dt
 from time import perf_counter
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 import streamlit as st
 from streamlit import session_state
 from tensorflow.keras.callbacks import Callback, TensorBoard
 from tensorflow import keras
 
+from training.progress_recorder import ProgressRecorder
+
 from .visuals import PrettyMetricPrinter
 
 
@@ -16,13 +18,16 @@ K = keras.backend
 class StreamlitOutputCallback(Callback):
     def __init__(self, pretty_metric_printer: PrettyMetricPrinter,
                  num_epochs, steps_per_epoch, progress_placeholder: Dict[str, Any],
-                 refresh_rate: int = 20, update_metrics: bool = True):
+                 refresh_rate: int = 20, update_metrics: bool = True,
+                 progress_recorder: Optional[ProgressRecorder] = None):
         self.pretty_metric = pretty_metric_printer
         self.num_epochs = num_epochs
         self.steps_per_epoch = steps_per_epoch
         self.refresh_rate = refresh_rate
         self.progress_placeholder = progress_placeholder
         self.update_metrics = update_metrics
+        # to save the progress and metrics to database in batches
+        self.progress_recorder = progress_recorder
 
         self._start: float = None
 
@@ -76,8 +81,15 @@ class StreamlitOutputCallback(Callback):
         st.markdown('___')
 
         if self.update_metrics:
-            session_state.new_training.update_progress({'Epoch': epoch})
-            session_state.new_training.update_metrics(logs)
+            if self.progress_recorder is not None:
+                self.progress_recorder.record({'Epoch': epoch}, logs, step=epoch)
+            else:
+                session_state.new_training.update_progress({'Epoch': epoch})
+                session_state.new_training.update_metrics(logs)
+
+    def on_train_end(self, logs=None):
+        if self.update_metrics and self.progress_recorder is not None:
+            self.progress_recorder.flush()
 
 
 class LRTensorBoard(TensorBoard):
@@ -90,3 +102,32 @@ class LRTensorBoard(TensorBoard):
         logs = logs or {}
         logs.update({'learning_rate': K.eval(self.model.optimizer.lr)})
         super().on_epoch_end(epoch, logs)
+
+
+class StepTimer(Callback):
+    """Measure the training steps/sec, excluding the validation at the end of every
+    epoch and the first `warmup_steps` steps which include the graph tracing (and the
+    XLA compilation if enabled)."""
+
+    def __init__(self, warmup_steps: int = 5):
+        super().__init__()
+        self.warmup_steps = warmup_steps
+        self.num_steps: int = 0
+        self.seconds: float = 0.0
+        self._total_steps: int = 0
+        self._start: float = None
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._start = perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._total_steps += 1
+        if self._total_steps > self.warmup_steps:
+            self.num_steps += 1
+            self.seconds += perf_counter() - self._start
+
+    @property
+    def steps_per_sec(self) -> Optional[float]:
+        if not self.num_steps:
+            return None
+        return self.num_steps / self.seconds
@@ -10,6 +10,7 @@ from time import sleep
 import re
 from typing import Dict, List, Optional, Tuple, Union
 from tempfile import gettempdir
+from threading import Thread
 import numpy as np
 
 import streamlit as st
@@ -19,6 +20,7 @@ from core.streamlit_tensorboard import st_tensorboard
 
 from path_desc import TFOD_DIR
 
+from .event_tailer import EventFileTailer, StepMetrics
 from .visuals import pretty_st_metric, PrettyMetricPrinter
 from core.utils.log import logger
 
@@ -346,22 +348,31 @@ def run_command_update_metrics_old(
 def run_command_update_metrics(
     command_line_args: str,
     total_steps: int,
+    model_dir: Union[str, Path],
     stdout_output: bool = True,
     step_name: str = 'Step',
-    pretty_print: Optional[bool] = False
+    pretty_print: Optional[bool] = False,
+    log_every_n_steps: int = 100,
+    poll_interval: float = 2.0
 ) -> str:
-    """Run the command for TFOD training script and update the metrics by extracting them
-    from the script output in real time.
+    """Run the command for TFOD training script and update the metrics by reading them
+    from the TensorBoard event files written by the script in real time.
 
     Args:
         command_line_args (str): Command line arguments to run.
         total_steps (int): total training steps, used to calculate ETA to complete training.
+        model_dir (Union[str, Path]): The `--model_dir` of the training script, the
+            event files are written in the 'train' folder inside.
         stdout_output (bool, optional): Set `stdout_output` to True to
             show the console outputs LIVE on terminal. Defaults to True.
         step_name (str, optional): The key name used to store our training step progress.
             Should be 'Step' for now. Defaults to 'Step'.
         pretty_print (bool, optional): Set `pretty_print` to True to show prettier `command_line_args`.
             Defaults to False.
+        log_every_n_steps (int, optional): Show and record the metrics every this number
+            of steps, same as the console logging of the training script. Defaults to 100.
+        poll_interval (float, optional): Seconds between reading the event files.
+            Defaults to 2.0.
 
     Returns:
         str: Traceback message (empty string if no error)
@@ -373,6 +384,8 @@ def run_command_update_metrics(
         # must pass in list to the subprocess when shell=False, which
         # is required to work properly in Linux
         command_line_args = shlex.split(command_line_args)
+    # the summaries of the previous training are skipped when continuing the training
+    tailer = EventFileTailer(Path(model_dir) / 'train', skip_existing=True)
     process = subprocess.Popen(command_line_args, shell=False,
                                # stdout to capture all output
                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
@@ -381,18 +394,18 @@ def run_command_update_metrics(
     # store this process ID to kill it in case the user wants to stop the training
     session_state.process_id = process.pid
 
-    pretty_metric_printer = PrettyMetricPrinter()
-    # list of stored stdout lines
-    current_lines = []
-    # flag to track the 'Step' text
-    step_name_found = False
     # to track any traceback
-    traceback_found = False
     traceback = []
-    for line in process.stdout:
-        # avoid line with only spaces
-        line = line.rstrip()
-        if line:
+
+    def read_output():
+        # the outputs are only used to find the traceback, the metrics are read
+        # from the event files
+        traceback_found = False
+        for line in process.stdout:
+            # avoid line with only spaces
+            line = line.rstrip()
+            if not line:
+                continue
             if stdout_output:
                 # print to console
                 print(line)
@@ -400,63 +413,57 @@ def run_command_update_metrics(
                 traceback_found = True
             if traceback_found:
                 traceback.append(line)
-                continue
-            # keep storing when stored stdout lines are less than 12,
-            #  12 is the exact number of lines output by the script
-            #  that will contain all the metrics after the line
-            #  with text 'Step', e.g.:
-            """
-            INFO:tensorflow:Step 900 per-step time 0.561s
-            I0813 13:07:28.326545 139687560058752 model_lib_v2.py:700] Step 900 per-step time 0.561s
-            INFO:tensorflow:{'Loss/classification_loss': 0.34123567,
-            'Loss/localization_loss': 0.0464548,
-            'Loss/regularization_loss': 0.24863605,
-            'Loss/total_loss': 0.6363265,
-            'learning_rate': 0.025333151}
-            I0813 13:07:28.326872 139687560058752 model_lib_v2.py:701] {'Loss/classification_loss': 0.34123567,
-            'Loss/localization_loss': 0.0464548,
-            'Loss/regularization_loss': 0.24863605,
-            'Loss/total_loss': 0.6363265,
-            'learning_rate': 0.025333151}
-            """
-            if step_name in line:
-                step_name_found = True
-            if step_name_found:
-                current_lines.append(line)
-            if len(current_lines) == 12:
-                # take the first line because that's where `step_name` was found and appended first
-                _, curr_step, step_time = find_tfod_metric(
-                    step_name, current_lines[0])
-                session_state.new_training.progress[step_name] = curr_step
-                session_state.new_training.update_progress(
-                    session_state.new_training.progress, verbose=True)
-
-                text = (f"**{step_name}**: {curr_step}/{total_steps}. "
-                        f"**Per-Step Time**: {step_time:.3f}s.")
-                if curr_step != total_steps:
-                    # only show ETA when it's not final epoch
-                    eta = (total_steps - curr_step) * step_time
-                    text += f" **ETA**: {eta:.2f}s"
-                st.markdown(text)
-
-                metrics = {}
-                for line in current_lines[2:]:
-                    metric = find_tfod_metric('Loss', line)
-                    if metric:
-                        metric_name, metric_val = metric
-                        metrics[metric_name] = metric_val
-                session_state.new_training.update_metrics(
-                    metrics, verbose=True)
-
-                # show the nicely formatted metrics on Streamlit
-                pretty_metric_printer.write(metrics)
-                st.markdown("___")
-
-                # reset the list of outputs to start storing again
-                current_lines = []
-                step_name_found = False
+
+    # NOTE: must keep reading the outputs to avoid the process being blocked
+    # by a full pipe, while the Streamlit elements must be updated in this thread
+    output_thread = Thread(target=read_output, daemon=True)
+    output_thread.start()
+
+    pretty_metric_printer = PrettyMetricPrinter()
+    last_logged: Optional[StepMetrics] = None
+    latest: Optional[StepMetrics] = None
+
+    def show_and_record(step_metrics: StepMetrics):
+        curr_step = step_metrics.step
+        text = f"**{step_name}**: {curr_step}/{total_steps}."
+        if last_logged is not None and curr_step > last_logged.step:
+            step_time = ((step_metrics.wall_time - last_logged.wall_time)
+                         / (curr_step - last_logged.step))
+            text += f" **Per-Step Time**: {step_time:.3f}s."
+            if curr_step < total_steps:
+                # only show ETA when it's not final step
+                eta = (total_steps - curr_step) * step_time
+                text += f" **ETA**: {eta:.2f}s"
+        st.markdown(text)
+
+        progress = {**session_state.new_training.progress, step_name: curr_step}
+        # saved to database in batches, see `ProgressRecorder`
+        progress_recorder.record(progress, step_metrics.metrics, step=curr_step)
+
+        # show the nicely formatted metrics on Streamlit
+        pretty_metric_printer.write(step_metrics.metrics)
+        st.markdown("___")
+
+    # flushes the pending progress and metrics when the process ends or on error
+    with session_state.new_training.create_progress_recorder() as progress_recorder:
+        while True:
+            finished = process.poll() is not None
+            for step_metrics in tailer.poll():
+                latest = step_metrics
+                if last_logged is None \
+                        or step_metrics.step - last_logged.step >= log_every_n_steps:
+                    show_and_record(step_metrics)
+                    last_logged = step_metrics
+            if finished:
+                break
+            sleep(poll_interval)
+        if latest is not None and latest is not last_logged:
+            # the final step
+            show_and_record(latest)
+
     # wait for the process to terminate and check for any error
     returncode = process.wait()
+    output_thread.join()
     traceback = check_process_returncode(returncode, traceback)
 
     # ensure the child process is properly killed
@@ -469,27 +476,46 @@ def run_command_update_metrics(
 
 def export_tfod_savedmodel(training_paths: Dict[str, Path],
                            stdout_output: bool = False,
-                           re_export: bool = True) -> bool:
+                           re_export: bool = True,
+                           in_process: bool = True) -> bool:
     """
     Export TFOD model to SavedModel format.
 
-    If `re_export` is `True`, then remove any existing export directories first
-    and export again. If `False`, skip export if SavedModel files already exist.
+    If `re_export` is `True`, export again only if the latest checkpoint or the
+    `pipeline.config` has changed since the last export (see `tfod_export.py`).
+    If `False`, skip export if SavedModel files already exist.
+
+    The export runs in this process by default, set `in_process` to False to run
+    `exporter_main_v2.py` in a subprocess instead, which is also used if the
+    in-process export fails.
     """
+    from .tfod_export import (
+        export_tfod_cached,
+        get_export_checksum,
+        swap_export_dir,
+        wait_for_background_export,
+    )
+
     paths = training_paths
     savedmodel_path = paths['export'] / 'saved_model' / 'saved_model.pb'
+    # the export might be still running in the background after training
+    wait_for_background_export(paths['export'])
 
     if not re_export and savedmodel_path.exists():
         logger.info("SavedModel already exists. Skipping export.")
         return True
 
-    if paths['export'].exists():
-        # remove any existing export directory first
-        shutil.rmtree(paths['export'])
-    os.makedirs(paths['export'])
-
     with st.spinner("Exporting TensorFlow Object Detection model ... "
                     "This may take awhile ..."):
+        if in_process and export_tfod_cached(paths):
+            logger.info("Successfully exported TensorFlow Object Detection model")
+            return True
+
+        # export into a temporary directory to keep any existing export until done
+        tmp_dir = paths['export'].with_name(paths['export'].name + '.tmp')
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
         pipeline_conf_path = paths['config_file']
         FREEZE_SCRIPT = TFOD_DIR / 'research' / \
             'object_detection' / 'exporter_main_v2.py'
@@ -497,12 +523,15 @@ def export_tfod_savedmodel(training_paths: Dict[str, Path],
                    '--input_type=image_tensor '
                    f'--pipeline_config_path "{pipeline_conf_path}" '
                    f'--trained_checkpoint_dir "{paths["models"]}" '
-                   f'--output_directory "{paths["export"]}"')
+                   f'--output_directory "{tmp_dir}"')
         run_command(command, stdout_output=stdout_output)
 
-    if savedmodel_path.exists():
+    if (tmp_dir / 'saved_model' / 'saved_model.pb').exists():
+        checksum = get_export_checksum(paths['models'], pipeline_conf_path)
+        swap_export_dir(tmp_dir, paths['export'], checksum)
         logger.info("Successfully exported TensorFlow Object Detection model")
         return True
     else:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
         logger.error("Failed to export TensorFlow Object Detection model!")
         return False
@@ -0,0 +1,309 @@
+"""
+Title: Derivative Image Store
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Store of the dataset images pre-resized to the training resolution, so the training
+pipelines decode small images instead of the full resolution camera images.
+
+The derivatives are created with the same `decode_image()` and `resize_image()` of the
+TF input pipeline and saved as lossless PNG, so resizing them again to the same size
+gives exactly the same pixels as resizing the original images. They are generated in
+parallel with `tf.data` on demand, i.e. the first time the images are used for
+training at a resolution.
+
+The derivatives are content-addressed by the SHA-1 of the original image, so the same
+image in different datasets or renamed is only resized once. The hashes are stored in
+`source_index.json` by the path, size and modification time of the originals to avoid
+hashing them again. The least recently used derivatives are removed when the store is
+larger than `max_bytes`, the access time of the files is used to track the usage.
+
+The access time is not updated while the training reads the derivatives (e.g. with
+`noatime` mounts or the dataset cache), so every process also keeps a lease file of
+the derivatives it has got, which are never evicted while the process is alive.
+
+Layout of the store:
+    - `source_index.json`: "<path>|<size>|<mtime_ns>" -> SHA-1 of the original image
+    - `<image_size>/<first 2 chars of SHA-1>/<SHA-1>.png`: the derivatives
+    - `leases/<pid>.json`: the derivatives used by the process
+"""
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock, get_ident
+from time import perf_counter, time_ns
+from typing import Dict, List, Optional, Sequence, Set
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+import psutil
+
+from core.utils.log import logger
+from core.utils.materialize import hash_file
+
+# increase this when the way of creating the derivatives is changed
+DERIVATIVE_VERSION = 1
+SOURCE_INDEX_FILENAME = 'source_index.json'
+LEASE_DIRNAME = 'leases'
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+# evict until the store is below this fraction of `max_bytes` to avoid evicting
+# for every new derivative
+EVICT_TARGET_RATIO = 0.9
+# the derivatives used within this many seconds are never evicted, as they could be
+# still read by another training process
+MIN_EVICT_AGE = 3600
+
+# the stores in this process share the same lock for the source index
+_index_lock = Lock()
+
+
+def get_source_key(path: Path) -> Optional[str]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{Path(path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def touch_access_time(path: Path):
+    """Update only the access time to keep track of the recently used files, the
+    modification time is used by the dataset cache keys and must not change."""
+    try:
+        stat = os.stat(path)
+        os.utime(path, ns=(time_ns(), stat.st_mtime_ns))
+    except OSError:
+        pass
+
+
+def generate_derivatives(src_paths: Sequence[str], dst_paths: Sequence[Path],
+                         image_size: int) -> List[bool]:
+    """Resize the images with the TF input pipeline ops in parallel and save them as
+    PNG. Returns whether each derivative is created, the images which failed to be
+    decoded are skipped."""
+    import tensorflow as tf
+    from machine_learning.tf_input_pipeline import decode_image, resize_image
+
+    def encode(idx: tf.Tensor, path: tf.Tensor):
+        image = resize_image(decode_image(path), image_size)
+        return idx, tf.io.encode_png(tf.cast(image, tf.uint8))
+
+    ds = tf.data.Dataset.from_tensor_slices(
+        (list(range(len(src_paths))), list(map(str, src_paths))))
+    ds = ds.map(encode, num_parallel_calls=tf.data.AUTOTUNE)
+    # skip the corrupted images instead of stopping the whole generation
+    ds = ds.apply(tf.data.experimental.ignore_errors())
+
+    created = [False] * len(src_paths)
+    for idx, png in ds.as_numpy_iterator():
+        dst = Path(dst_paths[idx])
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        # write into a unique temporary file first as other processes could be
+        # creating the same derivative
+        tmp_path = dst.with_name(f"{dst.name}.{os.getpid()}.{get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, dst)
+        created[idx] = True
+    return created
+
+
+@dataclass(eq=False)
+class DerivativeStore:
+    root: Path
+    max_bytes: int = DEFAULT_MAX_BYTES
+    num_workers: int = field(default_factory=lambda: min(8, os.cpu_count() or 1))
+
+    def __post_init__(self):
+        self.root = Path(self.root) / f"v{DERIVATIVE_VERSION}"
+        self._source_index: Optional[Dict[str, str]] = None
+        # the derivatives leased by this store, relative to the `root`
+        self._leased: Set[str] = set()
+
+    @property
+    def source_index_path(self) -> Path:
+        return self.root / SOURCE_INDEX_FILENAME
+
+    def load_source_index(self) -> Dict[str, str]:
+        if self._source_index is None:
+            self._source_index = {}
+            if self.source_index_path.exists():
+                try:
+                    with open(self.source_index_path) as f:
+                        self._source_index = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Ignoring the invalid derivative source index: {e}")
+        return self._source_index
+
+    def save_source_index(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.source_index_path.with_name(
+            f"{SOURCE_INDEX_FILENAME}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self._source_index, f)
+        os.replace(tmp_path, self.source_index_path)
+
+    def get_source_hashes(self, image_paths: Sequence[str]) -> List[Optional[str]]:
+        """SHA-1 of the original images, None for the missing images. Only the new
+        or modified images are hashed."""
+        keys = [get_source_key(p) for p in image_paths]
+        with _index_lock:
+            index = self.load_source_index()
+            to_hash = [i for i, k in enumerate(keys)
+                       if k is not None and k not in index]
+            if to_hash:
+                with ThreadPoolExecutor(self.num_workers) as executor:
+                    hashes = executor.map(hash_file, [image_paths[i] for i in to_hash])
+                    for i, h in zip(to_hash, hashes):
+                        index[keys[i]] = h
+                self.save_source_index()
+            return [index.get(k) if k is not None else None for k in keys]
+
+    @property
+    def lease_path(self) -> Path:
+        return self.root / LEASE_DIRNAME / f"{os.getpid()}.json"
+
+    def lease(self, paths: Sequence[str]):
+        """Add the derivative `paths` to the lease file of this process, to not be
+        evicted by any process until this process exits or `release()` is called."""
+        self._leased.update(os.path.relpath(p, self.root) for p in paths)
+        self.lease_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.lease_path.with_name(
+            f"{self.lease_path.name}.{get_ident()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(sorted(self._leased), f)
+        os.replace(tmp_path, self.lease_path)
+
+    def release(self):
+        self._leased.clear()
+        try:
+            os.remove(self.lease_path)
+        except OSError:
+            pass
+
+    def get_leased_paths(self) -> Set[str]:
+        """The derivatives leased by all the processes which are still alive, the lease
+        files of the exited processes are removed."""
+        leased = set()
+        for lease_path in self.root.glob(f"{LEASE_DIRNAME}/*.json"):
+            try:
+                pid = int(lease_path.stem)
+            except ValueError:
+                continue
+            if not psutil.pid_exists(pid):
+                try:
+                    os.remove(lease_path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(lease_path) as f:
+                    leased.update(str(self.root / p) for p in json.load(f))
+            except (OSError, ValueError):
+                # being replaced by the process
+                continue
+        return leased
+
+    def get_derivative_path(self, source_hash: str, image_size: int) -> Path:
+        return self.root / str(image_size) / source_hash[:2] / f"{source_hash}.png"
+
+    def get_paths(self, image_paths: Sequence[str], image_size: int) -> List[str]:
+        """Paths to the derivatives of the `image_paths` resized to `image_size`,
+        creating the missing ones. The original path is returned for any image
+        that fails to be resized, so the outputs can always be used for training."""
+        start = perf_counter()
+        source_hashes = self.get_source_hashes(image_paths)
+        out_paths = list(map(str, image_paths))
+        missing = {}
+        for i, source_hash in enumerate(source_hashes):
+            if source_hash is None:
+                continue
+            dst = self.get_derivative_path(source_hash, image_size)
+            if dst.exists():
+                out_paths[i] = str(dst)
+            else:
+                # NOTE: duplicated images only need to be resized once
+                missing.setdefault(dst, i)
+
+        if missing:
+            logger.info(f"Resizing {len(missing)} images to {image_size}px "
+                        f"for the derivative store at {self.root}")
+            dst_paths = list(missing)
+            src_paths = [image_paths[i] for i in missing.values()]
+            created = generate_derivatives(src_paths, dst_paths, image_size)
+            num_failed = created.count(False)
+            if num_failed:
+                logger.warning(f"Failed to resize {num_failed} images, using "
+                               "the original images for them instead")
+            for i, source_hash in enumerate(source_hashes):
+                if source_hash is None:
+                    continue
+                dst = self.get_derivative_path(source_hash, image_size)
+                if dst.exists():
+                    out_paths[i] = str(dst)
+
+        used_paths = [p for p, orig in zip(out_paths, image_paths) if p != str(orig)]
+        for p in used_paths:
+            touch_access_time(p)
+        self.lease(used_paths)
+        self.evict()
+        logger.info(f"Got {len(used_paths)}/{len(out_paths)} derivative images in "
+                    f"{perf_counter() - start:.2f}s")
+        return out_paths
+
+    def evict(self, keep: Optional[set] = None):
+        """Remove the least recently used derivatives until the store is smaller than
+        `max_bytes`, except those in `keep` and those leased by the live processes,
+        which are currently used."""
+        files = []
+        total_bytes = 0
+        for path in self.root.glob('*/*/*.png'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_atime, stat.st_size, path))
+            total_bytes += stat.st_size
+        if total_bytes <= self.max_bytes:
+            return
+        keep = (keep or set()) | self.get_leased_paths()
+        target_bytes = self.max_bytes * EVICT_TARGET_RATIO
+        num_removed = 0
+        now = time_ns() / 1e9
+        for atime, size, path in sorted(files, key=lambda x: x[0]):
+            if total_bytes <= target_bytes:
+                break
+            if str(path) in keep or (now - atime) < MIN_EVICT_AGE:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            num_removed += 1
+        logger.info(f"Evicted {num_removed} least recently used derivative images, "
+                    f"the store is now {total_bytes / 1024 ** 2:.1f}MB")
@@ -0,0 +1,555 @@
+"""
+Title: Test Set Evaluation Cache
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Run the whole test set through the trained model once in batches and store the
+predictions, the per-image results and the thumbnails on disk, so paging through the
+evaluation results only needs to read the small thumbnails instead of running the
+model on every page.
+
+The cache folder contains:
+    - `manifest.json`: the keys of the model and the test set used to build the cache
+    - `predictions.npz`: the predictions and the per-image results of all the images
+    - `metrics.json`: the metrics computed from the predictions by `evaluation.py`
+    - `thumbnails/`: the resized test set images, and the predicted masks for
+        segmentation
+
+The cache is rebuilt when the model file (or the TFOD checkpoint) or the test set
+has changed. It is built in a temporary folder first and then moved into place, the
+same way as the TFOD export in `tfod_export.py`.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+import pandas as pd
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+
+from .evaluation import compute_metrics
+from .utils import preprocess_image
+
+# increase this when the format of the cache is changed to rebuild the old caches
+EVAL_CACHE_VERSION = 2
+MANIFEST_FILENAME = 'manifest.json'
+PREDICTIONS_FILENAME = 'predictions.npz'
+METRICS_FILENAME = 'metrics.json'
+# maximum width or height of the thumbnails shown in the evaluation views
+THUMBNAIL_MAX_SIZE = 480
+BATCH_SIZE = 16
+# keep the low score detections to be able to change the confidence threshold
+# without running the model again
+MIN_DETECTION_SCORE = 0.05
+
+# only build one cache at a time, the models take too much memory
+_build_lock = Lock()
+# cache_dir -> the running background build thread
+_background_builds: Dict[str, Thread] = {}
+_background_lock = Lock()
+# cache_dir -> (manifest mtime, loaded EvalCache) to page through the results
+# without reading the predictions again
+_loaded_caches: Dict[str, Tuple[int, 'EvalCache']] = {}
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def get_file_key(path: Path) -> Optional[str]:
+    """Key of the model file to invalidate the cache when the file is changed,
+    None if the file does not exist."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return f"{path.name}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def get_test_set_key(image_paths: Sequence[str], labels: Any = None) -> str:
+    """Checksum of the test set image paths with their file stats, and the labels
+    which could be the class IDs, the mask paths or the bytes of the TFOD
+    annotations."""
+    h = hashlib.sha1()
+    for p in image_paths:
+        try:
+            stat = os.stat(p)
+            h.update(f"{p}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+        except OSError:
+            h.update(f"{p}|missing\n".encode())
+    if isinstance(labels, bytes):
+        h.update(labels)
+    elif labels is not None:
+        h.update(json.dumps([str(x) for x in labels]).encode())
+    return h.hexdigest()
+
+
+def get_tfod_labels_bytes(gt_xml_df: pd.DataFrame) -> bytes:
+    """Bytes of the TFOD ground truth annotations for `get_test_set_key()`"""
+    return pd.util.hash_pandas_object(gt_xml_df, index=False).values.tobytes()
+
+
+def get_thumbnail_size(height: int, width: int,
+                       max_size: int = THUMBNAIL_MAX_SIZE) -> Tuple[int, int]:
+    """Returns the (width, height) of the thumbnail, not upscaling small images."""
+    scale = min(1.0, max_size / max(height, width))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def get_pixel_confusion(gt_mask: np.ndarray, pred_mask: np.ndarray,
+                        num_classes: int) -> np.ndarray:
+    """Confusion matrix of the pixels with the ground truth classes as rows and
+    the predicted classes as columns."""
+    if gt_mask.shape != pred_mask.shape:
+        gt_mask = cv2.resize(gt_mask, pred_mask.shape[::-1],
+                             interpolation=cv2.INTER_NEAREST)
+    gt = gt_mask.astype(np.int64).ravel()
+    pred = pred_mask.astype(np.int64).ravel()
+    # ignore the unknown pixel values of the ground truth
+    valid = (gt < num_classes) & (pred < num_classes)
+    counts = np.bincount(num_classes * gt[valid] + pred[valid],
+                         minlength=num_classes ** 2)
+    return counts.reshape(num_classes, num_classes)
+
+
+def read_image(path: str) -> np.ndarray:
+    image = cv2.imread(str(path))
+    if image is None:
+        raise FileNotFoundError(f"Unable to read the test set image at {path}")
+    return image
+
+
+def iter_image_batches(image_paths: Sequence[str], batch_size: int = BATCH_SIZE,
+                       num_workers: int = None) -> Iterator[Tuple[List[int], List[np.ndarray]]]:
+    """Yield the indices and the BGR images of every batch. The images are decoded
+    in a thread pool, and the next batch is read while the model is running on
+    the current batch."""
+    if num_workers is None:
+        num_workers = min(8, os.cpu_count() or 1)
+    batches = [list(range(i, min(i + batch_size, len(image_paths))))
+               for i in range(0, len(image_paths), batch_size)]
+    if not batches:
+        return
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        def submit(indices: List[int]):
+            return [executor.submit(read_image, image_paths[i]) for i in indices]
+
+        futures = submit(batches[0])
+        for batch_idx, indices in enumerate(batches):
+            images = [f.result() for f in futures]
+            if batch_idx + 1 < len(batches):
+                futures = submit(batches[batch_idx + 1])
+            yield indices, images
+
+
+@dataclass(eq=False)
+class EvalCache:
+    cache_dir: Path
+    deployment_type: str
+    image_paths: List[str]
+    class_names: List[str]
+    model_key: str
+    test_set_key: str
+    # 'image_sizes' with the original (height, width) of every image, and
+    # classification: 'y_true', 'probs'
+    # segmentation: 'pixel_confusion' with shape (N, C, C)
+    # TFOD: 'det_image_idx', 'det_boxes', 'det_scores', 'det_classes',
+    #  'gt_image_idx', 'gt_boxes', 'gt_classes'
+    arrays: Dict[str, np.ndarray]
+    # see `evaluation.py` for the structure
+    metrics: Dict[str, Any]
+
+    def __len__(self) -> int:
+        return len(self.image_paths)
+
+    @property
+    def y_pred(self) -> np.ndarray:
+        return np.argmax(self.arrays['probs'], axis=-1)
+
+    def thumbnail_path(self, idx: int) -> Path:
+        return self.cache_dir / 'thumbnails' / f'{idx:06d}.jpg'
+
+    def pred_mask_path(self, idx: int) -> Path:
+        return self.cache_dir / 'thumbnails' / f'{idx:06d}_pred.png'
+
+    def read_thumbnail(self, idx: int) -> np.ndarray:
+        """Returns the BGR thumbnail"""
+        return cv2.imread(str(self.thumbnail_path(idx)))
+
+    def read_pred_mask(self, idx: int) -> np.ndarray:
+        """Returns the predicted segmentation mask in the size of the thumbnail"""
+        return cv2.imread(str(self.pred_mask_path(idx)), cv2.IMREAD_GRAYSCALE)
+
+    def get_thumbnail_scale(self, idx: int) -> float:
+        height, width = self.arrays['image_sizes'][idx]
+        thumb_w, _ = get_thumbnail_size(height, width)
+        return thumb_w / width
+
+    def get_detections(self, idx: int, min_score: float = 0.0) -> Dict[str, Any]:
+        """Detections of the image in the same format as `tfod_detect()`, with
+        normalized box coordinates and the class IDs of the labelmap."""
+        mask = (self.arrays['det_image_idx'] == idx) \
+            & (self.arrays['det_scores'] >= min_score)
+        return {'detection_boxes': self.arrays['det_boxes'][mask],
+                'detection_classes': self.arrays['det_classes'][mask],
+                'detection_scores': self.arrays['det_scores'][mask],
+                'num_detections': int(mask.sum())}
+
+    def get_gt_boxes(self, idx: int, scale: float = 1.0) -> Tuple[List[str], np.ndarray]:
+        """Class names and (xmin, ymin, xmax, ymax) pixel coordinates of the ground
+        truth boxes, scaled by `scale`, e.g. for the thumbnail."""
+        mask = self.arrays['gt_image_idx'] == idx
+        # NOTE: the class IDs of the generated labelmap start from 1
+        class_names = [self.class_names[c - 1] for c in self.arrays['gt_classes'][mask]]
+        bboxes = np.round(self.arrays['gt_boxes'][mask] * scale).astype(int)
+        return class_names, bboxes
+
+
+class _CacheWriter:
+    """Write the cache into a temporary folder and move it into place in `finish()`"""
+
+    def __init__(self, cache_dir: Path, manifest: Dict[str, Any]):
+        self.cache_dir = Path(cache_dir)
+        self.manifest = manifest
+        self.tmp_dir = self.cache_dir.with_name(self.cache_dir.name + '.tmp')
+        if self.tmp_dir.exists():
+            shutil.rmtree(self.tmp_dir)
+        (self.tmp_dir / 'thumbnails').mkdir(parents=True)
+        self.image_sizes = np.zeros((len(manifest['image_paths']), 2), dtype=np.int32)
+
+    def save_thumbnail(self, idx: int, image: np.ndarray) -> Tuple[int, int]:
+        """Save the BGR image as a thumbnail, returns the (width, height) of the
+        thumbnail."""
+        height, width = image.shape[:2]
+        self.image_sizes[idx] = height, width
+        size = get_thumbnail_size(height, width)
+        if size != (width, height):
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        cv2.imwrite(str(self.tmp_dir / 'thumbnails' / f'{idx:06d}.jpg'), image,
+                    [cv2.IMWRITE_JPEG_QUALITY, 90])
+        return size
+
+    def save_pred_mask(self, idx: int, mask: np.ndarray, size: Tuple[int, int]):
+        # NOTE: nearest to keep the class IDs, and PNG to not lose any pixel
+        mask = cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST)
+        cv2.imwrite(str(self.tmp_dir / 'thumbnails' / f'{idx:06d}_pred.png'), mask)
+
+    def finish(self, arrays: Dict[str, np.ndarray]) -> EvalCache:
+        arrays = dict(arrays, image_sizes=self.image_sizes)
+        np.savez(self.tmp_dir / PREDICTIONS_FILENAME, **arrays)
+        metrics = compute_metrics(self.manifest['deployment_type'], arrays,
+                                  self.manifest['class_names'])
+        with open(self.tmp_dir / METRICS_FILENAME, 'w') as f:
+            json.dump(metrics, f)
+        # the manifest is written last, the cache is only valid with it
+        with open(self.tmp_dir / MANIFEST_FILENAME, 'w') as f:
+            json.dump(self.manifest, f)
+        if self.cache_dir.exists():
+            shutil.rmtree(self.cache_dir)
+        self.tmp_dir.rename(self.cache_dir)
+        return EvalCache(cache_dir=self.cache_dir,
+                         deployment_type=self.manifest['deployment_type'],
+                         image_paths=self.manifest['image_paths'],
+                         class_names=self.manifest['class_names'],
+                         model_key=self.manifest['model_key'],
+                         test_set_key=self.manifest['test_set_key'],
+                         arrays=arrays, metrics=metrics)
+
+    def abort(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def create_manifest(deployment_type: str, image_paths: Sequence[str],
+                    class_names: Sequence[str], model_key: str,
+                    test_set_key: str) -> Dict[str, Any]:
+    return {'version': EVAL_CACHE_VERSION,
+            'deployment_type': deployment_type,
+            'model_key': model_key,
+            'test_set_key': test_set_key,
+            'image_paths': [str(p) for p in image_paths],
+            'class_names': list(class_names)}
+
+
+def load_eval_cache(cache_dir: Path, model_key: Optional[str],
+                    test_set_key: str) -> Optional[EvalCache]:
+    """Load the cache if it was built with the same model and test set, otherwise
+    returns None."""
+    cache_dir = Path(cache_dir)
+    manifest_path = cache_dir / MANIFEST_FILENAME
+    if model_key is None or not manifest_path.exists():
+        return None
+    mtime = manifest_path.stat().st_mtime_ns
+    loaded = _loaded_caches.get(str(cache_dir))
+    if loaded is not None and loaded[0] == mtime:
+        cache = loaded[1]
+        if cache.model_key == model_key and cache.test_set_key == test_set_key:
+            return cache
+        logger.info(f"The evaluation cache at {cache_dir} is outdated")
+        return None
+
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != EVAL_CACHE_VERSION \
+            or manifest.get('model_key') != model_key \
+            or manifest.get('test_set_key') != test_set_key:
+        logger.info(f"The evaluation cache at {cache_dir} is outdated")
+        return None
+
+    try:
+        with np.load(cache_dir / PREDICTIONS_FILENAME) as data:
+            arrays = {k: data[k] for k in data.files}
+        with open(cache_dir / METRICS_FILENAME) as f:
+            metrics = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading the evaluation cache at {cache_dir}: {e}")
+        return None
+    cache = EvalCache(cache_dir=cache_dir,
+                      deployment_type=manifest['deployment_type'],
+                      image_paths=manifest['image_paths'],
+                      class_names=manifest['class_names'],
+                      model_key=model_key,
+                      test_set_key=test_set_key,
+                      arrays=arrays, metrics=metrics)
+    _loaded_caches[str(cache_dir)] = (mtime, cache)
+    return cache
+
+
+def _report_progress(progress_fn: Optional[ProgressCallback], done: int, total: int):
+    if progress_fn is not None:
+        progress_fn(done, total)
+
+
+def build_classification_cache(
+        cache_dir: Path, model: Any, image_paths: Sequence[str], labels: Sequence[int],
+        class_names: Sequence[str], image_size: int, preprocess_fn: Callable,
+        model_key: str, test_set_key: str, batch_size: int = BATCH_SIZE,
+        progress_fn: ProgressCallback = None) -> EvalCache:
+    """`labels` are the encoded class IDs, `class_names` are ordered by their IDs"""
+    manifest = create_manifest('Image Classification', image_paths, class_names,
+                               model_key, test_set_key)
+    writer = _CacheWriter(cache_dir, manifest)
+    probs = []
+    try:
+        for indices, images in iter_image_batches(image_paths, batch_size):
+            # same preprocessing as `classification_inference_pipeline()`
+            batch = np.stack([preprocess_image(img, image_size, preprocess_fn=preprocess_fn)
+                              for img in images])
+            probs.append(np.asarray(model.predict_on_batch(batch), dtype=np.float32))
+            for idx, img in zip(indices, images):
+                writer.save_thumbnail(idx, img)
+            _report_progress(progress_fn, indices[-1] + 1, len(image_paths))
+    except Exception:
+        writer.abort()
+        raise
+    arrays = {'y_true': np.asarray(labels, dtype=np.int64),
+              'probs': (np.concatenate(probs) if probs
+                        else np.zeros((0, len(class_names)), dtype=np.float32))}
+    return writer.finish(arrays)
+
+
+def build_segmentation_cache(
+        cache_dir: Path, model: Any, image_paths: Sequence[str],
+        mask_paths: Sequence[str], class_names: Sequence[str], image_size: int,
+        model_key: str, test_set_key: str, batch_size: int = BATCH_SIZE,
+        progress_fn: ProgressCallback = None) -> EvalCache:
+    manifest = create_manifest('Semantic Segmentation with Polygons', image_paths,
+                               class_names, model_key, test_set_key)
+    writer = _CacheWriter(cache_dir, manifest)
+    num_classes = len(class_names)
+    pixel_confusion = np.zeros((len(image_paths), num_classes, num_classes),
+                               dtype=np.int64)
+    try:
+        for indices, images in iter_image_batches(image_paths, batch_size):
+            # same preprocessing as `segment_inference_pipeline()`
+            batch = np.stack([
+                preprocess_image(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), image_size,
+                                 bgr2rgb=False)
+                for img in images])
+            pred_masks = np.argmax(model.predict_on_batch(batch), axis=-1)
+            for idx, img, pred_mask in zip(indices, images, pred_masks.astype(np.uint8)):
+                height, width = img.shape[:2]
+                # same as `segmentation_predict()`
+                pred_mask = cv2.resize(pred_mask, (width, height),
+                                       interpolation=cv2.INTER_LINEAR)
+                gt_mask = cv2.imread(str(mask_paths[idx]), cv2.IMREAD_GRAYSCALE)
+                if gt_mask is not None:
+                    pixel_confusion[idx] = get_pixel_confusion(
+                        gt_mask, pred_mask, num_classes)
+                else:
+                    logger.warning(f"Missing mask image at {mask_paths[idx]}")
+                size = writer.save_thumbnail(idx, img)
+                writer.save_pred_mask(idx, pred_mask, size)
+            _report_progress(progress_fn, indices[-1] + 1, len(image_paths))
+    except Exception:
+        writer.abort()
+        raise
+    return writer.finish({'pixel_confusion': pixel_confusion})
+
+
+def _detect_batch(detect_fn: Callable, images: List[np.ndarray],
+                  tensor_dtype) -> List[Dict[str, np.ndarray]]:
+    import tensorflow as tf
+
+    input_tensor = tf.convert_to_tensor(np.stack(images), dtype=tensor_dtype)
+    detections = detect_fn(input_tensor)
+    num_detections = detections['num_detections'].numpy().astype(int)
+    results = []
+    for i, num in enumerate(num_detections):
+        results.append({
+            key: detections[key][i, :num].numpy()
+            for key in ('detection_boxes', 'detection_classes', 'detection_scores')})
+    return results
+
+
+def _group_same_shape(indices: List[int],
+                      images: List[np.ndarray]) -> Iterator[Tuple[List[int], List[np.ndarray]]]:
+    """Group the consecutive images with the same shape to stack them in a batch"""
+    group_indices, group_images = [], []
+    for idx, img in zip(indices, images):
+        if group_images and img.shape != group_images[0].shape:
+            yield group_indices, group_images
+            group_indices, group_images = [], []
+        group_indices.append(idx)
+        group_images.append(img)
+    if group_images:
+        yield group_indices, group_images
+
+
+def build_tfod_cache(
+        cache_dir: Path, detect_fn: Callable, image_paths: Sequence[str],
+        gt_xml_df: pd.DataFrame, category_index: Dict[int, Dict[str, Any]],
+        model_key: str, test_set_key: str, is_checkpoint: bool = False,
+        batch_size: int = BATCH_SIZE, progress_fn: ProgressCallback = None) -> EvalCache:
+    """`detect_fn` is obtained using `load_tfod_model` or `load_tfod_checkpoint`.
+    The detections are stored with the class IDs of `category_index`."""
+    import tensorflow as tf
+
+    class_ids = sorted(category_index)
+    class_names = [category_index[i]['name'] for i in class_ids]
+    manifest = create_manifest('Object Detection with Bounding Boxes', image_paths,
+                               class_names, model_key, test_set_key)
+    writer = _CacheWriter(cache_dir, manifest)
+    # take note of this tensor_dtype, same as `tfod_inference_pipeline()`
+    tensor_dtype = tf.float32 if is_checkpoint else tf.uint8
+    # NOTE: Model loaded from TFOD Checkpoint needs this offset
+    label_id_offset = 1 if is_checkpoint else 0
+    det_image_idx, det_boxes, det_scores, det_classes = [], [], [], []
+    try:
+        for indices, images in iter_image_batches(image_paths, batch_size):
+            for idx, img in zip(indices, images):
+                writer.save_thumbnail(idx, img)
+            rgb_images = [cv2.cvtColor(img, cv2.COLOR_BGR2RGB) for img in images]
+            # the images in a batch must have the same shape
+            for group_indices, group_images in _group_same_shape(indices, rgb_images):
+                try:
+                    results = _detect_batch(detect_fn, group_images, tensor_dtype)
+                except tf.errors.InvalidArgumentError:
+                    # some models only accept a batch of one image
+                    results = [_detect_batch(detect_fn, [img], tensor_dtype)[0]
+                               for img in group_images]
+                for idx, det in zip(group_indices, results):
+                    keep = det['detection_scores'] >= MIN_DETECTION_SCORE
+                    det_image_idx.append(np.full(keep.sum(), idx, dtype=np.int32))
+                    det_boxes.append(det['detection_boxes'][keep].astype(np.float32))
+                    det_scores.append(det['detection_scores'][keep].astype(np.float32))
+                    det_classes.append(det['detection_classes'][keep].astype(np.int64)
+                                       + label_id_offset)
+            _report_progress(progress_fn, indices[-1] + 1, len(image_paths))
+    except Exception:
+        writer.abort()
+        raise
+
+    # the ground truth boxes for drawing, and for computing the metrics
+    name2id = {name: i for i, name in zip(class_ids, class_names)}
+    filename2idx = {os.path.basename(p): i for i, p in enumerate(image_paths)}
+    gt_df = gt_xml_df.loc[gt_xml_df['filename'].isin(filename2idx)
+                          & gt_xml_df['classname'].isin(name2id)]
+
+    def concat(arrays: List[np.ndarray], shape: Tuple[int, ...], dtype) -> np.ndarray:
+        return np.concatenate(arrays) if arrays else np.zeros(shape, dtype=dtype)
+
+    arrays = {
+        'det_image_idx': concat(det_image_idx, (0,), np.int32),
+        'det_boxes': concat(det_boxes, (0, 4), np.float32),
+        'det_scores': concat(det_scores, (0,), np.float32),
+        'det_classes': concat(det_classes, (0,), np.int64),
+        'gt_image_idx': gt_df['filename'].map(filename2idx).values.astype(np.int32),
+        'gt_boxes': gt_df.loc[:, 'xmin': 'ymax'].values.astype(np.float32).reshape(-1, 4),
+        'gt_classes': gt_df['classname'].map(name2id).values.astype(np.int64),
+    }
+    return writer.finish(arrays)
+
+
+def run_build(cache_dir: Path, build_fn: Callable[..., EvalCache],
+              *args, **kwargs) -> Optional[EvalCache]:
+    """Run the `build_*_cache()` function, one build at a time."""
+    with _build_lock:
+        start = perf_counter()
+        logger.info(f"Building the evaluation cache at {cache_dir}")
+        try:
+            cache = build_fn(cache_dir, *args, **kwargs)
+        except Exception as e:
+            logger.error(f"Error building the evaluation cache at {cache_dir}: {e}")
+            return None
+        logger.info(f"Built the evaluation cache of {len(cache)} images in "
+                    f"{perf_counter() - start:.2f}s")
+        return cache
+
+
+def wait_for_background_build(cache_dir: Path):
+    with _background_lock:
+        thread = _background_builds.get(str(cache_dir))
+    if thread is not None and thread.is_alive():
+        logger.info(f"Waiting for the background evaluation at {cache_dir}")
+        thread.join()
+
+
+def start_background_build(cache_dir: Path, target: Callable, *args, **kwargs) -> Thread:
+    """Run `target` in a background thread, e.g. to build the cache after training
+    while the user is checking the training results. `target` should call
+    `run_build()`."""
+    with _background_lock:
+        thread = _background_builds.get(str(cache_dir))
+        if thread is not None and thread.is_alive():
+            return thread
+        thread = Thread(target=target, args=args, kwargs=kwargs,
+                        name=f'eval-cache-{Path(cache_dir).parents[1].name}', daemon=True)
+        _background_builds[str(cache_dir)] = thread
+        thread.start()
+    logger.info(f"Started the background evaluation at {cache_dir}")
+    return thread
@@ -0,0 +1,354 @@
+"""
+Title: Test Set Evaluation Metrics
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Compute the evaluation metrics directly from the cached test set predictions of
+`eval_cache.py` with NumPy, instead of parsing the console output of the TFOD
+evaluation script or running the Keras model on the test set again.
+
+The metrics of every task are returned in the same JSON-serializable structure:
+    - 'summary': the overall metrics, e.g. 'mAP' or 'accuracy'
+    - 'per_class': {class_name: {metric_name: value}}
+    - 'confusion_matrix': rows of the ground truth classes and columns of the
+        predicted classes, in the order of 'labels'
+    - 'labels': the class names of the confusion matrix
+"""
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+# same IoU thresholds as the COCO evaluation: 0.5, 0.55, ..., 0.95
+COCO_IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+# recall thresholds for the 101-point interpolated average precision of COCO
+COCO_RECALL_THRESHOLDS = np.linspace(0.0, 1.0, 101)
+# minimum score of the detections counted for the per-class precision and recall,
+# and the confusion matrix
+DETECTION_SCORE_THRESHOLD = 0.5
+BACKGROUND_LABEL = 'background'
+
+
+def _safe_divide(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    return np.divide(a, b, out=np.zeros(np.broadcast(a, b).shape), where=b > 0)
+
+
+def _to_float(value: Any) -> float:
+    return round(float(value), 6)
+
+
+def confusion_matrix_from_labels(y_true: np.ndarray, y_pred: np.ndarray,
+                                 num_classes: int) -> np.ndarray:
+    counts = np.bincount(num_classes * np.asarray(y_true, dtype=np.int64)
+                         + np.asarray(y_pred, dtype=np.int64),
+                         minlength=num_classes ** 2)
+    return counts.reshape(num_classes, num_classes)
+
+
+def per_class_from_confusion(cm: np.ndarray) -> Dict[str, np.ndarray]:
+    """Precision, recall and F1 score of every class from the confusion matrix
+    with the ground truth as rows."""
+    tp = np.diag(cm)
+    support = cm.sum(axis=1)
+    num_pred = cm.sum(axis=0)
+    precision = _safe_divide(tp, num_pred)
+    recall = _safe_divide(tp, support)
+    f1 = _safe_divide(2 * precision * recall, precision + recall)
+    return {'precision': precision, 'recall': recall, 'f1': f1,
+            'support': support, 'tp': tp, 'num_pred': num_pred}
+
+
+def _per_class_dict(class_names: Sequence[str],
+                    values: Dict[str, np.ndarray]) -> Dict[str, Dict[str, float]]:
+    per_class = {}
+    for i, name in enumerate(class_names):
+        per_class[name] = {
+            k: int(v[i]) if np.issubdtype(np.asarray(v).dtype, np.integer)
+            else _to_float(v[i])
+            for k, v in values.items()}
+    return per_class
+
+
+def compute_classification_metrics(y_true: np.ndarray, probs: np.ndarray,
+                                   class_names: Sequence[str]) -> Dict[str, Any]:
+    num_classes = len(class_names)
+    y_pred = np.argmax(probs, axis=-1)
+    cm = confusion_matrix_from_labels(y_true, y_pred, num_classes)
+    stats = per_class_from_confusion(cm)
+    # only average over the classes in the test set, same as sklearn's report
+    present = stats['support'] > 0
+    summary = {
+        'accuracy': _to_float(_safe_divide(stats['tp'].sum(), cm.sum())),
+        'macro_precision': _to_float(stats['precision'][present].mean()
+                                     if present.any() else 0.0),
+        'macro_recall': _to_float(stats['recall'][present].mean()
+                                  if present.any() else 0.0),
+        'macro_f1': _to_float(stats['f1'][present].mean() if present.any() else 0.0),
+        'num_images': int(len(y_true)),
+    }
+    per_class = _per_class_dict(class_names, {
+        k: stats[k] for k in ('precision', 'recall', 'f1', 'support')})
+    return {'summary': summary, 'per_class': per_class,
+            'confusion_matrix': cm.tolist(), 'labels': list(class_names)}
+
+
+def compute_segmentation_metrics(pixel_confusion: np.ndarray,
+                                 class_names: Sequence[str]) -> Dict[str, Any]:
+    """`pixel_confusion` is the pixel confusion matrix of every image with shape
+    (N, C, C)."""
+    cm = pixel_confusion.sum(axis=0)
+    tp = np.diag(cm).astype(np.float64)
+    gt_pixels = cm.sum(axis=1)
+    pred_pixels = cm.sum(axis=0)
+    union = gt_pixels + pred_pixels - tp
+    iou = _safe_divide(tp, union)
+    dice = _safe_divide(2 * tp, gt_pixels + pred_pixels)
+    # the classes which are neither in the ground truth nor the predictions
+    # are excluded from the mean
+    present = union > 0
+
+    # mean IoU of every image, to find the worst images
+    img_tp = np.diagonal(pixel_confusion, axis1=1, axis2=2)
+    img_union = (pixel_confusion.sum(axis=2) + pixel_confusion.sum(axis=1) - img_tp)
+    img_iou = _safe_divide(img_tp, img_union)
+    img_present = img_union > 0
+    img_miou = _safe_divide((img_iou * img_present).sum(axis=1), img_present.sum(axis=1))
+
+    summary = {
+        'mean_iou': _to_float(iou[present].mean() if present.any() else 0.0),
+        'mean_dice': _to_float(dice[present].mean() if present.any() else 0.0),
+        'pixel_accuracy': _to_float(_safe_divide(tp.sum(), cm.sum())),
+        'mean_image_iou': _to_float(img_miou.mean() if len(img_miou) else 0.0),
+        'num_images': int(len(pixel_confusion)),
+    }
+    per_class = _per_class_dict(class_names, {
+        'iou': iou, 'dice': dice,
+        'precision': _safe_divide(tp, pred_pixels),
+        'recall': _safe_divide(tp, gt_pixels),
+        'gt_pixels': gt_pixels.astype(np.int64)})
+    return {'summary': summary, 'per_class': per_class,
+            'confusion_matrix': cm.tolist(), 'labels': list(class_names),
+            'image_mean_iou': [_to_float(x) for x in img_miou]}
+
+
+def box_iou(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    """IoU matrix of two sets of boxes with the same coordinate order, e.g.
+    (ymin, xmin, ymax, xmax)."""
+    boxes1 = boxes1.reshape(-1, 4)
+    boxes2 = boxes2.reshape(-1, 4)
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    top_left = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    bottom_right = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    wh = np.clip(bottom_right - top_left, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    return _safe_divide(inter, area1[:, None] + area2[None, :] - inter)
+
+
+def match_detections(ious: np.ndarray, iou_thresholds: np.ndarray) -> np.ndarray:
+    """Greedily match the detections (rows of `ious`, sorted by score in descending
+    order) to the ground truth boxes (columns) for all the IoU thresholds at once,
+    same as the COCO evaluation. Returns the true positive mask with shape
+    (num_thresholds, num_detections)."""
+    num_dets, num_gt = ious.shape
+    tp = np.zeros((len(iou_thresholds), num_dets), dtype=bool)
+    if num_gt == 0:
+        return tp
+    gt_matched = np.zeros((len(iou_thresholds), num_gt), dtype=bool)
+    thresholds = iou_thresholds[:, None]
+    rows = np.arange(len(iou_thresholds))
+    for d in range(num_dets):
+        candidates = (ious[d][None, :] >= thresholds) & ~gt_matched
+        masked = np.where(candidates, ious[d][None, :], -1.0)
+        best = masked.argmax(axis=1)
+        hit = masked[rows, best] >= 0
+        tp[hit, d] = True
+        gt_matched[rows[hit], best[hit]] = True
+    return tp
+
+
+def average_precision(tp: np.ndarray, scores: np.ndarray, num_gt: int) -> np.ndarray:
+    """101-point interpolated AP of every IoU threshold from the true positive mask
+    with shape (num_thresholds, num_detections)."""
+    num_thresholds = tp.shape[0]
+    if num_gt == 0:
+        return np.full(num_thresholds, np.nan)
+    if tp.shape[1] == 0:
+        return np.zeros(num_thresholds)
+    order = np.argsort(-scores, kind='mergesort')
+    tp = tp[:, order]
+    tp_cum = np.cumsum(tp, axis=1)
+    fp_cum = np.cumsum(~tp, axis=1)
+    recall = tp_cum / num_gt
+    precision = tp_cum / (tp_cum + fp_cum)
+    # the precision envelope, i.e. the maximum precision at any higher recall
+    precision = np.maximum.accumulate(precision[:, ::-1], axis=1)[:, ::-1]
+    ap = np.zeros(num_thresholds)
+    for t in range(num_thresholds):
+        idx = np.searchsorted(recall[t], COCO_RECALL_THRESHOLDS, side='left')
+        valid = idx < precision.shape[1]
+        ap[t] = precision[t, idx[valid]].sum() / len(COCO_RECALL_THRESHOLDS)
+    return ap
+
+
+def compute_detection_metrics(
+        det_image_idx: np.ndarray, det_boxes: np.ndarray, det_scores: np.ndarray,
+        det_classes: np.ndarray, gt_image_idx: np.ndarray, gt_boxes: np.ndarray,
+        gt_classes: np.ndarray, image_sizes: np.ndarray, class_names: Sequence[str],
+        iou_thresholds: np.ndarray = COCO_IOU_THRESHOLDS,
+        score_threshold: float = DETECTION_SCORE_THRESHOLD) -> Dict[str, Any]:
+    """COCO-style mAP over `iou_thresholds`, with the per-class AP, precision and
+    recall, and the confusion matrix with an extra background class.
+
+    The detection boxes are normalized (ymin, xmin, ymax, xmax) as output by TFOD,
+    while the ground truth boxes are (xmin, ymin, xmax, ymax) in pixels. The class
+    IDs start from 1 in the order of `class_names`."""
+    num_classes = len(class_names)
+    # convert the ground truth boxes to the same format as the detections
+    heights = image_sizes[gt_image_idx, 0].astype(np.float64)
+    widths = image_sizes[gt_image_idx, 1].astype(np.float64)
+    gt_boxes = np.stack([gt_boxes[:, 1] / heights, gt_boxes[:, 0] / widths,
+                         gt_boxes[:, 3] / heights, gt_boxes[:, 2] / widths],
+                        axis=1) if len(gt_boxes) else np.zeros((0, 4))
+    num_images = len(image_sizes)
+    iou_50 = int(np.argmin(np.abs(iou_thresholds - 0.5)))
+    iou_75 = int(np.argmin(np.abs(iou_thresholds - 0.75)))
+
+    # sort all the detections by score once, so the detections of every image
+    # and class are also sorted
+    order = np.argsort(-det_scores, kind='mergesort')
+    det_image_idx, det_boxes = det_image_idx[order], det_boxes[order]
+    det_scores, det_classes = det_scores[order], det_classes[order]
+
+    ap = np.full((num_classes, len(iou_thresholds)), np.nan)
+    stats = {k: np.zeros(num_classes, dtype=np.int64)
+             for k in ('num_gt', 'num_pred', 'tp')}
+    for c in range(num_classes):
+        class_id = c + 1
+        det_mask = det_classes == class_id
+        gt_mask = gt_classes == class_id
+        c_det_image = det_image_idx[det_mask]
+        c_det_boxes = det_boxes[det_mask]
+        c_scores = det_scores[det_mask]
+        c_gt_image = gt_image_idx[gt_mask]
+        c_gt_boxes = gt_boxes[gt_mask]
+
+        tp = np.zeros((len(iou_thresholds), len(c_scores)), dtype=bool)
+        for img_idx in np.unique(c_det_image):
+            d_idx = np.flatnonzero(c_det_image == img_idx)
+            g_idx = np.flatnonzero(c_gt_image == img_idx)
+            if len(g_idx) == 0:
+                continue
+            ious = box_iou(c_det_boxes[d_idx], c_gt_boxes[g_idx])
+            tp[:, d_idx] = match_detections(ious, iou_thresholds)
+        num_gt = int(gt_mask.sum())
+        ap[c] = average_precision(tp, c_scores, num_gt)
+
+        above = c_scores >= score_threshold
+        stats['num_gt'][c] = num_gt
+        stats['num_pred'][c] = int(above.sum())
+        stats['tp'][c] = int(tp[iou_50, above].sum())
+
+    precision = _safe_divide(stats['tp'], stats['num_pred'])
+    recall = _safe_divide(stats['tp'], stats['num_gt'])
+    # the classes without any ground truth box are excluded from the mean, as COCO
+    has_gt = stats['num_gt'] > 0
+
+    def mean_ap(values: np.ndarray) -> float:
+        return _to_float(np.mean(values[has_gt]) if has_gt.any() else 0.0)
+
+    summary = {
+        'mAP': mean_ap(ap.mean(axis=1)),
+        'mAP@0.5': mean_ap(ap[:, iou_50]),
+        'mAP@0.75': mean_ap(ap[:, iou_75]),
+        'mean_precision': _to_float(precision[has_gt].mean() if has_gt.any() else 0.0),
+        'mean_recall': _to_float(recall[has_gt].mean() if has_gt.any() else 0.0),
+        'score_threshold': score_threshold,
+        'num_images': int(num_images),
+    }
+    per_class = _per_class_dict(class_names, {
+        'AP': np.nan_to_num(ap.mean(axis=1)), 'AP@0.5': np.nan_to_num(ap[:, iou_50]),
+        'precision': precision, 'recall': recall,
+        'num_gt': stats['num_gt'], 'num_pred': stats['num_pred']})
+
+    above = det_scores >= score_threshold
+    cm = detection_confusion_matrix(
+        det_image_idx[above], det_boxes[above], det_classes[above],
+        gt_image_idx, gt_boxes, gt_classes, num_classes)
+    return {'summary': summary, 'per_class': per_class,
+            'confusion_matrix': cm.tolist(),
+            'labels': list(class_names) + [BACKGROUND_LABEL]}
+
+
+def detection_confusion_matrix(
+        det_image_idx: np.ndarray, det_boxes: np.ndarray, det_classes: np.ndarray,
+        gt_image_idx: np.ndarray, gt_boxes: np.ndarray, gt_classes: np.ndarray,
+        num_classes: int, iou_threshold: float = 0.5) -> np.ndarray:
+    """Confusion matrix of the detections (sorted by score) matched to the ground
+    truth boxes of any class, the last row and column are the background for the
+    false positives and the missed boxes."""
+    background = num_classes
+    cm = np.zeros((num_classes + 1, num_classes + 1), dtype=np.int64)
+    for img_idx in np.union1d(det_image_idx, gt_image_idx):
+        d_idx = np.flatnonzero(det_image_idx == img_idx)
+        g_idx = np.flatnonzero(gt_image_idx == img_idx)
+        pred = det_classes[d_idx] - 1
+        gt = gt_classes[g_idx] - 1
+        if len(g_idx) == 0:
+            np.add.at(cm, (background, pred), 1)
+            continue
+        ious = box_iou(det_boxes[d_idx], gt_boxes[g_idx])
+        # match to the unmatched ground truth box with the highest IoU
+        matched_gt = np.full(len(d_idx), -1)
+        gt_used = np.zeros(len(g_idx), dtype=bool)
+        for d in range(len(d_idx)):
+            candidates = np.where(~gt_used & (ious[d] >= iou_threshold), ious[d], -1.0)
+            best = candidates.argmax()
+            if candidates[best] >= 0:
+                matched_gt[d] = best
+                gt_used[best] = True
+        tp = matched_gt >= 0
+        np.add.at(cm, (gt[matched_gt[tp]], pred[tp]), 1)
+        np.add.at(cm, (background, pred[~tp]), 1)
+        np.add.at(cm, (gt[~gt_used], background), 1)
+    return cm
+
+
+def compute_metrics(deployment_type: str, arrays: Dict[str, np.ndarray],
+                    class_names: List[str]) -> Dict[str, Any]:
+    """Compute the metrics from the arrays of the evaluation cache"""
+    if deployment_type == 'Image Classification':
+        return compute_classification_metrics(
+            arrays['y_true'], arrays['probs'], class_names)
+    elif deployment_type == 'Semantic Segmentation with Polygons':
+        return compute_segmentation_metrics(arrays['pixel_confusion'], class_names)
+    return compute_detection_metrics(
+        arrays['det_image_idx'], arrays['det_boxes'], arrays['det_scores'],
+        arrays['det_classes'], arrays['gt_image_idx'], arrays['gt_boxes'],
+        arrays['gt_classes'], arrays['image_sizes'], class_names)
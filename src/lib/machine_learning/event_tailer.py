@@ -0,0 +1,152 @@
+"""
+Title: Event File Tailer
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Read the scalar metrics (losses and learning rate) of the TFOD training from the
+TensorBoard event files written by `model_main_tf2.py` in `<model_dir>/train/`, instead
+of scraping the stdout of the training script.
+
+The event files are TFRecord files which are only appended to. The tailer keeps the
+byte offset of each file, and every `poll()` only reads the complete records written
+after the offset, so a record which is still being written is read again next time.
+"""
+import glob
+import os
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Union
+
+# TFRecord format: uint64 length, uint32 masked crc of length,
+# byte data[length], uint32 masked crc of data
+HEADER_SIZE = 12
+FOOTER_SIZE = 4
+EVENT_FILE_PATTERN = 'events.out.tfevents.*'
+
+
+@dataclass(eq=False)
+class StepMetrics:
+    step: int
+    # the latest wall time of the events of this step
+    wall_time: float
+    metrics: Dict[str, float] = field(default_factory=dict)
+
+
+def read_records(f: BinaryIO) -> Iterator[bytes]:
+    """Read the complete records from the current position of `f`, stops before an
+    incomplete record with the file position at the start of the record."""
+    while True:
+        start = f.tell()
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            f.seek(start)
+            return
+        length = struct.unpack('<Q', header[:8])[0]
+        data = f.read(length + FOOTER_SIZE)
+        if len(data) < length + FOOTER_SIZE:
+            # still being written by the training process
+            f.seek(start)
+            return
+        yield data[:length]
+
+
+def get_scalar_value(value) -> Optional[float]:
+    """Get the scalar from a `Summary.Value`, written as a tensor by TF2 summaries,
+    or as `simple_value` by TF1 summaries."""
+    if value.HasField('simple_value'):
+        return float(value.simple_value)
+    if not value.HasField('tensor'):
+        return None
+    tensor = value.tensor
+    # only scalars, which have no dimensions
+    if tensor.tensor_shape.dim:
+        return None
+    if tensor.float_val:
+        return float(tensor.float_val[0])
+    if tensor.double_val:
+        return float(tensor.double_val[0])
+    if tensor.tensor_content:
+        import numpy as np
+        from tensorflow.python.framework import dtypes
+        dtype = dtypes.as_dtype(tensor.dtype).as_numpy_dtype
+        if np.issubdtype(dtype, np.number):
+            return float(np.frombuffer(tensor.tensor_content, dtype=dtype)[0])
+    return None
+
+
+class EventFileTailer:
+    def __init__(self, logdir: Union[str, Path], skip_existing: bool = True,
+                 tags_prefixes: tuple = ('Loss/', 'learning_rate')) -> None:
+        """
+        Args:
+            logdir (Union[str, Path]): Folder of the event files, e.g. `<model_dir>/train`
+                for TFOD, which might not exist yet when the training just started.
+            skip_existing (bool, optional): Skip the events written before this,
+                e.g. from the previous training run when continuing the training.
+                Defaults to True.
+            tags_prefixes (tuple, optional): Only read the scalars with the tags
+                starting with these. Defaults to ('Loss/', 'learning_rate').
+        """
+        from tensorflow.core.util import event_pb2
+        self._event_cls = event_pb2.Event
+
+        self.logdir = str(logdir)
+        self.tags_prefixes = tags_prefixes
+        self.offsets: Dict[str, int] = {}
+        if skip_existing:
+            for path in self._find_files():
+                self.offsets[path] = os.path.getsize(path)
+
+    def _find_files(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.logdir, EVENT_FILE_PATTERN)))
+
+    def read_new_records(self) -> Iterator[bytes]:
+        for path in self._find_files():
+            offset = self.offsets.get(path, 0)
+            if os.path.getsize(path) <= offset:
+                continue
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                yield from read_records(f)
+                self.offsets[path] = f.tell()
+
+    def poll(self) -> List[StepMetrics]:
+        """Get the scalars written since the last poll, grouped by step in order."""
+        steps: Dict[int, StepMetrics] = {}
+        for record in self.read_new_records():
+            event = self._event_cls.FromString(record)
+            if not event.HasField('summary'):
+                continue
+            for value in event.summary.value:
+                if not value.tag.startswith(self.tags_prefixes):
+                    continue
+                scalar = get_scalar_value(value)
+                if scalar is None:
+                    continue
+                step_metrics = steps.get(event.step)
+                if step_metrics is None:
+                    step_metrics = steps[event.step] = StepMetrics(
+                        event.step, event.wall_time)
+                step_metrics.wall_time = max(step_metrics.wall_time, event.wall_time)
+                step_metrics.metrics[value.tag] = scalar
+        return [steps[step] for step in sorted(steps)]
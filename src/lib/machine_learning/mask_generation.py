@@ -0,0 +1,270 @@
+"""
+Title: Mask Generation
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Generate the uint8 mask images for semantic segmentation from a COCO JSON file in
+parallel, used by `generate_mask_images()`.
+
+Each mask is allocated once, then the annotations of each class are merged and decoded
+in a single pass, from the lowest to the highest pixel value, so the overlapping pixels
+take the highest class index like the previous `np.maximum()` approach. A manifest in
+the output folder records a hash of the annotations of every mask, so only the masks of
+new or modified annotations are generated again.
+"""
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context
+from pathlib import Path
+from threading import get_ident
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+from pycocotools import mask as mask_utils
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+
+MANIFEST_FILENAME = '.masks_manifest.json'
+# bump this to regenerate all the masks when the drawing logic is changed
+MASK_VERSION = 1
+# starting the worker processes takes longer than drawing a few small masks
+MIN_MASKS_FOR_WORKERS = 32
+
+# (pixel_value, segmentation) of an annotation
+MaskAnnotation = Tuple[int, Union[list, dict]]
+# (mask_filename, height, width, annotations)
+MaskTask = Tuple[str, int, int, List[MaskAnnotation]]
+# (mask_filename, unique pixel values)
+MaskResult = Tuple[str, List[int]]
+
+
+@dataclass(eq=False)
+class MaskSummary:
+    num_generated: int = 0
+    num_unchanged: int = 0
+    seconds: float = 0.0
+
+
+def get_pixel_values(categories: List[Dict]) -> Dict[int, int]:
+    """Map the COCO category IDs to the mask pixel values, following the classnames
+    of `get_coco_classes()` where a 'background' class is added at index 0 if it
+    does not exist in the COCO JSON file."""
+    classnames = [cat["name"] for cat in categories]
+    added_background = 'background' not in classnames
+    if added_background:
+        classnames = ["background"] + classnames
+    pixel_values = {}
+    for cat in categories:
+        class_idx = cat["id"] + 1 if added_background else cat["id"]
+        # the first index of the classname, same as the previous implementation
+        pixel_values[cat["id"]] = classnames.index(classnames[class_idx])
+    return pixel_values
+
+
+def create_mask_tasks(coco_json: Dict, n_masks: Optional[int] = None) -> List[MaskTask]:
+    """Group the annotations by image once, instead of querying the COCO object
+    for every image."""
+    pixel_values = get_pixel_values(coco_json["categories"])
+    if pixel_values and max(pixel_values.values()) > 255:
+        raise ValueError("Mask images only support up to 255 classes")
+
+    img_dicts = coco_json["images"]
+    if n_masks:
+        img_dicts = img_dicts[:n_masks]
+    annotations: Dict[int, List[MaskAnnotation]] = {
+        img_dict["id"]: [] for img_dict in img_dicts}
+    for annot in coco_json["annotations"]:
+        img_annots = annotations.get(annot["image_id"])
+        if img_annots is not None and annot["category_id"] in pixel_values:
+            img_annots.append(
+                (pixel_values[annot["category_id"]], annot["segmentation"]))
+
+    tasks = []
+    for img_dict in img_dicts:
+        filename = os.path.basename(img_dict["file_name"])
+        # save in PNG format to preserve the exact pixel values
+        mask_filename = os.path.splitext(filename)[0] + ".png"
+        tasks.append((mask_filename, img_dict["height"], img_dict["width"],
+                      annotations[img_dict["id"]]))
+    return tasks
+
+
+def get_task_hash(task: MaskTask) -> str:
+    content = json.dumps([MASK_VERSION, task], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def _to_rle(segmentation: Union[list, dict], height: int, width: int) -> dict:
+    # same as `COCO.annToRLE()` for polygons, uncompressed and compressed RLE
+    if isinstance(segmentation, list):
+        return mask_utils.merge(mask_utils.frPyObjects(segmentation, height, width))
+    if isinstance(segmentation['counts'], list):
+        return mask_utils.frPyObjects(segmentation, height, width)
+    return segmentation
+
+
+def draw_mask(height: int, width: int,
+              annotations: List[MaskAnnotation]) -> np.ndarray:
+    """Draw the uint8 mask with the pixel value of the class of each annotation."""
+    mask = np.zeros((height, width), dtype=np.uint8)
+    rles_per_value: Dict[int, List[dict]] = {}
+    for pixel_value, segmentation in annotations:
+        if pixel_value == 0 or not segmentation:
+            continue
+        rles_per_value.setdefault(pixel_value, []).append(
+            _to_rle(segmentation, height, width))
+    # draw the higher pixel values last to overwrite the overlapping pixels
+    for pixel_value in sorted(rles_per_value):
+        binary_mask = mask_utils.decode(mask_utils.merge(rles_per_value[pixel_value]))
+        mask[binary_mask.astype(bool)] = pixel_value
+    return mask
+
+
+def generate_mask(output_dir: str, task: MaskTask) -> MaskResult:
+    """Draw and save a single mask, runs in the worker processes."""
+    mask_filename, height, width, annotations = task
+    mask = draw_mask(height, width, annotations)
+    mask_path = os.path.join(output_dir, mask_filename)
+    if not cv2.imwrite(mask_path, mask):
+        raise OSError(f"Failed to write the mask image at {mask_path}")
+    return mask_filename, np.unique(mask).tolist()
+
+
+def _init_worker(num_threads: int):
+    # each process already handles one mask at a time
+    cv2.setNumThreads(num_threads)
+
+
+def _load_manifest(output_dir: Path) -> Dict[str, str]:
+    manifest_path = output_dir / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return {}
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(output_dir: Path, manifest: Dict[str, str]):
+    # unique temporary file as another export could be saving the manifest
+    tmp_path = output_dir / f"{MANIFEST_FILENAME}.{os.getpid()}.{get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, output_dir / MANIFEST_FILENAME)
+
+
+def _run(output_dir: str, tasks: List[MaskTask],
+         num_workers: int) -> Iterator[MaskResult]:
+    if num_workers <= 1 or len(tasks) < MIN_MASKS_FOR_WORKERS:
+        for task in tasks:
+            yield generate_mask(output_dir, task)
+        return
+    chunksize = max(1, min(16, len(tasks) // (num_workers * 4)))
+    # NOTE: 'spawn' because the Streamlit process has running threads
+    # and possibly TensorFlow initialized, which are not safe to fork
+    with ProcessPoolExecutor(num_workers, mp_context=get_context('spawn'),
+                             initializer=_init_worker, initargs=(1,)) as executor:
+        yield from executor.map(generate_mask, [output_dir] * len(tasks), tasks,
+                                chunksize=chunksize)
+
+
+def generate_masks(coco_json_path: Union[str, Path],
+                   output_dir: Union[str, Path],
+                   n_masks: Optional[int] = None,
+                   num_workers: Optional[int] = None,
+                   use_cache: bool = True,
+                   verbose: bool = False,
+                   progress_wrapper: Callable = None) -> MaskSummary:
+    """Generate the mask images of the COCO JSON file at `output_dir`.
+
+    Args:
+        coco_json_path (Union[str, Path]): Path to the COCO JSON file.
+        output_dir (Union[str, Path]): Folder to save the mask images, created if
+            not exists.
+        n_masks (Optional[int], optional): Only generate the masks of the first
+            `n_masks` images. Defaults to None to generate all.
+        num_workers (Optional[int], optional): Number of worker processes.
+            Defaults to the number of CPU cores.
+        use_cache (bool, optional): Skip the existing masks with unchanged
+            annotations. Defaults to True.
+        verbose (bool, optional): Log the pixel values of every generated mask.
+            Defaults to False.
+        progress_wrapper (Callable, optional): To wrap the iterator of generated
+            masks for progress display, e.g. `stqdm`.
+    """
+    start = perf_counter()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+
+    with open(coco_json_path) as f:
+        coco_json = json.load(f)
+    tasks = create_mask_tasks(coco_json, n_masks)
+
+    old_manifest = _load_manifest(output_dir) if use_cache else {}
+    manifest = {}
+    to_generate = []
+    summary = MaskSummary()
+    for task in tasks:
+        mask_filename = task[0]
+        task_hash = get_task_hash(task)
+        manifest[mask_filename] = task_hash
+        if old_manifest.get(mask_filename) == task_hash \
+                and (output_dir / mask_filename).exists():
+            summary.num_unchanged += 1
+        else:
+            to_generate.append(task)
+
+    logger.debug(f"Generating {len(to_generate)} mask images in: {output_dir}")
+    results = _run(str(output_dir), to_generate, num_workers)
+    if progress_wrapper is not None:
+        results = progress_wrapper(results, total=len(to_generate))
+    for (mask_filename, height, width, annotations), (_, pixel_values) in zip(
+            to_generate, results):
+        summary.num_generated += 1
+        if verbose:
+            logger.debug(
+                f"Generated mask image for {mask_filename} | "
+                f"Unique pixel values = {pixel_values} | "
+                f"Number of annotations = {len(annotations)}")
+
+    # keep the entries of the other masks, e.g. generated without `n_masks`
+    if n_masks:
+        manifest = {**old_manifest, **manifest}
+    _save_manifest(output_dir, manifest)
+    summary.seconds = perf_counter() - start
+    logger.info(f"Generated {summary.num_generated} mask images at {output_dir} in "
+                f"{summary.seconds:.2f}s, {summary.num_unchanged} unchanged")
+    return summary
@@ -0,0 +1,293 @@
+"""
+Title: Training Performance Profiles
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Performance profiles for Keras training, selected with the training param
+`perf_profile`:
+    - `Default`: TensorFlow defaults in float32.
+    - `CPUOptimized`: oneDNN optimizations with explicit intra/inter-op thread counts
+      (the training params `intra_op_threads` and `inter_op_threads`, 0 for auto).
+    - `MixedPrecision`: `CPUOptimized` with bfloat16 mixed precision when the CPU
+      supports bfloat16 natively (AVX512_BF16 or AMX), otherwise same as
+      `CPUOptimized`.
+The training param `jit_compile` additionally compiles the model with XLA.
+
+The oneDNN option and the thread counts only take effect before TensorFlow is
+initialized, i.e. in the processes of the training job worker, which calls
+`configure_tf_env()` before importing TensorFlow and `configure_threads()` before
+running any op. The Streamlit process keeps its existing settings.
+
+The mixed precision model is converted back to float32 before saving, so the saved
+and exported models work on any machine.
+
+NOTE: TensorFlow is only imported inside the functions, this module is imported by
+the job worker before TensorFlow.
+"""
+import inspect
+import os
+import sys
+from dataclasses import dataclass
+from enum import IntEnum
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+
+MIXED_PRECISION_POLICY = 'mixed_bfloat16'
+# flags in /proc/cpuinfo of the CPUs with native bfloat16 instructions
+BF16_CPU_FLAGS = ('avx512_bf16', 'amx_bf16')
+DEFAULT_INTER_OP_THREADS = 2
+
+
+class PerfProfile(IntEnum):
+    Default = 0
+    CPUOptimized = 1
+    MixedPrecision = 2
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_string(cls, s):
+        try:
+            return PerfProfile[s]
+        except KeyError:
+            raise ValueError()
+
+
+@dataclass(eq=False)
+class PerfSettings:
+    profile: PerfProfile = PerfProfile.Default
+    # 0 to use the number of CPU cores available for this process
+    intra_op_threads: int = 0
+    # 0 to use `DEFAULT_INTER_OP_THREADS`
+    inter_op_threads: int = 0
+    jit_compile: bool = False
+
+    @property
+    def use_onednn(self) -> bool:
+        return self.profile != PerfProfile.Default
+
+    @property
+    def wants_mixed_precision(self) -> bool:
+        return self.profile == PerfProfile.MixedPrecision
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'Profile': str(self.profile), 'XLA': self.jit_compile}
+
+
+def get_perf_settings(training_param: Optional[Dict[str, Any]]) -> PerfSettings:
+    training_param = training_param or {}
+    try:
+        profile = PerfProfile.from_string(
+            training_param.get('perf_profile', str(PerfProfile.Default)))
+    except ValueError:
+        logger.warning("Unknown perf_profile "
+                       f"'{training_param.get('perf_profile')}', using Default")
+        profile = PerfProfile.Default
+    return PerfSettings(
+        profile=profile,
+        intra_op_threads=int(training_param.get('intra_op_threads', 0)),
+        inter_op_threads=int(training_param.get('inter_op_threads', 0)),
+        jit_compile=bool(training_param.get('jit_compile', False)),
+    )
+
+
+def query_training_param(training_id: int, conn) -> Dict[str, Any]:
+    """To get the settings in the job worker before importing TensorFlow, which is
+    imported by `training_management.py`"""
+    from data_manager.database_manager import db_fetchone
+
+    sql_query = """
+            SELECT
+                training_param
+            FROM
+                public.training
+            WHERE
+                id = %s;
+    """
+    row = db_fetchone(sql_query, conn, [training_id])
+    return (row.training_param if row else None) or {}
+
+
+def cpu_supports_bf16() -> bool:
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    flags = set(line.split(':', 1)[1].split())
+                    return any(flag in flags for flag in BF16_CPU_FLAGS)
+    except OSError:
+        pass
+    return False
+
+
+def is_onednn_enabled() -> bool:
+    """oneDNN is only enabled by default since TF 2.9 on Linux x86"""
+    env = os.environ.get('TF_ENABLE_ONEDNN_OPTS')
+    if env is not None:
+        return env == '1'
+    import tensorflow as tf
+    major, minor = (int(x) for x in tf.__version__.split('.')[:2])
+    return (major, minor) >= (2, 9)
+
+
+def configure_tf_env(settings: PerfSettings):
+    """Set the environment variables read when TensorFlow is imported."""
+    if 'tensorflow' in sys.modules:
+        logger.warning("TensorFlow is already imported, the oneDNN option of the "
+                       f"'{settings.profile}' profile is not changed")
+        return
+    if settings.use_onednn:
+        os.environ['TF_ENABLE_ONEDNN_OPTS'] = '1'
+    if settings.intra_op_threads:
+        os.environ['OMP_NUM_THREADS'] = str(settings.intra_op_threads)
+
+
+def configure_threads(settings: PerfSettings, num_threads: Optional[int] = None):
+    """Set the thread counts of the profile, must be called before running any
+    TensorFlow op. `num_threads` is the number of CPU cores for this process."""
+    import tensorflow as tf
+
+    if settings.profile == PerfProfile.Default:
+        intra, inter = settings.intra_op_threads, settings.inter_op_threads
+    else:
+        intra = settings.intra_op_threads or num_threads or (os.cpu_count() or 1)
+        inter = settings.inter_op_threads or DEFAULT_INTER_OP_THREADS
+    try:
+        if intra:
+            tf.config.threading.set_intra_op_parallelism_threads(intra)
+        if inter:
+            tf.config.threading.set_inter_op_parallelism_threads(inter)
+    except RuntimeError as e:
+        # TensorFlow has been initialized, e.g. in the Streamlit process
+        logger.warning(f"Unable to set the TensorFlow threads: {e}")
+        return
+    logger.info(f"TensorFlow threads for the '{settings.profile}' profile: "
+                f"intra-op = {tf.config.threading.get_intra_op_parallelism_threads()}, "
+                f"inter-op = {tf.config.threading.get_inter_op_parallelism_threads()}")
+
+
+def get_mixed_precision_policy(settings: PerfSettings) -> Optional[str]:
+    """The mixed precision policy to use, None for float32."""
+    if not settings.wants_mixed_precision:
+        return None
+    import tensorflow as tf
+    if tf.config.list_physical_devices('GPU'):
+        logger.info("bfloat16 mixed precision is only used for CPU training")
+        return None
+    if not cpu_supports_bf16():
+        logger.info("The CPU does not support bfloat16 natively, training in float32")
+        return None
+    if not is_onednn_enabled():
+        # the bfloat16 CPU kernels are from oneDNN
+        logger.warning("oneDNN is not enabled in this process, training in float32. "
+                       "Run the training with the training job worker instead.")
+        return None
+    return MIXED_PRECISION_POLICY
+
+
+def recompile_model(model, metrics, settings: PerfSettings, optimizer=None, loss=None):
+    """Compile with the `jit_compile` option of the profile, using the optimizer
+    (with its state) and the loss of the `model` if not given."""
+    compile_kwargs = {}
+    if settings.jit_compile:
+        if 'jit_compile' in inspect.signature(model.compile).parameters:
+            compile_kwargs['jit_compile'] = True
+        else:
+            # NOTE: `Model.compile()` of older Keras (e.g. 2.7) has no `jit_compile`
+            import tensorflow as tf
+            logger.warning("Model.compile() does not support `jit_compile`, enabling "
+                           "XLA auto-clustering with tf.config.optimizer.set_jit()")
+            tf.config.optimizer.set_jit(True)
+    model.compile(loss=loss if loss is not None else model.loss,
+                  optimizer=optimizer if optimizer is not None else model.optimizer,
+                  metrics=metrics,
+                  **compile_kwargs)
+    return model
+
+
+def transfer_optimizer_state(old_optimizer, new_optimizer, new_model):
+    """Copy the iterations and the slots (e.g. the moments of Adam) to the optimizer
+    of the rebuilt model, which has the same trainable variables in the same order,
+    same as how Keras restores the optimizer of a saved model."""
+    old_weights = old_optimizer.get_weights()
+    if not old_weights:
+        # not trained yet
+        return
+    new_optimizer._create_all_weights(new_model.trainable_variables)
+    try:
+        new_optimizer.set_weights(old_weights)
+    except ValueError as e:
+        logger.warning(f"Unable to keep the optimizer state of the model: {e}")
+
+
+def convert_model_dtype_policy(model, policy: str, metrics, settings: PerfSettings,
+                               custom_objects: Dict[str, Any] = None):
+    """Rebuild the compiled functional Keras model with every layer in the dtype
+    `policy`, with the same weights and optimizer state. The output layer always
+    stays in float32 for numeric stability of the softmax and the loss, as
+    recommended for mixed precision."""
+    import tensorflow as tf
+
+    def set_dtypes(layer_config: Dict[str, Any], is_output: bool = False):
+        config = layer_config['config']
+        if 'layers' in config:
+            # nested model, e.g. the pretrained base model of classification
+            for nested in config['layers']:
+                set_dtypes(nested)
+        elif layer_config['class_name'] != 'InputLayer' and 'dtype' in config:
+            config['dtype'] = 'float32' if is_output else policy
+
+    model_config = model.get_config()
+    output_names = {output[0] for output in model_config['output_layers']}
+    for layer_config in model_config['layers']:
+        set_dtypes(layer_config, layer_config['name'] in output_names)
+    new_model = tf.keras.Model.from_config(model_config, custom_objects=custom_objects)
+    new_model.set_weights(model.get_weights())
+
+    optimizer = model.optimizer
+    new_optimizer = optimizer.__class__.from_config(optimizer.get_config())
+    recompile_model(new_model, metrics, settings, optimizer=new_optimizer,
+                    loss=model.loss)
+    transfer_optimizer_state(optimizer, new_optimizer, new_model)
+    logger.info(f"Converted the model to the '{policy}' dtype policy")
+    return new_model
+
+
+def get_model_dtype_policy(model) -> str:
+    """The dtype policy of the first hidden layer, e.g. 'mixed_bfloat16'"""
+    import tensorflow as tf
+
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.Model):
+            # the layers of the nested model have their own policies
+            return get_model_dtype_policy(layer)
+        if not isinstance(layer, tf.keras.layers.InputLayer):
+            return layer.dtype_policy.name
+    return 'float32'
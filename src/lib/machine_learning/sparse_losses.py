@@ -0,0 +1,61 @@
+"""
+Title: Sparse Segmentation Losses
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Losses and metrics for segmentation training with sparse labels, i.e. the training
+param `use_sparse_labels`.
+
+The input pipeline then yields the uint8 class-index masks of shape
+(image_size, image_size, 1) instead of the one-hot encoded int32 masks with
+`num_classes` channels, which are 4 * `num_classes` times larger. The masks are only
+one-hot encoded inside these functions, for each batch inside the model's train step.
+"""
+import tensorflow as tf
+from keras_unet_collection.losses import focal_tversky, iou_seg
+
+
+def sparse_to_one_hot(y_true: tf.Tensor, y_pred: tf.Tensor) -> tf.Tensor:
+    """One-hot encode the class-index `y_true` into the same shape and dtype
+    as `y_pred`."""
+    y_true = tf.cast(y_true, tf.int32)
+    if y_true.shape.rank == y_pred.shape.rank:
+        # (N, H, W, 1) -> (N, H, W)
+        y_true = tf.squeeze(y_true, axis=-1)
+    return tf.one_hot(y_true, depth=tf.shape(y_pred)[-1], dtype=y_pred.dtype)
+
+
+def sparse_focal_tversky(y_true, y_pred):
+    return focal_tversky(sparse_to_one_hot(y_true, y_pred), y_pred)
+
+
+def sparse_iou_seg(y_true, y_pred):
+    return iou_seg(sparse_to_one_hot(y_true, y_pred), y_pred)
+
+
+def sparse_hybrid_loss(y_true, y_pred):
+    # same as `hybrid_loss()` but only one-hot encode once
+    y_true = sparse_to_one_hot(y_true, y_pred)
+    loss_focal = focal_tversky(y_true, y_pred, alpha=0.5, gamma=4 / 3)
+    loss_iou = iou_seg(y_true, y_pred)
+
+    return loss_focal + loss_iou
@@ -0,0 +1,462 @@
+"""
+Title: TensorFlow Input Pipeline
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Input pipeline for Keras training with only TensorFlow ops, without `tf.numpy_function`.
+
+Python functions wrapped with `tf.numpy_function` hold the GIL, so the parallel calls of
+`Dataset.map()` mostly wait for each other. Here the decoding, resizing, normalization,
+mask one-hot encoding and a subset of the Albumentations transforms (`TF_AUGMENTATIONS`)
+are all expressed as TF ops which run in parallel in the tf.data threads.
+
+When any of the selected transforms is not supported, the augmentation falls back to
+the Albumentations transform in `tf.numpy_function`, same as before.
+
+The decoded and resized samples can also be cached on disk with
+`load_cached_dataset()`, so that only the augmentation and normalization run in the
+later epochs and training runs with the same dataset.
+
+`load_dataset()` and `batch_dataset()` build the datasets of `Trainer.create_tf_dataset()`
+and of the throughput benchmark suite in `benchmark_input_pipeline.py`.
+"""
+import hashlib
+import os
+import shutil
+import sys
+from functools import partial
+from pathlib import Path
+from time import perf_counter, time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import tensorflow as tf
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+
+# default probability of Albumentations transforms
+DEFAULT_P = 0.5
+# increase this when the outputs of the load functions are changed
+CACHE_VERSION = 1
+# number of cached datasets to keep in the cache folder of a training session
+MAX_CACHED_DATASETS = 3
+# a cache with a lockfile and files modified within this many seconds is assumed to
+# be still written by another process, e.g. another trial of a hyper-parameter sweep
+CACHE_WRITE_TIMEOUT = 120
+
+
+# ****************************** Decoding ******************************
+
+def decode_image(image_path: tf.Tensor) -> tf.Tensor:
+    """Read and decode a JPEG or PNG image into uint8 RGB with 3 channels."""
+    raw = tf.io.read_file(image_path)
+
+    def decode_jpeg():
+        # decode using "INTEGER_ACCURATE" to achieve identical results with OpenCV
+        return tf.image.decode_jpeg(raw, channels=3, dct_method='INTEGER_ACCURATE')
+
+    def decode_other():
+        image = tf.io.decode_image(raw, channels=3, expand_animations=False)
+        return tf.cast(image, tf.uint8)
+
+    image = tf.cond(tf.io.is_jpeg(raw), decode_jpeg, decode_other)
+    image.set_shape([None, None, 3])
+    return image
+
+
+def decode_mask(mask_path: tf.Tensor) -> tf.Tensor:
+    """Read the mask image with class indices as the pixel values, in the shape of
+    (H, W, 1) to be able to use `tf.image` functions."""
+    raw = tf.io.read_file(mask_path)
+    mask = tf.io.decode_png(raw, channels=1)
+    mask.set_shape([None, None, 1])
+    return mask
+
+
+def resize_image(image: tf.Tensor, image_size: int) -> tf.Tensor:
+    # 'nearest' is identical with OpenCV's INTER_NEAREST_EXACT used in `preprocess_image()`
+    return tf.image.resize(image, (image_size, image_size), method='nearest')
+
+
+def resize_mask(mask: tf.Tensor, image_size: int) -> tf.Tensor:
+    # using bilinear to follow `preprocess_mask()`, rounded like OpenCV does for uint8
+    mask = tf.image.resize(mask, (image_size, image_size), method='bilinear')
+    return tf.cast(tf.round(mask), tf.uint8)
+
+
+# ****************************** Augmentations ******************************
+# Each function takes the float32 image in [0, 1] of shape (H, W, 3) and optionally
+# the mask of shape (H, W, 1), and returns both. The parameters follow Albumentations.
+
+def _apply_with_p(p: float, fn: Callable, image: tf.Tensor, mask: Optional[tf.Tensor]):
+    def apply():
+        return fn(image, mask)
+
+    def skip():
+        return image, mask
+
+    if mask is None:
+        # tf.cond does not accept None as output
+        return tf.cond(tf.random.uniform([]) < p,
+                       lambda: apply()[0], lambda: image), None
+    return tf.cond(tf.random.uniform([]) < p, apply, skip)
+
+
+def _spatial(fn: Callable) -> Callable:
+    """Apply the same spatial transform on both image and mask."""
+    def wrapper(image, mask):
+        return fn(image), (fn(mask) if mask is not None else None)
+    return wrapper
+
+
+def _flip(image, mask):
+    # same as A.Flip: -1 for both, 0 for vertical, 1 for horizontal flip
+    d = tf.random.uniform([], -1, 2, dtype=tf.int32)
+
+    def flip(x):
+        x = tf.cond(d <= 0, lambda: tf.image.flip_up_down(x), lambda: x)
+        return tf.cond(tf.not_equal(d, 0), lambda: tf.image.flip_left_right(x), lambda: x)
+    return _spatial(flip)(image, mask)
+
+
+def _rotate90(image, mask):
+    k = tf.random.uniform([], 0, 4, dtype=tf.int32)
+    return _spatial(lambda x: tf.image.rot90(x, k))(image, mask)
+
+
+def _brightness_contrast(image, mask, brightness_limit=(-0.2, 0.2),
+                         contrast_limit=(-0.2, 0.2), brightness_by_max=True):
+    if isinstance(brightness_limit, (int, float)):
+        brightness_limit = (-brightness_limit, brightness_limit)
+    if isinstance(contrast_limit, (int, float)):
+        contrast_limit = (-contrast_limit, contrast_limit)
+    alpha = 1.0 + tf.random.uniform([], *contrast_limit)
+    beta = tf.random.uniform([], *brightness_limit)
+    if brightness_by_max:
+        # the max value of float images is 1.0
+        image = image * alpha + beta
+    else:
+        image = image * alpha + beta * tf.reduce_mean(image)
+    return tf.clip_by_value(image, 0.0, 1.0), mask
+
+
+def _gamma(image, mask, gamma_limit=(80, 120)):
+    if isinstance(gamma_limit, (int, float)):
+        gamma_limit = (100 - gamma_limit, 100 + gamma_limit)
+    gamma = tf.random.uniform([], *gamma_limit) / 100.0
+    return tf.pow(image, gamma), mask
+
+
+def _to_gray(image, mask):
+    return tf.image.grayscale_to_rgb(tf.image.rgb_to_grayscale(image)), mask
+
+
+TF_AUGMENTATIONS: Dict[str, Callable] = {
+    'HorizontalFlip': _spatial(tf.image.flip_left_right),
+    'VerticalFlip': _spatial(tf.image.flip_up_down),
+    'Flip': _flip,
+    'RandomRotate90': _rotate90,
+    'Transpose': _spatial(tf.image.transpose),
+    'RandomBrightnessContrast': _brightness_contrast,
+    'RandomBrightness': lambda image, mask, limit=(-0.2, 0.2): _brightness_contrast(
+        image, mask, brightness_limit=limit, contrast_limit=(0.0, 0.0)),
+    'RandomContrast': lambda image, mask, limit=(-0.2, 0.2): _brightness_contrast(
+        image, mask, brightness_limit=(0.0, 0.0), contrast_limit=limit),
+    'RandomGamma': _gamma,
+    'ToGray': _to_gray,
+    'InvertImg': lambda image, mask: (1.0 - image, mask),
+}
+
+
+def is_tf_supported(augmentations: Dict[str, Dict[str, Any]]) -> bool:
+    """Check whether all the selected transforms (the `augmentations` of
+    `AugmentationConfig`) are supported by `TF_AUGMENTATIONS`."""
+    unsupported = [name for name in augmentations if name not in TF_AUGMENTATIONS]
+    if unsupported:
+        logger.info(f"Transforms not supported with TensorFlow ops: {unsupported}, "
+                    "using Albumentations in tf.numpy_function instead")
+    return not unsupported
+
+
+def build_tf_augment(augmentations: Dict[str, Dict[str, Any]]) -> Callable:
+    """Build the function to apply the `augmentations` in order, which takes the
+    float image in [0, 1] and the mask (or None), and returns both."""
+    steps = []
+    for name, params in augmentations.items():
+        params = dict(params)
+        p = params.pop('p', DEFAULT_P)
+        params.pop('always_apply', None)
+        steps.append((p, partial(TF_AUGMENTATIONS[name], **params)))
+
+    def augment(image: tf.Tensor, mask: Optional[tf.Tensor] = None):
+        for p, fn in steps:
+            image, mask = _apply_with_p(p, fn, image, mask)
+        return image, mask
+    return augment
+
+
+# ****************************** Map functions ******************************
+# The map functions are split into a `load` step (decode and resize, the output is
+# deterministic and small in uint8, so it can be cached on disk) and a `finish` step
+# (augmentation and normalization, which must run for every epoch).
+
+def get_classification_load_fn(image_size: int) -> Callable:
+    def load_fn(image_path: tf.Tensor, label: tf.Tensor):
+        image = resize_image(decode_image(image_path), image_size)
+        image.set_shape([image_size, image_size, 3])
+        return image, tf.cast(label, dtype=tf.int32)
+    return load_fn
+
+
+def get_classification_finish_fn(image_size: int, preprocess_fn: Callable = None,
+                                 augment: Callable = None) -> Callable:
+    """`preprocess_fn` is the Keras `preprocess_input` function, which works directly
+    on tensors without `tf.numpy_function`. The augmentation is applied before it."""
+    def finish_fn(image: tf.Tensor, label: tf.Tensor):
+        if augment is not None:
+            image = tf.cast(image, tf.float32) / 255.0
+            image, _ = augment(image)
+            image = image * 255.0
+        else:
+            image = tf.cast(image, tf.float32)
+        if preprocess_fn is not None:
+            image = preprocess_fn(image)
+        image.set_shape([image_size, image_size, 3])
+        label.set_shape([])
+        return image, label
+    return finish_fn
+
+
+def get_segmentation_load_fn(image_size: int) -> Callable:
+    def load_fn(image_path: tf.Tensor, mask_path: tf.Tensor):
+        image = resize_image(decode_image(image_path), image_size)
+        mask = resize_mask(decode_mask(mask_path), image_size)
+        image.set_shape([image_size, image_size, 3])
+        mask.set_shape([image_size, image_size, 1])
+        return image, mask
+    return load_fn
+
+
+def get_segmentation_finish_fn(image_size: int, num_classes: int,
+                               augment: Callable = None,
+                               sparse: bool = False) -> Callable:
+    """Same outputs as `segmentation_read_and_preprocess()`: the image rescaled to
+    [0, 1] and the one-hot encoded int32 mask, or the uint8 class-index mask with a
+    single channel if `sparse` is True."""
+    def finish_fn(image: tf.Tensor, mask: tf.Tensor):
+        image = tf.cast(image, tf.float32) / 255.0
+        if augment is not None:
+            image, mask = augment(image, mask)
+        image.set_shape([image_size, image_size, 3])
+        if sparse:
+            mask.set_shape([image_size, image_size, 1])
+            return image, mask
+        mask = tf.one_hot(mask[..., 0], depth=num_classes, dtype=tf.int32)
+        mask.set_shape([image_size, image_size, num_classes])
+        return image, mask
+    return finish_fn
+
+
+def _compose(load_fn: Callable, finish_fn: Callable) -> Callable:
+    def map_fn(x, y):
+        return finish_fn(*load_fn(x, y))
+    return map_fn
+
+
+def get_classification_map_fn(image_size: int, preprocess_fn: Callable = None,
+                              augment: Callable = None) -> Callable:
+    return _compose(get_classification_load_fn(image_size),
+                    get_classification_finish_fn(image_size, preprocess_fn, augment))
+
+
+def get_segmentation_map_fn(image_size: int, num_classes: int,
+                            augment: Callable = None, sparse: bool = False) -> Callable:
+    return _compose(get_segmentation_load_fn(image_size),
+                    get_segmentation_finish_fn(image_size, num_classes, augment, sparse))
+
+
+# ****************************** Dataset cache ******************************
+
+def get_dataset_cache_key(X: List[str], y: List[Any], image_size: int,
+                          deployment_type: str) -> str:
+    """Key of the cached samples, changes when any image (or mask) is added, removed,
+    relabeled or modified (by its size and modification time), or when the image size
+    or deployment type is changed."""
+    h = hashlib.sha1()
+    h.update(f"{CACHE_VERSION}|{deployment_type}|{image_size}".encode())
+    for image_path, label in sorted(zip(map(str, X), map(str, y))):
+        stat = os.stat(image_path)
+        h.update(f"|{image_path}|{stat.st_size}|{stat.st_mtime_ns}|{label}".encode())
+        if os.path.isfile(label):
+            # the mask path for segmentation
+            stat = os.stat(label)
+            h.update(f"|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    return h.hexdigest()[:16]
+
+
+def prune_dataset_cache(cache_root: Path, keep: int = MAX_CACHED_DATASETS):
+    """Remove the least recently used cached datasets except the latest `keep`."""
+    if not cache_root.exists():
+        return
+    cache_dirs = sorted((d for d in cache_root.iterdir() if d.is_dir()),
+                        key=lambda d: d.stat().st_mtime, reverse=True)
+    for d in cache_dirs[keep:]:
+        logger.info(f"Removing old cached dataset at {d}")
+        shutil.rmtree(d, ignore_errors=True)
+
+
+def is_cache_being_written(cache_dir: Path, subset: str,
+                           timeout: float = CACHE_WRITE_TIMEOUT) -> bool:
+    lockfiles = list(cache_dir.glob(f"{subset}*.lockfile"))
+    if not lockfiles:
+        return False
+    last_modified = max(p.stat().st_mtime for p in cache_dir.glob(f"{subset}*"))
+    return (time() - last_modified) < timeout
+
+
+def load_cached_dataset(X: List[str], y: List[Any], load_fn: Callable,
+                        cache_root: Path, subset: str, image_size: int,
+                        deployment_type: str,
+                        num_parallel_calls: int = tf.data.AUTOTUNE) -> tf.data.Dataset:
+    """Dataset of the decoded and resized samples, which are cached on disk in
+    `cache_root` after the first full iteration, e.g. the first epoch. Later
+    iterations and training runs with the same samples read from the cache.
+
+    NOTE: the cache is in the order of the first iteration, so the dataset must
+    still be shuffled after this."""
+    key = get_dataset_cache_key(X, y, image_size, deployment_type)
+    cache_dir = cache_root / key
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # touch to keep track of the recently used caches
+    os.utime(cache_dir)
+    cache_prefix = cache_dir / subset
+    if is_cache_being_written(cache_dir, subset):
+        # TF only allows a single writer of the cache, so read without the cache
+        logger.info(f"The {subset} dataset at {cache_dir} is being cached by "
+                    "another process, not using the cache for this run")
+        ds = tf.data.Dataset.from_tensor_slices((X, y))
+        return ds.map(load_fn, num_parallel_calls=num_parallel_calls)
+    for lockfile in cache_dir.glob(f"{subset}*.lockfile"):
+        # left by a previous run stopped in the middle of writing the cache
+        os.remove(lockfile)
+    if any(cache_dir.glob(f"{subset}.index")):
+        logger.info(f"Using the cached {subset} dataset at {cache_dir}")
+    else:
+        logger.info(f"Caching the {subset} dataset at {cache_dir} "
+                    "during the first iteration")
+    ds = tf.data.Dataset.from_tensor_slices((X, y))
+    ds = ds.map(load_fn, num_parallel_calls=num_parallel_calls)
+    return ds.cache(str(cache_prefix))
+
+
+def load_dataset(X: List[str], y: List[Any], load_fn: Callable,
+                 finish_fn: Optional[Callable] = None, *,
+                 num_parallel_calls: int = tf.data.AUTOTUNE,
+                 cache_root: Optional[Path] = None, subset: str = None,
+                 image_size: int = None, deployment_type: str = None) -> tf.data.Dataset:
+    """Map the `load_fn`, cached on disk in `cache_root` if given (see
+    `load_cached_dataset()`), then the `finish_fn` which is never cached."""
+    if cache_root is not None:
+        ds = load_cached_dataset(X, y, load_fn, cache_root, subset, image_size,
+                                 deployment_type, num_parallel_calls)
+    else:
+        ds = tf.data.Dataset.from_tensor_slices((X, y))
+        ds = ds.map(load_fn, num_parallel_calls=num_parallel_calls)
+    if finish_fn is not None:
+        ds = ds.map(finish_fn, num_parallel_calls=num_parallel_calls)
+    return ds
+
+
+def batch_dataset(ds: tf.data.Dataset, batch_size: int, *,
+                  map_fns: Sequence[Callable] = (), shuffle_size: int = 0,
+                  num_parallel_calls: int = tf.data.AUTOTUNE,
+                  prefetch: int = tf.data.AUTOTUNE) -> tf.data.Dataset:
+    """Apply the remaining `map_fns`, then shuffle if `shuffle_size` > 0, batch and
+    prefetch `prefetch` batches, 0 to not prefetch."""
+    for map_fn in map_fns:
+        ds = ds.map(map_fn, num_parallel_calls=num_parallel_calls)
+    if shuffle_size:
+        ds = ds.shuffle(shuffle_size)
+    ds = ds.batch(batch_size)
+    if prefetch:
+        ds = ds.prefetch(prefetch)
+    return ds
+
+
+# ****************************** Benchmark ******************************
+# see `benchmark_input_pipeline.py` for the benchmark suite
+
+def benchmark_dataset(dataset: tf.data.Dataset, num_epochs: int = 2,
+                      warmup_batches: int = 2) -> float:
+    """Iterate through the `dataset` and return the throughput in images/sec,
+    excluding the first `warmup_batches` batches of the first epoch."""
+    num_images = 0
+    start = None
+    for epoch in range(num_epochs):
+        for i, batch in enumerate(dataset):
+            if start is None and i + 1 >= warmup_batches:
+                start = perf_counter()
+                continue
+            if start is not None:
+                num_images += int(tf.shape(batch[0])[0])
+    if start is None or num_images == 0:
+        return 0.0
+    return num_images / (perf_counter() - start)
+
+
+def get_numpy_function_map_fns(image_size: int, num_classes: Optional[int],
+                               transform=None, sparse: bool = False
+                               ) -> Tuple[Callable, Optional[Callable]]:
+    """The previous pipeline with `tf.numpy_function` for comparison."""
+    from machine_learning.utils import (segmentation_read_and_preprocess,
+                                        tf_classification_preprocess_input)
+    if num_classes is None:
+        map_fn = partial(tf_classification_preprocess_input, image_size=image_size,
+                         rescale=True)
+
+        def aug_fn(image):
+            return transform(image=image)['image']
+
+        def augment(image, label):
+            return tf.numpy_function(aug_fn, [image], tf.float32), label
+    else:
+        preprocess_fn = partial(segmentation_read_and_preprocess,
+                                image_size=image_size, num_classes=num_classes,
+                                sparse=sparse)
+        mask_dtype = tf.uint8 if sparse else tf.int32
+
+        def map_fn(image_path, mask_path):
+            return tf.numpy_function(preprocess_fn, [image_path, mask_path],
+                                     [tf.float32, mask_dtype])
+
+        def aug_fn(image, mask):
+            data = transform(image=image, mask=mask)
+            return data['image'], data['mask']
+
+        def augment(image, mask):
+            return tf.numpy_function(aug_fn, [image, mask], [tf.float32, mask_dtype])
+    return map_fn, (augment if transform is not None else None)
+
@@ -0,0 +1,180 @@
+"""
+Title: TFOD SavedModel Export
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Export the TFOD checkpoint to SavedModel in the current process, instead of running
+`exporter_main_v2.py` in a subprocess which imports TensorFlow and the Object Detection
+API again every time, used by `export_tfod_savedmodel()`.
+
+The checksum of the latest checkpoint and the `pipeline.config` is saved with the
+export, so the export is skipped when the checkpoint has not changed since the last
+export. The model is exported into a temporary folder first and then moved into
+place, so a failed or unfinished export never replaces a complete one.
+
+The export can also run in a background thread after training with
+`start_background_export()`, the other exports of the same folder wait for it.
+"""
+import hashlib
+import json
+import shutil
+import sys
+from pathlib import Path
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Dict, Optional
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+
+CHECKSUM_FILENAME = 'export_checksum.json'
+
+# only one export at a time, building the graphs concurrently takes too much memory
+_export_lock = Lock()
+# export_dir -> the running background export thread
+_background_exports: Dict[str, Thread] = {}
+_background_lock = Lock()
+
+
+def get_export_checksum(ckpt_dir: Path, pipeline_config_path: Path) -> Optional[str]:
+    """Checksum of the latest checkpoint and the pipeline config, None if there is
+    no checkpoint.
+
+    The `.index` file of a checkpoint stores the CRC32C checksum of every tensor
+    in the data files, so hashing it with the sizes of the data files is enough
+    to detect a changed checkpoint without reading the large data files."""
+    from machine_learning.utils import get_tfod_last_ckpt_path
+
+    ckpt_index_path = get_tfod_last_ckpt_path(Path(ckpt_dir))
+    if ckpt_index_path is None or not Path(pipeline_config_path).exists():
+        return None
+    h = hashlib.sha1()
+    h.update(ckpt_index_path.name.encode())
+    h.update(ckpt_index_path.read_bytes())
+    ckpt_prefix = ckpt_index_path.with_suffix('')
+    for data_path in sorted(ckpt_prefix.parent.glob(f"{ckpt_prefix.name}.data-*")):
+        h.update(f"|{data_path.name}|{data_path.stat().st_size}".encode())
+    h.update(Path(pipeline_config_path).read_bytes())
+    return h.hexdigest()
+
+
+def read_export_checksum(export_dir: Path) -> Optional[str]:
+    checksum_path = Path(export_dir) / CHECKSUM_FILENAME
+    if not checksum_path.exists():
+        return None
+    try:
+        with open(checksum_path) as f:
+            return json.load(f)['checksum']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def is_export_up_to_date(training_paths: Dict[str, Path]) -> bool:
+    export_dir = training_paths['export']
+    if not (export_dir / 'saved_model' / 'saved_model.pb').exists():
+        return False
+    checksum = get_export_checksum(training_paths['models'],
+                                   training_paths['config_file'])
+    return checksum is not None and checksum == read_export_checksum(export_dir)
+
+
+def export_in_process(pipeline_config_path: Path, ckpt_dir: Path, output_dir: Path):
+    """Same as running `exporter_main_v2.py` with `--input_type=image_tensor`."""
+    import tensorflow as tf
+    from google.protobuf import text_format
+    from object_detection import exporter_lib_v2
+    from object_detection.protos import pipeline_pb2
+
+    pipeline_config = pipeline_pb2.TrainEvalPipelineConfig()
+    with tf.io.gfile.GFile(str(pipeline_config_path), 'r') as f:
+        text_format.Merge(f.read(), pipeline_config)
+    exporter_lib_v2.export_inference_graph(
+        'image_tensor', pipeline_config, str(ckpt_dir), str(output_dir))
+
+
+def swap_export_dir(tmp_dir: Path, export_dir: Path, checksum: Optional[str]):
+    """Replace the export folder with the newly exported temporary folder."""
+    if checksum is not None:
+        with open(tmp_dir / CHECKSUM_FILENAME, 'w') as f:
+            json.dump({'checksum': checksum}, f)
+    if export_dir.exists():
+        shutil.rmtree(export_dir)
+    tmp_dir.rename(export_dir)
+
+
+def wait_for_background_export(export_dir: Path):
+    with _background_lock:
+        thread = _background_exports.get(str(export_dir))
+    if thread is not None and thread.is_alive():
+        logger.info(f"Waiting for the background export at {export_dir}")
+        thread.join()
+
+
+def export_tfod_cached(training_paths: Dict[str, Path], force: bool = False) -> bool:
+    """Export the latest checkpoint in this process unless the existing export is
+    up to date. Returns True if the SavedModel exists after this."""
+    paths = training_paths
+    export_dir: Path = paths['export']
+    with _export_lock:
+        checksum = get_export_checksum(paths['models'], paths['config_file'])
+        if checksum is None:
+            logger.error(f"No TFOD checkpoint to export in {paths['models']}")
+            return False
+        if not force and checksum == read_export_checksum(export_dir) \
+                and (export_dir / 'saved_model' / 'saved_model.pb').exists():
+            logger.info("The exported SavedModel is up to date. Skipping export.")
+            return True
+
+        tmp_dir = export_dir.with_name(export_dir.name + '.tmp')
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        logger.info(f"Exporting TFOD SavedModel to {export_dir}")
+        start = perf_counter()
+        try:
+            export_in_process(paths['config_file'], paths['models'], tmp_dir)
+        except Exception as e:
+            logger.error(f"Error exporting the TFOD SavedModel: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+        swap_export_dir(tmp_dir, export_dir, checksum)
+        logger.info(f"Exported TFOD SavedModel in {perf_counter() - start:.2f}s")
+        return True
+
+
+def start_background_export(training_paths: Dict[str, Path]) -> Thread:
+    """Export in a background thread, e.g. right after training while the user is
+    checking the evaluation results."""
+    export_dir = training_paths['export']
+    with _background_lock:
+        thread = _background_exports.get(str(export_dir))
+        if thread is not None and thread.is_alive():
+            return thread
+        thread = Thread(target=export_tfod_cached, args=(dict(training_paths),),
+                        name=f'tfod-export-{export_dir.parent.name}', daemon=True)
+        _background_exports[str(export_dir)] = thread
+        thread.start()
+    logger.info(f"Started the background export at {export_dir}")
+    return thread
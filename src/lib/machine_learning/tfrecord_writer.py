@@ -0,0 +1,295 @@
+"""
+Title: TFRecord Writer
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Write the Pascal VOC bounding boxes (the dataframe from `xml_to_df()` or the CSV file
+of `generate_tfod_xml_csv()`) into sharded TFRecord files for the TFOD API, e.g.
+`train.record-00000-of-00004`, ... `train.record-00003-of-00004`.
+
+This replaces running `module/generate_tfrecord_st.py` in a subprocess. The boxes are
+validated with vectorized checks on the whole dataframe, and each shard is written by
+its own worker process. Small datasets are written in the current process to avoid
+the startup time of the workers, which need to import TensorFlow.
+"""
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+
+# minimum number of images for each shard, to not spawn workers for tiny datasets
+MIN_EXAMPLES_PER_SHARD = 200
+MAX_SHARDS = 16
+
+# (filename, image_path, width, height, classnames, xmins, ymins, xmaxs, ymaxs),
+# with the coordinates already normalized to [0, 1]
+ExampleData = Tuple[str, str, int, int, List[str],
+                    List[float], List[float], List[float], List[float]]
+
+
+def get_shard_paths(output_path: Union[str, Path], num_shards: int) -> List[Path]:
+    output_path = Path(output_path)
+    return [output_path.with_name(f"{output_path.name}-{i:05d}-of-{num_shards:05d}")
+            for i in range(num_shards)]
+
+
+def get_shard_pattern(output_path: Union[str, Path], num_shards: int) -> str:
+    """The glob pattern of the shards to use as the `input_path` in the
+    `tf_record_input_reader` of the TFOD pipeline config."""
+    output_path = Path(output_path)
+    return str(output_path.with_name(f"{output_path.name}-?????-of-{num_shards:05d}"))
+
+
+def remove_existing_records(output_path: Union[str, Path]):
+    """Remove the record file(s) generated previously at `output_path`,
+    including the old unsharded record file."""
+    output_path = Path(output_path)
+    for p in output_path.parent.glob(f"{output_path.name}*"):
+        os.remove(p)
+
+
+def get_num_shards(num_examples: int, max_shards: Optional[int] = None) -> int:
+    if max_shards is None:
+        max_shards = min(os.cpu_count() or 1, MAX_SHARDS)
+    return max(1, min(max_shards, math.ceil(num_examples / MIN_EXAMPLES_PER_SHARD)))
+
+
+def validate_boxes(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
+    """Normalize the box coordinates with the image sizes and check them all at once.
+
+    Returns the dataframe of the valid images with the normalized coordinates, and the
+    filenames of the images with any box outside of the image or an invalid image
+    size, which are excluded entirely, same as the original script. The degenerate
+    boxes (e.g. zero width or height) are only dropped from their images."""
+    df = df.copy()
+    width = df['width'].to_numpy(dtype=np.float64)
+    height = df['height'].to_numpy(dtype=np.float64)
+    df['xmin'] = df['xmin'].to_numpy(dtype=np.float64) / width
+    df['xmax'] = df['xmax'].to_numpy(dtype=np.float64) / width
+    df['ymin'] = df['ymin'].to_numpy(dtype=np.float64) / height
+    df['ymax'] = df['ymax'].to_numpy(dtype=np.float64) / height
+
+    invalid = ((df['xmin'] < 0) | (df['xmax'] > 1)
+               | (df['ymin'] < 0) | (df['ymax'] > 1)
+               | (width <= 0) | (height <= 0))
+    degenerate = ((df['xmin'] >= df['xmax']) | (df['ymin'] >= df['ymax'])) & ~invalid
+    if degenerate.any():
+        num_images = df.loc[degenerate, 'filename'].nunique()
+        logger.warning(
+            f"Dropping {degenerate.sum()} degenerate boxes (xmin >= xmax or "
+            f"ymin >= ymax) in {num_images} images, the images without any other "
+            f"box are excluded from the TFRecords. Some of them: "
+            f"{df.loc[degenerate].head(5).to_dict('records')}")
+        df = df.loc[~degenerate]
+        invalid = invalid.loc[~degenerate]
+    if not invalid.any():
+        return df, []
+
+    error_filenames = df.loc[invalid, 'filename'].unique().tolist()
+    logger.warning(
+        f"Found {invalid.sum()} invalid boxes in {len(error_filenames)} images, "
+        f"these images are excluded from the TFRecords. Some of them: "
+        f"{df.loc[invalid].head(5).to_dict('records')}")
+    df = df.loc[~df['filename'].isin(error_filenames)]
+    return df, error_filenames
+
+
+def find_image_path(image_dir: Path, filename: str,
+                    image_extensions: Sequence[str] = ()) -> Optional[Path]:
+    """Label Studio exports XML filenames without the extensions, so the
+    `image_extensions` are tried when the file is not found."""
+    image_path = image_dir / filename
+    if image_path.exists():
+        return image_path
+    for ext in image_extensions:
+        new_image_path = image_dir / f"{filename}.{ext}"
+        if new_image_path.exists():
+            return new_image_path
+    return None
+
+
+def group_examples(df: pd.DataFrame, image_dir: Path,
+                   image_extensions: Sequence[str] = ()) -> List[ExampleData]:
+    examples = []
+    missing = []
+    for filename, group in df.groupby('filename', sort=False):
+        image_path = find_image_path(image_dir, filename, image_extensions)
+        if image_path is None:
+            missing.append(filename)
+            continue
+        first = group.iloc[0]
+        examples.append((
+            filename, str(image_path), int(first['width']), int(first['height']),
+            group['classname'].astype(str).tolist(),
+            group['xmin'].tolist(), group['ymin'].tolist(),
+            group['xmax'].tolist(), group['ymax'].tolist()))
+    if missing:
+        raise FileNotFoundError(
+            f"{len(missing)} images are not found in {image_dir}, e.g. {missing[:5]}. "
+            "If you are using Label Studio, try to pass in the `image_extensions` "
+            "to append the image extension at the end as the XML file exported "
+            "from Label Studio did not include file extension in the filename.")
+    return examples
+
+
+def _write_shard(output_path: str, examples: List[ExampleData],
+                 label_map_dict: Dict[str, int]) -> int:
+    """Write the examples into a single TFRecord file, runs in the worker processes."""
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    import tensorflow as tf
+
+    def bytes_feature(values: List[bytes]):
+        return tf.train.Feature(bytes_list=tf.train.BytesList(value=values))
+
+    def float_feature(values: List[float]):
+        return tf.train.Feature(float_list=tf.train.FloatList(value=values))
+
+    def int64_feature(values: List[int]):
+        return tf.train.Feature(int64_list=tf.train.Int64List(value=values))
+
+    with tf.io.TFRecordWriter(output_path) as writer:
+        for (filename, image_path, width, height, classnames,
+             xmins, ymins, xmaxs, ymaxs) in examples:
+            with open(image_path, 'rb') as f:
+                encoded_image = f.read()
+            # NOTE: do not read the width and height from the image with PIL,
+            # it might read the image in the rotated dimensions
+            filename = filename.encode('utf8')
+            tf_example = tf.train.Example(features=tf.train.Features(feature={
+                "image/height": int64_feature([height]),
+                "image/width": int64_feature([width]),
+                "image/filename": bytes_feature([filename]),
+                "image/source_id": bytes_feature([filename]),
+                "image/encoded": bytes_feature([encoded_image]),
+                "image/format": bytes_feature([b"jpg"]),
+                "image/object/bbox/xmin": float_feature(xmins),
+                "image/object/bbox/xmax": float_feature(xmaxs),
+                "image/object/bbox/ymin": float_feature(ymins),
+                "image/object/bbox/ymax": float_feature(ymaxs),
+                "image/object/class/text": bytes_feature(
+                    [c.encode('utf8') for c in classnames]),
+                "image/object/class/label": int64_feature(
+                    [label_map_dict[c] for c in classnames]),
+            }))
+            writer.write(tf_example.SerializeToString())
+    return len(examples)
+
+
+def load_label_map_dict(labelmap_path: Union[str, Path]) -> Dict[str, int]:
+    from object_detection.utils import label_map_util
+    label_map = label_map_util.load_labelmap(str(labelmap_path))
+    return label_map_util.get_label_map_dict(label_map)
+
+
+def write_sharded_tfrecords(df: pd.DataFrame,
+                            image_dir: Union[str, Path],
+                            labelmap_path: Union[str, Path],
+                            output_path: Union[str, Path],
+                            num_shards: Optional[int] = None,
+                            image_extensions: Sequence[str] = ('jpeg', 'jpg', 'png'),
+                            remove_error_images: bool = True) -> str:
+    """Write the boxes in `df` (with the columns of `xml_to_df()`) into sharded
+    TFRecord files at `output_path`, e.g. `train.record-00000-of-00004`.
+
+    Args:
+        df (pd.DataFrame): Dataframe from `xml_to_df()` or the CSV file of
+            `generate_tfod_xml_csv()`.
+        image_dir (Union[str, Path]): Directory of the images.
+        labelmap_path (Union[str, Path]): Path to the label_map.pbtxt file.
+        output_path (Union[str, Path]): Path prefix of the record files.
+        num_shards (Optional[int], optional): Number of shards, which is also the
+            number of worker processes. Defaults to one shard for every
+            `MIN_EXAMPLES_PER_SHARD` images up to the number of CPU cores.
+        image_extensions (Sequence[str], optional): Extensions to try for Label
+            Studio filenames without extensions. Defaults to ('jpeg', 'jpg', 'png').
+        remove_error_images (bool, optional): Remove the images and their XML files
+            with boxes outside of the image or an invalid image size, as they are
+            excluded from the TFRecords. The images are never removed for the
+            degenerate boxes, which are only dropped. Defaults to True.
+
+    Returns:
+        str: The glob pattern of the shards for the TFOD pipeline config.
+    """
+    start = perf_counter()
+    image_dir = Path(image_dir)
+    df, error_filenames = validate_boxes(df)
+    examples = group_examples(df, image_dir, image_extensions)
+    if not examples:
+        raise ValueError(f"No valid annotated image found for {output_path}")
+
+    if remove_error_images and error_filenames:
+        logger.info(f"Removing {len(error_filenames)} images with invalid boxes")
+        for filename in error_filenames:
+            image_path = find_image_path(image_dir, filename, image_extensions)
+            if image_path is None:
+                continue
+            os.remove(image_path)
+            xml_path = image_path.with_suffix('.xml')
+            if xml_path.exists():
+                os.remove(xml_path)
+
+    if num_shards is None:
+        num_shards = get_num_shards(len(examples))
+    num_shards = max(1, min(num_shards, len(examples)))
+    label_map_dict = load_label_map_dict(labelmap_path)
+    missing_classes = set(df['classname'].astype(str)) - set(label_map_dict)
+    if missing_classes:
+        raise ValueError(
+            f"Class names not found in the labelmap file: {missing_classes}")
+
+    remove_existing_records(output_path)
+    shard_paths = [str(p) for p in get_shard_paths(output_path, num_shards)]
+    # round-robin so that every shard has a similar mix of the images
+    shard_examples = [examples[i::num_shards] for i in range(num_shards)]
+
+    if num_shards == 1:
+        total = _write_shard(shard_paths[0], shard_examples[0], label_map_dict)
+    else:
+        # NOTE: must use 'spawn' instead of 'fork', forking a process which has
+        # already initialized TensorFlow might hang
+        with ProcessPoolExecutor(num_shards, mp_context=get_context('spawn')) as executor:
+            futures = [executor.submit(_write_shard, path, shard, label_map_dict)
+                       for path, shard in zip(shard_paths, shard_examples)]
+            total = sum(f.result() for f in futures)
+
+    time_elapsed = perf_counter() - start
+    logger.info(f"Written {total} examples into {num_shards} TFRecord shard(s) at "
+                f"{output_path} in {time_elapsed:.2f} seconds")
+    return get_shard_pattern(output_path, num_shards)
+
+
+def records_exist(shard_pattern: str) -> bool:
+    return any(Path(shard_pattern).parent.glob(Path(shard_pattern).name))
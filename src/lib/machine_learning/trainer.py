@@ -37,7 +37,7 @@ from functools import partial
 from itertools import cycle
 from pathlib import Path
 from time import perf_counter
-from typing import TYPE_CHECKING, Any, Callable, Dict, List, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
 
 import cv2
 import matplotlib.pyplot as plt
@@ -50,9 +50,7 @@ import wget
 from google.protobuf import text_format
 from imutils.paths import list_images
 from keras_unet_collection import models
-from keras_unet_collection.losses import focal_tversky
 from object_detection.protos import pipeline_pb2
-from sklearn.metrics import classification_report, confusion_matrix
 from sklearn.utils import shuffle
 from streamlit import session_state
 from tensorflow import keras
@@ -79,27 +77,65 @@ if TYPE_CHECKING:
     from project.project_management import Project
     from training.training_management import Training, AugmentationConfig
 
-from deployment.utils import (
-    classification_inference_pipeline,
-    segment_inference_pipeline,
-    tfod_inference_pipeline,
-)
+from data_manager.database_manager import init_connection
 from path_desc import (
     DATASET_DIR,
+    DERIVATIVE_IMAGE_DIR,
     PRE_TRAINED_MODEL_DIR,
     TFOD_DIR,
     TFOD_MODELS_TABLE_PATH,
 )
+from training.evaluation_result import save_evaluation_result
 from training.labelmap_management import Framework, Labels
+from training.progress_recorder import ProgressRecorder
 
-from .callbacks import LRTensorBoard, StreamlitOutputCallback
+from .callbacks import LRTensorBoard, StepTimer, StreamlitOutputCallback
 from .command_utils import (
     export_tfod_savedmodel,
-    find_tfod_eval_metrics,
     find_tfod_metric,
-    run_command,
     run_command_update_metrics,
 )
+from .derivative_store import DerivativeStore
+from .perf_profile import (
+    PerfSettings,
+    convert_model_dtype_policy,
+    get_mixed_precision_policy,
+    get_model_dtype_policy,
+    get_perf_settings,
+    recompile_model,
+)
+from .tf_input_pipeline import (
+    batch_dataset,
+    build_tf_augment,
+    get_classification_finish_fn,
+    get_classification_load_fn,
+    get_segmentation_finish_fn,
+    get_segmentation_load_fn,
+    is_tf_supported,
+    load_dataset,
+    prune_dataset_cache,
+)
+from .eval_cache import (
+    EvalCache,
+    build_classification_cache,
+    build_segmentation_cache,
+    build_tfod_cache,
+    get_file_key,
+    get_test_set_key,
+    get_tfod_labels_bytes,
+    load_eval_cache,
+    run_build,
+    start_background_build,
+    wait_for_background_build,
+)
+from .tfod_export import (
+    export_tfod_cached,
+    get_export_checksum,
+    is_export_up_to_date,
+    start_background_export,
+    wait_for_background_export,
+)
+from .tfrecord_writer import records_exist, write_sharded_tfrecords
 from .utils import (
     NASNET_IMAGENET_INPUT_SHAPES,
     check_unique_label_counts,
@@ -107,16 +143,16 @@ from .utils import (
     custom_train_test_split,
     find_architecture_name,
     generate_tfod_xml_csv,
-    get_bbox_label_info,
+    get_all_keras_custom_objects,
     get_ckpt_cnt,
     get_classif_model_preprocess_func,
     get_detection_classes,
     get_mask_path_from_image_path,
+    get_segmentation_loss,
     get_test_images_labels,
     get_tfod_last_ckpt_path,
     get_tfod_test_set_data,
     get_transform,
-    hybrid_loss,
     load_keras_model,
     load_labelmap,
     load_tfod_checkpoint,
@@ -125,6 +161,7 @@ from .utils import (
     modify_trained_model_layers,
     segmentation_read_and_preprocess,
     tf_classification_preprocess_input,
+    xml_to_df,
 )
 from .visuals import (
     PrettyMetricPrinter,
@@ -132,6 +169,7 @@ from .visuals import (
     create_color_legend,
     draw_gt_bboxes,
     draw_segmentation_classes,
+    draw_tfod_bboxes,
     get_colored_mask_image,
     get_segmentation_data_to_draw_class_names,
 )
@@ -192,6 +230,8 @@ class Trainer:
         # preprocess function specifically for image classification, to obtain later
         # on evaluation in run_keras_eval()
         self.preprocess_fn: Callable = None
+        # leases the derivatives used by the datasets until the training is finished
+        self.derivative_store: Optional[DerivativeStore] = None
 
     def __repr__(self):
         return "<{klass} {attrs}>".format(
@@ -210,6 +250,8 @@ class Trainer:
         tf.keras.backend.clear_session()
         gc.collect()
 
+        # the export and evaluation from the previous training might be still running
+        self.wait_for_background_tasks()
         if self.training_path['export'].exists():
             # remove the exported model first before training
             shutil.rmtree(self.training_path['export'])
@@ -235,10 +277,16 @@ class Trainer:
                 segmentation = True
             # optionally also allow train with one batch of data for classification/segmentation
             #  to test whether the model is good enough to overfit only one batch
-            self.run_keras_training(is_resume=is_resume,
-                                    classification=classification,
-                                    segmentation=segmentation,
-                                    train_one_batch=train_one_batch)
+            try:
+                self.run_keras_training(is_resume=is_resume,
+                                        classification=classification,
+                                        segmentation=segmentation,
+                                        train_one_batch=train_one_batch)
+            finally:
+                if self.derivative_store is not None:
+                    # the derivatives can be evicted by any process again
+                    self.derivative_store.release()
+                    self.derivative_store = None
         # clear models cache
         st.legacy_caching.clear_cache()
 
@@ -252,7 +300,7 @@ class Trainer:
     def export_model(self, re_export: bool = True):
         """
         TFOD: Export model and create a tarfile. If `re_export` is True,
-        will export again even though the exported files already exist.
+        will export again if the latest checkpoint has changed.
 
         Classification/segmentation: Move to paths['export'] and create a tarfile
         """
@@ -263,6 +311,197 @@ class Trainer:
         else:
             self.export_keras_model()
 
+    def wait_for_background_tasks(self):
+        """Wait for the background export and evaluation started after training,
+        e.g. before the training job process exits."""
+        wait_for_background_build(self.training_path['eval_cache'])
+        wait_for_background_export(self.training_path['export'])
+
+    def get_split_kwargs(self) -> Dict[str, Any]:
+        """Split method for `custom_train_test_split()`, the hash split keeps the
+        partitions of the existing images when the dataset grows, so the copied
+        images and caches of the existing images can be reused."""
+        return {
+            'split_method': self.training_param.get('split_method', 'hash'),
+            'hash_by': self.training_param.get('split_hash_by', 'name'),
+        }
+
+    # ********************* METHODS FOR EVALUATION CACHE *********************
+
+    def get_eval_model_key(self) -> Optional[str]:
+        """Key of the trained model to invalidate the cached test set predictions,
+        None if the model does not exist."""
+        paths = self.training_path
+        if self.deployment_type == 'Object Detection with Bounding Boxes':
+            # the exported model and the checkpoint have the same predictions
+            return get_export_checksum(paths['models'], paths['config_file'])
+        return get_file_key(paths['output_keras_model_file'])
+
+    def load_eval_test_set(self) -> Dict[str, Any]:
+        """Load the test set for `build_eval_cache()`. This must be called in the
+        main thread because of the Streamlit spinners and caching."""
+        paths = self.training_path
+        if self.deployment_type == 'Object Detection with Bounding Boxes':
+            image_paths, gt_xml_df = get_tfod_test_set_data(paths['images'] / 'test')
+            return {'image_paths': image_paths, 'gt_xml_df': gt_xml_df,
+                    'category_index': load_labelmap(paths['labelmap_file'])}
+        elif self.deployment_type == 'Image Classification':
+            X_test, y_test, encoded_label_dict = get_test_images_labels(
+                paths['test_set_pkl_file'], self.deployment_type)
+            class_names = [encoded_label_dict[i] for i in sorted(encoded_label_dict)]
+            return {'image_paths': X_test, 'labels': y_test, 'class_names': class_names}
+        else:
+            X_test, y_test = get_test_images_labels(
+                paths['test_set_pkl_file'], self.deployment_type)
+            return {'image_paths': X_test, 'mask_paths': y_test,
+                    'class_names': self.class_names}
+
+    def get_eval_test_set_key(self, test_set: Dict[str, Any]) -> str:
+        if self.deployment_type == 'Object Detection with Bounding Boxes':
+            labels = get_tfod_labels_bytes(test_set['gt_xml_df'])
+        elif self.deployment_type == 'Image Classification':
+            labels = list(test_set['labels']) + test_set['class_names']
+        else:
+            labels = list(test_set['mask_paths']) + test_set['class_names']
+        return get_test_set_key(test_set['image_paths'], labels)
+
+    def load_eval_model(self) -> Tuple[Any, bool]:
+        """Returns the model to run on the test set, and whether it is a TFOD checkpoint."""
+        paths = self.training_path
+        if self.deployment_type == 'Object Detection with Bounding Boxes':
+            # only use the full exported model if it is exported from the latest checkpoint
+            if is_export_up_to_date(paths):
+                return load_tfod_model(paths['export'] / 'saved_model'), False
+            return load_tfod_checkpoint(ckpt_dir=paths['models'],
+                                        pipeline_config_path=paths['config_file']), True
+        logger.info(f"Loading trained Keras model for {self.deployment_type}")
+        if self.is_not_pretrained:
+            model = load_trained_keras_model(paths['output_keras_model_file'])
+        else:
+            model = load_keras_model(paths['output_keras_model_file'],
+                                     self.metrics, self.training_param)
+        return model, False
+
+    def build_eval_cache(self, test_set: Dict[str, Any], model: Any, conn,
+                         is_checkpoint: bool = False,
+                         progress_fn: Callable[[int, int], None] = None
+                         ) -> Optional[EvalCache]:
+        """Run the model on the whole test set in batches and cache the predictions,
+        thumbnails and metrics, returns None if there is any error. The metrics are
+        also saved in the database with `conn`."""
+        cache_dir = self.training_path['eval_cache']
+        model_key = self.get_eval_model_key()
+        test_set_key = self.get_eval_test_set_key(test_set)
+        if self.deployment_type == 'Object Detection with Bounding Boxes':
+            cache = run_build(
+                cache_dir, build_tfod_cache, model, test_set['image_paths'],
+                test_set['gt_xml_df'], test_set['category_index'], model_key,
+                test_set_key, is_checkpoint=is_checkpoint, progress_fn=progress_fn)
+        elif self.deployment_type == 'Image Classification':
+            self.preprocess_fn = self.get_preprocess_fn(model)
+            cache = run_build(
+                cache_dir, build_classification_cache, model, test_set['image_paths'],
+                test_set['labels'], test_set['class_names'],
+                self.training_param['image_size'], self.preprocess_fn, model_key,
+                test_set_key, progress_fn=progress_fn)
+        else:
+            cache = run_build(
+                cache_dir, build_segmentation_cache, model, test_set['image_paths'],
+                test_set['mask_paths'], test_set['class_names'],
+                self.training_param['image_size'], model_key, test_set_key,
+                progress_fn=progress_fn)
+        if cache is not None:
+            # also keep the metrics in the database to compare the trainings
+            save_evaluation_result(self.training_id, model_key, cache.metrics, conn)
+        return cache
+
+    def _build_tfod_eval_cache(self, test_set: Dict[str, Any], conn):
+        # this waits for the background export, and is skipped if it is up to date
+        if not export_tfod_cached(self.training_path):
+            return
+        # NOTE: not using load_tfod_model() which clears the Keras session
+        model = tf.saved_model.load(
+            str(self.training_path['export'] / 'saved_model'))
+        self.build_eval_cache(test_set, model, conn)
+
+    def start_background_eval(self, model: keras.Model = None):
+        """Run the model on the test set in a background thread after training, while
+        the user is checking the training results. The trained Keras `model` is
+        required for classification and segmentation."""
+        test_set = self.load_eval_test_set()
+        conn = init_connection(**st.secrets["postgres"])
+        cache_dir = self.training_path['eval_cache']
+        if self.deployment_type == 'Object Detection with Bounding Boxes':
+            start_background_build(cache_dir, self._build_tfod_eval_cache,
+                                   test_set, conn)
+        else:
+            start_background_build(cache_dir, self.build_eval_cache,
+                                   test_set, model, conn)
+
+    def get_eval_cache(self) -> Optional[EvalCache]:
+        """Load the cached test set predictions, the model is run on the whole test
+        set again only if the model or the test set has changed."""
+        cache_dir = self.training_path['eval_cache']
+        wait_for_background_build(cache_dir)
+
+        model_key = self.get_eval_model_key()
+        if model_key is None:
+            logger.error(f"Trained model not found for Training {self.training_id}")
+            st.error("The trained model is not found, please train the model first.")
+            return None
+        test_set = self.load_eval_test_set()
+        cache = load_eval_cache(
+            cache_dir, model_key, self.get_eval_test_set_key(test_set))
+        if cache is not None:
+            return cache
+
+        with st.spinner("Loading model ... This might take awhile ..."):
+            model, is_checkpoint = self.load_eval_model()
+        progress_bar = st.progress(0.0)
+
+        def update_progress(done: int, total: int):
+            progress_bar.progress(done / total)
+
+        with st.spinner("Running the model on the test set ..."):
+            cache = self.build_eval_cache(
+                test_set, model, init_connection(**st.secrets["postgres"]),
+                is_checkpoint=is_checkpoint, progress_fn=update_progress)
+        progress_bar.empty()
+        if cache is None:
+            st.error("Error running the model on the test set, please check the "
+                     "terminal output, or contact the admin.")
+        return cache
+
+    def show_eval_metrics(self, metrics: Dict[str, Any]):
+        """Show the metrics computed from the cached test set predictions, see
+        `evaluation.py` for the structure of `metrics`."""
+        summary_txt = []
+        for name, value in metrics['summary'].items():
+            value = f"{value:.4f}" if isinstance(value, float) else value
+            summary_txt.append(f"**{name}**: {value}")
+        st.info("  \n".join(summary_txt))
+
+        st.markdown("**Per-class metrics**")
+        st.dataframe(pd.DataFrame(metrics['per_class']).T)
+
+        cm = np.array(metrics['confusion_matrix'])
+        if self.deployment_type == 'Semantic Segmentation with Polygons':
+            # too many pixels to show the counts
+            cm = cm / np.maximum(cm.sum(axis=1, keepdims=True), 1)
+            title, fmt = "Pixel Confusion Matrix (normalized)", ".2f"
+        else:
+            title, fmt = "Confusion Matrix", "d"
+        fig = plt.figure()
+        sns.heatmap(
+            cm, cmap="Blues", annot=True, fmt=fmt, cbar=False,
+            yticklabels=metrics['labels'], xticklabels=metrics['labels'],
+        )
+        plt.title(title, size=12, fontfamily="serif")
+        plt.ylabel('Actual')
+        plt.xlabel('Predicted')
+        st.pyplot(fig)
+        plt.close(fig)
+
     def reset_tfod_progress(self):
         # reset the training progress
         training_progress = {'Step': 0, 'Checkpoint': 0}
@@ -387,7 +626,8 @@ class Trainer:
                 image_paths=image_paths,
                 test_size=test_size,
                 labels=labels,
-                no_validation=True
+                no_validation=True,
+                **self.get_split_kwargs()
             )
 
         col, _ = st.columns([1, 1])
@@ -403,8 +643,8 @@ class Trainer:
             st.code(f"Total training images = {train_size}  \n"
                     f"Total testing images = {len(y_test)}")
 
-        # initialize to check whether these paths exist for generating TF Records
-        train_xml_csv_path = None
+        # initialize to check whether the augmented bboxes exist for generating TF Records
+        train_xml_df = None
         with st.spinner('Copying images to folder, this may take awhile ...'):
             logger.info('Copying images to train test folder')
             if self.augmentation_config.exists():
@@ -415,7 +655,7 @@ class Trainer:
 
                     # these csv files are temporarily generated to use for generating TF Records, should be removed later
                     train_xml_csv_path = paths['annotations'] / 'train.csv'
-                    generate_tfod_xml_csv(
+                    train_xml_df = generate_tfod_xml_csv(
                         image_paths=X_train,
                         xml_dir=self.dataset_export_path / "Annotations",
                         output_img_dir=paths["images"] / 'train',
@@ -464,44 +704,34 @@ class Trainer:
                 CLASS_NAMES, paths["labelmap_file"].parent, self.deployment_type)
 
         # ******************** Generate TFRecords ********************
-        # this generate_tfrecord_st.py script is modified from https://tensorflow-object-detection-api-tutorial.readthedocs.io/en/latest/training.html
-        # to convert our PascalVOC XML annotation files into TFRecords for TFOD API
-        GENERATE_TFRECORD_SCRIPT = LIB_PATH / \
-            "machine_learning" / "module" / "generate_tfrecord_st.py"
-
+        # the TFRecords are written in sharded files by parallel worker processes,
+        # modified from the `generate_tfrecord_st.py` script from https://tensorflow-object-detection-api-tutorial.readthedocs.io/en/latest/training.html
+        # to convert our PascalVOC XML annotations into TFRecords for TFOD API
         with st.spinner('Generating TFRecords ...'):
             logger.info('Generating TFRecords')
-            image_extensions = 'jpeg jpg png'
-            if train_xml_csv_path is not None:
-                # using the CSV file generated during the augmentation process above
-                # Must provide both image_dir and csv_path to skip the `xml_to_df` conversion step
-                run_command(
-                    f'python "{GENERATE_TFRECORD_SCRIPT}" '
-                    f'-e {image_extensions} '
-                    f'-i "{paths["images"] / "train"}" '
-                    f'-l "{paths["labelmap_file"]}" '
-                    f'-d "{train_xml_csv_path}" '
-                    f'-o "{paths["annotations"] / "train.record"}"'
-                )
+            if train_xml_df is not None:
+                # using the bboxes generated during the augmentation process above
+                train_df = train_xml_df
             else:
-                run_command(
-                    f'python "{GENERATE_TFRECORD_SCRIPT}" '
-                    f'-e {image_extensions} '
-                    f'-x "{paths["images"] / "train"}" '
-                    f'-l "{paths["labelmap_file"]}" '
-                    f'-o "{paths["annotations"] / "train.record"}"'
-                )
-            # test set images are not augmented
-            run_command(
-                f'python "{GENERATE_TFRECORD_SCRIPT}" '
-                f'-e {image_extensions} '
-                f'-x "{paths["images"] / "test"}" '
-                f'-l "{paths["labelmap_file"]}" '
-                f'-o "{paths["annotations"] / "test.record"}"'
-            )
-
-        if not (paths["annotations"] / "train.record").exists() or \
-                not (paths["annotations"] / "test.record").exists():
+                train_df = xml_to_df(paths["images"] / "train")
+            try:
+                train_record_pattern = write_sharded_tfrecords(
+                    train_df,
+                    image_dir=paths["images"] / "train",
+                    labelmap_path=paths["labelmap_file"],
+                    output_path=paths["annotations"] / "train.record")
+                # test set images are not augmented
+                test_record_pattern = write_sharded_tfrecords(
+                    xml_to_df(paths["images"] / "test"),
+                    image_dir=paths["images"] / "test",
+                    labelmap_path=paths["labelmap_file"],
+                    output_path=paths["annotations"] / "test.record")
+            except (FileNotFoundError, ValueError) as e:
+                logger.error(f"Error generating TFRecords: {e}")
+                train_record_pattern = test_record_pattern = None
+
+        if train_record_pattern is None or not records_exist(train_record_pattern) \
+                or not records_exist(test_record_pattern):
             txt = "Error generating TFRecords, please try again."
             logger.error(txt)
             st.error(txt)
@@ -556,11 +786,11 @@ class Trainer:
             pipeline_config.train_input_reader.label_map_path = str(
                 paths["labelmap_file"])
             pipeline_config.train_input_reader.tf_record_input_reader.input_path[:] = [
-                str(paths['annotations'] / 'train.record')]
+                train_record_pattern]
             pipeline_config.eval_input_reader[0].label_map_path = str(
                 paths["labelmap_file"])
             pipeline_config.eval_input_reader[0].tf_record_input_reader.input_path[:] = [
-                str(paths['annotations'] / 'test.record')]
+                test_record_pattern]
 
             config_text = text_format.MessageToString(pipeline_config)
             with tf.io.gfile.GFile(paths["config_file"], "wb") as f:
@@ -599,8 +829,8 @@ class Trainer:
             # stdout_output = True
             logger.debug(f"{stdout_output = }")
             traceback = run_command_update_metrics(
-                command, num_train_steps, stdout_output=stdout_output,
-                step_name='Step')
+                command, num_train_steps, paths['models'],
+                stdout_output=stdout_output, step_name='Step')
         if traceback:
             st.error(
                 "Some error occurred while training, it could be due to insufficient "
@@ -635,50 +865,29 @@ class Trainer:
         session_state.new_training.update_progress(
             progress, verbose=True)
 
-        # ************************ EVALUATION ************************
-        start = perf_counter()
-        with st.spinner("Running object detection evaluation ..."):
-            logger.info('Running object detection evaluation')
-            command = (f'python "{TRAINING_SCRIPT}" '
-                       f'--model_dir "{paths["models"]}" '
-                       f'--pipeline_config_path "{paths["config_file"]}" '
-                       f'--checkpoint_dir "{paths["models"]}"')
-            filtered_outputs = run_command(
-                command, stdout_output=stdout_output, st_output=False,
-                filter_by=['DetectionBoxes_', 'Loss/'], is_cocoeval=True)
-        if filtered_outputs:
-            time_elapsed = perf_counter() - start
-            m, s = divmod(time_elapsed, 60)
-            m, s = int(m), int(s)
-            logger.info(f'Finished COCO evaluation! Took {m}m {s}s')
-            st.success(
-                f'Model has finished COCO evaluation! Took **{m}m {s}s**')
-            eval_result_text = find_tfod_eval_metrics(filtered_outputs)
-
-            st.subheader("Object detection evaluation results on test set:")
-            st.info(eval_result_text)
-
-            # store the results to directly show on the training page in the future
-            with open(paths['test_result_txt_file'], 'w') as f:
-                f.write(eval_result_text)
-            logger.debug("Saved evaluation script results at: "
-                         f"{paths['test_result_txt_file']}")
-        else:
-            st.warning("There was some error occurred with COCO evaluation.")
-            logger.error("There was some error occurred with COCO evaluation.")
+        if self.training_param.get('export_after_training', True):
+            # export while running the evaluation and showing the results,
+            # the export is skipped later if the checkpoint is not changed
+            start_background_export(paths)
 
         # Delete unwanted files excluding those needed for evaluation and exporting
-        paths_to_del = (paths['annotations'],
-                        paths["images"] / 'train', paths["export"])
+        paths_to_del = (paths['annotations'], paths["images"] / 'train')
         for p in paths_to_del:
             if p.exists():
                 logger.debug("Removing unwanted directories used only "
                              f"for TFOD training: {p}")
                 shutil.rmtree(p)
 
+        # ************************ EVALUATION ************************
+        if self.training_param.get('export_after_training', True):
+            # evaluate on the test set with the exported model in this process
+            # instead of running the evaluation script, the metrics are shown
+            # in the evaluation views
+            self.start_background_eval()
+
     def export_tfod_model(self, stdout_output: bool = False, re_export: bool = True):
-        """ If `re_export` is True, will export again even though the exported
-        files already exist."""
+        """ If `re_export` is True, will export again if the latest checkpoint has
+        changed since the existing export."""
         paths = self.training_path
 
         export_tfod_savedmodel(paths, stdout_output, re_export)
@@ -705,33 +914,17 @@ class Trainer:
         # get the required paths
         paths = self.training_path
 
-        # show the stored evaluation result during training
-        if paths['test_result_txt_file'].exists():
-            st.subheader("Object Detection Evaluation results")
-            with open(paths['test_result_txt_file']) as f:
-                eval_result_text = f.read()
-            st.info(eval_result_text)
-        else:
-            logger.error("Some error occurred while running COCO evaluation script, and "
-                         f"the results were not saved at {paths['test_result_txt_file']}.")
+        # the predictions of the whole test set are cached to compute the metrics
+        # and to page through them
+        eval_cache = self.get_eval_cache()
+        if eval_cache is None:
+            return
+
+        st.subheader("Object Detection Evaluation results on test set:")
+        self.show_eval_metrics(eval_cache.metrics)
 
         # **************** SHOW SOME IMAGES FOR EVALUATION ****************
         st.subheader("Prediction Results on Validation/Test Set:")
-
-        exist_dict = self.check_model_exists()
-        with st.spinner("Loading model ... This might take awhile ..."):
-            # only use the full exported model after the user has exported it
-            if exist_dict['exported_model']:
-                if not hasattr(self, 'model'):
-                    self.model = load_tfod_model(
-                        self.training_path['export'] / 'saved_model')
-                is_checkpoint = False
-            else:
-                if not hasattr(self, 'model'):
-                    self.model = load_tfod_checkpoint(
-                        ckpt_dir=self.training_path['models'],
-                        pipeline_config_path=self.training_path['config_file'])
-                is_checkpoint = True
         category_index = load_labelmap(paths['labelmap_file'])
         logger.debug(f"{category_index = }")
 
@@ -744,10 +937,6 @@ class Trainer:
             # to keep track of the image index to show
             session_state['start_idx'] = 0
 
-        # take the test set images
-        test_data_dir = paths['images'] / 'test'
-        image_paths, gt_xml_df = get_tfod_test_set_data(test_data_dir)
-
         with options_col:
             def reset_start_idx():
                 session_state['start_idx'] = 0
@@ -760,7 +949,7 @@ class Trainer:
                 step=1,
                 format='%d',
                 key='n_samples',
-                help="Number of samples to run detection and display results.",
+                help="Number of samples to display results.",
                 on_change=reset_start_idx
             )
             conf_threshold = st.number_input(
@@ -775,30 +964,16 @@ class Trainer:
                       "then it will be displayed, otherwise discarded."),
             )
 
-            total_samples = len(image_paths)
+            total_samples = len(eval_cache)
             st.info(f"**Total test set images**: {total_samples}")
-            if not exist_dict['exported_model']:
-                with st.expander("NOTES about inference with non-exported model:"):
-                    st.markdown("""You are using the model loaded from a
-                    checkpoint, the inference time will be slightly slower
-                    than an exported model.  You may use this to check the
-                    performance of the model on real images before deciding
-                    to export the model. Or you may choose to export the
-                    model by clicking the "Export Model" button above first
-                    (if this is in training page)
-                    before checking the evaluation results. Note that the
-                    inference time for the first image will take significantly
-                    longer than others. In production, we will also export the
-                    model before deploying it for inference.""")
 
         # must try to int them to avoid complications
         start_idx, n_samples = int(session_state['start_idx']), int(n_samples)
-        current_image_paths = image_paths[start_idx: start_idx + n_samples]
 
         start = start_idx + 1
         end = start_idx + n_samples
         end = end if end <= total_samples else total_samples
-        logger.info(f"Detecting from the test set images: {start}"
+        logger.info(f"Showing the cached detections of the test set images: {start}"
                     f" to {end} ...")
         options_col.info(
             f"Showing sample images: **{start}** to **{end}**")
@@ -817,40 +992,29 @@ class Trainer:
         next_btn_col_1.button('Next samples ⏭️', key='btn_next_images_1',
                               on_click=next_samples)
 
-        with st.spinner("Running detections ..."):
-            # create the colors for each class to draw the bboxes nicely
-            class_colors = create_class_colors(self.class_names)
-
-            for i, p in enumerate(current_image_paths):
-                # current_img_idx = start_idx + i + 1
-                logger.debug(f"Detecting on image at: {p}")
-                img = cv2.imread(str(p))
-                filename = os.path.basename(p)
-
-                start_t = perf_counter()
-                results = tfod_inference_pipeline(
-                    img, model=self.model,
-                    conf_threshold=conf_threshold,
-                    category_index=category_index,
-                    is_checkpoint=is_checkpoint)
-                detections = results['detections']
-                img_with_detections = results['img']
-                time_elapsed = perf_counter() - start_t
-                logger.info(f"Done inference on {filename}. "
-                            f"[{time_elapsed:.2f} secs]")
-
-                pred_classes = get_detection_classes(
-                    detections, category_index, is_checkpoint=is_checkpoint)
-                logger.info(f"Detected classes: {pred_classes}")
-
-                class_names, bboxes = get_bbox_label_info(gt_xml_df, filename)
-                img = draw_gt_bboxes(img, bboxes,
-                                     class_names=class_names,
-                                     class_colors=class_colors)
-                true_img_col.image(img, channels='BGR',
-                                   caption=f'{start + i}. Ground Truth: {filename}')
-                pred_img_col.image(img_with_detections, channels='RGB',
-                                   caption=f'Prediction: {filename}')
+        # create the colors for each class to draw the bboxes nicely
+        class_colors = create_class_colors(self.class_names)
+
+        for idx in range(start_idx, end):
+            filename = os.path.basename(eval_cache.image_paths[idx])
+            img = eval_cache.read_thumbnail(idx)
+
+            detections = eval_cache.get_detections(idx, min_score=conf_threshold)
+            pred_classes = get_detection_classes(detections, category_index)
+            logger.debug(f"Detected classes in {filename}: {pred_classes}")
+            img_with_detections = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            draw_tfod_bboxes(detections, img_with_detections, category_index,
+                             min_score_thresh=conf_threshold)
+
+            class_names, bboxes = eval_cache.get_gt_boxes(
+                idx, scale=eval_cache.get_thumbnail_scale(idx))
+            img = draw_gt_bboxes(img, bboxes,
+                                 class_names=class_names,
+                                 class_colors=class_colors)
+            true_img_col.image(img, channels='BGR',
+                               caption=f'{idx + 1}. Ground Truth: {filename}')
+            pred_img_col.image(img_with_detections, channels='RGB',
+                               caption=f'Prediction: {filename}')
 
         prev_btn_col_2.button('⏮️ Previous samples', key='btn_prev_images_2',
                               on_click=previous_samples)
@@ -877,10 +1041,59 @@ class Trainer:
                           X_val: List[str] = None, y_val: List[str] = None,
                           keras_model: tf.keras.Model = None):
         """Create tf.data.Dataset for training set and testing set; also optionally
-        create for validation set if passed in."""
+        create for validation set if passed in.
+
+        By default, the preprocessing and the supported augmentations only use
+        TensorFlow ops (see `tf_input_pipeline.py`), set the training param
+        `use_tf_input_pipeline` to False to use `tf.numpy_function` instead.
+        The decoded and resized samples are cached on disk in the training folder
+        (or the training param `dataset_cache_dir`) unless the training param
+        `cache_dataset` is set to False.
+
+        The images are read from the derivative store in `DERIVATIVE_IMAGE_DIR`,
+        which are pre-resized to the `image_size` with the same TF ops, unless the
+        training param `use_derivative_images` is set to False.
+
+        The training params `input_num_parallel_calls` and `input_prefetch` override
+        the AUTOTUNE defaults of the tf.data pipeline, e.g. with the best values found
+        by `benchmark_input_pipeline.py`.
+
+        For segmentation with the training param `use_sparse_labels`, the masks are
+        uint8 class indices with a single channel instead of one-hot encoded."""
         logger.debug(f"Creating TF dataset for {self.deployment_type}")
         image_size = self.training_param['image_size']
-        if self.deployment_type == 'Image Classification':
+        use_tf_pipeline = self.training_param.get('use_tf_input_pipeline', True)
+        augmentations = (self.augmentation_config.augmentations
+                         if self.augmentation_config.exists() else {})
+        # augmentations are done with TF ops in the map function of the train set
+        use_tf_augment = (use_tf_pipeline and bool(augmentations)
+                          and is_tf_supported(augmentations))
+        if self.deployment_type != 'Image Classification':
+            num_classes = len(self.class_names)
+            logger.debug(f"{num_classes = }")
+            sparse = self.training_param.get('use_sparse_labels', False)
+            mask_dtype = tf.uint8 if sparse else tf.int32
+            mask_channels = 1 if sparse else num_classes
+
+        if use_tf_pipeline:
+            logger.info("Using the TensorFlow ops input pipeline")
+            tf_augment = build_tf_augment(augmentations) if use_tf_augment else None
+            # the load functions decode and resize, the finish functions augment
+            # and normalize, so that the outputs of the load functions can be cached
+            if self.deployment_type == 'Image Classification':
+                preprocess_fn = self.get_preprocess_fn(keras_model)
+                load_fn = get_classification_load_fn(image_size)
+                finish_fn = get_classification_finish_fn(
+                    image_size, preprocess_fn)
+                finish_train_fn = get_classification_finish_fn(
+                    image_size, preprocess_fn, augment=tf_augment)
+            else:
+                load_fn = get_segmentation_load_fn(image_size)
+                finish_fn = get_segmentation_finish_fn(
+                    image_size, num_classes, sparse=sparse)
+                finish_train_fn = get_segmentation_finish_fn(
+                    image_size, num_classes, augment=tf_augment, sparse=sparse)
+        elif self.deployment_type == 'Image Classification':
             preprocess_fn = self.get_preprocess_fn(keras_model)
 
             def tf_preprocess_fn(image):
@@ -894,12 +1107,11 @@ class Trainer:
                                          #  preprocess_fn=None)
                                          preprocess_fn=tf_preprocess_fn)
         else:
-            num_classes = len(self.class_names)
-            logger.debug(f"{num_classes = }")
             # preprocess_fn = tf_segmentation_preprocess_input
             preprocess_fn = partial(segmentation_read_and_preprocess,
                                     image_size=image_size,
-                                    num_classes=num_classes)
+                                    num_classes=num_classes,
+                                    sparse=sparse)
 
             def tf_preprocess_data(imagePath: str, maskPath: str) -> Tuple[tf.Tensor, tf.Tensor]:
                 # wrap the function and use it as a TF operation
@@ -907,11 +1119,51 @@ class Trainer:
                 image, mask = tf.numpy_function(
                     preprocess_fn,
                     inp=[imagePath, maskPath],
-                    Tout=[tf.float32, tf.int32]
+                    Tout=[tf.float32, mask_dtype]
                 )
                 return image, mask
-
-        if self.augmentation_config.exists():
+        # options of the tf.data pipeline, also swept by `benchmark_input_pipeline.py`
+        num_parallel_calls = self.training_param.get(
+            'input_num_parallel_calls', tf.data.AUTOTUNE)
+        prefetch = self.training_param.get('input_prefetch', tf.data.AUTOTUNE)
+        # cache the decoded and resized samples on disk to skip decoding in the later
+        # epochs and the later training runs of this training session with the same data
+        use_cache = use_tf_pipeline and self.training_param.get(
+            'cache_dataset', True)
+        if use_cache:
+            # `dataset_cache_dir` is shared by the concurrent trials of a hyper-parameter
+            # sweep, which must not prune the caches still read by the other trials,
+            # the whole directory is removed once the sweep is finished instead
+            cache_root = self.training_param.get('dataset_cache_dir')
+            if cache_root:
+                cache_root = Path(cache_root)
+            else:
+                cache_root = self.training_path['ROOT'] / 'dataset_cache'
+                prune_dataset_cache(cache_root)
+        # the derivatives only give the same results with the TF ops pipeline
+        use_derivatives = use_tf_pipeline and self.training_param.get(
+            'use_derivative_images', True)
+        if use_derivatives:
+            if self.derivative_store is None:
+                self.derivative_store = DerivativeStore(DERIVATIVE_IMAGE_DIR)
+            derivative_store = self.derivative_store
+
+        def load_subset(X: List[str], y: List[str], subset: str,
+                        is_train: bool = False) -> tf.data.Dataset:
+            if not use_tf_pipeline:
+                return load_dataset(X, y, tf_preprocess_data,
+                                    num_parallel_calls=num_parallel_calls)
+            if use_derivatives:
+                with st.spinner(f"Preparing the resized {subset} images ..."):
+                    X = derivative_store.get_paths(X, image_size)
+            # augmentation must be done after the cache
+            return load_dataset(
+                X, y, load_fn, finish_train_fn if is_train else finish_fn,
+                num_parallel_calls=num_parallel_calls,
+                cache_root=cache_root if use_cache else None, subset=subset,
+                image_size=image_size, deployment_type=self.deployment_type)
+
+        if augmentations and not use_tf_augment:
             # get the Albumentations transform
             transform = get_transform(self.augmentation_config,
                                       self.deployment_type)
@@ -936,7 +1188,7 @@ class Trainer:
 
                 def augment(image, mask):
                     aug_img, aug_mask = tf.numpy_function(
-                        func=aug_fn, inp=[image, mask], Tout=[tf.float32, tf.int32])
+                        func=aug_fn, inp=[image, mask], Tout=[tf.float32, mask_dtype])
                     return aug_img, aug_mask
 
         if self.deployment_type == 'Image Classification':
@@ -950,7 +1202,7 @@ class Trainer:
                 # just like `assert` statements to ensure the shapes are correct
                 # NOTE: this step is required to show metrics during training
                 img.set_shape([image_size, image_size, 3])
-                mask.set_shape([image_size, image_size, num_classes])
+                mask.set_shape([image_size, image_size, mask_channels])
                 return img, mask
 
         # randomly shuffle once here, then shuffle with smaller buffer size later
@@ -958,44 +1210,28 @@ class Trainer:
         X_train, y_train = shuffle(X_train, y_train)
 
         # only train set is augmented and shuffled
-        AUTOTUNE = tf.data.AUTOTUNE
         batch_size = self.training_param['batch_size']
-        train_ds = tf.data.Dataset.from_tensor_slices((X_train, y_train))
         # NOTE: large shuffle takes up too much memory and could be very slow
-        # cache() also takes up too much memory on large dataset
+        # cache() in memory also takes up too much memory on large dataset,
+        # the on-disk cache in `load_dataset()` is used instead
         shuffle_size = len(X_train) if len(X_train) < 1000 else 1000
-        train_ds = train_ds.map(
-            tf_preprocess_data, num_parallel_calls=AUTOTUNE)
-        if self.augmentation_config.exists():
-            train_ds = train_ds.map(augment, num_parallel_calls=AUTOTUNE)
-        train_ds = (
-            train_ds.map(set_shapes, num_parallel_calls=AUTOTUNE)
-            .shuffle(shuffle_size)
-            # .cache()
-            .batch(batch_size)
-            .prefetch(AUTOTUNE)
-        )
-
-        test_ds = tf.data.Dataset.from_tensor_slices((X_test, y_test))
-        test_ds = (
-            test_ds.map(tf_preprocess_data,
-                        num_parallel_calls=AUTOTUNE)
-            .map(set_shapes, num_parallel_calls=AUTOTUNE)
-            # .cache()
-            .batch(batch_size)
-            .prefetch(AUTOTUNE)
-        )
+        train_map_fns = ([augment, set_shapes] if augmentations and not use_tf_augment
+                         else [set_shapes])
+        train_ds = batch_dataset(
+            load_subset(X_train, y_train, 'train', is_train=True), batch_size,
+            map_fns=train_map_fns, shuffle_size=shuffle_size,
+            num_parallel_calls=num_parallel_calls, prefetch=prefetch)
+
+        test_ds = batch_dataset(
+            load_subset(X_test, y_test, 'test'), batch_size,
+            map_fns=[set_shapes], num_parallel_calls=num_parallel_calls,
+            prefetch=prefetch)
 
         if X_val:
-            val_ds = tf.data.Dataset.from_tensor_slices((X_val, y_val))
-            val_ds = (
-                val_ds.map(tf_preprocess_data,
-                           num_parallel_calls=AUTOTUNE)
-                .map(set_shapes, num_parallel_calls=AUTOTUNE)
-                # .cache()
-                .batch(batch_size)
-                .prefetch(AUTOTUNE)
-            )
+            val_ds = batch_dataset(
+                load_subset(X_val, y_val, 'val'), batch_size,
+                map_fns=[set_shapes], num_parallel_calls=num_parallel_calls,
+                prefetch=prefetch)
             return train_ds, val_ds, test_ds
 
         return train_ds, test_ds
@@ -1104,10 +1340,7 @@ class Trainer:
         # using a simple decay for now, can use cosine annealing if wanted
         opt = optimizer_func(learning_rate=lr,
                              decay=lr / self.training_param['num_epochs'])
-        use_hybrid_loss = self.training_param['use_hybrid_loss']
-        # focal_tversky seems to be good default
-        # in the future, perhaps also allow use to choose a loss function
-        loss = hybrid_loss if use_hybrid_loss else focal_tversky
+        loss = get_segmentation_loss(self.training_param)
 
         model.compile(loss=loss, optimizer=opt, metrics=self.metrics)
         return model
@@ -1125,6 +1358,12 @@ class Trainer:
 
         image_size = self.training_param['image_size']
         input_shape = (image_size, image_size, 3)
+        if self.deployment_type == 'Semantic Segmentation with Polygons':
+            # the loss must match the mask format of the current training param,
+            # the trained model could be trained with or without sparse labels
+            loss = get_segmentation_loss(self.training_param)
+        else:
+            loss = None
 
         model = modify_trained_model_layers(
             model, self.deployment_type,
@@ -1132,13 +1371,15 @@ class Trainer:
             num_classes=len(self.class_names),
             # must compile
             compile=True,
-            metrics=self.metrics)
+            metrics=self.metrics,
+            loss=loss)
         return model
 
     def create_callbacks(self, train_size: int,
                          progress_placeholder: Dict[str, Any],
                          num_epochs: int,
-                         update_metrics: bool = True) -> List[Callback]:
+                         update_metrics: bool = True,
+                         progress_recorder: ProgressRecorder = None) -> List[Callback]:
         # this callback saves the checkpoint with the best `val_loss`
         ckpt_cb = ModelCheckpoint(
             filepath=self.training_path['model_weights_file'],
@@ -1164,7 +1405,8 @@ class Trainer:
             steps_per_epoch=steps_per_epoch,
             progress_placeholder=progress_placeholder,
             refresh_rate=20,
-            update_metrics=update_metrics
+            update_metrics=update_metrics,
+            progress_recorder=progress_recorder
         )
 
         return [ckpt_cb, tensorboard_cb, st_output_cb]
@@ -1189,6 +1431,19 @@ class Trainer:
             layers.""")
             st.stop()
 
+    def apply_perf_profile(self, model: keras.Model,
+                           perf_settings: PerfSettings) -> keras.Model:
+        """Convert the model to the mixed precision policy of the performance profile
+        if supported, or back to float32 otherwise, and compile with XLA if enabled."""
+        policy = get_mixed_precision_policy(perf_settings) or 'float32'
+        if get_model_dtype_policy(model) != policy:
+            return convert_model_dtype_policy(
+                model, policy, self.metrics, perf_settings,
+                custom_objects=get_all_keras_custom_objects())
+        if perf_settings.jit_compile:
+            return recompile_model(model, self.metrics, perf_settings)
+        return model
+
     def run_keras_training(self,
                            is_resume: bool = False,
                            train_one_batch: bool = False,
@@ -1250,6 +1505,7 @@ class Trainer:
                     stratify=stratify,
                     encoded_label_dict=encoded_label_dict,
                     show_class_distribution=show_class_distribution,
+                    **self.get_split_kwargs()
                 )
 
             col, _ = st.columns([1, 1])
@@ -1271,6 +1527,7 @@ class Trainer:
                     stratify=stratify,
                     encoded_label_dict=encoded_label_dict,
                     show_class_distribution=show_class_distribution,
+                    **self.get_split_kwargs()
                 )
 
             col, _ = st.columns([1, 1])
@@ -1316,6 +1573,12 @@ class Trainer:
                     self.training_path['output_keras_model_file'],
                     self.metrics, self.training_param)
 
+        perf_settings = get_perf_settings(self.training_param)
+        model = self.apply_perf_profile(model, perf_settings)
+        mixed_precision_policy = get_model_dtype_policy(model)
+        logger.info(f"Training with the '{perf_settings.profile}' performance profile "
+                    f"in '{mixed_precision_policy}', XLA = {perf_settings.jit_compile}")
+
         # ***************** Preparing tf.data.Dataset *****************
         # this comes after building model to be able to pass the model
         # into self.create_tf_dataset()
@@ -1356,9 +1619,13 @@ class Trainer:
         progress_placeholder['batch'] = st.empty()
         # not updating progress & metrics if test training on one batch of data
         update_metrics = False if train_one_batch else True
+        progress_recorder = session_state.new_training.create_progress_recorder()
         callbacks = self.create_callbacks(
             train_size=len(y_train), progress_placeholder=progress_placeholder,
-            num_epochs=num_epochs, update_metrics=update_metrics)
+            num_epochs=num_epochs, update_metrics=update_metrics,
+            progress_recorder=progress_recorder)
+        step_timer = StepTimer()
+        callbacks.append(step_timer)
 
         # ********************** Train the model **********************
         if self.has_valid_set:
@@ -1368,7 +1635,8 @@ class Trainer:
 
         logger.info("Training model...")
         start = perf_counter()
-        with st.spinner("Training model ..."):
+        # the recorder flushes the latest progress even if the training is stopped
+        with st.spinner("Training model ..."), progress_recorder:
             model.fit(
                 train_ds,
                 validation_data=validation_data,
@@ -1385,8 +1653,24 @@ class Trainer:
         logger.info(f'Finished training! Took {m}m {s}s')
         st.success(f'Model has finished training! Took **{m}m {s}s**')
 
+        steps_per_sec = step_timer.steps_per_sec
+        if steps_per_sec is not None:
+            logger.info(f"Training speed: {steps_per_sec:.2f} steps/sec")
+            if not train_one_batch:
+                # to compare the performance profiles on the same hardware
+                session_state.new_training.update_progress({
+                    **session_state.new_training.progress,
+                    **perf_settings.to_dict(),
+                    'Precision': mixed_precision_policy,
+                    'Steps/sec': round(steps_per_sec, 2)})
+
         with st.spinner("Loading the model with the best validation loss ..."):
             model = self.load_model_weights(model)
+            if mixed_precision_policy != 'float32':
+                # evaluate and save in float32 to run the model on any machine
+                model = convert_model_dtype_policy(
+                    model, 'float32', self.metrics, PerfSettings(),
+                    custom_objects=get_all_keras_custom_objects())
 
         if not train_one_batch:
             with st.spinner("Saving the trained TensorFlow model ..."):
@@ -1417,46 +1701,6 @@ class Trainer:
             # display the result info
             st.info(result_txt)
 
-        if classification:
-            # show a nicely formatted classification report
-            with st.spinner("Making predictions on the test set ..."):
-                pred_proba = model.predict(test_ds)
-                preds = np.argmax(pred_proba, axis=-1)
-                y_true = np.concatenate([y for _, y in test_ds], axis=0)
-                unique_label_ids = np.unique((y_true, preds))
-                target_names = [str(encoded_label_dict[i])
-                                for i in unique_label_ids]
-                logger.debug(f"{target_names = }")
-
-            with st.spinner("Generating classification report ..."):
-                classif_report = classification_report(
-                    y_true, preds, target_names=target_names, zero_division=0
-                )
-                st.subheader("Classification report")
-                st.text(classif_report)
-
-                # append to the test results
-                header_txt = "Classification report:"
-                result_txt = "  \n".join(
-                    [result_txt, header_txt, classif_report])
-
-            with st.spinner("Creating confusion matrix ..."):
-                cm = confusion_matrix(y_true, preds)
-
-                fig = plt.figure()
-                sns.heatmap(
-                    cm, cmap="Blues", annot=True, fmt="d", cbar=False,
-                    yticklabels=target_names, xticklabels=target_names,
-                )
-
-                plt.title("Confusion Matrix", size=12, fontfamily="serif")
-                plt.ylabel('Actual')
-                plt.xlabel('Predicted')
-                # save the figure to reuse later
-                plt.savefig(str(self.training_path['confusion_matrix_file']),
-                            bbox_inches="tight")
-                st.pyplot(fig)
-
         # save the results in a txt file to easily show again later
         with open(self.training_path['test_result_txt_file'], "w") as f:
             f.write(result_txt)
@@ -1483,50 +1727,44 @@ class Trainer:
             logger.info("Removing unused exported training images")
             shutil.rmtree(self.dataset_export_path / 'images')
 
+        if not train_one_batch:
+            # cache the predictions of the test set for the evaluation views
+            self.start_background_eval(model)
+
     def run_keras_eval(self):
         if self.training_path['test_result_txt_file'].exists():
             # show the evaluation results stored during training
             with open(self.training_path['test_result_txt_file']) as f:
                 result_txt = f.read()
+            # NOTE: the results of the older trainings also have the classification
+            #  report appended, it's computed from the cached predictions now
+            result_txt = result_txt.split("Classification report:")[0]
             st.subheader("Evaluation result on validation set and "
                          "test set if available:")
             result_col, _ = st.columns(2)
             with result_col:
-                if self.deployment_type == 'Image Classification':
-                    # NOTE: this `header_txt` must be the same as the one used during the creation
-                    #  of the text in run_keras_training()
-                    header_txt = "Classification report:"
-                    results, classif_report = result_txt.split(header_txt)
-                    classif_report = header_txt + classif_report
-                    st.info(results)
-                    st.text(classif_report)
-                else:
-                    st.info(result_txt)
-
-        if self.deployment_type == 'Image Classification' and \
-                self.training_path['confusion_matrix_file'].exists():
-            logger.debug("Showing confusion matrix from "
-                         f"{self.training_path['confusion_matrix_file']}")
-            image = plt.imread(self.training_path['confusion_matrix_file'])
-            st.image(image)
-            st.markdown("___")
+                st.info(result_txt)
 
         # ************* Show predictions on test set images *************
         st.subheader("Prediction Results on Validation/Test Set:")
 
-        # load back the best model
-        logger.info(f"Loading trained Keras model for {self.deployment_type}")
-        if not hasattr(self, 'model'):
-            if self.is_not_pretrained:
-                self.model = load_trained_keras_model(
-                    self.training_path['output_keras_model_file'])
-            else:
-                self.model = load_keras_model(self.training_path['output_keras_model_file'],
-                                              self.metrics, self.training_param)
-            if self.deployment_type == 'Image Classification':
-                # use preprocess_fn if available
-                self.preprocess_fn: Callable = self.get_preprocess_fn(
-                    self.model)
+        if self.deployment_type == 'Semantic Segmentation with Polygons':
+            # the generated masks are required for evaluation
+            if not (self.dataset_export_path / 'masks').exists():
+                with st.spinner("Exporting labeled data for evaluation ..."):
+                    logger.info("Exporting tasks for evaluation ...")
+                    session_state.project.export_tasks(
+                        for_training_id=self.training_id)
+
+        # the predictions of the whole test set are cached to compute the metrics
+        # and to page through them
+        eval_cache = self.get_eval_cache()
+        if eval_cache is None:
+            return
+
+        st.subheader("Evaluation metrics on test set:")
+        self.show_eval_metrics(eval_cache.metrics)
+        st.markdown("___")
 
         options_col, _ = st.columns([1, 1])
         prev_btn_col_1, next_btn_col_1, _ = st.columns([1, 1, 3])
@@ -1540,25 +1778,6 @@ class Trainer:
             # to keep track of the image index to show
             session_state['start_idx'] = 0
 
-        logger.info("Loading test set data")
-        if self.deployment_type == 'Image Classification':
-            X_test, y_test, encoded_label_dict = get_test_images_labels(
-                self.training_path['test_set_pkl_file'],
-                self.deployment_type
-            )
-        else:
-            X_test, y_test = get_test_images_labels(
-                self.training_path['test_set_pkl_file'],
-                self.deployment_type
-            )
-
-            # the generated masks are required for evaluation
-            if not (self.dataset_export_path / 'masks').exists():
-                with st.spinner("Exporting labeled data for evaluation ..."):
-                    logger.info("Exporting tasks for evaluation ...")
-                    session_state.project.export_tasks(
-                        for_training_id=self.training_id)
-
         with options_col:
             st.header("Prediction results on test set")
 
@@ -1573,25 +1792,20 @@ class Trainer:
                 step=1,
                 format='%d',
                 key='n_samples',
-                help="Number of samples to run inference and display results.",
+                help="Number of samples to display results.",
                 on_change=reset_start_idx
             )
 
-            total_samples = len(y_test)
+            total_samples = len(eval_cache)
             st.info(f"**Total test set images**: {total_samples}")
 
         n_samples = int(session_state['n_samples'])
         start_idx = session_state['start_idx']
-        # st.write(f"{start_idx = }")
-        # st.write(f"{start_idx + n_samples = }")
-        current_image_paths = X_test[start_idx: start_idx + n_samples]
-        # NOTE: these are mask_paths for segmentation task
-        current_labels = y_test[start_idx: start_idx + n_samples]
 
         start = start_idx + 1
         end = start_idx + n_samples
         end = end if end <= total_samples else total_samples
-        logger.info(f"Detecting from the test set images: {start}"
+        logger.info(f"Showing the cached predictions of the test set images: {start}"
                     f" to {end} ...")
         options_col.info(
             f"Showing sample images: **{start}** to **{end}**")
@@ -1610,36 +1824,21 @@ class Trainer:
         next_btn_col_1.button('Next samples ⏭️', key='btn_next_images_1',
                               on_click=next_samples)
 
-        image_size = self.training_param["image_size"]
         if self.deployment_type == 'Image Classification':
             image_cols = cycle((image_col, image_col_2))
-            with st.spinner("Running classifications ..."):
-                for i, (p, label, col) in enumerate(zip(
-                        current_image_paths, current_labels, image_cols)):
-                    logger.debug(f"Image path: {p}")
-                    filename = os.path.basename(p)
-
-                    img = cv2.imread(p)
-                    start_t = perf_counter()
-                    results = classification_inference_pipeline(
-                        img, model=self.model, image_size=image_size,
-                        encoded_label_dict=encoded_label_dict,
-                        preprocess_fn=self.preprocess_fn)
-                    pred_classname = results['pred_classname']
-                    y_proba = results['probability']
-                    time_elapsed = perf_counter() - start_t
-                    logger.info(f"Inference on image: {filename} "
-                                f"[{time_elapsed:.4f}s]")
-
-                    true_classname = encoded_label_dict[label]
-
-                    caption = (f"{start + i}. {filename}; "
-                               f"Actual: {true_classname}; "
-                               f"Predicted: {pred_classname}; "
-                               f"Score: {y_proba * 100:.1f}")
-
-                    with col:
-                        st.image(img, channels='BGR', caption=caption)
+            probs, y_true = eval_cache.arrays['probs'], eval_cache.arrays['y_true']
+            for idx, col in zip(range(start_idx, end), image_cols):
+                filename = os.path.basename(eval_cache.image_paths[idx])
+                img = eval_cache.read_thumbnail(idx)
+                y_pred = int(np.argmax(probs[idx]))
+
+                caption = (f"{idx + 1}. {filename}; "
+                           f"Actual: {eval_cache.class_names[y_true[idx]]}; "
+                           f"Predicted: {eval_cache.class_names[y_pred]}; "
+                           f"Score: {probs[idx, y_pred] * 100:.1f}")
+
+                with col:
+                    st.image(img, channels='BGR', caption=caption)
         else:
             with figure_row_place:
                 class_colors = create_class_colors(self.class_names)
@@ -1657,68 +1856,59 @@ class Trainer:
             class_colors = np.array(list(class_colors.values()),
                                     dtype=np.uint8)
             class_names_arr = np.array(self.class_names)
-            with st.spinner("Running segmentation ..."):
-                for i, (img_path, mask_path) in enumerate(zip(current_image_paths, current_labels)):
-                    logger.debug(f"Image path: {img_path}")
-                    logger.debug(f"Mask path: {mask_path}")
-                    filename = os.path.basename(img_path)
-
-                    image = cv2.imread(img_path)
-                    start_t = perf_counter()
-                    results = segment_inference_pipeline(
-                        image, model=self.model, image_size=image_size,
-                        class_colors=class_colors,
-                        ignore_background=ignore_background)
-
-                    pred_mask = results['prediction_mask']
-                    classes_found = class_names_arr[np.unique(pred_mask)]
-
-                    pred_output = results['img']
-                    if show_classes:
-                        class_name2color, first_coords = (
-                            get_segmentation_data_to_draw_class_names(
-                                class_colors, pred_mask, self.class_names
-                            ))
-                        draw_segmentation_classes(
-                            pred_output, first_coords, class_name2color,
-                            alpha=0.5, copy_image=False
-                        )
-                    time_elapsed = perf_counter() - start_t
-                    logger.info(f"Inference on image: {filename} "
-                                f"[{time_elapsed:.4f}s]")
-
-                    # convert to RGB for visualizing with Matplotlib
-                    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-                    figure_row_place.subheader(
-                        f"Image {start + i}: {filename}")
-                    caption = '**Found classes**: ' + ', '.join(classes_found)
-                    figure_row_place.markdown(caption)
-                    fig = plt.figure()
-                    plt.subplot(131)
-                    plt.title("Original Image")
-                    plt.imshow(image)
-                    plt.axis('off')
-
-                    mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
-                    plt.subplot(132)
-                    plt.title("Ground Truth")
-                    true_output = get_colored_mask_image(
-                        image, mask, class_colors,
-                        ignore_background=ignore_background)
-                    plt.imshow(true_output)
-                    plt.axis('off')
-
-                    plt.subplot(133)
-                    plt.title("Predicted")
-                    plt.imshow(pred_output)
-                    plt.axis('off')
-
-                    plt.tight_layout()
-                    figure_row_place.pyplot(fig)
-                    figure_row_place.markdown("___")
-
-                # logger.debug(f"{unique_pixels = }")
+            _, mask_paths = get_test_images_labels(
+                self.training_path['test_set_pkl_file'], self.deployment_type)
+            for idx in range(start_idx, end):
+                filename = os.path.basename(eval_cache.image_paths[idx])
+                # convert to RGB for visualizing with Matplotlib
+                image = cv2.cvtColor(eval_cache.read_thumbnail(idx), cv2.COLOR_BGR2RGB)
+
+                # the predicted mask is stored in the size of the thumbnail
+                pred_mask = eval_cache.read_pred_mask(idx)
+                classes_found = class_names_arr[np.unique(pred_mask)]
+                pred_output = get_colored_mask_image(
+                    image, pred_mask, class_colors,
+                    ignore_background=ignore_background)
+                if show_classes:
+                    class_name2color, first_coords = (
+                        get_segmentation_data_to_draw_class_names(
+                            class_colors, pred_mask, self.class_names
+                        ))
+                    draw_segmentation_classes(
+                        pred_output, first_coords, class_name2color,
+                        alpha=0.5, copy_image=False
+                    )
+
+                figure_row_place.subheader(
+                    f"Image {idx + 1}: {filename}")
+                caption = '**Found classes**: ' + ', '.join(classes_found)
+                figure_row_place.markdown(caption)
+                fig = plt.figure()
+                plt.subplot(131)
+                plt.title("Original Image")
+                plt.imshow(image)
+                plt.axis('off')
+
+                mask = cv2.imread(mask_paths[idx], cv2.IMREAD_GRAYSCALE)
+                mask = cv2.resize(mask, image.shape[1::-1],
+                                  interpolation=cv2.INTER_NEAREST)
+                plt.subplot(132)
+                plt.title("Ground Truth")
+                true_output = get_colored_mask_image(
+                    image, mask, class_colors,
+                    ignore_background=ignore_background)
+                plt.imshow(true_output)
+                plt.axis('off')
+
+                plt.subplot(133)
+                plt.title("Predicted")
+                plt.imshow(pred_output)
+                plt.axis('off')
+
+                plt.tight_layout()
+                figure_row_place.pyplot(fig)
+                plt.close(fig)
+                figure_row_place.markdown("___")
 
         prev_btn_col_2.button('⏮️ Previous samples', key='btn_prev_images_2',
                               on_click=previous_samples)
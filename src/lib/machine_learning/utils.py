@@ -2,12 +2,11 @@ from __future__ import annotations
 
 import gc
 import glob
-import json
+import hashlib
 import os
 import pickle
-import shutil
-import xml.etree.ElementTree as ET
 from collections import Counter
+from functools import partial
 from operator import attrgetter
 from pathlib import Path
 from time import perf_counter
@@ -22,10 +21,22 @@ import tensorflow as tf
 
 # >>>> User-defined Modules >>>>
 from core.utils.log import logger
-from data_manager.dataset_management import generate_image_name
+from core.utils.materialize import sync_files
 from imutils.paths import list_images
 from keras_unet_collection.activations import GELU, Snake
 from keras_unet_collection.losses import focal_tversky, iou_seg
+from machine_learning.annotation_index import (
+    XML_DF_COLUMNS,
+    load_annotation_index,
+    parse_voc_xml,
+)
+from machine_learning.bbox_augmentation import BboxAugmentationGenerator
+from machine_learning.mask_generation import generate_masks
+from machine_learning.sparse_losses import (
+    sparse_focal_tversky,
+    sparse_hybrid_loss,
+    sparse_iou_seg,
+)
 from object_detection.builders import model_builder
 from object_detection.utils import config_util, label_map_util
 from path_desc import _DIR_APP_NAME, _OLD_DIR_APP_NAME, BASE_DATA_DIR
@@ -78,6 +89,105 @@ def get_class_distribution(
     return df
 
 
+SPLIT_METHODS = ('hash', 'random')
+HASH_SPLIT_KEYS = ('name', 'content')
+
+
+def get_split_hash_key(image_path: Union[str, Path], hash_by: str = 'name') -> bytes:
+    """Stable key of the image to assign its partition for the hash split, either
+    the file name, or the file content to keep the same partition for the same image
+    even after it's renamed."""
+    if hash_by == 'name':
+        return Path(image_path).name.encode()
+    h = hashlib.sha1()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+def get_split_hash_value(key: bytes, seed: Optional[int] = None) -> float:
+    """Map the key uniformly into [0, 1), the same key always gets the same value
+    for the same seed."""
+    h = hashlib.sha1(key)
+    if seed is not None:
+        h.update(f"|{seed}".encode())
+    return int(h.hexdigest()[:15], 16) / 16 ** 15
+
+
+def _partition_bounds(n: int, ratios: Tuple[float, ...],
+                      min_size: int = 0) -> List[int]:
+    """The start rank of each partition of `n` ranked images, cut from the end, so that
+    the first partition (training set) takes the remainder after rounding. Every
+    partition with a positive ratio gets at least `min_size` images when there are
+    enough images for all of them."""
+    bounds = [0] * len(ratios)
+    end = n
+    for j in range(len(ratios) - 1, 0, -1):
+        size = int(round(n * ratios[j]))
+        if ratios[j] > 0:
+            size = max(size, min_size)
+        # leave enough images for the earlier partitions with a positive ratio
+        num_reserved = min_size * sum(1 for r in ratios[:j] if r > 0)
+        bounds[j] = end - max(min(size, end - num_reserved), 0)
+        end = bounds[j]
+    return bounds
+
+
+def hash_partition_ids(image_paths: List[Union[str, Path]],
+                       labels: List[Any],
+                       ratios: Tuple[float, ...],
+                       *,
+                       stratify: bool = False,
+                       hash_by: str = 'name',
+                       random_seed: Optional[int] = None) -> List[int]:
+    """Assign each image to a partition index of `ratios` from the rank of the hash of
+    its name or content. The images (of each class with stratification) are sorted by
+    their hash values and the partitions are cut at the exact ratios, so adding an
+    image only moves at most one image across each cut, and only the moved images
+    need to be copied and processed again.
+
+    Without stratification, every partition with a positive ratio gets at least one
+    image when there are enough images."""
+    assert abs(sum(ratios) - 1) < 1e-6, f"Ratios must sum to 1: {ratios}"
+    assert hash_by in HASH_SPLIT_KEYS, f"Invalid hash_by: {hash_by}"
+    values = [get_split_hash_value(get_split_hash_key(p, hash_by), random_seed)
+              for p in image_paths]
+
+    partition_ids = [0] * len(image_paths)
+    if stratify:
+        class_idxs: Dict[Any, List[int]] = {}
+        for i, label in enumerate(labels):
+            class_idxs.setdefault(label, []).append(i)
+        groups = list(class_idxs.values())
+        min_size = 0
+    else:
+        groups = [list(range(len(image_paths)))]
+        min_size = 1
+    for idxs in groups:
+        # sort by the file name for ties, e.g. duplicated images hashed by content
+        idxs.sort(key=lambda i: (values[i], Path(image_paths[i]).name))
+        bounds = _partition_bounds(len(idxs), ratios, min_size)
+        for rank, i in enumerate(idxs):
+            partition_ids[i] = int(np.searchsorted(bounds, rank, side='right')) - 1
+    return partition_ids
+
+
+def hash_train_test_split(image_paths: List[Union[str, Path]],
+                          labels: List[Any],
+                          ratios: Tuple[float, ...],
+                          **kwargs) -> Tuple[List[Any], ...]:
+    """Same outputs as `train_test_split()` but using `hash_partition_ids()`, returns
+    the image paths of every partition, followed by the labels of every partition."""
+    partition_ids = hash_partition_ids(image_paths, labels, ratios, **kwargs)
+    X_splits = [[] for _ in ratios]
+    y_splits = [[] for _ in ratios]
+    for path, label, pid in zip(image_paths, labels, partition_ids):
+        X_splits[pid].append(path)
+        y_splits[pid].append(label)
+    return (*X_splits, *y_splits)
+
+
 def custom_train_test_split(image_paths: List[Path],
                             test_size: float,
                             *,
@@ -88,7 +198,9 @@ def custom_train_test_split(image_paths: List[Path],
                             stratify: Optional[bool] = False,
                             show_class_distribution: Optional[bool] = False,
                             encoded_label_dict: Optional[Dict[int, str]] = None,
-                            random_seed: Optional[int] = None
+                            random_seed: Optional[int] = None,
+                            split_method: Optional[str] = 'random',
+                            hash_by: Optional[str] = 'name',
                             ) -> Tuple[List[str], ...]:
     """
     Splitting the dataset into train set, test set, and optionally validation set
@@ -105,6 +217,12 @@ def custom_train_test_split(image_paths: List[Path],
         stratify (Optional[bool]): stratification should only be used for image classification. Defaults to False
         show_class_distribution (Optional[bool]): whether to show class distribution in a Streamlit table. Defaults to False.
         random_seed (Optional[int]): random seed to use for splitting. Defaults to None.
+        split_method (Optional[str]): 'random' to split with `train_test_split()`,
+            or 'hash' to assign each image from the hash of its name or content with
+            `hash_partition_ids()`, which keeps the partitions of the existing images
+            when the dataset grows. Defaults to 'random'.
+        hash_by (Optional[str]): 'name' or 'content' of the images to hash, only used
+            for the 'hash' split method. Defaults to 'name'.
 
     Returns:
         Tuples of lists of image paths (str), and optionally annotation paths,
@@ -115,6 +233,7 @@ def custom_train_test_split(image_paths: List[Path],
     else:
         assert val_size, "Must pass in `val_size` if `no_validation` is False."
 
+    assert split_method in SPLIT_METHODS, f"Invalid split_method: {split_method}"
     total_images = len(image_paths)
     assert total_images == len(labels)
 
@@ -130,17 +249,25 @@ def custom_train_test_split(image_paths: List[Path],
         stratify = None
 
     logger.info(f"Total images = {total_images}")
+    if split_method == 'hash':
+        logger.info(f"Splitting with the hash of the image {hash_by}s")
+        hash_kwargs = dict(stratify=stratify is not None, hash_by=hash_by,
+                           random_seed=random_seed)
 
     if no_validation:
         train_size = train_size if train_size else round(1 - test_size, 2)
         logger.info("Splitting into train:test dataset"
                     f" with ratio of {train_size:.2f}:{test_size:.2f}")
-        X_train, X_test, y_train, y_test = train_test_split(
-            image_paths, labels,
-            test_size=test_size,
-            stratify=stratify,
-            random_state=random_seed
-        )
+        if split_method == 'hash':
+            X_train, X_test, y_train, y_test = hash_train_test_split(
+                image_paths, labels, (1 - test_size, test_size), **hash_kwargs)
+        else:
+            X_train, X_test, y_train, y_test = train_test_split(
+                image_paths, labels,
+                test_size=test_size,
+                stratify=stratify,
+                random_state=random_seed
+            )
 
         if show_class_distribution:
             df = get_class_distribution(
@@ -156,24 +283,29 @@ def custom_train_test_split(image_paths: List[Path],
         logger.info("Splitting into train:valid:test dataset"
                     " with ratio of "
                     f"{train_size:.2f}:{val_size:.2f}:{test_size:.2f}")
-        X_train, X_val_test, y_train, y_val_test = train_test_split(
-            image_paths, labels,
-            test_size=(val_size + test_size),
-            stratify=stratify,
-            random_state=random_seed
-        )
-        logger.debug(f"{len(X_train) = }, {len(y_train) = }, "
-                     f"{len(X_val_test) = }, {len(y_val_test) = }")
-
-        stratify = y_val_test if stratify else None
-        X_val, X_test, y_val, y_test = train_test_split(
-            X_val_test, y_val_test,
-            test_size=(test_size / (val_size + test_size)),
-            # shuffle must be True if stratify is True
-            shuffle=True if stratify else False,
-            stratify=stratify,
-            random_state=random_seed,
-        )
+        if split_method == 'hash':
+            X_train, X_val, X_test, y_train, y_val, y_test = hash_train_test_split(
+                image_paths, labels, (1 - val_size - test_size, val_size, test_size),
+                **hash_kwargs)
+        else:
+            X_train, X_val_test, y_train, y_val_test = train_test_split(
+                image_paths, labels,
+                test_size=(val_size + test_size),
+                stratify=stratify,
+                random_state=random_seed
+            )
+            logger.debug(f"{len(X_train) = }, {len(y_train) = }, "
+                         f"{len(X_val_test) = }, {len(y_val_test) = }")
+
+            stratify = y_val_test if stratify else None
+            X_val, X_test, y_val, y_test = train_test_split(
+                X_val_test, y_val_test,
+                test_size=(test_size / (val_size + test_size)),
+                # shuffle must be True if stratify is True
+                shuffle=True if stratify else False,
+                stratify=stratify,
+                random_state=random_seed,
+            )
 
         if show_class_distribution:
             df = get_class_distribution(
@@ -187,22 +319,16 @@ def custom_train_test_split(image_paths: List[Path],
 
 def copy_images(image_paths: Path,
                 dest_dir: Path,
-                label_paths: Optional[Path] = None):
-    if dest_dir.exists():
-        # remove the existing images
-        shutil.rmtree(dest_dir, ignore_errors=False)
-
-    # create new directories
-    os.makedirs(dest_dir)
-
+                label_paths: Optional[Path] = None,
+                method: str = 'auto'):
+    """Materialize the images (and labels) into `dest_dir`, replacing the existing files.
+    The files are hardlinked or cloned from the dataset whenever possible instead of
+    copied, and only the files changed since the last time are created again,
+    see `sync_files()`."""
+    src_paths = list(image_paths)
     if label_paths:
-        for image_path, label_path in stqdm(zip(image_paths, label_paths), total=len(image_paths)):
-            # copy the image file and label file to the new directory
-            shutil.copy2(image_path, dest_dir)
-            shutil.copy2(label_path, dest_dir)
-    else:
-        for image_path in image_paths:
-            shutil.copy2(image_path, dest_dir)
+        src_paths.extend(label_paths)
+    sync_files(src_paths, dest_dir, method=method, progress_wrapper=stqdm)
 
 
 def load_image_into_numpy_array(path: str, bgr2rgb: bool = True):
@@ -274,7 +400,10 @@ def preprocess_image(
 def get_all_keras_custom_objects() -> Dict[str, Callable]:
     """Get all the Keras model's custom_objects currently used in our application."""
     custom_objects = {"hybrid_loss": hybrid_loss, "focal_tversky": focal_tversky,
-                      "iou_seg": iou_seg, 'Snake': Snake, 'GELU': GELU}
+                      "iou_seg": iou_seg, 'Snake': Snake, 'GELU': GELU,
+                      "sparse_hybrid_loss": sparse_hybrid_loss,
+                      "sparse_focal_tversky": sparse_focal_tversky,
+                      "sparse_iou_seg": sparse_iou_seg}
     return custom_objects
 
 
@@ -285,8 +414,11 @@ def get_segmentation_model_custom_objects(training_param: Dict[str, Any]) -> Dic
      in `build_segmentation_model()`. Currently should only be these custom metrics:
 
     metrics = [hybrid_loss, iou_seg, focal_tversky]
+
+    or their sparse versions if trained with `use_sparse_labels`.
     """
     use_hybrid_loss: bool = training_param['use_hybrid_loss']
+    use_sparse_labels: bool = training_param.get('use_sparse_labels', False)
     activation: str = training_param['activation']
     output_activation: str = training_param['output_activation']
 
@@ -308,8 +440,13 @@ def get_segmentation_model_custom_objects(training_param: Dict[str, Any]) -> Dic
     # NOTE: putting hybrid_loss as the first one just in case
     custom_objects = {"hybrid_loss": hybrid_loss, "focal_tversky": focal_tversky,
                       "iou_seg": iou_seg}
+    if use_sparse_labels:
+        custom_objects = {"sparse_hybrid_loss": sparse_hybrid_loss,
+                          "sparse_focal_tversky": sparse_focal_tversky,
+                          "sparse_iou_seg": sparse_iou_seg}
     if not use_hybrid_loss:
-        del custom_objects["hybrid_loss"]
+        custom_objects.pop("hybrid_loss", None)
+        custom_objects.pop("sparse_hybrid_loss", None)
     if activation == 'GELU':
         custom_objects['GELU'] = GELU
     if activation == 'Snake' or output_activation == 'Snake':
@@ -410,10 +547,13 @@ def load_trained_keras_model(path: str):
 def modify_trained_model_layers(model: tf.keras.Model, deployment_type: str,
                                 input_shape: Tuple[int, int, int], num_classes: int,
                                 compile: bool = False,
-                                metrics: List[Callable] = None):
+                                metrics: List[Callable] = None,
+                                loss: Union[str, Callable] = None):
     """Modify the layers of the uploaded Keras model to have different input shape 
     and output shape. Input shape depends on the image_size or input_size of the 
     training_param, while the output shape depends on the number of classes (`num_classes`).
+
+    The model is compiled with `loss` if passed in, else with the loss of the original model.
     """
     # NOTE: do not clear_session() when modifying the model midway here
     # https://newbedev.com/keras-replacing-input-layer
@@ -451,7 +591,7 @@ def modify_trained_model_layers(model: tf.keras.Model, deployment_type: str,
         inputs=new_model.input, outputs=new_output)
 
     if compile or metrics:
-        final_model.compile(loss=model.loss,
+        final_model.compile(loss=loss if loss is not None else model.loss,
                             optimizer=model.optimizer,
                             metrics=metrics)
     return final_model
@@ -459,11 +599,12 @@ def modify_trained_model_layers(model: tf.keras.Model, deployment_type: str,
 # ******************************* TFOD funcs *******************************
 
 
-def xml_to_df(path: str) -> pd.DataFrame:
+def xml_to_df(path: str, use_cache: bool = True) -> pd.DataFrame:
     """
     If a path to XML file is passed in, parse it directly.
-    If directory is passed in, iterates through all .xml files (generated by our custom Label Studio) 
-    in a given directory and combines them in a single Pandas dataframe.
+    If directory is passed in, get all the bboxes in the .xml files (generated by our custom Label Studio)
+    in the directory combined in a single Pandas dataframe, from the cached annotation index
+    which only parses the new or modified XML files, see `load_annotation_index()`.
     NOTE: This function will not work for the original Label Studio, because they export
     Pascal VOC XML files without the image extensions in the <filename> tags.
 
@@ -471,52 +612,16 @@ def xml_to_df(path: str) -> pd.DataFrame:
     ----------
     path : str
         The path containing the .xml files
+    use_cache : bool
+        Set to False to parse all the XML files again and rebuild the index
     Returns
     -------
     Pandas DataFrame
         The produced dataframe
     """
-    if isinstance(path, Path):
-        path = str(path)
-
-    xml_list = []
-
     if os.path.isfile(path):
-        xml_files = [path]
-    else:
-        xml_files = glob.glob(path + "/*.xml")
-
-    for xml_file in xml_files:
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        filename = root.find("filename").text
-        width = int(root.find("size").find("width").text)
-        height = int(root.find("size").find("height").text)
-        for member in root.findall("object"):
-            bndbox = member.find("bndbox")
-            value = (
-                filename,
-                width,
-                height,
-                member.find("name").text,
-                int(bndbox.find("xmin").text),
-                int(bndbox.find("ymin").text),
-                int(bndbox.find("xmax").text),
-                int(bndbox.find("ymax").text),
-            )
-            xml_list.append(value)
-    column_name = [
-        "filename",
-        "width",
-        "height",
-        "classname",
-        "xmin",
-        "ymin",
-        "xmax",
-        "ymax",
-    ]
-    xml_df = pd.DataFrame(xml_list, columns=column_name)
-    return xml_df
+        return pd.DataFrame(parse_voc_xml(str(path)), columns=XML_DF_COLUMNS)
+    return load_annotation_index(path, use_cache=use_cache)
 
 
 def get_bbox_label_info(xml_df: pd.DataFrame,
@@ -535,59 +640,29 @@ def generate_tfod_xml_csv(image_paths: List[str],
                           output_img_dir: Path,
                           csv_path: Path,
                           train_size: int,
-                          transform: A.Compose):
+                          transform: A.Compose,
+                          num_workers: Optional[int] = None,
+                          seed: int = 42) -> pd.DataFrame:
     """Generate TFOD's CSV file for augmented images and bounding boxes used for generating TF Records.
     Also save the transformed images to the `output_img_dir` at the same time.
+    The dataframe of the CSV file is returned to directly write the TF Records from it.
 
-    `transform` is obtained from `get_transform()`.
+    `transform` is obtained from `get_transform()`. The images are augmented in parallel
+    by `num_workers` processes (default to the number of CPU cores) with deterministic
+    seeds derived from `seed`, see `BboxAugmentationGenerator`.
     """
-
-    output_img_dir.mkdir(parents=True, exist_ok=True)
-
     xml_df = xml_to_df(str(xml_dir))
 
-    if train_size > len(image_paths):
-        # randomly select the remaining paths and extend them to the original List
-        # to make sure to go through the entire dataset for at least once
-        n_remaining = train_size - len(image_paths)
-        image_paths.extend(np.random.choice(
-            image_paths, size=n_remaining, replace=True))
-
     logger.info('Generating CSV file for augmented bounding boxes ...')
-    start = perf_counter()
-    xml_list = []
-    all_img_names = set()
-    for image_path in stqdm(image_paths):
-        image = cv2.imread(image_path)
-        filename = os.path.basename(image_path)
-        class_names, bboxes = get_bbox_label_info(xml_df, filename)
-        width, height = xml_df.loc[xml_df['filename'] == filename,
-                                   'width': 'height'].values[0]
-
-        transformed = transform(image=image, bboxes=bboxes,
-                                class_names=class_names)
-        transformed_image = transformed['image']
-
-        # also save the transformed image at the same time to avoid doing it again later
-        new_img_name = generate_image_name(filename, all_img_names)
-        cv2.imwrite(str(output_img_dir / new_img_name), transformed_image)
-
-        transformed_bboxes = np.array(transformed['bboxes'], dtype=np.int32)
-        # this 'class_names' key is based on the 'label_fields' in A.BboxParams()
-        # used in get_transform()
-        transformed_class_names = transformed['class_names']
-
-        for bbox, class_name in zip(transformed_bboxes, transformed_class_names):
-            value = (new_img_name, width, height, class_name, *bbox)
-            xml_list.append(value)
-
-    col_names = ["filename", "width", "height", "classname",
-                 "xmin", "ymin", "xmax", "ymax"]
-
-    xml_df = pd.DataFrame(xml_list, columns=col_names)
-    xml_df.to_csv(csv_path, index=False)
-    time_elapsed = perf_counter() - start
-    logger.info(f"Done. {time_elapsed = :.4f} seconds")
+    generator = BboxAugmentationGenerator(
+        transform, num_workers=num_workers, seed=seed)
+    xml_df, summary = generator.generate(
+        image_paths, xml_df, output_img_dir, csv_path,
+        train_size=train_size, progress_wrapper=stqdm)
+    logger.info(f"Done. Augmented {summary.num_images} images with "
+                f"{summary.num_boxes} boxes in {summary.seconds:.2f} seconds "
+                f"({summary.images_per_sec:.2f} images/sec)")
+    return xml_df
 
 
 def load_labelmap(labelmap_path):
@@ -713,6 +788,8 @@ def tfod_detect(detect_fn: Callable[[tf.Tensor], Dict[str, Any]],
     `detect_fn` is obtained using `load_tfod_model` or `load_tfod_checkpoint` functions. 
     `tensor_dtype` should be `tf.uint8` for exported model; 
     and `tf.float32` for checkpoint model to work. 
+
+    `image_np` can also be a batch of one image with shape (1, H, W, 3).
     """
     # Running the infernce on the image specified in the  image path
     # The input needs to be a tensor, convert it using `tf.convert_to_tensor`.
@@ -721,8 +798,9 @@ def tfod_detect(detect_fn: Callable[[tf.Tensor], Dict[str, Any]],
     # input_tensor = input_tensor[tf.newaxis, ...]
     # input_tensor = tf.expand_dims(input_tensor, 0)
 
-    input_tensor = tf.convert_to_tensor(
-        np.expand_dims(image_np, 0), dtype=tensor_dtype)
+    if image_np.ndim == 3:
+        image_np = np.expand_dims(image_np, 0)
+    input_tensor = tf.convert_to_tensor(image_np, dtype=tensor_dtype)
 
     # running detection using the loaded model: detect_fn
     detections = detect_fn(input_tensor)
@@ -938,8 +1016,10 @@ def generate_mask_images(coco_json_path: Union[str, Path] = None,
                          output_dir: Path = None,
                          n_masks: int = None,
                          verbose: bool = False,
-                         st_container=None):
-    """Generate mask images based on a COCO JSON file and save at `output_dir`
+                         st_container=None,
+                         num_workers: Optional[int] = None,
+                         use_cache: bool = True):
+    """Generate uint8 mask images based on a COCO JSON file and save at `output_dir`
 
     Args:
         coco_json_path (Union[str, Path], optional): Path to the COCO JSON file.
@@ -953,61 +1033,24 @@ def generate_mask_images(coco_json_path: Union[str, Path] = None,
             Defaults to False.
         st_container ([type], optional): For `stqdm` progress bar. Can optionally pass
             in `st.sidebar`. Defaults to None.
+        num_workers (Optional[int], optional): Number of worker processes.
+            Defaults to the number of CPU cores.
+        use_cache (bool, optional): If True, skip the existing mask images with
+            unchanged annotations. Defaults to True.
     """
     data_export_dir = session_state.project.get_export_path()
     if not coco_json_path:
         coco_json_path = data_export_dir / "result.json"
     if not output_dir:
         output_dir = data_export_dir / "masks"
-    os.makedirs(output_dir, exist_ok=True)
-
-    json_file = json.load(open(coco_json_path))
-    img_dict_list = json_file["images"]
-    if n_masks:
-        # optionally only generate certain number of mask images,
-        # currently using this for the augmentation demo at the config page
-        img_dict_list = img_dict_list[:n_masks]
-    total_masks = len(img_dict_list)
-
-    coco, catIDs, added_background, classnames = get_coco_classes(
-        coco_json_path)
-
-    logger.debug(f"Generating {total_masks} mask images in: {output_dir}")
-    for img_dict in stqdm(img_dict_list, total=total_masks,
-                          desc='Generating mask images', st_container=st_container):
-        filename = os.path.basename(img_dict["file_name"])
-
-        annIds = coco.getAnnIds(
-            imgIds=img_dict["id"], catIds=catIDs, iscrowd=None)
-        anns = coco.loadAnns(annIds)
-
-        mask = np.zeros((img_dict["height"], img_dict["width"]))
-        classes_found = []
-        for annot in anns:
-            current_annot_id = annot["category_id"]
-            if added_background:
-                # considering the extra added 'background' class at index 0
-                # that did not exist in the COCO JSON file
-                current_annot_id += 1
-            className = classnames[current_annot_id]
-            classes_found.append(className)
-            pixel_value = classnames.index(className)
-            # the final mask contains the pixel values for each class
-            mask = np.maximum(coco.annToMask(annot) * pixel_value, mask)
-
-        # save the mask images in PNG format to preserve the exact pixel values
-        mask_filename = os.path.splitext(filename)[0] + ".png"
-        mask_path = os.path.join(output_dir, mask_filename)
-        success = cv2.imwrite(mask_path, mask)
-
-        if verbose:
-            logger.debug(f"Generated mask image for {mask_filename}")
-            logger.debug(
-                f"{filename} | "
-                f"Unique pixel values = {np.unique(mask)} | "
-                f"Unique classes found = {set(classes_found)} | "
-                f"Number of annotations = {len(classes_found)}"  # or len(anns)
-            )
+
+    # the masks are generated in parallel processes, and only the masks of
+    # the new or modified annotations are generated again
+    generate_masks(
+        coco_json_path, output_dir, n_masks=n_masks, num_workers=num_workers,
+        use_cache=use_cache, verbose=verbose,
+        progress_wrapper=partial(stqdm, desc='Generating mask images',
+                                 st_container=st_container))
 
 
 def hybrid_loss(y_true, y_pred):
@@ -1017,10 +1060,26 @@ def hybrid_loss(y_true, y_pred):
     return loss_focal + loss_iou
 
 
-def preprocess_mask(mask: np.ndarray, image_size: int, num_classes: int) -> tf.Tensor:
+def get_segmentation_loss(training_param: Dict[str, Any]) -> Callable:
+    """Get the loss function for the segmentation model based on the training param."""
+    use_hybrid_loss = training_param['use_hybrid_loss']
+    if training_param.get('use_sparse_labels', False):
+        return sparse_hybrid_loss if use_hybrid_loss else sparse_focal_tversky
+    # focal_tversky seems to be good default
+    # in the future, perhaps also allow use to choose a loss function
+    return hybrid_loss if use_hybrid_loss else focal_tversky
+
+
+def preprocess_mask(mask: np.ndarray, image_size: int, num_classes: int,
+                    sparse: bool = False) -> Union[np.ndarray, tf.Tensor]:
+    """Resize the mask, then one-hot encode it into `num_classes` channels of int32,
+    or keep the uint8 class indices with a single channel if `sparse` is True."""
     # using bilinear to follow tensorflow default
     mask = cv2.resize(mask, (image_size, image_size),
                       interpolation=cv2.INTER_LINEAR)
+    if sparse:
+        # to be one-hot encoded by the sparse loss functions inside the model
+        return mask[..., np.newaxis].astype(np.uint8)
 
     # this is a very important step to one-hot encode the mask
     # based on the number of classes, and keep in mind that
@@ -1032,13 +1091,14 @@ def preprocess_mask(mask: np.ndarray, image_size: int, num_classes: int) -> tf.T
 
 def segmentation_read_and_preprocess(
         imagePath: bytes, maskPath: bytes,
-        image_size: int, num_classes: int) -> Tuple[np.ndarray, tf.Tensor]:
+        image_size: int, num_classes: int,
+        sparse: bool = False) -> Tuple[np.ndarray, Union[np.ndarray, tf.Tensor]]:
     # must decode the paths because they are in bytes format in TF operations
     image = cv2.imread(imagePath.decode())
     image = preprocess_image(image, image_size, rescale=True)
 
     mask = cv2.imread(maskPath.decode(), cv2.IMREAD_GRAYSCALE)
-    mask = preprocess_mask(mask, image_size, num_classes)
+    mask = preprocess_mask(mask, image_size, num_classes, sparse=sparse)
     return image, mask
 
 
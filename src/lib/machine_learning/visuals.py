@@ -151,7 +151,9 @@ class PrettyMetricPrinter:
         # more loss names to check for inverse delta_color
         self._extra_lossnames: Set[str] = {
             'categorical_crossentropy', 'iou_seg',
-            'val_categorical_crossentropy', 'val_iou_seg'}
+            'val_categorical_crossentropy', 'val_iou_seg',
+            'sparse_categorical_crossentropy', 'sparse_iou_seg',
+            'val_sparse_categorical_crossentropy', 'val_sparse_iou_seg'}
         self._first: bool = True
 
     def write(self, metrics: Dict[str, float]):
@@ -32,7 +32,6 @@ import shutil
 import sys
 from time import perf_counter, sleep
 from itertools import cycle
-import gc
 from typing import Any, Callable, Dict, List
 
 import cv2
@@ -64,15 +63,20 @@ from core.utils.log import logger
 from core.utils.helper import (Timer, get_all_timezones, get_now_string,
                                list_available_cameras, save_image, get_ram_usage,
                                reset_camera)
+from core.utils.memory import BufferPool, MemoryMonitor, release_replaced_media_files
 from user.user_management import User, UserRole
 from data_manager.database_manager import init_connection
 from project.project_management import Project
 from data_manager.dataset_management import Dataset
 from machine_learning.visuals import create_color_legend
 from deployment.deployment_management import DeploymentConfig, DeploymentPagination, Deployment
+from deployment.batch_inspection import BatchInspector
+from deployment.inference_server import DEFAULT_PORT, InferenceServer
+from deployment.frame_scheduler import FrameScheduler
 from deployment.utils import (ORI_PUBLISH_FRAME_TOPIC, MQTTConfig, MQTTTopics,
                               create_csv_file_and_writer, image_from_buffer, image_to_bytes,
-                              get_mqtt_client, read_images_from_uploaded, reset_video_deployment)
+                              get_mqtt_client, read_images_from_uploaded, reset_inference_server,
+                              reset_video_deployment)
 from dobot_arm_demo import main as dobot_demo
 from csv_label_inspection import csv_label_check as csv_labels
 from Node_Red.Not_dobot_version import Label_View
@@ -141,6 +145,8 @@ def index(RELEASE=True):
         conf.num_cameras = 1
         # reset camera titles
         conf.camera_titles = ['']
+        conf.camera_target_fps = conf.camera_target_fps[:1]
+        conf.camera_priorities = conf.camera_priorities[:1]
         topics.publish_frame = [topics.publish_frame[0]]
 
     def update_camera_sources_from_types():
@@ -166,10 +172,14 @@ def index(RELEASE=True):
         conf.camera_titles = []
         conf.camera_types = []
         conf.camera_sources = []
+        conf.camera_target_fps = []
+        conf.camera_priorities = []
         for _ in range(conf.num_cameras):
             conf.camera_titles.append('')
             conf.camera_types.append('IP Camera')
             conf.camera_sources.append('')
+            conf.camera_target_fps.append(0)
+            conf.camera_priorities.append(1.0)
 
     def image_recv_frame_cb(client, userdata, msg):
         # logger.debug("FRAME RECEIVED, REFRESHING")
@@ -416,6 +426,58 @@ def index(RELEASE=True):
                                     timezone=conf.timezone)
         return get_result_fn
 
+    def run_batch_inspection(input_path: str, key: str):
+        """Run the offline batch inspection job on `input_path` and show the summary."""
+        batch_conf_col, batch_conf_col_2 = st.columns(2)
+        batch_size = batch_conf_col.number_input(
+            "Batch size", 1, 256, 32, 8, key=f'batch_size_{key}',
+            help="Number of images/frames passed to the model at once.")
+        frame_step = batch_conf_col_2.number_input(
+            "Process every N-th frame (videos only)", 1, 300, 1, 1,
+            key=f'frame_step_{key}')
+        save_annotated = st.checkbox(
+            "Save annotated images/videos", value=False, key=f'save_annotated_{key}',
+            help="This will take more time and disk space.")
+        if not st.button("⏩ Run Batch Inspection", key=f'btn_batch_{key}'):
+            return
+
+        output_dir = deployment.get_frame_save_dir('batch') / get_now_string(
+            dt_format='%Y-%m-%d_%H-%M-%S', timezone=conf.timezone)
+        inspector = BatchInspector(
+            deployment, batch_size=batch_size, frame_step=frame_step,
+            conf_threshold=conf.confidence_threshold,
+            ignore_background=conf.ignore_background,
+            timezone=conf.timezone, save_annotated=save_annotated)
+
+        progress_bar = st.progress(0)
+        progress_text = st.empty()
+
+        def update_progress(done: int, total: int, eta: float):
+            progress_bar.progress(done / total)
+            progress_text.markdown(f"Processed **{done}/{total}**, "
+                                   f"ETA: **{eta:.0f}** seconds")
+
+        try:
+            summary = inspector.run(input_path, output_dir,
+                                    progress_callback=update_progress)
+        except Exception as e:
+            if os.getenv('DEBUG', '1') == '1':
+                st.exception(e)
+            logger.error(f"Error running batch inspection: {e}")
+            error_msg_place.error(f"Error running batch inspection: {e}")
+            st.stop()
+
+        st.success(f"Processed **{summary.processed}** images/frames in "
+                   f"**{summary.elapsed:.2f}** seconds "
+                   f"(**{summary.items_per_sec:.2f}** per second).  \n"
+                   f"Results are saved at `{summary.csv_path}`.")
+        if summary.annotated_dir:
+            st.info(f"Annotated outputs are saved at `{summary.annotated_dir}`.")
+        if summary.failed:
+            st.warning(f"Unable to read {len(summary.failed)} images: "
+                       f"{', '.join(summary.failed[:10])}")
+        st.stop()
+
     # connect MQTT broker and set up callbacks
     if not session_state.client_connected:
         logger.debug(f"{mqtt_conf = }")
@@ -559,13 +621,53 @@ def index(RELEASE=True):
                 f"**Confidence threshold**: {conf.confidence_threshold}")
         pipeline_kwargs = {'conf_threshold': conf.confidence_threshold}
 
+    with st.sidebar.expander("HTTP Inference Service"):
+        st.markdown(
+            "Serve the model locally over HTTP for other systems to send an image "
+            "with `POST /predict` and receive the results in JSON. Concurrent requests "
+            "are grouped into micro-batches. Also see `GET /health` and `GET /metrics`.")
+        server: InferenceServer = session_state.get('inference_server')
+        if server is None or not server.is_running:
+            if has_access:
+                with st.form('form_inference_server'):
+                    port = st.number_input("Port", 1024, 65535, DEFAULT_PORT,
+                                           key='inference_server_port')
+                    max_batch_size = st.number_input(
+                        "Max batch size", 1, 64, 8, key='inference_max_batch_size')
+                    max_wait_ms = st.number_input(
+                        "Max wait (ms)", 0, 1000, 10, key='inference_max_wait_ms',
+                        help="Maximum time to wait for more requests to fill up "
+                        "a batch after the first request arrived.")
+                    start_server = st.form_submit_button("Start Service")
+                if start_server:
+                    server = InferenceServer(
+                        deployment, port=port, max_batch_size=max_batch_size,
+                        max_wait_ms=max_wait_ms,
+                        conf_threshold=conf.confidence_threshold,
+                        timezone=conf.timezone)
+                    try:
+                        server.start()
+                    except OSError as e:
+                        logger.error(f"Unable to start inference server: {e}")
+                        st.error(f"Unable to start the service on port {port}: {e}")
+                    else:
+                        session_state.inference_server = server
+                        st.experimental_rerun()
+        else:
+            st.markdown(f"**Running at**: `{server.url}`")
+            st.json(server.metrics.to_dict())
+            if has_access:
+                st.button("Stop Service", key='btn_stop_inference_server',
+                          on_click=reset_inference_server)
+
     if conf.input_type == 'Image':
         sidebar_image_conf_col = st.sidebar.container()
         sidebar_mqtt_conf_col = st.sidebar.container()
 
         image_type = sidebar_image_conf_col.radio(
             "Select type of image",
-            ("Image from project datasets", "Uploaded Image", "From MQTT"),
+            ("Image from project datasets", "Uploaded Image", "From MQTT",
+             "Batch from folder/archive"),
             key='select_image_type', on_change=reset_image_idx)
 
         sidebar_mqtt_conf_col.markdown("___")
@@ -631,6 +733,21 @@ def index(RELEASE=True):
             img: np.ndarray = cv2.imread(image_path)
             # using this to cater to the case of multiple uploaded images
             imgs_info = ((img, filename),)
+        elif image_type == "Batch from folder/archive":
+            input_path = sidebar_image_conf_col.text_input(
+                "Path to an image folder, archive (ZIP/TAR) or video file",
+                key='batch_input_path',
+                help="All images and videos found in the folder or archive will be "
+                "processed offline in batches, and the results will be saved into a "
+                "CSV file in the project's `batch-inspection` folder.")
+            if not input_path:
+                st.stop()
+            if not os.path.exists(input_path):
+                error_msg_place.error(f"The path does not exist: `{input_path}`")
+                st.stop()
+            run_batch_inspection(input_path, 'folder')
+            # only continue to the per-image deployment below after the batch job
+            st.stop()
         elif image_type == "Uploaded Image":
             uploaded_imgs = sidebar_image_conf_col.file_uploader(
                 "Upload image(s)", type=['jpg', 'jpeg', 'png'],
@@ -775,12 +892,6 @@ def index(RELEASE=True):
             update_deploy_conf(conf_attr)
             reset_video_deployment()
 
-        # Does not seem to work properly
-        # max_allowed_fps = st.sidebar.slider(
-        #     'Maximum frame rate', 1, 60, 24, 1,
-        #     key='selected_max_allowed_fps', on_change=reset_video_deployment,
-        #     help="""This is the maximum allowed frame rate that the
-        #         videostream will run at.""")
         if has_access:
             options = ("Uploaded Video", "Video Camera", "From MQTT")
             idx = options.index(conf.video_type)
@@ -1053,6 +1164,84 @@ def index(RELEASE=True):
             reset_single_camera_conf()
             logger.info("Using continuous frames receiving through MQTT")
 
+        # ************************ FRAME RATE SCHEDULING ************************
+        if len(conf.camera_target_fps) != conf.num_cameras:
+            # e.g. from the older config without these attributes or
+            # when the number of cameras is changed
+            conf.camera_target_fps = (conf.camera_target_fps + [0] * conf.num_cameras
+                                      )[:conf.num_cameras]
+            conf.camera_priorities = (conf.camera_priorities + [1.0] * conf.num_cameras
+                                      )[:conf.num_cameras]
+
+        with st.sidebar.expander("Frame Rate Scheduling"):
+            st.markdown(
+                "Set the target frame rate (**0** for unlimited) and priority for each "
+                "camera. When the machine is too slow to reach all the target frame "
+                "rates, the cameras with higher priority keep their target frame rate "
+                "while the others are slowed down.")
+            if has_access:
+                def update_frame_rate_conf():
+                    conf.camera_target_fps = [
+                        int(session_state[f'input_target_fps_{i}'])
+                        for i in range(conf.num_cameras)]
+                    conf.camera_priorities = [
+                        float(session_state[f'input_cam_priority_{i}'])
+                        for i in range(conf.num_cameras)]
+                    logger.info(f"Updated target FPS: {conf.camera_target_fps}, "
+                                f"priorities: {conf.camera_priorities}")
+                    reset_video_deployment()
+
+                with st.form('form_frame_rate', clear_on_submit=True):
+                    for i in range(conf.num_cameras):
+                        fps_col, priority_col = st.columns(2)
+                        fps_col.number_input(
+                            f"Target FPS for camera {i}", 0, 120,
+                            int(conf.camera_target_fps[i]), 1,
+                            key=f'input_target_fps_{i}')
+                        priority_col.number_input(
+                            f"Priority for camera {i}", 0.1, 10.0,
+                            float(conf.camera_priorities[i]), 0.5,
+                            key=f'input_cam_priority_{i}')
+                    st.form_submit_button("Update frame rates",
+                                          on_click=update_frame_rate_conf)
+            else:
+                for i, (fps, priority) in enumerate(zip(conf.camera_target_fps,
+                                                        conf.camera_priorities)):
+                    st.markdown(f"**Camera {i}**: target FPS: {fps or 'unlimited'}, "
+                                f"priority: {priority}")
+
+        # ***************************** MEMORY USAGE *****************************
+        if 'memory_monitor' not in session_state:
+            session_state.memory_monitor = MemoryMonitor()
+        memory_monitor: MemoryMonitor = session_state.memory_monitor
+
+        with st.sidebar.expander("Memory Usage"):
+            def take_memory_snapshot():
+                session_state.memory_snapshot = memory_monitor.take_snapshot()
+
+            def stop_memory_tracing():
+                memory_monitor.stop_tracing()
+                if 'memory_snapshot' in session_state:
+                    del session_state['memory_snapshot']
+
+            st.json(memory_monitor.get_stats())
+            if has_access:
+                if not memory_monitor.is_tracing:
+                    st.button("Start tracing allocations", key='btn_start_mem_trace',
+                              on_click=memory_monitor.start_tracing,
+                              help="Take a baseline snapshot of the memory allocations "
+                              "to compare with later. Note that this will slow down "
+                              "the deployment until it is stopped.")
+                else:
+                    st.button("Take snapshot", key='btn_take_mem_snapshot',
+                              on_click=take_memory_snapshot,
+                              help="Show where memory has grown since the last snapshot.")
+                    st.button("Stop tracing", key='btn_stop_mem_trace',
+                              on_click=stop_memory_tracing)
+            if session_state.get('memory_snapshot'):
+                st.markdown("**Top memory growth since the last snapshot**")
+                st.table(session_state.memory_snapshot)
+
         # **************************** MQTT STUFF ****************************
         saved_frame_dir = deployment.get_frame_save_dir('image')
         ng_frame_dir = deployment.get_frame_save_dir('NG')
@@ -1245,6 +1434,13 @@ def index(RELEASE=True):
                                      f"'{video_file.name}' with error: {e}")
                         st.stop()
 
+                if not session_state.deployed:
+                    with st.expander("Offline batch inspection for the uploaded video"):
+                        st.markdown(
+                            "Process the entire video offline in batches (much faster than "
+                            "real-time) instead of deploying it frame by frame.")
+                        run_batch_inspection(video_path, 'uploaded_vid')
+
                 if not session_state.deployed:
                     if not deploy_btn_place.button(
                         "🛠️ Deploy Model", key='btn_deploy_uploaded_vid',
@@ -1547,8 +1743,13 @@ def index(RELEASE=True):
 
         # prepare variables for the video deployment loop
         timezone = conf.timezone
-        inference_pipeline = deployment.get_inference_pipeline(
-            draw_result=draw_result, **pipeline_kwargs)
+        # one pipeline per camera, each with its own preallocated preprocessing buffers
+        inference_pipelines = [
+            deployment.get_inference_pipeline(
+                draw_result=draw_result,
+                preprocessor=deployment.create_frame_preprocessor(),
+                **pipeline_kwargs)
+            for _ in range(conf.num_cameras)]
 
         get_result_fn = get_result_postprocessor()
 
@@ -1562,10 +1763,16 @@ def index(RELEASE=True):
 
         starting_time = datetime.now()
         logger.info(f"Starting RAM usage: {get_ram_usage()} %")
-        # use this to check when to clear memory
-        memory_clear_start = perf_counter()
-        # clear memory every 15 minutes (900 seconds)
-        MEMORY_CLEAR_INTERVAL = 900
+        # NOTE: Streamlit keeps all the frames shown with st.image() in memory until the
+        # script run ends, so the replaced frames are released at a short interval
+        # instead of clearing memory with a periodic st.experimental_rerun()
+        MEDIA_CLEANUP_INTERVAL = 5
+        # log the memory stats every 5 minutes
+        MEMORY_LOG_INTERVAL = 300
+        media_cleanup_start = memory_log_start = perf_counter()
+        memory_monitor.log_stats()
+        # reusable buffers to avoid allocating new arrays for every frame
+        buffer_pool = BufferPool()
         csv_path = deployment.get_csv_path(starting_time)
         csv_dir = csv_path.parent
         if not csv_dir.exists():
@@ -1590,22 +1797,34 @@ def index(RELEASE=True):
         display_width = conf.video_width
         publish_frame = conf.publish_frame
         first_csv_save = True
+        if video_type == 2:
+            # read the uploaded video frames into the same preallocated buffer
+            frame_buffer = buffer_pool.get('frame', (
+                int(session_state.camera.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                int(session_state.camera.get(cv2.CAP_PROP_FRAME_WIDTH)), 3))
+
+        # decides which camera to process next based on the target FPS and priorities,
+        # this also limits the frame rate by waiting until the next camera is due
+        scheduler = FrameScheduler(conf.camera_target_fps, conf.camera_priorities)
 
         # start the video deployment loop
-        for i in cycle(range(conf.num_cameras)):
+        while True:
+            i, wait_time = scheduler.next_camera()
+            if wait_time > 0:
+                sleep(wait_time)
             start_time = perf_counter()
 
-            # clear memory at an interval
-            if (start_time - memory_clear_start) > MEMORY_CLEAR_INTERVAL:
-                # restart clear interval
-                memory_clear_start = perf_counter()
-                logger.info(
-                    f"Clearing unused memory [Current RAM usage: {get_ram_usage()}%]")
-                with msg_place['top'].container():
-                    with st.spinner("Clearing memory ..."):
-                        gc.collect()
-                # seems like must rerun only can clear properly
-                st.experimental_rerun()
+            if (start_time - media_cleanup_start) > MEDIA_CLEANUP_INTERVAL:
+                media_cleanup_start = start_time
+                memory_monitor.update('st_media_files',
+                                      release_replaced_media_files())
+                memory_monitor.update('frame_buffers', buffer_pool.nbytes)
+                memory_monitor.update('preprocess_buffers', sum(
+                    p.keywords['preprocessor'].pool.nbytes
+                    for p in inference_pipelines))
+            if (start_time - memory_log_start) > MEMORY_LOG_INTERVAL:
+                memory_log_start = start_time
+                memory_monitor.log_stats()
 
             if session_state.refresh:
                 # refresh page once to refresh the widgets
@@ -1621,7 +1840,7 @@ def index(RELEASE=True):
                 frame = image_from_buffer(session_state.mqtt_recv_frame)
             else:
                 # Uploaded Video, read with cv2.VideoCapture instead of WebcamVideoStream
-                ret, frame = session_state.camera.read()
+                ret, frame = session_state.camera.read(frame_buffer)
                 if not ret:
                     break
 
@@ -1653,7 +1872,7 @@ def index(RELEASE=True):
 
             # frame.flags.writeable = True  # might need this?
             # run inference on the frame
-            inference_output = inference_pipeline(frame)
+            inference_output = inference_pipelines[i](frame)
             output_img = inference_output['img']
             channels = inference_output['channels']
             results = get_result_fn(**inference_output, camera_title=cam_title)
@@ -1670,7 +1889,9 @@ def index(RELEASE=True):
                 create_video_writer_if_not_exists(i)
                 if channels == 'RGB':
                     # cv2.VideoWriter needs BGR format
-                    out = cv2.cvtColor(output_img, cv2.COLOR_RGB2BGR)
+                    out = cv2.cvtColor(
+                        output_img, cv2.COLOR_RGB2BGR,
+                        dst=buffer_pool.get_like(f'record_{i}', output_img))
                 else:
                     out = output_img
                 session_state[vid_writer_key].write(out)
@@ -1682,12 +1903,19 @@ def index(RELEASE=True):
                     session_state[vid_writer_key].release()
                     del session_state[vid_writer_key]
 
-            # count FPS
-            fps = 1 / (perf_counter() - start_time)
+            # record the cost of this frame for the scheduler to adapt the frame rates
+            scheduler.record(i, start_time)
+            cam_schedule = scheduler.cameras[i]
 
             # fps_place[i].markdown(kpi_format(int(fps)),
             #                       unsafe_allow_html=True)
-            fps_place[i].markdown(f"**Frame Rate**: {int(fps)}")
+            if cam_schedule.target_fps > 0:
+                fps_place[i].markdown(
+                    f"**Frame Rate**: {int(cam_schedule.achieved_fps)} "
+                    f"(target: {int(cam_schedule.effective_fps)})")
+            else:
+                fps_place[i].markdown(
+                    f"**Frame Rate**: {int(cam_schedule.achieved_fps)}")
 
             if show_labels:
                 result_place[i].table(results)
@@ -1806,10 +2034,6 @@ def index(RELEASE=True):
                 for row in results:
                     session_state.csv_writer.writerow(row)
 
-            # This below does not seem to work properly
-            # if fps > max_allowed_fps:
-            #     sleep(1 / (fps - max_allowed_fps))
-
         # clean up everything if it's an uploaded video
         reset_video_deployment()
 
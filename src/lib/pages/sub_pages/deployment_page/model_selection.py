@@ -406,8 +406,9 @@ def index(RELEASE=True):
 
         with deploy_button_col:
             with st.spinner("Preparing model for deployment ..."):
+                # only exports again if the checkpoint has changed
                 session_state.deployment.run_preparation_pipeline(
-                    re_export=False)
+                    re_export=True)
         session_state.deployment_pagination = DeploymentPagination.Deployment
 
     with deploy_button_col:
@@ -260,6 +260,10 @@ def export_section():
 
             st.selectbox("Select your choice of format to export the labeled tasks:",
                         options=format_df['Format'], key='export_format')
+            st.checkbox(
+                "Rebuild the export from scratch", key='export_full_rebuild',
+                help="""By default, only the new, changed or deleted annotations and
+                images since the previous export are exported again.""")
 
     def download_export_tasks():
         with st.spinner("Creating the zipfile, this may take awhile depending on your dataset size..."):
@@ -269,7 +273,8 @@ def export_section():
             zipfile_path = session_state.project.download_tasks(
                 converter=converter,
                 export_format=format_enum_str,
-                return_original_path=True)
+                return_original_path=True,
+                full_rebuild=session_state.export_full_rebuild)
             session_state['zipfile_path'] = zipfile_path
             logger.info(f"Zipfile created at: {zipfile_path}")
 
@@ -169,7 +169,8 @@ def augmentation_configuration(RELEASE=True):
         bbox_label_folder = exported_dataset_dir / "Annotations"
         mask_folder = None
 
-        # NOTE: Only cache for augmentation demo for fast loading
+        # NOTE: Only cache for augmentation demo for fast loading, reloading after
+        # clearing it is also cheap as only the modified XML files are parsed again
         if not hasattr(session_state.project, 'xml_df'):
             with st.spinner("Loading bounding box data ..."):
                 logger.debug("Loading bounding box data")
@@ -44,7 +44,8 @@ from machine_learning.visuals import plot_cosine_lr_schedule  # logger
 from training.training_management import NewTrainingPagination, Training
 from project.project_management import Project
 from user.user_management import User
-from machine_learning.utils import NASNET_IMAGENET_INPUT_SHAPES
+from machine_learning.perf_profile import PerfProfile
+from machine_learning.utils import NASNET_IMAGENET_INPUT_SHAPES, SPLIT_METHODS
 from training.utils import get_segmentation_model_name2func, get_training_param_from_session_state
 
 
@@ -125,6 +126,23 @@ def training_configuration(RELEASE=True):
                 successfully with the selected parameters! 
                 You may proceed to submit the training config.""")
 
+    def show_split_method_option():
+        split_method = param_dict.get('split_method', 'hash')
+        split_method_names = {
+            'hash': 'Stable (by image file name)',
+            'random': 'Random',
+        }
+        st.radio(
+            "Dataset split method", SPLIT_METHODS,
+            index=SPLIT_METHODS.index(split_method),
+            format_func=lambda x: split_method_names[x],
+            key="param_split_method",
+            help="""**Stable** assigns each image to the same training/validation/testing
+            set every time based on its file name, so adding new images to the dataset
+            only assigns the new images and does not reshuffle the existing ones.
+            **Random** shuffles the whole dataset every time the training starts."""
+        )
+
     with train_config_col:
         def update_training_param():
             # set this so that it can be saved to the training param
@@ -238,6 +256,29 @@ def training_configuration(RELEASE=True):
                 help="""Number of epochs to train your model. One epoch will go through
                 our entire dataset for exactly once. Recommended to start with **10**."""
             )
+            show_split_method_option()
+            perf_profile = param_dict.get('perf_profile', str(PerfProfile.Default))
+            perf_profile_choices = [str(p) for p in PerfProfile]
+            st.selectbox(
+                "Performance profile", perf_profile_choices,
+                index=perf_profile_choices.index(perf_profile),
+                key="param_perf_profile",
+                help="""**Default** uses the default TensorFlow settings.
+                **CPUOptimized** enables the oneDNN optimizations with dedicated CPU
+                threads for training. **MixedPrecision** also trains in bfloat16
+                mixed precision if the CPU supports it, the trained model is still
+                saved in float32. The oneDNN and thread settings are only applied
+                when the training runs in the background training job queue. The
+                achieved training steps/sec is shown in the training progress to
+                compare the profiles."""
+            )
+            st.checkbox(
+                "Compile with XLA", value=param_dict.get('jit_compile', False),
+                key="param_jit_compile",
+                help="""Compile the model with XLA, which could speed up training
+                after compiling during the first few steps, but not every model
+                layer is supported."""
+            )
             if DEPLOYMENT_TYPE == "Image Classification":
                 # NOTE: not using fine_tune_all for now
                 # st.checkbox(
@@ -288,6 +329,7 @@ def training_configuration(RELEASE=True):
                     "Checkpoint is saved at every 100 steps."
                 )
                 msg_place['num_train_steps'] = st.empty()
+                show_split_method_option()
 
                 if session_state.is_changing_default_lr:
                     change_lr_btn_name = "Use the default learning rate schedule"
@@ -384,6 +426,7 @@ def training_configuration(RELEASE=True):
             aspp_num_down = param_dict.get('aspp_num_down', 256)
             aspp_num_up = param_dict.get('aspp_num_up', 128)
             use_hybrid_loss = param_dict.get('use_hybrid_loss', False)
+            use_sparse_labels = param_dict.get('use_sparse_labels', False)
 
             st.markdown("___")
             st.subheader("Segmentation model parameters")
@@ -506,6 +549,14 @@ def training_configuration(RELEASE=True):
             session_state['param_use_hybrid_loss'] = (True if loss_func == 'Hybrid Loss'
                                                       else False)
 
+            st.checkbox(
+                "Sparse labels", value=use_sparse_labels, key='param_use_sparse_labels',
+                help="Feed the masks as class indices (one channel of uint8) instead of "
+                "one-hot encoded masks of all the classes, and use the sparse versions "
+                "of the loss functions and metrics.  \nThis greatly reduces the memory "
+                "usage and speeds up the input pipeline, especially with many classes "
+                "or large image sizes.")
+
             st.button("Test Build Model", key='btn_test_build_model',
                       help="""Test building a segmentation model to verify that 
                       the parameters are working""")
@@ -23,6 +23,7 @@ SPDX-License-Identifier: Apache-2.0
 ========================================================================================
 """
 import gc
+import json
 import os
 import shutil
 import sys
@@ -50,6 +51,7 @@ import tensorflow as tf
 
 # >>>> User-defined Modules >>>>
 from core.utils.log import logger
+from data_manager.database_manager import init_connection
 from machine_learning.trainer import Trainer
 from machine_learning.command_utils import kill_process, kill_tensorboard, run_tensorboard
 from machine_learning.visuals import pretty_format_param
@@ -58,6 +60,24 @@ from training.training_management import NewTrainingPagination, Training, Traini
 from user.user_management import User
 from deployment.deployment_management import Deployment
 from training.model_management import UNSUPPORTED_MODELS
+from training.job_queue import (
+    JobStatus,
+    TrainingJob,
+    ensure_worker_running,
+    get_latest_job,
+    request_cancel,
+    submit_job,
+)
+from training.sweep import (
+    SweepConfig,
+    SweepStatus,
+    cancel_sweep,
+    create_sweep,
+    query_sweeps,
+)
+
+# >>>> Variable Declaration >>>>
+conn = init_connection(**st.secrets["postgres"])
 
 
 def index(RELEASE=True):
@@ -247,13 +267,167 @@ def index(RELEASE=True):
         take much longer time to complete without GPU. Inference time will
         also be slower.""")
 
+    # ************************** BACKGROUND TRAINING JOB **************************
+    def reload_training():
+        # the background job updates the training in the database
+        reset_trainer()
+        session_state.new_training = Training(training.id, project)
+
+    def show_training_job(job: TrainingJob):
+        st.info(f"Training job **{job.id}** is **{job.status}** in the background "
+                f"with priority **{job.priority}**. You may leave this page, "
+                "the training continues in the background.")
+        if job.cancel_requested:
+            st.warning("Cancelling the training job ...")
+        if training.progress:
+            progress_text = pretty_format_param(
+                training.progress, st_newlines=False, bold_name=True)
+            st.markdown(f"Latest progress at {progress_text}")
+        metrics_history = training.query_metrics_history()
+        if not metrics_history.empty:
+            st.line_chart(metrics_history)
+
+        refresh_col, cancel_col, auto_col, _ = st.columns([1, 1, 1, 2])
+        with refresh_col:
+            st.button("🔄 Refresh", key='btn_refresh_job',
+                      on_click=reload_training)
+        if not job.cancel_requested:
+            with cancel_col:
+                st.button("⛔ Cancel Training", key='btn_cancel_job',
+                          on_click=request_cancel, args=(job.id, conn))
+        with auto_col:
+            auto_refresh = st.checkbox("Auto refresh", value=True,
+                                       key='auto_refresh_job',
+                                       help="Refresh the status every 10 seconds")
+        if auto_refresh:
+            sleep(10)
+            reload_training()
+            st.experimental_rerun()
+
+    training_job = get_latest_job(training.id, conn)
+    if training_job is not None:
+        if training_job.is_active:
+            st.markdown("### Background Training:")
+            show_training_job(training_job)
+            # do not allow starting another training at the same time
+            st.stop()
+        elif training_job.status == JobStatus.Failed:
+            st.error(f"The latest background training job **{training_job.id}** "
+                     "has failed.")
+            if training_job.error:
+                with st.expander("Error details"):
+                    st.text(training_job.error)
+
+    # *************************** HYPER-PARAMETER SWEEP ***************************
+    def show_sweeps():
+        for sweep in query_sweeps(training.id, conn):
+            st.markdown(f"**Sweep {sweep.id}**: {sweep.status}, rung "
+                        f"{sweep.rung + 1} of {len(sweep.config.get_rung_epochs())}")
+            trial_rows = [{'Training ID': t.training_id, 'Name': t.name,
+                           'Params': json.dumps(t.params), 'Active': t.active,
+                           'Rung': t.rung + 1, sweep.config.metric: t.score,
+                           'Error': t.error}
+                          for t in sweep.trials]
+            st.table(trial_rows)
+            if sweep.best_training_id is not None:
+                st.success(f"Best trial: Training **{sweep.best_training_id}**, "
+                           "its model is exported for deployment.")
+            if sweep.status == SweepStatus.Running:
+                st.button("⛔ Cancel Sweep", key=f'btn_cancel_sweep_{sweep.id}',
+                          on_click=cancel_sweep, args=(sweep.id, conn))
+
+    def start_sweep(config: SweepConfig):
+        user = session_state.get('user')
+        try:
+            sweep_id = create_sweep(training, project, config, conn,
+                                    submitted_by=user.id if user is not None else None)
+        except ValueError as e:
+            st.error(f"Invalid sweep config: {e}")
+            st.stop()
+        ensure_worker_running()
+        st.success(f"Sweep {sweep_id} is queued, the trials are run in the background.")
+
+    if training.deployment_type != 'Object Detection with Bounding Boxes':
+        with st.expander("🔬 Hyper-parameter Sweep"):
+            st.markdown(
+                "Train a clone of this training for every combination of the search "
+                "space in the background, and only continue training the best trials "
+                "(successive halving). The model of the best trial is exported at "
+                "the end. A list is a choice of values, and a dict such as "
+                "`{\"log_uniform\": [1e-5, 1e-2]}` is a distribution for random search.")
+            default_space = {'training_param': {
+                'learning_rate': [1e-3, 1e-4],
+                'batch_size': [training.training_param_dict.get('batch_size', 32)]}}
+            search_space_txt = st.text_area(
+                "Search space (JSON)", json.dumps(default_space, indent=2),
+                height=200, key='sweep_search_space')
+            method_col, trials_col, eta_col = st.columns(3)
+            method = method_col.selectbox("Search method", ('grid', 'random'),
+                                          key='sweep_method')
+            num_trials = trials_col.number_input(
+                "Number of trials (random search)", 1, 100, 8, key='sweep_num_trials')
+            eta = eta_col.number_input(
+                "Keep 1/eta trials in each rung", 2, 10, 3, key='sweep_eta')
+            min_col, max_col, metric_col = st.columns(3)
+            min_epochs = min_col.number_input(
+                "Epochs of the first rung", 1, 1000, 2, key='sweep_min_epochs')
+            max_epochs = max_col.number_input(
+                "Maximum epochs", 1, 1000,
+                max(2, training.training_param_dict.get('num_epochs', 10)),
+                key='sweep_max_epochs')
+            metric = metric_col.text_input("Metric to minimize", 'val_loss',
+                                           key='sweep_metric')
+            if st.button("⚡ Start Sweep", key='btn_start_sweep'):
+                try:
+                    config = SweepConfig(
+                        search_space=json.loads(search_space_txt), method=method,
+                        num_trials=int(num_trials), min_epochs=int(min_epochs),
+                        max_epochs=int(max_epochs), eta=int(eta), metric=metric,
+                        priority=int(session_state.get('job_priority', 0)))
+                except ValueError as e:
+                    st.error(f"Invalid sweep config: {e}")
+                    st.stop()
+                with st.spinner("Creating the trials ..."):
+                    start_sweep(config)
+            show_sweeps()
+
     # ******************************* START TRAINING *******************************
+    bg_col, priority_col, _ = st.columns([1, 1, 2])
+    with bg_col:
+        st.checkbox(
+            "Run training in background", key='run_in_background',
+            help="Queue the training to be run by a background worker process "
+            "instead of in this page, to be able to leave this page or close the "
+            "browser while training. The number of trainings running at the same "
+            "time is limited by the CPU cores.")
+    if session_state.get('run_in_background'):
+        with priority_col:
+            st.number_input("Job priority", value=0, step=1, key='job_priority',
+                            help="The queued training jobs with higher priority "
+                            "are run first")
+
     train_btn_place = st.empty()
     retrain_place = st.empty()
     message_place = st.empty()  # for warning messages
     result_place = st.empty()
 
+    def submit_training_job(is_resume=False, train_one_batch=False):
+        user = session_state.get('user')
+        job_id = submit_job(
+            training.id, conn,
+            params={'is_resume': is_resume, 'train_one_batch': train_one_batch},
+            priority=int(session_state.get('job_priority', 0)),
+            submitted_by=user.id if user is not None else None)
+        logger.info(f"Submitted training job {job_id} for Training {training.id}")
+        ensure_worker_running()
+        # NOTE: no rerun here, the script is rerun after the callback to show the job
+        reset_trainer()
+
     def start_training_callback(is_resume=False, train_one_batch=False):
+        if session_state.get('run_in_background'):
+            submit_training_job(is_resume, train_one_batch)
+            return
+
         if not is_resume:
             root = training_paths['ROOT']
             if root.exists():
@@ -482,6 +656,11 @@ def index(RELEASE=True):
                 st.markdown(f"Latest progress at {progress_text}")
                 st.info(metrics)
 
+                metrics_history = training.query_metrics_history()
+                if not metrics_history.empty:
+                    with st.expander("Metrics history"):
+                        st.line_chart(metrics_history)
+
                 if training.deployment_type == 'Object Detection with Bounding Boxes':
                     with st.expander("Notion about the metrics"):
                         st.markdown(
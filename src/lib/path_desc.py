@@ -110,6 +110,8 @@ USER_DEEP_LEARNING_MODEL_UPLOAD_DIR = MEDIA_ROOT / \
 # named temporary directory
 TEMP_DIR = BASE_DATA_DIR / 'temp'
 CAPTURED_IMAGES_DIR = MEDIA_ROOT / 'captured_images'
+# dataset images pre-resized to the training resolutions, see `derivative_store.py`
+DERIVATIVE_IMAGE_DIR = MEDIA_ROOT / 'derivatives'
 
 # Pretrained model details
 # assuming this folder is in "utils/resources/" directory
@@ -0,0 +1,186 @@
+"""
+Title: Project Export Manifest
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Manifest of the exported annotations of a project, used by `Project.export_tasks()` to
+only export the new, changed or deleted annotations again instead of rebuilding the
+whole export directory.
+
+The manifest is saved in the export directory and has an entry for every exported
+annotation ID, with:
+    - `updated_at`: the `updated_at` of the annotation in the database
+    - `image_path`: the image path relative to the `DATASET_DIR`
+    - `stat`: [mtime_ns, size] of the image, to only hash the new or modified images
+    - `checksum`: SHA-1 of the image, to detect the images replaced with new content
+    - `outputs`: glob patterns of the files exported for the annotation, relative to
+      the export directory with the escaped image filename, which are removed when
+      the annotation is changed or deleted
+
+The `settings` of the export (e.g. the export format) must be the same as the previous
+export, otherwise the export directory is rebuilt from scratch.
+"""
+import glob
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import get_ident
+from typing import Any, Callable, Dict, List, Optional, Set
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+from core.utils.materialize import hash_file
+
+MANIFEST_FILENAME = '.export_manifest.json'
+# increase this when the exported files of the same settings are changed
+MANIFEST_VERSION = 1
+
+# annotation ID -> entry, the IDs are strings as they are the keys of the JSON file
+ManifestItems = Dict[str, Dict[str, Any]]
+
+
+@dataclass(eq=False)
+class ExportDiff:
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    num_unchanged: int = 0
+
+    @property
+    def to_export(self) -> Set[str]:
+        return set(self.added) | set(self.changed)
+
+    def __str__(self):
+        return (f"{len(self.added)} new, {len(self.changed)} changed, "
+                f"{len(self.removed)} deleted, {self.num_unchanged} unchanged")
+
+
+def load_export_manifest(output_dir: Path) -> Optional[Dict[str, Any]]:
+    """Returns None if there is no valid manifest of the current version."""
+    manifest_path = output_dir / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return None
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring the invalid export manifest: {e}")
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_export_manifest(output_dir: Path, settings: Dict[str, Any],
+                         items: ManifestItems):
+    manifest = {'version': MANIFEST_VERSION, 'settings': settings, 'items': items}
+    # unique temporary file as another export could be saving the manifest
+    tmp_path = output_dir / f"{MANIFEST_FILENAME}.{os.getpid()}.{get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, output_dir / MANIFEST_FILENAME)
+
+
+def _file_stat(path: Path) -> Optional[List[int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def get_manifest_items(tasks: List[Dict[str, Any]], old_items: ManifestItems,
+                       dataset_dir: Path,
+                       get_outputs: Callable[[Dict[str, Any]], List[str]]
+                       ) -> ManifestItems:
+    """Create the entries of the Label Studio JSON `tasks` from
+    `Project.generate_label_json()`. The images are only hashed again when their
+    modification time or size has changed since the `old_items`."""
+    items = {}
+    for task in tasks:
+        annot_id = str(task['id'])
+        image_path = task['data']['image']
+        stat = _file_stat(dataset_dir / image_path)
+        old_item = old_items.get(annot_id)
+        if stat is None:
+            checksum = None
+        elif old_item and old_item['image_path'] == image_path \
+                and old_item['stat'] == stat:
+            checksum = old_item['checksum']
+        else:
+            checksum = hash_file(dataset_dir / image_path)
+        items[annot_id] = {
+            'updated_at': task['annotations'][0].get('updated_at'),
+            'image_path': image_path,
+            'stat': stat,
+            'checksum': checksum,
+            'outputs': get_outputs(task),
+        }
+    return items
+
+
+def diff_manifest_items(old_items: ManifestItems, items: ManifestItems) -> ExportDiff:
+    diff = ExportDiff()
+    for annot_id, item in items.items():
+        old_item = old_items.get(annot_id)
+        if old_item is None:
+            diff.added.append(annot_id)
+        elif any(old_item.get(k) != item[k]
+                 for k in ('updated_at', 'image_path', 'checksum', 'outputs')):
+            diff.changed.append(annot_id)
+        else:
+            diff.num_unchanged += 1
+    diff.removed = [annot_id for annot_id in old_items if annot_id not in items]
+    return diff
+
+
+def remove_outputs(output_dir: Path, old_items: ManifestItems, items: ManifestItems,
+                   diff: ExportDiff) -> int:
+    """Remove the exported files of the changed and deleted annotations in the
+    previous export, except those also exported for the unchanged annotations,
+    e.g. the same image annotated in different datasets."""
+    to_remove = set(diff.changed) | set(diff.removed)
+    if not to_remove:
+        return 0
+    keep = set()
+    for annot_id, item in items.items():
+        if annot_id not in to_remove:
+            keep.update(item['outputs'])
+    root = glob.escape(str(output_dir))
+    num_removed = 0
+    for annot_id in to_remove:
+        for pattern in old_items[annot_id]['outputs']:
+            if pattern in keep:
+                continue
+            for path in glob.glob(os.path.join(root, pattern)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                num_removed += 1
+    return num_removed
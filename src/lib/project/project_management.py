@@ -33,7 +33,7 @@ from collections import namedtuple
 from typing import NamedTuple, Optional, Tuple, Union, List, Dict
 from time import sleep, perf_counter
 from enum import IntEnum
-from glob import glob, iglob
+from glob import escape as glob_escape, glob, iglob
 from itertools import chain
 
 from natsort import os_sorted
@@ -62,12 +62,15 @@ from path_desc import PROJECT_DIR, chdir_root, DATASET_DIR
 from core.utils.log import logger  # logger
 from data_manager.database_manager import init_connection, db_fetchone, db_no_fetch, db_fetchall
 from core.utils.file_handler import create_folder_if_not_exist, file_archive_handler
+from core.utils.materialize import link_or_copy
 from core.utils.helper import get_directory_name, create_dataframe, dataframe2dict
 from core.utils.form_manager import check_if_exists, check_if_field_empty, reset_page_attributes
 from data_manager.dataset_management import Dataset, get_dataset_name_list, query_dataset_list
 # Add CLI so can run Python script directly
 from data_editor.editor_management import Editor
 from annotation.annotation_management import Annotations, NewTask, Task, get_task_row
+from project.export_manifest import (diff_manifest_items, get_manifest_items, load_export_manifest,
+                                     remove_outputs, save_export_manifest)
 
 # <<<<<<<<<<<<<<<<<<<<<<TEMP<<<<<<<<<<<<<<<<<<<<<<<
 
@@ -76,6 +79,9 @@ from annotation.annotation_management import Annotations, NewTask, Task, get_tas
 # initialise connection to Database
 conn = init_connection(**st.secrets["postgres"])
 
+# the export formats with files per image, which are exported incrementally
+INCREMENTAL_FORMATS = (Format.VOC, Format.COCO, Format.CSV)
+
 
 class ProjectPermission(IntEnum):
     ViewOnly = 0
@@ -412,14 +418,17 @@ class Project(BaseProject):
     def download_tasks(self, *,
                        converter: Converter = None, export_format: str = None,
                        target_path: Path = None, return_original_path: bool = False,
-                       return_target_path: bool = True) -> Union[None, Path]:
+                       return_target_path: bool = True,
+                       full_rebuild: bool = False) -> Union[None, Path]:
         """
         Download all the labeled tasks by archiving and moving them into the user's `Downloads` folder.
         Or you may also pass in a directory to the `target_path` parameter to move the file there.
         NOTE: If `return_original_path` is passed, this will only return the path to where the zipfile is created,
         and the zipfile will not be moved to the "Downloads" folder.
+        `full_rebuild` is passed to `export_tasks()`.
         """
-        self.export_tasks(converter=converter, export_format=export_format)
+        self.export_tasks(converter=converter, export_format=export_format,
+                          full_rebuild=full_rebuild)
         export_path = self.get_export_path()
         filename_no_ext = export_path.parent.name
         file_archive_handler(filename_no_ext, export_path, ".zip")
@@ -444,7 +453,8 @@ class Project(BaseProject):
                      export_format: Optional[str] = None,
                      for_training_id: Optional[int] = 0,
                      download_resources: Optional[bool] = True,
-                     generate_mask: Optional[bool] = True):
+                     generate_mask: Optional[bool] = True,
+                     full_rebuild: Optional[bool] = False):
         """
         Export all annotated tasks into a specific format (e.g. Pascal VOC) and save to the dataset export directory.
 
@@ -458,53 +468,107 @@ class Project(BaseProject):
 
         If `generate_mask` is True, will generate mask images for segmentation task. 
             Required for training. Defaults to True.
+
+        The export is incremental for the VOC, COCO and CSV formats: only the files of
+        the new, changed or deleted annotations and images since the previous export
+        are created or removed, based on the export manifest (see `export_manifest.py`).
+        The export directory is rebuilt from scratch if `full_rebuild` is True, or if
+        the export settings are different from the previous export.
         """
         logger.debug(
             f"Exporting labeled tasks for Project ID: {session_state.project.id}")
 
         output_dir = self.get_export_path()
 
-        # - beware here I added removing the entire existing directory before proceeding
-        if output_dir.exists():
+        if export_format:
+            export_format = Format.from_string(export_format)
+
+        if self.deployment_type == "Image Classification":
+            if for_training_id != 0 or export_format is None:
+                # using CSV format to get our image_paths for training
+                # training must use CSV file format for our implementation
+                export_format = Format.CSV
+        elif self.deployment_type == "Object Detection with Bounding Boxes":
+            if for_training_id != 0 or export_format is None:
+                # using Pascal VOC XML format for TensorFlow Object Detection API
+                export_format = Format.VOC
+        elif self.deployment_type == "Semantic Segmentation with Polygons":
+            if for_training_id != 0 or export_format is None:
+                # using COCO JSON format for segmentation
+                export_format = Format.COCO
+
+        # if it's not for training but using CSV format, then we copy the images
+        #  into class folders to let the user download them
+        copy_class_images = (self.deployment_type == "Image Classification"
+                             and for_training_id == 0 and export_format == Format.CSV)
+        # the exported files are different with different settings
+        export_settings = {
+            'deployment_type': self.deployment_type,
+            'export_format': str(export_format),
+            'download_resources': download_resources,
+            'copy_class_images': copy_class_images,
+        }
+        manifest = load_export_manifest(output_dir)
+        is_incremental = (not full_rebuild and manifest is not None
+                          and manifest['settings'] == export_settings
+                          and export_format in INCREMENTAL_FORMATS)
+        old_items = manifest['items'] if is_incremental else {}
+
+        if not is_incremental and output_dir.exists():
             logger.debug(
                 f"Removing existing exported directory: {output_dir}")
             shutil.rmtree(output_dir)
-        os.makedirs(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
 
         json_path = self.generate_label_json(
             for_training_id=for_training_id, output_dir=output_dir,
             return_dataset_names=False)
 
+        def get_outputs(task: Dict) -> List[str]:
+            """Glob patterns of the files exported for the task"""
+            image_name = glob_escape(os.path.basename(task['data']['image']))
+            stem = os.path.splitext(image_name)[0]
+            outputs = []
+            if copy_class_images:
+                outputs.append(f"images/*/{image_name}")
+            if export_format in (Format.VOC, Format.COCO) and download_resources:
+                outputs.append(f"images/{image_name}")
+            if export_format == Format.VOC:
+                outputs.append(f"Annotations/{stem}.xml")
+            elif export_format == Format.COCO:
+                outputs.append(f"masks/{stem}.png")
+            return outputs
+
+        with open(json_path) as f:
+            tasks = json.load(f)
+        # reuse the checksums of the unmodified images even when rebuilding
+        items = get_manifest_items(tasks, manifest['items'] if manifest else {},
+                                   DATASET_DIR, get_outputs)
+        diff = diff_manifest_items(old_items, items)
+        to_export = diff.to_export
+        if is_incremental:
+            num_removed = remove_outputs(output_dir, old_items, items, diff)
+            logger.info(f"Incremental export of Project ID {self.id}: {diff}, "
+                        f"removed {num_removed} outdated files")
+
         if converter is None:
             # NOTE: If `download_resources` is True, when in YOLO/VOC/COCO format,
             #  the converter will also copy the images to the output_dir when converting
             converter = self.editor.get_labelstudio_converter(
                 download_resources=download_resources)
-
-        if export_format:
-            export_format = Format.from_string(export_format)
+        # keep the images of the unchanged annotations, the outdated ones are removed
+        converter.overwrite_resources = not is_incremental
 
         if self.deployment_type == "Image Classification":
-            if for_training_id != 0 or export_format is None:
-                # using CSV format to get our image_paths for training
-                export_format = Format.CSV
-                # training must use CSV file format for our implementation
-                logger.info("Exporting in CSV format for training")
+            if export_format == Format.CSV:
+                logger.info("Exporting in CSV format")
                 converter.convert_to_csv(
                     json_path,
                     output_dir=output_dir,
                     is_dir=False,
                 )
 
-            # if it's not for training but using CSV format, then we copy the images
-            #  into class folders to let the user download them
-            if for_training_id == 0 and export_format == Format.CSV:
-                logger.info("Exporting in CSV format for the user")
-                converter.convert_to_csv(
-                    json_path,
-                    output_dir=output_dir,
-                    is_dir=False,
-                )
+            if copy_class_images:
                 # the CSV file generated has these columns:
                 # image, id, label, annotator, annotation_id, created_at, updated_at, lead_time.
                 # The first col `image` contains the absolute paths to the images
@@ -517,7 +581,10 @@ class Project(BaseProject):
                     class_path = project_img_path / label
                     logger.debug(
                         f"Creating folder for class '{label}' at {class_path}")
-                    os.makedirs(class_path)
+                    os.makedirs(class_path, exist_ok=True)
+
+                # only copy the images of the new or changed annotations
+                df = df[df['id'].isin(to_export)]
 
                 def get_full_image_path(image_path: str) -> str:
                     # the image_path from CSV file is relative to the DATASET_DIR
@@ -532,7 +599,9 @@ class Project(BaseProject):
                 def copy_images(paths):
                     image_path = paths[0]    # first row for image_path
                     class_path = paths[-1]  # last row for class_path
-                    shutil.copy2(image_path, class_path)
+                    # hardlink or clone instead of copying if possible
+                    link_or_copy(image_path, os.path.join(
+                        class_path, os.path.basename(image_path)))
 
                 logger.info(
                     f"Copying images into each class folder in {project_img_path}")
@@ -545,23 +614,22 @@ class Project(BaseProject):
                                    total=len(paths_arr)))
                 logger.info(
                     f"Image folders for each class {unique_labels} created successfully for Project ID {self.id}")
-                # done and directly return back
-                return
 
         elif self.deployment_type == "Object Detection with Bounding Boxes":
-            if for_training_id != 0 or export_format is None:
-                # using Pascal VOC XML format for TensorFlow Object Detection API
-                export_format = Format.VOC
-
+            if is_incremental and export_format == Format.VOC:
+                # the XML files are per image, so only convert the new or changed ones
+                input_path = output_dir / f"project-{self.id}-labelstudio-changes.json"
+                with open(input_path, "w") as f:
+                    json.dump([t for t in tasks if str(t['id']) in to_export], f)
+            else:
+                input_path = json_path
             # NOTE: If `download_resources` is True, this will also copy the images to output_dir
-            converter.convert(json_path, output_dir,
+            converter.convert(input_path, output_dir,
                               export_format, is_dir=False)
+            if input_path != json_path:
+                os.remove(input_path)
 
         elif self.deployment_type == "Semantic Segmentation with Polygons":
-            if for_training_id != 0 or export_format is None:
-                # using COCO JSON format for segmentation
-                export_format = Format.COCO
-
             # NOTE: If `download_resources` is True, this will also copy the images to output_dir
             converter.convert(json_path, output_dir,
                               export_format, is_dir=False)
@@ -574,9 +642,11 @@ class Project(BaseProject):
                     logger.error('Error generating COCO JSON file')
 
                 if generate_mask:
+                    # only the masks of the new or changed annotations are generated
                     mask_folder = output_dir / "masks"
                     generate_mask_images(coco_json_path, mask_folder)
 
+        save_export_manifest(output_dir, export_settings, items)
         logger.info(f"Exported tasks in {export_format} format for "
                     f"{self.deployment_type} for Project ID: {self.id}")
 
@@ -617,14 +687,16 @@ class Project(BaseProject):
             # full_image_path = str((DATASET_DIR / image_path).resolve())
             return {"image": image_path}
 
-        def create_annotations(result):
-            return [{"result": result}]
+        def create_annotations(result, updated_at):
+            # `updated_at` is used by the export manifest to find the changed annotations
+            return [{"result": result, "updated_at": str(updated_at)}]
 
         # create the format required to use Label Studio converter to export
         df['data'] = df['image_path'].apply(get_image_path)
-        df['annotations'] = df['result'].apply(create_annotations)
+        df['annotations'] = [create_annotations(result, updated_at) for result, updated_at
+                             in zip(df['result'], df['updated_at'])]
         # drop the columns not necessary for converting
-        df.drop(columns=['image_path', 'result'], inplace=True)
+        df.drop(columns=['image_path', 'result', 'updated_at'], inplace=True)
 
         # convert to json format to export to the project_path and use for conversion
         result = df.to_json(orient="records")
@@ -740,6 +812,7 @@ class Project(BaseProject):
             sql_query = r"""
                 SELECT  a.id AS id,
                         a.result AS result,
+                        a.updated_at AS updated_at,
                         d.name AS dataset_name,
                     -- flag of 'g' to match every pattern instead of only the first
                         CONCAT_WS
@@ -762,6 +835,7 @@ class Project(BaseProject):
             sql_query = r"""
                 SELECT  a.id     AS id,
                         a.result AS result,
+                        a.updated_at AS updated_at,
                         d.name   AS dataset_name,
                     -- flag of 'g' to match every pattern instead of only the first
                         CONCAT_WS
@@ -0,0 +1,92 @@
+"""
+Title: Training Evaluation Results
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Store the test set evaluation metrics computed by `machine_learning/evaluation.py` in
+the `training_evaluation` table, to query and compare the metrics of the trainings
+without reading their evaluation caches.
+"""
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+from data_manager.database_manager import (
+    create_training_evaluation_table,
+    db_fetchone,
+    db_no_fetch,
+    ensure_table,
+)
+
+
+def save_evaluation_result(training_id: int, model_key: str,
+                           metrics: Dict[str, Any], conn):
+    """Save the metrics of the evaluated model, nothing is updated if the metrics of
+    the same model are already saved."""
+    ensure_table(create_training_evaluation_table, conn)
+    sql_query = """
+            INSERT INTO public.training_evaluation (
+                training_id
+                , model_key
+                , summary
+                , metrics)
+            VALUES (
+                %s
+                , %s
+                , %s::JSONB
+                , %s::JSONB)
+            ON CONFLICT (training_id)
+                DO UPDATE SET
+                    model_key = EXCLUDED.model_key
+                    , summary = EXCLUDED.summary
+                    , metrics = EXCLUDED.metrics
+                    , updated_at = CURRENT_TIMESTAMP
+                WHERE
+                    training_evaluation.model_key IS DISTINCT FROM EXCLUDED.model_key;
+    """
+    query_vars = [training_id, model_key, json.dumps(metrics['summary']),
+                  json.dumps(metrics)]
+    db_no_fetch(sql_query, conn, query_vars)
+    logger.debug(f"Saved evaluation result for Training {training_id}: "
+                 f"{metrics['summary']}")
+
+
+def query_evaluation_result(training_id: int, conn) -> Optional[Dict[str, Any]]:
+    ensure_table(create_training_evaluation_table, conn)
+    sql_query = """
+            SELECT
+                metrics
+            FROM
+                public.training_evaluation
+            WHERE
+                training_id = %s;
+    """
+    row = db_fetchone(sql_query, conn, [training_id])
+    return row.metrics if row else None
+
@@ -0,0 +1,351 @@
+"""
+Title: Training Job Queue
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Persistent queue of the training jobs in the `training_job` table, to run the trainings
+in the background worker (`training/job_worker.py`) instead of inside the Streamlit
+session of the training page.
+
+The jobs are claimed with `SELECT ... FOR UPDATE SKIP LOCKED`, so multiple workers
+can share the same queue without running a job twice. The training page only submits
+the jobs, polls their status and requests cancellation.
+"""
+import json
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from enum import IntEnum
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+from data_manager.database_manager import (
+    create_training_job_table,
+    db_fetchall,
+    db_fetchone,
+    db_no_fetch,
+    ensure_table,
+)
+from path_desc import BASE_DATA_DIR
+
+# number of CPU cores for each training job, TensorFlow training uses all the
+# cores by default, running more jobs than this would only slow down all of them
+CORES_PER_JOB = 4
+WORKER_PID_FILE = BASE_DATA_DIR / "training_jobs" / "worker.pid"
+WORKER_SCRIPT = Path(__file__).resolve().parent / "job_worker.py"
+
+
+class JobStatus(IntEnum):
+    Queued = 0
+    Running = 1
+    Succeeded = 2
+    Failed = 3
+    Cancelled = 4
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_string(cls, s):
+        try:
+            return JobStatus[s]
+        except KeyError:
+            raise ValueError()
+
+
+ACTIVE_STATUSES = (str(JobStatus.Queued), str(JobStatus.Running))
+
+
+@dataclass(eq=False)
+class TrainingJob:
+    id: int
+    training_id: int
+    project_id: int
+    params: Dict[str, Any]
+    priority: int
+    status: JobStatus
+    cancel_requested: bool
+    worker_pid: Optional[int] = None
+    error: Optional[str] = None
+    submitted_by: Optional[int] = None
+
+    @classmethod
+    def from_row(cls, row) -> 'TrainingJob':
+        return cls(id=row.id, training_id=row.training_id, project_id=row.project_id,
+                   params=row.params or {},
+                   priority=row.priority, status=JobStatus.from_string(row.status),
+                   cancel_requested=row.cancel_requested, worker_pid=row.worker_pid,
+                   error=row.error, submitted_by=row.submitted_by)
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in (JobStatus.Queued, JobStatus.Running)
+
+
+def get_max_concurrent_jobs(cores_per_job: int = CORES_PER_JOB) -> int:
+    return max(1, (os.cpu_count() or 1) // cores_per_job)
+
+
+def submit_job(training_id: int, conn, params: Dict[str, Any] = None,
+               priority: int = 0, submitted_by: Optional[int] = None) -> int:
+    """Add a training job to the queue and return its ID. The active job is returned
+    instead if the training already has one, to not run the same training twice."""
+    ensure_table(create_training_job_table, conn)
+    # NOTE: the partial unique index `training_job_active_idx` makes the check and the
+    # insert atomic, even when the same training is submitted by multiple sessions
+    sql_query = """
+            INSERT INTO public.training_job (
+                training_id
+                , params
+                , priority
+                , submitted_by)
+            VALUES (
+                %s
+                , %s::JSONB
+                , %s
+                , %s)
+            ON CONFLICT (training_id)
+            WHERE
+                status IN ('Queued', 'Running')
+                DO NOTHING
+            RETURNING
+                id;
+    """
+    query_vars = [training_id, json.dumps(params or {}), priority, submitted_by]
+    row = db_fetchone(sql_query, conn, query_vars)
+    if row is None:
+        active_job = get_latest_job(training_id, conn)
+        logger.warning(f"Training {training_id} already has an active job "
+                       f"{active_job.id} ({active_job.status})")
+        return active_job.id
+    logger.info(f"Submitted job {row.id} for Training {training_id} "
+                f"with priority {priority}: {params}")
+    return row.id
+
+
+def get_job(job_id: int, conn) -> Optional[TrainingJob]:
+    sql_query = """
+            SELECT
+                j.*
+                , t.project_id
+            FROM
+                public.training_job j
+                LEFT JOIN public.training t ON t.id = j.training_id
+            WHERE
+                j.id = %s;
+    """
+    row = db_fetchone(sql_query, conn, [job_id])
+    return TrainingJob.from_row(row) if row else None
+
+
+def get_latest_job(training_id: int, conn) -> Optional[TrainingJob]:
+    ensure_table(create_training_job_table, conn)
+    sql_query = """
+            SELECT
+                j.*
+                , t.project_id
+            FROM
+                public.training_job j
+                LEFT JOIN public.training t ON t.id = j.training_id
+            WHERE
+                j.training_id = %s
+            ORDER BY
+                j.id DESC
+            LIMIT 1;
+    """
+    row = db_fetchone(sql_query, conn, [training_id])
+    return TrainingJob.from_row(row) if row else None
+
+
+def get_active_jobs(conn) -> List[TrainingJob]:
+    ensure_table(create_training_job_table, conn)
+    sql_query = """
+            SELECT
+                j.*
+                , t.project_id
+            FROM
+                public.training_job j
+                LEFT JOIN public.training t ON t.id = j.training_id
+            WHERE
+                j.status IN %s
+            ORDER BY
+                j.priority DESC
+                , j.id;
+    """
+    rows = db_fetchall(sql_query, conn, [ACTIVE_STATUSES])
+    return [TrainingJob.from_row(row) for row in rows or []]
+
+
+def claim_next_job(conn, worker_pid: int) -> Optional[TrainingJob]:
+    """Mark the queued job with the highest priority (then the oldest) as running."""
+    sql_query = """
+            UPDATE
+                public.training_job
+            SET
+                status = %s
+                , worker_pid = %s
+                , started_at = CURRENT_TIMESTAMP
+            WHERE
+                id = (
+                    SELECT
+                        id
+                    FROM
+                        public.training_job
+                    WHERE
+                        status = %s
+                        AND NOT cancel_requested
+                    ORDER BY
+                        priority DESC
+                        , id
+                    LIMIT 1
+                    FOR UPDATE
+                        SKIP LOCKED)
+            RETURNING
+                *
+                , (
+                    SELECT
+                        project_id
+                    FROM
+                        public.training
+                    WHERE
+                        training.id = training_job.training_id) AS project_id;
+    """
+    query_vars = [str(JobStatus.Running), worker_pid, str(JobStatus.Queued)]
+    row = db_fetchone(sql_query, conn, query_vars)
+    return TrainingJob.from_row(row) if row else None
+
+
+def finish_job(job_id: int, status: JobStatus, conn, error: Optional[str] = None):
+    sql_query = """
+            UPDATE
+                public.training_job
+            SET
+                status = %s
+                , error = %s
+                , finished_at = CURRENT_TIMESTAMP
+            WHERE
+                id = %s;
+    """
+    db_no_fetch(sql_query, conn, [str(status), error, job_id])
+    logger.info(f"Job {job_id} finished with status: {status}")
+
+
+def request_cancel(job_id: int, conn):
+    """Cancel the job directly if it is still queued, otherwise the worker stops the
+    running job in its next poll."""
+    sql_query = """
+            UPDATE
+                public.training_job
+            SET
+                cancel_requested = TRUE
+                , status = CASE WHEN status = %s THEN
+                    %s
+                ELSE
+                    status
+                END
+                , finished_at = CASE WHEN status = %s THEN
+                    CURRENT_TIMESTAMP
+                ELSE
+                    finished_at
+                END
+            WHERE
+                id = %s;
+    """
+    queued, cancelled = str(JobStatus.Queued), str(JobStatus.Cancelled)
+    db_no_fetch(sql_query, conn, [queued, cancelled, queued, job_id])
+    logger.info(f"Requested to cancel job {job_id}")
+
+
+def get_cancel_requested_ids(job_ids: List[int], conn) -> List[int]:
+    if not job_ids:
+        return []
+    sql_query = """
+            SELECT
+                id
+            FROM
+                public.training_job
+            WHERE
+                id IN %s
+                AND cancel_requested;
+    """
+    rows = db_fetchall(sql_query, conn, [tuple(job_ids)])
+    return [row.id for row in rows or []]
+
+
+def fail_orphaned_jobs(conn, alive_pids: List[int]):
+    """Mark the running jobs of the workers which are no longer alive as failed,
+    e.g. after the machine is restarted."""
+    sql_query = """
+            UPDATE
+                public.training_job
+            SET
+                status = %s
+                , error = 'The worker process exited before the job finished'
+                , finished_at = CURRENT_TIMESTAMP
+            WHERE
+                status = %s
+                AND (worker_pid IS NULL
+                    OR NOT (worker_pid = ANY (%s)));
+    """
+    query_vars = [str(JobStatus.Failed), str(JobStatus.Running), list(alive_pids)]
+    db_no_fetch(sql_query, conn, query_vars)
+
+
+def is_worker_running() -> bool:
+    import psutil
+    if not WORKER_PID_FILE.exists():
+        return False
+    try:
+        pid = int(WORKER_PID_FILE.read_text())
+    except ValueError:
+        return False
+    return psutil.pid_exists(pid) and pid != os.getpid()
+
+
+def ensure_worker_running(idle_timeout: float = 600.0) -> bool:
+    """Start the background worker as a detached process if it is not running yet,
+    the worker exits by itself after `idle_timeout` seconds without any job.
+    Returns True if a new worker is started."""
+    if is_worker_running():
+        return False
+    WORKER_PID_FILE.parent.mkdir(parents=True, exist_ok=True)
+    command = [sys.executable, str(WORKER_SCRIPT),
+               '--idle-timeout', str(idle_timeout)]
+    logger.info(f"Starting the training job worker: {command}")
+    kwargs = {}
+    if os.name == 'nt':
+        kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        # not killed together with the Streamlit session
+        kwargs['start_new_session'] = True
+    # NOTE: the worker must be run in the same working directory as the
+    # Streamlit app to read the same '.streamlit/secrets.toml'
+    subprocess.Popen(command, cwd=os.getcwd(), stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, **kwargs)
+    return True
@@ -0,0 +1,373 @@
+"""
+Title: Training Job Worker
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Background worker to run the training jobs of `training/job_queue.py` outside of the
+Streamlit session, started by the training page, or manually from the project root
+folder (for the same `.streamlit/secrets.toml`):
+
+    python src/lib/training/job_worker.py --max-jobs 2
+
+The worker claims the queued jobs by priority and runs each of them in a separate
+process, up to `--max-jobs` at once, and kills the process of a job when its
+cancellation is requested. It also advances the hyper-parameter sweeps of
+`training/sweep.py` which queue the jobs of their trials.
+
+The `Trainer` shows its progress and errors with Streamlit elements and reads the
+`session_state`, so each job process runs the training in a headless Streamlit script
+context, with its own session state and the error messages captured for the job.
+"""
+import argparse
+import os
+import sys
+import threading
+import traceback
+from contextlib import contextmanager
+from multiprocessing import get_context
+from pathlib import Path
+from time import perf_counter, sleep
+from typing import Any, Dict, List, Tuple
+
+import streamlit as st
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+from data_manager.database_manager import init_connection
+from training.job_queue import (
+    WORKER_PID_FILE,
+    JobStatus,
+    claim_next_job,
+    fail_orphaned_jobs,
+    finish_job,
+    get_active_jobs,
+    get_cancel_requested_ids,
+    get_job,
+    get_max_concurrent_jobs,
+)
+from machine_learning.perf_profile import (
+    configure_tf_env,
+    configure_threads,
+    get_perf_settings,
+    query_training_param,
+)
+from training.sweep import advance_sweeps
+
+# seconds to wait for the job process to exit after terminating it
+TERMINATE_TIMEOUT = 10
+
+
+def create_headless_context() -> Tuple[Any, List[str]]:
+    """Create a Streamlit script context which is not connected to any browser
+    session, to run the Streamlit code in this process. Returns the context and the
+    list which collects the body of every `st.error()`."""
+    from streamlit.proto.Alert_pb2 import Alert as AlertProto
+    from streamlit.script_run_context import ScriptRunContext
+    from streamlit.state.session_state import SessionState
+    from streamlit.uploaded_file_manager import UploadedFileManager
+
+    errors: List[str] = []
+
+    def enqueue(msg):
+        # only keep the error messages, the other elements are discarded
+        if msg.HasField('delta') and msg.delta.HasField('new_element'):
+            element = msg.delta.new_element
+            if element.HasField('alert') and element.alert.format == AlertProto.ERROR:
+                errors.append(element.alert.body)
+                logger.error(f"Training error: {element.alert.body}")
+
+    ctx = ScriptRunContext(
+        session_id=f'training-job-{os.getpid()}',
+        enqueue=enqueue,
+        query_string='',
+        session_state=SessionState(),
+        uploaded_file_mgr=UploadedFileManager(),
+    )
+    return ctx, errors
+
+
+@contextmanager
+def project_export_lock(project_id: int):
+    """Inter-process lock of the export directory of the project, the concurrent jobs
+    of the same project (e.g. the trials of a sweep) would otherwise remove and write
+    the same exported files at the same time."""
+    lock_path = WORKER_PID_FILE.parent / f"export_project_{project_id}.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK only retries for 10 seconds
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def limit_threads(num_threads: int):
+    """Limit the CPU threads of the libraries, must be called before importing
+    TensorFlow. The env variables are also inherited by the TFOD training script."""
+    for env_name in ('OMP_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS'):
+        os.environ[env_name] = str(num_threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(min(2, num_threads))
+
+
+def train_job(job, perf_settings=None):
+    """Same steps as `start_training_callback()` of the training page."""
+    import shutil
+
+    import tensorflow as tf
+    from streamlit import session_state
+
+    from machine_learning.trainer import Trainer
+    from project.project_management import Project
+    from training.training_management import Training
+    from user.user_management import User
+
+    if perf_settings is not None and perf_settings.use_onednn:
+        # the thread counts of the performance profile of the training
+        configure_threads(perf_settings,
+                          num_threads=int(os.environ['TF_NUM_INTRAOP_THREADS']))
+    else:
+        tf.config.threading.set_intra_op_parallelism_threads(
+            int(os.environ['TF_NUM_INTRAOP_THREADS']))
+        tf.config.threading.set_inter_op_parallelism_threads(
+            int(os.environ['TF_NUM_INTEROP_THREADS']))
+
+    is_resume = job.params.get('is_resume', False)
+    train_one_batch = job.params.get('train_one_batch', False)
+
+    if job.submitted_by is not None:
+        session_state.user = User(job.submitted_by)
+    session_state.project = Project(job.project_id)
+    session_state.new_training = Training(job.training_id, session_state.project)
+    training: Training = session_state.new_training
+
+    if job.params.get('export_only'):
+        # e.g. to register the best model of a hyper-parameter sweep
+        trainer = Trainer(session_state.project, training)
+        trainer.export_model()
+        return
+
+    if not is_resume:
+        root = training.get_paths()['ROOT']
+        if root.exists():
+            logger.info(f"Removing existing training directory {root}")
+            shutil.rmtree(root)
+    training.initialise_training_folder()
+
+    logger.info(f"Exporting tasks for Training {training.id} ...")
+    with project_export_lock(job.project_id):
+        session_state.project.export_tasks(for_training_id=training.id)
+
+    trainer = Trainer(session_state.project, training)
+    trainer.train(is_resume, stdout_output=False, train_one_batch=train_one_batch)
+    # the background threads are killed when the job process exits
+    trainer.wait_for_background_tasks()
+
+
+def run_job(job_id: int, num_threads: int):
+    """Entry point of the job process."""
+    limit_threads(num_threads)
+
+    from streamlit.script_run_context import add_script_run_ctx
+    from streamlit.script_runner import StopException
+
+    ctx, errors = create_headless_context()
+    add_script_run_ctx(threading.current_thread(), ctx)
+
+    conn = init_connection(**st.secrets["postgres"])
+    job = get_job(job_id, conn)
+    logger.info(f"Running job {job.id} for Training {job.training_id} "
+                f"with {num_threads} threads: {job.params}")
+    # must be configured before importing TensorFlow in `train_job()`
+    perf_settings = get_perf_settings(query_training_param(job.training_id, conn))
+    configure_tf_env(perf_settings)
+    try:
+        train_job(job, perf_settings)
+    except StopException:
+        # `st.stop()` is called by the Trainer after showing the error
+        error = '\n'.join(errors) or "The training was stopped"
+        finish_job(job.id, JobStatus.Failed, conn, error=error)
+    except Exception:
+        logger.error(f"Error running job {job.id}:\n{traceback.format_exc()}")
+        finish_job(job.id, JobStatus.Failed, conn, error=traceback.format_exc())
+    else:
+        finish_job(job.id, JobStatus.Succeeded, conn,
+                   error='\n'.join(errors) or None)
+
+
+def kill_process_tree(pid: int, timeout: float = TERMINATE_TIMEOUT):
+    """Kill the job process together with its child processes, e.g. the TFOD
+    training script."""
+    import psutil
+    try:
+        parent = psutil.Process(pid)
+    except psutil.NoSuchProcess:
+        return
+    processes = parent.children(recursive=True) + [parent]
+    for p in processes:
+        try:
+            p.terminate()
+        except psutil.NoSuchProcess:
+            pass
+    _, alive = psutil.wait_procs(processes, timeout=timeout)
+    for p in alive:
+        logger.warning(f"Killing process {p.pid} which did not terminate")
+        try:
+            p.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+
+class JobWorker:
+    def __init__(self, conn, max_jobs: int, poll_interval: float = 5.0,
+                 idle_timeout: float = 0.0) -> None:
+        """
+        Args:
+            conn: The database connection.
+            max_jobs (int): Maximum number of jobs to run at the same time.
+            poll_interval (float, optional): Seconds between checking the queue.
+                Defaults to 5.0.
+            idle_timeout (float, optional): Exit after this many seconds without any
+                running job, 0 to never exit. Defaults to 0.0.
+        """
+        self.conn = conn
+        self.max_jobs = max_jobs
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        # job_id -> process
+        self.processes: Dict[int, Any] = {}
+        # share the CPU cores among the jobs
+        self.num_threads = max(1, (os.cpu_count() or 1) // max_jobs)
+        # NOTE: 'spawn' to start every job with a fresh TensorFlow and Streamlit
+        self._mp_context = get_context('spawn')
+
+    def fail_orphaned_jobs(self):
+        import psutil
+        alive_pids = [job.worker_pid for job in get_active_jobs(self.conn)
+                      if job.worker_pid and job.worker_pid != os.getpid()
+                      and psutil.pid_exists(job.worker_pid)]
+        fail_orphaned_jobs(self.conn, alive_pids)
+
+    def start_job(self, job):
+        process = self._mp_context.Process(
+            target=run_job, args=(job.id, self.num_threads),
+            name=f'training-job-{job.id}')
+        process.start()
+        self.processes[job.id] = process
+        logger.info(f"Started job {job.id} for Training {job.training_id} "
+                    f"with priority {job.priority} in process {process.pid}")
+
+    def reap_finished_jobs(self):
+        for job_id, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self.processes[job_id]
+            job = get_job(job_id, self.conn)
+            if job is not None and job.status == JobStatus.Running:
+                # crashed without updating the status, e.g. out of memory
+                finish_job(job_id, JobStatus.Failed, self.conn,
+                           error=f"The job process exited with code {process.exitcode}")
+
+    def cancel_requested_jobs(self):
+        for job_id in get_cancel_requested_ids(list(self.processes), self.conn):
+            process = self.processes.pop(job_id)
+            logger.info(f"Cancelling job {job_id} in process {process.pid}")
+            kill_process_tree(process.pid)
+            process.join()
+            finish_job(job_id, JobStatus.Cancelled, self.conn)
+
+    def claim_jobs(self):
+        while len(self.processes) < self.max_jobs:
+            job = claim_next_job(self.conn, os.getpid())
+            if job is None:
+                break
+            self.start_job(job)
+
+    def run(self):
+        logger.info(f"Training job worker {os.getpid()} started with "
+                    f"max {self.max_jobs} jobs of {self.num_threads} threads each")
+        self.fail_orphaned_jobs()
+        last_active = perf_counter()
+        while True:
+            self.reap_finished_jobs()
+            self.cancel_requested_jobs()
+            # queue the jobs of the next rungs of the hyper-parameter sweeps
+            advance_sweeps(self.conn)
+            self.claim_jobs()
+
+            if self.processes:
+                last_active = perf_counter()
+            elif self.idle_timeout and perf_counter() - last_active > self.idle_timeout:
+                logger.info("No training job for "
+                            f"{self.idle_timeout:.0f}s, exiting the worker")
+                break
+            sleep(self.poll_interval)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Run the queued training jobs")
+    parser.add_argument(
+        '--max-jobs', type=int, default=get_max_concurrent_jobs(),
+        help="Maximum number of concurrent jobs, defaults to one for every few CPU cores")
+    parser.add_argument(
+        '--poll-interval', type=float, default=5.0,
+        help="Seconds between checking the queue")
+    parser.add_argument(
+        '--idle-timeout', type=float, default=0.0,
+        help="Exit after this many idle seconds, 0 to keep running")
+    args = parser.parse_args(args)
+
+    conn = init_connection(**st.secrets["postgres"])
+    WORKER_PID_FILE.parent.mkdir(parents=True, exist_ok=True)
+    WORKER_PID_FILE.write_text(str(os.getpid()))
+    worker = JobWorker(conn, args.max_jobs, poll_interval=args.poll_interval,
+                       idle_timeout=args.idle_timeout)
+    try:
+        worker.run()
+    finally:
+        if WORKER_PID_FILE.exists() and WORKER_PID_FILE.read_text() == str(os.getpid()):
+            WORKER_PID_FILE.unlink()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Title: Training Progress Recorder
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Buffer the training progress and metrics in memory and save them to the database in
+batches, instead of two separate `UPDATE` queries for every epoch or TFOD step output.
+
+The `Training` instance is updated immediately for display, while the database is only
+updated every `flush_interval` seconds (or when many steps are pending) and when the
+training finishes. All the pending queries are executed in a single transaction. The
+metrics of every step are also kept in the `training_metrics` table for the charts,
+while the `models` table only stores the latest metrics as before.
+"""
+import json
+import math
+import sys
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+from data_manager.database_manager import (
+    create_training_metrics_table,
+    db_fetchall,
+    db_no_fetch,
+    db_no_fetch_many,
+    ensure_table,
+)
+
+if TYPE_CHECKING:
+    from training.training_management import Training
+
+# seconds between the database updates during training
+FLUSH_INTERVAL = 10.0
+# also flush when this many steps are pending, e.g. for very fast epochs
+MAX_PENDING_STEPS = 50
+
+
+def to_json_metric(value: Any) -> Optional[float]:
+    """The metric as a float, or None for NaN and infinity (e.g. a diverging epoch),
+    which are not valid JSON and rejected by PostgreSQL."""
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def query_metrics_history(training_id: int, conn) -> pd.DataFrame:
+    """Get the metrics of every recorded step of the training, with the steps as the
+    index and the metric names as the columns, e.g. to use in `st.line_chart()`."""
+    ensure_table(create_training_metrics_table, conn)
+    sql_query = """
+            SELECT
+                step
+                , metrics
+            FROM
+                public.training_metrics
+            WHERE
+                training_id = %s
+            ORDER BY
+                step;
+    """
+    records = db_fetchall(sql_query, conn, [training_id])
+    if not records:
+        return pd.DataFrame()
+    history = pd.DataFrame.from_records(
+        [r.metrics for r in records], index=[r.step for r in records])
+    history.index.name = 'step'
+    return history
+
+
+def delete_metrics_history(training_id: int, conn):
+    ensure_table(create_training_metrics_table, conn)
+    sql_query = """
+            DELETE FROM public.training_metrics
+            WHERE training_id = %s;
+    """
+    db_no_fetch(sql_query, conn, [training_id])
+
+
+class ProgressRecorder:
+    def __init__(self, training: 'Training', conn,
+                 flush_interval: float = FLUSH_INTERVAL,
+                 max_pending_steps: int = MAX_PENDING_STEPS) -> None:
+        """Use as a context manager to always flush the pending updates at the end,
+        including when the training is stopped by an error.
+
+        Args:
+            training (Training): The current training, its `progress` and
+                `training_model.metrics` are updated immediately on every `record()`.
+            conn: The database connection.
+            flush_interval (float, optional): Minimum seconds between the database
+                updates, 0 to update on every `record()`. Defaults to `FLUSH_INTERVAL`.
+            max_pending_steps (int, optional): Flush earlier when this many steps of
+                metrics are pending. Defaults to `MAX_PENDING_STEPS`.
+        """
+        self.training = training
+        self.conn = conn
+        self.flush_interval = flush_interval
+        self.max_pending_steps = max_pending_steps
+
+        self._dirty: bool = False
+        # (step, metrics) to insert into the history
+        self._pending_steps: List[Tuple[int, Dict[str, float]]] = []
+        self._last_flush: float = perf_counter()
+        self.num_flushes: int = 0
+        ensure_table(create_training_metrics_table, conn)
+
+    def __enter__(self) -> 'ProgressRecorder':
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.flush()
+
+    def record(self, progress: Dict[str, int],
+               metrics: Optional[Dict[str, Any]] = None,
+               step: Optional[int] = None):
+        """Record the latest progress (e.g. `{'Epoch': 3}`) and metrics. The metrics
+        are also added to the history when `step` is given."""
+        self.training.is_started = True
+        self.training.progress = progress
+        if metrics is not None:
+            metrics = {k: to_json_metric(v) for k, v in metrics.items()}
+            self.training.training_model.metrics = metrics
+            if step is not None:
+                self._pending_steps.append((int(step), metrics))
+        self._dirty = True
+
+        if (perf_counter() - self._last_flush) >= self.flush_interval \
+                or len(self._pending_steps) >= self.max_pending_steps:
+            self.flush()
+
+    def flush(self):
+        """Save the latest progress, the latest metrics and the pending history of
+        metrics in a single transaction."""
+        if not self._dirty:
+            return
+        training = self.training
+        queries = [(
+            """
+                UPDATE
+                    public.training
+                SET
+                    is_started = %s,
+                    progress = %s::JSONB
+                WHERE
+                    id = %s;
+            """,
+            [training.is_started, json.dumps(training.progress), training.id])]
+        if training.training_model.metrics is not None:
+            queries.append((
+                """
+                UPDATE
+                    public.models
+                SET
+                    metrics = %s::JSONB
+                WHERE
+                    id = %s;
+                """,
+                [json.dumps(training.training_model.metrics),
+                 training.training_model.id]))
+        if self._pending_steps:
+            # keep only the last metrics of each step, a step recorded twice in the
+            # same statement fails with "ON CONFLICT DO UPDATE command cannot
+            # affect row a second time"
+            latest_metrics = dict(self._pending_steps)
+            history = [{'step': step, 'metrics': metrics}
+                       for step, metrics in latest_metrics.items()]
+            # one query for all the steps, the steps could be recorded again
+            # after continuing the training from an earlier checkpoint
+            queries.append((
+                """
+                INSERT INTO public.training_metrics (training_id, step, metrics)
+                SELECT
+                    %s
+                    , r.step
+                    , r.metrics
+                FROM
+                    jsonb_to_recordset(%s::JSONB) AS r (step integer, metrics jsonb)
+                ON CONFLICT (training_id, step)
+                    DO UPDATE SET
+                        metrics = EXCLUDED.metrics;
+                """,
+                [training.id, json.dumps(history)]))
+
+        if db_no_fetch_many(queries, self.conn):
+            logger.debug(f"Saved progress for Training {training.id}: "
+                         f"'{training.progress}' with {len(self._pending_steps)} "
+                         "steps of metrics")
+        else:
+            # NOTE: not kept for the next flush, otherwise the same invalid data would
+            # fail every later flush, the next `record()` saves the latest state again
+            logger.warning(f"Unable to save the progress of Training {training.id}, "
+                           f"discarded {len(self._pending_steps)} steps of metrics")
+        self._pending_steps = []
+        self._dirty = False
+        self._last_flush = perf_counter()
+        self.num_flushes += 1
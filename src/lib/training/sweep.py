@@ -0,0 +1,484 @@
+"""
+Title: Hyper-parameter Sweep
+Date: 19/10/2026
+Author: Anson Tan Chen Tung
+Organisation: Malaysian Smart Factory 4.0 Team at Selangor Human Resource Development Centre (SHRDC)
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Copyright (C) 2021 Selangor Human Resource Development Centre
+SPDX-License-Identifier: Apache-2.0
+========================================================================================
+
+Grid or random search over the `training_param` and the augmentations of a Keras
+training (image classification and segmentation), with successive halving.
+
+Every trial is a clone of the base training, trained by the background job worker
+(`training/job_worker.py`), which runs the trials concurrently in separate processes
+with their share of the CPU threads. All the trials read the decoded and resized
+samples from the same on-disk dataset cache, which is not pruned by the trials and
+is removed once when the sweep is finished.
+
+All trials are first trained for `min_epochs`, then only the best `1 / eta` of them
+continue training for `eta` times more epochs in each rung, until `max_epochs`. The
+job worker advances the sweeps with `advance_sweeps()` while it is polling the queue,
+and exports the model of the best trial at the end.
+
+Example of a search space, a list is a choice of values, and a dict is a distribution
+for random search:
+
+    {
+        "training_param": {
+            "learning_rate": {"log_uniform": [1e-5, 1e-2]},
+            "batch_size": [16, 32],
+            "image_size": [128, 224]
+        },
+        "augmentations": [{}, {"HorizontalFlip": {"p": 0.5}}]
+    }
+"""
+import itertools
+import json
+import math
+import random
+import shutil
+import sys
+from copy import deepcopy
+from dataclasses import asdict, dataclass, field
+from enum import IntEnum
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+SRC = Path(__file__).resolve().parents[2]  # ROOT folder -> ./src
+LIB_PATH = SRC / "lib"
+if str(LIB_PATH) not in sys.path:
+    sys.path.insert(0, str(LIB_PATH))  # ./lib
+
+from core.utils.log import logger
+from data_manager.database_manager import (
+    create_training_sweep_table,
+    db_fetchall,
+    db_fetchone,
+    db_no_fetch,
+    ensure_table,
+)
+from training.job_queue import JobStatus, get_job, request_cancel, submit_job
+
+if TYPE_CHECKING:
+    from project.project_management import Project
+    from training.training_management import Training
+
+SWEEP_METHODS = ('grid', 'random')
+# the keys of the distributions for random search
+DISTRIBUTIONS = ('uniform', 'log_uniform', 'int_uniform')
+
+
+class SweepStatus(IntEnum):
+    Running = 0
+    Succeeded = 1
+    Failed = 2
+    Cancelled = 3
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_string(cls, s):
+        try:
+            return SweepStatus[s]
+        except KeyError:
+            raise ValueError()
+
+
+@dataclass(eq=False)
+class SweepConfig:
+    search_space: Dict[str, Any]
+    method: str = 'grid'
+    # number of trials for random search
+    num_trials: int = 8
+    # successive halving: epochs of the first rung, and the maximum epochs
+    min_epochs: int = 2
+    max_epochs: int = 18
+    # keep the best 1 / eta trials and train eta times more epochs in each rung
+    eta: int = 3
+    # the metric to compare the trials, from the metrics history of every epoch
+    metric: str = 'val_loss'
+    mode: str = 'min'
+    seed: int = 42
+    priority: int = 0
+
+    def __post_init__(self):
+        if self.method not in SWEEP_METHODS:
+            raise ValueError(f"Sweep method must be one of {SWEEP_METHODS}")
+        if self.mode not in ('min', 'max'):
+            raise ValueError("Sweep mode must be either 'min' or 'max'")
+        if self.eta < 2:
+            raise ValueError("eta must be at least 2")
+        if not 0 < self.min_epochs <= self.max_epochs:
+            raise ValueError("min_epochs must be between 1 and max_epochs")
+
+    def get_rung_epochs(self) -> List[int]:
+        """Total epochs trained by the end of each rung, e.g. [2, 6, 18]."""
+        rung_epochs = [self.min_epochs]
+        while rung_epochs[-1] < self.max_epochs:
+            rung_epochs.append(min(rung_epochs[-1] * self.eta, self.max_epochs))
+        return rung_epochs
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass(eq=False)
+class Trial:
+    training_id: int
+    name: str
+    params: Dict[str, Any]
+    job_id: Optional[int] = None
+    # still training in the next rungs
+    active: bool = True
+    # the index of the last rung trained
+    rung: int = 0
+    score: Optional[float] = None
+    error: Optional[str] = None
+
+
+@dataclass(eq=False)
+class Sweep:
+    id: int
+    base_training_id: int
+    config: SweepConfig
+    status: SweepStatus
+    rung: int = 0
+    trials: List[Trial] = field(default_factory=list)
+    best_training_id: Optional[int] = None
+    submitted_by: Optional[int] = None
+
+    @classmethod
+    def from_row(cls, row) -> 'Sweep':
+        state = row.state or {}
+        return cls(id=row.id, base_training_id=row.base_training_id,
+                   config=SweepConfig(**row.config),
+                   status=SweepStatus.from_string(row.status),
+                   rung=state.get('rung', 0),
+                   trials=[Trial(**t) for t in state.get('trials', [])],
+                   best_training_id=row.best_training_id,
+                   submitted_by=row.submitted_by)
+
+    def get_state(self) -> Dict[str, Any]:
+        return {'rung': self.rung, 'trials': [asdict(t) for t in self.trials]}
+
+
+def _sample(space: Any, rng: random.Random) -> Any:
+    if isinstance(space, list):
+        return rng.choice(space)
+    if isinstance(space, dict) and len(space) == 1:
+        dist, (low, high) = next(iter(space.items()))
+        if dist == 'uniform':
+            return rng.uniform(low, high)
+        if dist == 'log_uniform':
+            return math.exp(rng.uniform(math.log(low), math.log(high)))
+        if dist == 'int_uniform':
+            return rng.randint(low, high)
+    raise ValueError(f"Invalid search space {space}, must be a list of values "
+                     f"or a dict of one of {DISTRIBUTIONS}")
+
+
+def generate_trial_params(search_space: Dict[str, Any], method: str = 'grid',
+                          num_trials: int = 8, seed: int = 42) -> List[Dict[str, Any]]:
+    """Generate the params of every trial, each with the 'training_param' to update,
+    and optionally the 'augmentations' to replace."""
+    param_space: Dict[str, Any] = search_space.get('training_param', {})
+    aug_space: Optional[List[Dict]] = search_space.get('augmentations')
+    if aug_space is not None and not isinstance(aug_space, list):
+        raise ValueError("The augmentations search space must be a list of "
+                         "augmentation configs")
+
+    trials = []
+    if method == 'grid':
+        names = list(param_space)
+        for name in names:
+            if not isinstance(param_space[name], list):
+                raise ValueError(f"Grid search only supports lists of values, "
+                                 f"got {param_space[name]} for '{name}'")
+        value_lists = [param_space[name] for name in names]
+        aug_choices = aug_space if aug_space is not None else [None]
+        for values, augmentations in itertools.product(
+                itertools.product(*value_lists), aug_choices):
+            trials.append({'training_param': dict(zip(names, values)),
+                           'augmentations': augmentations})
+    else:
+        rng = random.Random(seed)
+        for _ in range(num_trials):
+            trials.append({
+                'training_param': {name: _sample(space, rng)
+                                   for name, space in param_space.items()},
+                'augmentations': (rng.choice(aug_space)
+                                  if aug_space is not None else None)})
+    for trial in trials:
+        if trial['augmentations'] is None:
+            del trial['augmentations']
+    return trials
+
+
+def get_sweep_cache_dir(base_training: 'Training', sweep_id: int) -> Path:
+    """The dataset cache shared by all the trials of the sweep."""
+    return Path(base_training.project_path) / 'sweep_cache' / str(sweep_id)
+
+
+def _insert_sweep(base_training_id: int, config: SweepConfig, conn,
+                  submitted_by: Optional[int] = None) -> int:
+    ensure_table(create_training_sweep_table, conn)
+    sql_query = """
+            INSERT INTO public.training_sweep (
+                base_training_id
+                , config
+                , status
+                , submitted_by)
+            VALUES (
+                %s
+                , %s::JSONB
+                , %s
+                , %s)
+            RETURNING
+                id;
+    """
+    query_vars = [base_training_id, json.dumps(config.to_dict()),
+                  str(SweepStatus.Running), submitted_by]
+    return db_fetchone(sql_query, conn, query_vars).id
+
+
+def save_sweep(sweep: Sweep, conn):
+    sql_query = """
+            UPDATE
+                public.training_sweep
+            SET
+                state = %s::JSONB
+                , status = %s
+                , best_training_id = %s
+            WHERE
+                id = %s;
+    """
+    query_vars = [json.dumps(sweep.get_state()), str(sweep.status),
+                  sweep.best_training_id, sweep.id]
+    db_no_fetch(sql_query, conn, query_vars)
+
+
+def create_sweep(base_training: 'Training', project: 'Project', config: SweepConfig,
+                 conn, submitted_by: Optional[int] = None) -> int:
+    """Create a clone of the base training for every trial, and queue the training
+    jobs of the first rung. Returns the sweep ID."""
+    from training.training_management import Training
+
+    if base_training.deployment_type == 'Object Detection with Bounding Boxes':
+        raise ValueError("Hyper-parameter sweep only supports Keras training, "
+                         "i.e. image classification and segmentation")
+    trial_params = generate_trial_params(
+        config.search_space, config.method, config.num_trials, config.seed)
+    if not trial_params:
+        raise ValueError("The search space does not have any trial")
+
+    sweep_id = _insert_sweep(base_training.id, config, conn, submitted_by)
+    sweep = Sweep(sweep_id, base_training.id, config, SweepStatus.Running,
+                  submitted_by=submitted_by)
+    cache_dir = get_sweep_cache_dir(base_training, sweep_id)
+    first_epochs = config.get_rung_epochs()[0]
+    logger.info(f"Creating {len(trial_params)} trials for sweep {sweep_id} of "
+                f"Training {base_training.id}")
+
+    for params in trial_params:
+        # NOTE: cloning changes the instance into the clone
+        trial_training = Training(base_training.id, project)
+        trial_training.clone_training_session()
+
+        training_param = {**base_training.training_param_dict,
+                          **params['training_param'],
+                          'num_epochs': first_epochs,
+                          'dataset_cache_dir': str(cache_dir)}
+        trial_training.update_training_param(training_param)
+        if 'augmentations' in params:
+            augmentation_config = deepcopy(base_training.augmentation_config)
+            augmentation_config.augmentations = params['augmentations']
+            trial_training.update_augment_config(augmentation_config)
+
+        job_id = submit_job(
+            trial_training.id, conn, params={'is_resume': False, 'sweep_id': sweep_id},
+            priority=config.priority, submitted_by=submitted_by)
+        sweep.trials.append(Trial(trial_training.id, trial_training.name,
+                                  params, job_id=job_id))
+    save_sweep(sweep, conn)
+    return sweep_id
+
+
+def get_sweep(sweep_id: int, conn) -> Optional[Sweep]:
+    sql_query = """
+            SELECT
+                *
+            FROM
+                public.training_sweep
+            WHERE
+                id = %s;
+    """
+    row = db_fetchone(sql_query, conn, [sweep_id])
+    return Sweep.from_row(row) if row else None
+
+
+def query_sweeps(base_training_id: int, conn) -> List[Sweep]:
+    ensure_table(create_training_sweep_table, conn)
+    sql_query = """
+            SELECT
+                *
+            FROM
+                public.training_sweep
+            WHERE
+                base_training_id = %s
+            ORDER BY
+                id DESC;
+    """
+    rows = db_fetchall(sql_query, conn, [base_training_id])
+    return [Sweep.from_row(row) for row in rows or []]
+
+
+def get_trial_score(training_id: int, metric: str, mode: str, conn) -> Optional[float]:
+    """The best value of the metric over all the recorded epochs, because the
+    Trainer keeps the weights of the best epoch."""
+    agg = 'MIN' if mode == 'min' else 'MAX'
+    sql_query = f"""
+            SELECT
+                {agg} ((metrics ->> %s)::double precision) AS score
+            FROM
+                public.training_metrics
+            WHERE
+                training_id = %s;
+    """
+    row = db_fetchone(sql_query, conn, [metric, training_id])
+    return row.score if row else None
+
+
+def _update_num_epochs(training_id: int, num_epochs: int, conn):
+    sql_query = """
+            UPDATE
+                public.training
+            SET
+                training_param = training_param || %s::JSONB
+            WHERE
+                id = %s;
+    """
+    db_no_fetch(sql_query, conn, [json.dumps({'num_epochs': num_epochs}), training_id])
+
+
+def _remove_cache(sweep: Sweep, conn):
+    row = db_fetchone("""
+            SELECT
+                training_param ->> 'dataset_cache_dir' AS cache_dir
+            FROM
+                public.training
+            WHERE
+                id = %s;
+    """, conn, [sweep.trials[0].training_id]) if sweep.trials else None
+    if row and row.cache_dir and Path(row.cache_dir).exists():
+        logger.info(f"Removing the dataset cache of sweep {sweep.id}")
+        shutil.rmtree(row.cache_dir, ignore_errors=True)
+
+
+def finish_sweep(sweep: Sweep, status: SweepStatus, conn):
+    sweep.status = status
+    save_sweep(sweep, conn)
+    _remove_cache(sweep, conn)
+    logger.info(f"Sweep {sweep.id} finished with status: {status}")
+
+
+def cancel_sweep(sweep_id: int, conn):
+    sweep = get_sweep(sweep_id, conn)
+    if sweep is None or sweep.status != SweepStatus.Running:
+        return
+    for trial in sweep.trials:
+        if trial.active and trial.job_id is not None:
+            request_cancel(trial.job_id, conn)
+        trial.active = False
+    finish_sweep(sweep, SweepStatus.Cancelled, conn)
+
+
+def advance_sweep(sweep: Sweep, conn):
+    """Check the jobs of the current rung, and when all of them are finished, either
+    promote the best trials to the next rung or register the best trial."""
+    config = sweep.config
+    active_trials = [t for t in sweep.trials if t.active]
+    jobs = {t.job_id: get_job(t.job_id, conn) for t in active_trials}
+    if any(job is not None and job.is_active for job in jobs.values()):
+        return
+
+    for trial in active_trials:
+        job = jobs[trial.job_id]
+        if job is None or job.status != JobStatus.Succeeded:
+            trial.active = False
+            trial.error = job.error if job is not None else "The job is deleted"
+            continue
+        trial.score = get_trial_score(trial.training_id, config.metric,
+                                      config.mode, conn)
+        if trial.score is None:
+            trial.active = False
+            trial.error = f"No '{config.metric}' is recorded"
+
+    scored = [t for t in active_trials if t.active]
+    if not scored:
+        logger.error(f"All the trials of sweep {sweep.id} have failed")
+        finish_sweep(sweep, SweepStatus.Failed, conn)
+        return
+    scored.sort(key=lambda t: t.score, reverse=config.mode == 'max')
+
+    rung_epochs = config.get_rung_epochs()
+    if sweep.rung + 1 >= len(rung_epochs) or len(scored) == 1:
+        best = scored[0]
+        sweep.best_training_id = best.training_id
+        logger.info(f"Best trial of sweep {sweep.id}: Training {best.training_id} "
+                    f"with {config.metric} = {best.score:.4f}")
+        # register the best model to be used for deployment
+        submit_job(best.training_id, conn, params={'export_only': True},
+                   priority=config.priority, submitted_by=sweep.submitted_by)
+        finish_sweep(sweep, SweepStatus.Succeeded, conn)
+        return
+
+    num_keep = max(1, len(scored) // config.eta)
+    for trial in scored[num_keep:]:
+        trial.active = False
+    sweep.rung += 1
+    extra_epochs = rung_epochs[sweep.rung] - rung_epochs[sweep.rung - 1]
+    logger.info(f"Sweep {sweep.id} rung {sweep.rung}: continue training "
+                f"{num_keep} of {len(scored)} trials for {extra_epochs} epochs")
+    for trial in scored[:num_keep]:
+        _update_num_epochs(trial.training_id, extra_epochs, conn)
+        trial.rung = sweep.rung
+        trial.job_id = submit_job(
+            trial.training_id, conn, params={'is_resume': True, 'sweep_id': sweep.id},
+            priority=config.priority, submitted_by=sweep.submitted_by)
+    save_sweep(sweep, conn)
+
+
+def advance_sweeps(conn):
+    """Advance all the running sweeps, called by the job worker in every poll."""
+    ensure_table(create_training_sweep_table, conn)
+    sql_query = """
+            SELECT
+                *
+            FROM
+                public.training_sweep
+            WHERE
+                status = %s;
+    """
+    rows = db_fetchall(sql_query, conn, [str(SweepStatus.Running)])
+    for row in rows or []:
+        try:
+            advance_sweep(Sweep.from_row(row), conn)
+        except Exception as e:
+            logger.error(f"Error advancing sweep {row.id}: {e}")
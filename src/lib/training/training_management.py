@@ -66,6 +66,12 @@ from project.project_management import Project
 from streamlit import cli as stcli  # Add CLI so can run Python script directly
 from streamlit import session_state as session_state
 from training.model_management import BaseModel, Model, NewModel
+from training.progress_recorder import (
+    FLUSH_INTERVAL,
+    ProgressRecorder,
+    delete_metrics_history,
+    query_metrics_history,
+)
 from training.utils import (
     get_segmentation_model_func2params,
     get_segmentation_model_name2func,
@@ -888,6 +894,8 @@ class Training(BaseTraining):
         # paths['exported_models'] = root / \
         #     'exported_models'
         paths['export'] = paths['models'] / 'export'
+        # cached test set predictions and thumbnails for the evaluation views
+        paths['eval_cache'] = paths['models'] / 'eval_cache'
         # ANNOTATIONS PATH
         paths['annotations'] = root / 'annotations'
 
@@ -974,6 +982,20 @@ class Training(BaseTraining):
             logger.info(f"Updated progress for Training {self.id} "
                         f"with: '{progress}'")
 
+    def create_progress_recorder(self) -> ProgressRecorder:
+        """To record the progress and metrics during training in batches, the interval
+        between the database updates is the training param `progress_flush_interval`
+        in seconds. Use it as a context manager to flush at the end."""
+        flush_interval = FLUSH_INTERVAL
+        if self.training_param_dict:
+            flush_interval = self.training_param_dict.get(
+                'progress_flush_interval', FLUSH_INTERVAL)
+        return ProgressRecorder(self, conn, flush_interval=flush_interval)
+
+    def query_metrics_history(self):
+        """Get the metrics of every recorded epoch (or step for TFOD) as a DataFrame."""
+        return query_metrics_history(self.id, conn)
+
     def update_metrics(self, result_metrics: Dict[str, Any], verbose: bool = False):
         self.training_model.metrics = result_metrics
 
@@ -1293,6 +1315,7 @@ class Training(BaseTraining):
 
         # reset the training result metrics
         self.update_metrics({})
+        delete_metrics_history(self.id, conn)
 
     def clone_training_session(self):
         """
@@ -1433,6 +1456,15 @@ class Training(BaseTraining):
             from keras_unet_collection.losses import focal_tversky, iou_seg
 
             metrics = [focal_tversky, categorical_crossentropy, iou_seg]
+            if self.training_param_dict.get('use_sparse_labels'):
+                # the masks are uint8 class indices instead of one-hot encoded
+                from keras.losses import sparse_categorical_crossentropy
+                from machine_learning.sparse_losses import (
+                    sparse_focal_tversky,
+                    sparse_iou_seg,
+                )
+                metrics = [sparse_focal_tversky,
+                           sparse_categorical_crossentropy, sparse_iou_seg]
             use_hybrid_loss = self.training_param_dict.get('use_hybrid_loss')
             # no need to take focal_tversky as a metric since we are using it as loss func
             metrics = metrics if use_hybrid_loss else metrics[1:]